@@ -1,24 +1,30 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 from scipy.linalg import solve_triangular
 # python utilities
 from abc import ABC
 from functools import partial
+import tempfile
 # pyscf utilities
-from pyscf import gto
-from pyscf.df.grad.rhf import _int3c_wrapper as int3c_wrapper
+from pyscf import gto, lib
+from pyscf.df.grad.rhf import _int3c_wrapper as int3c_wrapper, balance_partition
 # pyxdh utilities
-from pyxdh.DerivOnce import DerivOnceSCF, DerivOnceMP2
-from pyxdh.Utilities import cached_property
+from pyxdh.DerivOnce import DerivOnceSCF, DerivOnceNCDFT, DerivOnceMP2, DerivOnceXDH
+from pyxdh.Utilities import cached_property, laplace_quadrature
+from pyxdh.Utilities.laplace import exp_divided_difference
 # simplification
 st = partial(solve_triangular, lower=True)
 
 
 class DerivOnceDFSCF(DerivOnceSCF, ABC):
 
+    shared_properties = ("int2c2e_jk", "int3c2e_jk", "L_jk", "int3c2e_fit_jk")
+
     def __init__(self, config):
         super(DerivOnceDFSCF, self).__init__(config)
+        if self.scf_eng.with_df.auxmol is None:
+            self.scf_eng.with_df.build()
         self.aux_jk = self.scf_eng.with_df.auxmol  # type: gto.Mole
 
     @cached_property
@@ -29,6 +35,38 @@ class DerivOnceDFSCF(DerivOnceSCF, ABC):
     def eri1_ao(self):
         raise AssertionError("eri1 should not be called in density fitting module!")
 
+    @cached_property
+    def int2c2e_jk(self):
+        return self.aux_jk.intor("int2c2e")
+
+    @cached_property
+    def int3c2e_jk(self):
+        return int3c_wrapper(self.mol, self.aux_jk, "int3c2e", "s1")()
+
+    @cached_property
+    def L_jk(self):
+        return np.linalg.cholesky(self.int2c2e_jk)
+
+    @cached_property
+    def int3c2e_fit_jk(self):
+        # Fitting coefficient tensor (μν|Q) (J^-1)_QP, by two triangular solves
+        naux = self.aux_jk.nao
+        fit = st(self.L_jk, self.int3c2e_jk.reshape(-1, naux).T)
+        fit = st(self.L_jk, fit, trans="T")
+        return fit.T.reshape((self.nao, self.nao, naux))
+
+    @cached_property
+    def int2c2e_ip1_jk(self):
+        return self.aux_jk.intor("int2c2e_ip1")
+
+    @cached_property
+    def int3c2e_ip1_jk(self):
+        return int3c_wrapper(self.mol, self.aux_jk, "int3c2e_ip1", "s1")()
+
+    @cached_property
+    def int3c2e_ip2_jk(self):
+        return int3c_wrapper(self.mol, self.aux_jk, "int3c2e_ip2", "s1")()
+
     @staticmethod
     def _get_int2c2e(aux):
         return aux.intor("int2c2e")
@@ -38,42 +76,249 @@ class DerivOnceDFSCF(DerivOnceSCF, ABC):
         return int3c_wrapper(mol, aux, "int3c2e", "s1")()
 
 
+class DerivOnceDFNCDFT(DerivOnceNCDFT, DerivOnceDFSCF, ABC):
+    pass
+
+
 class DerivOnceDFMP2(DerivOnceMP2, DerivOnceDFSCF, ABC):
 
+    shared_properties = (
+        "int2c2e_ri", "L_ri", "Y_ia_ri", "Y_ij_ri", "G_ia_ri",
+        "ri_intermediates", "laplace_intermediates", "ri_tmpfiles",
+    )
+
     def __init__(self, config):
         super(DerivOnceDFMP2, self).__init__(config)
         self.aux_ri = config["aux_ri"]  # type: gto.Mole
+        self.ri_memory = config.get("ri_memory", 2000)
+        self.ri_outcore = config.get("ri_outcore", False)
+        if self.frozen:
+            raise NotImplementedError("Frozen core is not implemented for density fitting MP2!")
+        # Laplace-transformed opposite-spin MP2, switched on by default if same-spin term vanishes
+        self.laplace = config.get("laplace", self.ss == 0)
+        self.laplace_points = config.get("laplace_points", 12)
+        if self.laplace and self.ss != 0:
+            raise ValueError("Laplace-transformed MP2 is only available for opposite-spin MP2 (ss = 0)!")
+        # Amplitudes are generated from RI factors, not from occupied-batched integral blocks
+        self._mp2_batched = False
         self._int2c2e_ri = NotImplemented  # type: np.ndarray
-        self._int3c2e_ri = NotImplemented  # type: np.ndarray
         self._L_ri = NotImplemented  # type: np.ndarray
-        self._L_inv_ri = NotImplemented  # type: np.ndarray
-        self._Y_ao_ri = NotImplemented  # type: np.ndarray
         self._Y_ia_ri = NotImplemented  # type: np.ndarray
+        self._ri_tmpfiles = []
 
     @cached_property
     def int2c2e_ri(self):
         return self.aux_ri.intor("int2c2e")
 
-    @cached_property
-    def int3c2e_ri(self):
-        return int3c_wrapper(self.mol, self.aux_ri, "int3c2e", "s1")()
-
     @cached_property
     def L_ri(self):
         return np.linalg.cholesky(self.int2c2e_ri)
 
     @cached_property
-    def L_inv_ri(self):
-        return np.linalg.inv(self.L_ri)
+    def Y_ia_ri(self):
+        return self._get_Y_mo_ri(self.Co, self.Cv)
 
     @cached_property
-    def Y_ao_ri(self):
-        return einsum("μνQ, PQ -> μνP", self.int3c2e_ri, self.L_inv_ri)
+    def Y_ij_ri(self):
+        return self._get_Y_mo_ri(self.Co, self.Co)
 
-    @cached_property
-    def Y_ia_ri(self):
-        return einsum("μνP, μi, νa -> iaP", self.Y_ao_ri, self.Co, self.Cv)
+    def _get_Y_mo_ri(self, C1, C2):
+        """
+        Generate Cholesky-orthogonalized RI factor in molecular orbital basis,
+        :math:`Y_{pq, P} = (L^{-1})_{PQ} (pq|Q)`.
+
+        3-center integrals are streamed by AO shell batches (``_gen_int3c2e_ri``) and half-transformed
+        immediately, so that AO-basis RI factors are never formed. Metric is applied by triangular
+        solve. If ``ri_outcore``, result is stored as memory-mapped file in PySCF's temporary directory.
+
+        Parameters
+        ----------
+        C1: np.ndarray
+        C2: np.ndarray
+
+        Returns
+        -------
+        np.ndarray
+        """
+        naux, L_ri = self.aux_ri.nao, self.L_ri
+        n1, n2 = C1.shape[-1], C2.shape[-1]
+
+        if self.ri_outcore:
+            tmpfile = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+            self._ri_tmpfiles.append(tmpfile)
+            Y_mo_ri = np.memmap(tmpfile.name, dtype=np.float64, mode="w+", shape=(n1, n2, naux))
+        else:
+            Y_mo_ri = np.zeros((n1, n2, naux))
+
+        # Half-transformed integrals are accumulated over AO shell batches of first index
+        for su, int3c2e_batch in self._gen_int3c2e_ri():
+            Y_mo_ri += einsum("uvQ, up, vq -> pqQ", int3c2e_batch, C1[su], C2)
+
+        # Metric by triangular solve, batched by first MO index
+        for p in range(n1):
+            Y_mo_ri[p] = st(L_ri, Y_mo_ri[p].T).T
+        return Y_mo_ri
+
+    def _gen_int3c2e_ri(self):
+        """
+        Generate 3-center integrals :math:`(\\mu \\nu | Q)` of ``aux_ri`` by AO shell batches of first index, each
+        limited by ``ri_memory``.
+
+        Yields
+        ------
+        tuple
+            ``(su, int3c2e_batch)``: AO slice of batch, and integrals of shape (nu, nao, naux).
+        """
+        mol, aux_ri = self.mol, self.aux_ri
+        int3c2e = int3c_wrapper(mol, aux_ri, "int3c2e", "s1")
+        ao_loc = mol.ao_loc_nr()
+        blksize = max(int(self.ri_memory * 1e6 / 8 / (self.nao * aux_ri.nao)), np.diff(ao_loc).max())
+        for shl0, shl1, _ in balance_partition(ao_loc, blksize):
+            yield slice(ao_loc[shl0], ao_loc[shl1]), int3c2e((shl0, shl1, 0, mol.nbas, 0, aux_ri.nbas))
 
     @cached_property
     def t_iajb(self):
+        # Not used in energy or gradient, which are evaluated from occupied-batched or Laplace intermediates
         return einsum("iaP, jbP -> iajb", self.Y_ia_ri, self.Y_ia_ri) / self.D_iajb
+
+    @cached_property
+    def eng_corr(self):
+        return self.ri_intermediates["eng_corr"]
+
+    @cached_property
+    def G_ia_ri(self):
+        # RI 3-index amplitude: G_iaP = T_iajb Y_jbP
+        return self.ri_intermediates["G_ia_ri"]
+
+    @cached_property
+    def D_r_oovv(self):
+        return self.ri_intermediates["D_r_oovv"]
+
+    @cached_property
+    def ri_intermediates(self):
+        """
+        RI-MP2 intermediates, without storing amplitudes ``t_iajb`` or ``T_iajb``.
+
+        If ``laplace``, these are ``laplace_intermediates``; otherwise amplitudes are generated from RI factors by
+        batches of first occupied index, with batch size chosen from ``mp2_memory``. Occupied-occupied block of
+        relaxed density runs over both occupied indices of amplitudes, and is rewritten by the symmetry
+        :math:`T_{ia, jb} = T_{jb, ia}` so that the summed occupied index is the batched one.
+
+        Returns
+        -------
+        dict
+            ``eng_corr``: correlation energy; ``G_ia_ri``: RI 3-index amplitude; ``D_r_oovv``: occupied-occupied and
+            virtual-virtual blocks of relaxed density.
+        """
+        if self.laplace:
+            return self.laplace_intermediates
+        nmo, nocc, nvir, naux = self.nmo, self.nocc, self.nvir, self.aux_ri.nao
+        so, sv = self.so, self.sv
+        eo, ev = self.eo, self.ev
+        cc, os, ss = self.cc, self.os, self.ss
+        Y_ia_ri = np.asarray(self.Y_ia_ri)
+
+        eng_corr = 0
+        G_ia_ri = np.zeros((nocc, nvir, naux))
+        D_r_oovv = np.zeros((nmo, nmo))
+
+        # Integrals, denominators and amplitudes t, T of batch are four ov-ov slices per occupied index
+        blksize = max(int(self.mp2_memory * 1e6 / 8 / (4 * nocc * nvir ** 2)), 1)
+        for i0 in range(0, nocc, blksize):
+            sI = slice(i0, min(i0 + blksize, nocc))
+            g = einsum("iaP, jbP -> iajb", Y_ia_ri[sI], Y_ia_ri)
+            D = eo[sI, None, None, None] - ev[None, :, None, None] + eo[None, None, :, None] - ev[None, None, None, :]
+            t = g / D
+            T = cc * ((os + ss) * t - ss * t.swapaxes(-1, -3))
+            eng_corr += (T * g).sum()
+            G_ia_ri[sI] = einsum("iajb, jbP -> iaP", T, Y_ia_ri)
+            D_r_oovv[so, so] -= 2 * einsum("kbia, kbja -> ij", T, t)
+            D_r_oovv[sv, sv] += 2 * einsum("iajc, ibjc -> ab", T, t)
+        return {"eng_corr": eng_corr, "G_ia_ri": G_ia_ri, "D_r_oovv": D_r_oovv}
+
+    @cached_property
+    def laplace_intermediates(self):
+        """
+        Laplace-transformed opposite-spin MP2 intermediates, without forming amplitudes ``t_iajb`` or ``T_iajb``.
+
+        Denominators are decomposed as :math:`1 / \\Delta_{ij}^{ab} = \\sum_\\tau w_\\tau x_{ia}^\\tau x_{jb}^\\tau`,
+        with :math:`x_{ia}^\\tau = e^{-(e_a - e_i) t_\\tau}` (``laplace_points`` quadrature points), so that with RI
+        factors :math:`Y_{ia, P}`, and :math:`c = c_\\mathrm{c} c_\\mathrm{os}`,
+
+        .. math::
+
+            M_{PQ}^\\tau &= Y_{ia, P} x_{ia}^\\tau Y_{ia, Q} \\\\
+            E_\\mathrm{corr} &= - c \\sum_\\tau w_\\tau M_{PQ}^\\tau M_{PQ}^\\tau \\\\
+            G_{ia, P} &= - c \\sum_\\tau w_\\tau x_{ia}^\\tau Y_{ia, Q} M_{QP}^\\tau
+
+        Occupied-occupied and virtual-virtual blocks of relaxed density are derivatives of this energy expression
+        with respect to Fock matrix, by divided differences :math:`\\phi` of matrix exponentials
+        (:func:`~pyxdh.Utilities.laplace.exp_divided_difference`):
+
+        .. math::
+
+            D_{ij} &= - 2 c \\sum_\\tau w_\\tau \\phi_{ij} (t_\\tau) e^{-e_a t_\\tau} Y_{ia, P} M_{PQ} Y_{ja, Q} \\\\
+            D_{ab} &= - 2 c \\sum_\\tau w_\\tau \\phi_{ab} (-t_\\tau) e^{e_i t_\\tau} Y_{ia, P} M_{PQ} Y_{ib, Q}
+
+        Quadrature points are streamed; each costs :math:`O(N^4)`.
+
+        Returns
+        -------
+        dict
+            ``eng_corr``: correlation energy; ``G_ia_ri``: RI 3-index amplitude; ``D_r_oovv``: occupied-occupied and
+            virtual-virtual blocks of relaxed density.
+        """
+        nmo, nocc, nvir, naux = self.nmo, self.nocc, self.nvir, self.aux_ri.nao
+        so, sv = self.so, self.sv
+        eo, ev = self.eo, self.ev
+        c = self.cc * self.os
+        Y_ia_ri = np.asarray(self.Y_ia_ri)
+
+        eng_corr = 0
+        G_ia_ri = np.zeros((nocc, nvir, naux))
+        D_r_oovv = np.zeros((nmo, nmo))
+
+        x_min, x_max = 2 * (ev.min() - eo.max()), 2 * (ev.max() - eo.min())
+        for t, w in zip(*laplace_quadrature(self.laplace_points, x_min, x_max)):
+            xo, xv = np.exp(eo * t), np.exp(-ev * t)
+            x_ia = xo[:, None] * xv[None, :]
+            M = einsum("iaP, ia, iaQ -> PQ", Y_ia_ri, x_ia, Y_ia_ri)
+            YM = einsum("iaQ, QP -> iaP", Y_ia_ri, M)
+            eng_corr -= c * w * (M * M).sum()
+            G_ia_ri -= c * w * x_ia[:, :, None] * YM
+            # Divided differences are derivatives of exp(F_oo t) and exp(- F_vv t)
+            phi_o, phi_v = exp_divided_difference(eo, t), exp_divided_difference(ev, -t)
+            D_r_oovv[so, so] -= 2 * c * w * phi_o * einsum("iaP, a, jaP -> ij", YM, xv, Y_ia_ri)
+            D_r_oovv[sv, sv] -= 2 * c * w * phi_v * einsum("iaP, i, ibP -> ab", YM, xo, Y_ia_ri)
+        return {"eng_corr": eng_corr, "G_ia_ri": G_ia_ri, "D_r_oovv": D_r_oovv}
+
+    def _get_L(self):
+        nvir, nocc, naux = self.nvir, self.nocc, self.aux_ri.nao
+        so, sv, sa = self.so, self.sv, self.sa
+        Ax0_Core = self.Ax0_Core
+        Y_ij_ri, G_ia_ri = self.Y_ij_ri, self.G_ia_ri
+        L = np.zeros((nvir, nocc))
+        L += Ax0_Core(sv, so, sa, sa)(self.D_r_oovv)
+        L -= 4 * einsum("ijP, jaP -> ai", Y_ij_ri, G_ia_ri)
+        # Virtual-virtual RI factor is not formed: G_ia_ri is transformed back to original auxiliary basis and to AO
+        # basis, then contracted with 3-center integrals streamed by AO shell batches
+        G_ia = st(self.L_ri, G_ia_ri.reshape(-1, naux).T, trans="T").reshape((naux, nocc, nvir))
+        G_iv = einsum("Qib, vb -> ivQ", G_ia, self.Cv)
+        for su, int3c2e_batch in self._gen_int3c2e_ri():
+            L += 4 * self.Cv[su].T @ einsum("uvQ, ivQ -> ui", int3c2e_batch, G_iv)
+        return L
+
+    @cached_property
+    def W_I(self):
+        so, sv = self.so, self.sv
+        nmo = self.nmo
+        Y_ia_ri, Y_ij_ri, G_ia_ri = self.Y_ia_ri, self.Y_ij_ri, self.G_ia_ri
+        W_I = np.zeros((nmo, nmo))
+        W_I[so, so] = - 2 * einsum("iaP, jaP -> ij", G_ia_ri, Y_ia_ri)
+        W_I[sv, sv] = - 2 * einsum("iaP, ibP -> ab", G_ia_ri, Y_ia_ri)
+        W_I[sv, so] = - 4 * einsum("ijP, jaP -> ai", Y_ij_ri, G_ia_ri)
+        return W_I
+
+
+class DerivOnceDFXDH(DerivOnceXDH, DerivOnceDFMP2, ABC):
+    pass
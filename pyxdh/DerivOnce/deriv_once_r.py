@@ -1,25 +1,66 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # python utilities
 from abc import ABC, abstractmethod
 import warnings
 import copy
+import tempfile
 # pyscf utilities
 from pyscf.scf._response_functions import _gen_rhf_response
-from pyscf import gto, dft, scf, lib, hessian
+from pyscf import gto, dft, scf, lib, hessian, ao2mo
 from pyscf.scf import cphf
+from pyscf.ao2mo import _ao2mo
 # pyxdh utilities
 from pyxdh.Utilities import timing, cached_property
 # additional definition for hessian
 scf.hf.RHF.Hessian = lib.class_as_method(hessian.rhf.Hessian)
 dft.rks.RKS.Hessian = lib.class_as_method(hessian.rks.Hessian)
 
+class DerivContext:
+    """
+    Perturbation-independent quantities of one molecule, SCF and method, shared by all ``DerivOnce`` instances
+    linked by ``DerivOnceSCF.share_context``.
+
+    Cached properties listed in ``shared_properties`` of ``DerivOnce`` classes (and mutable integral caches) are
+    stored in ``values`` instead of in each instance.
+    """
+
+    def __init__(self, names):
+        self.names = names  # type: frozenset
+        self.values = {}  # type: dict
+
+    def merge(self, other):
+        # Values already evaluated in `other` context are kept only if not evaluated in this context
+        for key, val in other.values.items():
+            if key not in self.values or self.values[key] is NotImplemented:
+                self.values[key] = val
+            elif isinstance(val, dict) and isinstance(self.values[key], dict):
+                for k, v in val.items():
+                    self.values[key].setdefault(k, v)
+            elif isinstance(val, list) and isinstance(self.values[key], list) and val is not self.values[key]:
+                self.values[key].extend(val)
+
+
 # Cubic Inheritance: A1
 class DerivOnceSCF(ABC):
 
+    # Perturbation-independent cached properties, which could be shared among instances on the same SCF
+    shared_properties = (
+        "D", "eng", "H_0_ao", "H_0_mo", "S_0_ao", "S_0_mo", "F_0_ao", "F_0_mo", "eri0_ao", "eri0_mo",
+        "jk_0_ao", "xc_0_ao", "resp", "resp_cphf", "resp_anti", "Ax0_memo",
+    )
+
     def __init__(self, config):
 
+        # Perturbation-independent quantities; should be set before any cached property
+        names = set()
+        for cls in type(self).__mro__:
+            names.update("_" + name for name in vars(cls).get("shared_properties", ()))
+        self.context = DerivContext(frozenset(names))
+        # Memoized results of ``Ax0_Core_batch``
+        self._Ax0_memo = {}
+
         # From configuration file, with default values
         self.config = config  # type: dict
         self.scf_eng = config["scf_eng"]  # type: dft.rks.RKS
@@ -27,6 +68,10 @@ class DerivOnceSCF(ABC):
         self.grdit_memory = config.get("grdit_memory", 2000)
         self.init_scf = config.get("init_scf", True)
         self.cphf_tol = config.get("cphf_tol", 1e-6)
+        # AO-basis guesses of v-o CP-HF solutions (``Z``, ``D_r``), e.g. of previous geometry in optimization
+        self.cphf_guess = config.get("cphf_guess", {})  # type: dict
+        # Number of iterations of v-o CP-HF equations solved by ``solve_cphf_vo``
+        self.cphf_cycles = {}  # type: dict
 
         # Basic settings
         self.mol = self.scf_eng.mol  # type: gto.Mole
@@ -50,6 +95,11 @@ class DerivOnceSCF(ABC):
         # Initializer
         self.initialization()
         self.cphf_grids = config.get("cphf_grids", self.grids)
+
+        # Instance whose Coulomb and exchange integrals of the same density are reused, and exchange coefficients
+        # of all instances that reuse J/K of this instance; see ``DerivOnceNCDFT``
+        self.jk_deriv = self  # type: DerivOnceSCF
+        self.jk_cx = [self.cx]
         return
 
     # region Initializers
@@ -85,6 +135,64 @@ class DerivOnceSCF(ABC):
 
     # endregion
 
+    # region Shared context
+
+    def __getattr__(self, key):
+        # Only called if `key` is not found in instance; shared cached properties are looked up in context
+        context = self.__dict__.get("context")
+        if context is not None and key in context.values:
+            return context.values[key]
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, key))
+
+    def __setattr__(self, key, value):
+        context = self.__dict__.get("context")
+        if context is not None and key in context.names:
+            # Shared value could have been used by other instances, so it should not be changed once evaluated
+            if key in context.values and context.values[key] is not NotImplemented and context.values[key] is not value:
+                raise AttributeError("Once shared quantity `{}` is evaluated, it should not be changed anymore."
+                                     .format(key[1:]))
+            context.values[key] = value
+            return
+        super(DerivOnceSCF, self).__setattr__(key, value)
+
+    def _get_context_signature(self):
+        # Quantities that perturbation-independent values depend on, besides molecular orbitals
+        family = next(cls for cls in type(self).__mro__ if cls.__name__.startswith("DerivOnce"))
+        keys = [
+            "rotation", "cphf_tol", "frozen", "cc", "os", "ss", "mp2_batched", "eri0_outcore",
+            "aux_ri", "laplace", "laplace_points",
+        ]
+        return (family, self.scf_eng, self.cphf_grids) + tuple(getattr(self, key, None) for key in keys)
+
+    def share_context(self, other):
+        """
+        Share perturbation-independent quantities (reference energy, Fock matrices, response functions,
+        ERI and MP2 intermediates, relaxed densities, ...) with ``other`` instance, so that these quantities are
+        evaluated and stored only once. Quantities already evaluated by either instance are kept.
+
+        Instances should be built on the same SCF instance and with the same method settings; e.g. ``GradXDH`` and
+        ``DipoleXDH`` of the same ``scf_eng`` and ``nc_eng``.
+
+        Parameters
+        ----------
+        other: DerivOnceSCF
+
+        Returns
+        -------
+        bool
+            Whether context is shared; False if method settings of instances differ.
+        """
+        if self.context is other.context:
+            return True
+        signature = self._get_context_signature()
+        if signature != other._get_context_signature() or not np.allclose(self.C, other.C):
+            return False
+        other.context.merge(self.context)
+        self.context = other.context
+        return True
+
+    # endregion
+
     # region Properties
 
     @property
@@ -205,9 +313,67 @@ class DerivOnceSCF(ABC):
     def S_0_mo(self):
         return self.C.T @ self.S_0_ao @ self.C
 
+    @property
+    def is_rsh(self) -> bool:
+        # Range-separated functionals are left to PySCF, since J/K here are full-range only
+        return self.xc_type != "HF" and self.scf_eng._numint.rsh_coeff(self.xc)[0] != 0
+
+    @property
+    def is_nlc(self) -> bool:
+        # Non-local correlation (VV10, by ``nlc`` or by functional itself) is left to PySCF, since only local XC
+        # part is evaluated here
+        if self.xc_type == "HF":
+            return False
+        return bool(getattr(self.scf_eng, "nlc", "")) or self.scf_eng._numint.libxc.is_nlc(self.xc)
+
+    @cached_property
+    def jk_0_ao(self):
+        # Coulomb and exchange matrices (J, K) of density D; K is None if no instance sharing J/K requires exchange
+        if self.jk_deriv is not self:
+            return self.jk_deriv.jk_0_ao
+        if any(cx != 0 for cx in self.jk_cx):
+            return self.scf_eng.get_jk(dm=self.D)
+        return self.scf_eng.get_j(dm=self.D), None
+
+    @cached_property
+    def xc_0_ao(self):
+        # Exchange-correlation energy and potential (exc, vxc) of density D
+        if self.xc_type == "HF":
+            return 0, 0
+        grids = self.grids
+        if grids.coords is None:
+            # Grids of caller are not modified
+            grids = copy.copy(grids)
+            grids.build()
+        _, exc, vxc = self.scf_eng._numint.nr_rks(self.mol, grids, self.xc, self.D, max_memory=self.grdit_memory)
+        return exc, vxc
+
     @cached_property
     def F_0_ao(self):
-        return self.scf_eng.get_fock(dm=self.D)
+        if self.is_rsh or self.is_nlc:
+            return self.scf_eng.get_fock(dm=self.D)
+        vj, vk = self.jk_0_ao
+        F_0_ao = self.H_0_ao + vj + self.xc_0_ao[1]
+        if self.cx != 0:
+            F_0_ao -= 0.5 * self.cx * vk
+        return F_0_ao
+
+    def _get_eng_dm(self):
+        """
+        Total energy of functional of ``scf_eng`` on density D, from J/K of ``jk_deriv`` instance.
+
+        Returns
+        -------
+        float
+        """
+        if self.is_rsh or self.is_nlc:
+            return self.scf_eng.energy_tot(dm=self.D)
+        D = self.D
+        vj, vk = self.jk_0_ao
+        eng = einsum("uv, uv -> ", self.H_0_ao + 0.5 * vj, D) + self.xc_0_ao[0] + self.mol.energy_nuc()
+        if self.cx != 0:
+            eng -= 0.25 * self.cx * einsum("uv, uv -> ", vk, D)
+        return eng
 
     @cached_property
     def F_0_mo(self):
@@ -248,8 +414,15 @@ class DerivOnceSCF(ABC):
     def S_1_ao(self):
         pass
 
+    @cached_property
+    def S_1_ao_block(self):
+        # Atom-block-sparse form of S_1_ao (AtomBlockMatrix), if perturbation is local to atoms
+        return None
+
     @cached_property
     def S_1_mo(self):
+        if self.S_1_ao_block is not None:
+            return self.S_1_ao_block.to_mo(self.C)
         if not isinstance(self.S_1_ao, np.ndarray):
             return 0
         return einsum("Auv, up, vq -> Apq", self.S_1_ao, self.C, self.C)
@@ -275,13 +448,16 @@ class DerivOnceSCF(ABC):
         if isinstance(self.S_1_mo, np.ndarray):
             B_1 += (
                 - self.S_1_mo * self.e
-                - 0.5 * self.Ax0_Core(sa, sa, so, so)(self.S_1_mo[:, so, so])
+                - 0.5 * self.Ax0_Core_batch((sa, sa, so, so, self.S_1_mo[:, so, so]))[0]
             )
         return B_1
 
     @cached_property
     @timing
     def U_1(self):
+        return self._get_U_1()
+
+    def _get_U_1(self):
         B_1 = self.B_1
         S_1_mo = self.S_1_mo
         if not isinstance(S_1_mo, np.ndarray):
@@ -332,6 +508,72 @@ class DerivOnceSCF(ABC):
 
         return U_1_pq
 
+    def solve_cphf_vo(self, rhs, name=None):
+        """
+        Solve v-o CP-HF equation of one right-hand side,
+
+        .. math::
+
+            (\\varepsilon_a - \\varepsilon_i) X_{ai} + A_{ai, bj} X_{bj} = - R_{ai}
+
+        If ``cphf_guess`` has AO-basis guess of ``name``, it is projected onto orbitals of this instance, and only the
+        correction to the guess is solved. Number of iterations is recorded in ``cphf_cycles``.
+
+        Parameters
+        ----------
+        rhs: np.ndarray
+            Shape (nvir, nocc).
+        name: str or None
+            Name of solution, e.g. ``Z`` or ``D_r``.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (nvir, nocc).
+        """
+        sv, so = self.sv, self.so
+        Ax0_Core = self.Ax0_Core(sv, so, sv, so, in_cphf=True)
+        cycles = [0]
+
+        def fx(X):
+            cycles[0] += 1
+            return Ax0_Core(X)
+
+        X0 = self._get_cphf_guess_vo(name)
+        if X0 is not None:
+            rhs = rhs + X0 * (self.ev[:, None] - self.eo[None, :]) + Ax0_Core(X0)
+        X = cphf.solve(fx, self.e, self.mo_occ, rhs, max_cycle=100, tol=self.cphf_tol)[0]
+        if X0 is not None:
+            X += X0
+        if name is not None:
+            self.cphf_cycles[name] = cycles[0]
+        return X
+
+    def _get_cphf_guess_vo(self, name):
+        # Guess of another geometry is stored in AO basis, and projected by overlap of this geometry
+        if name not in self.cphf_guess:
+            return None
+        S = self.S_0_ao
+        return self.Cv.T @ S @ self.cphf_guess[name] @ S @ self.Co
+
+    def get_cphf_guess(self):
+        """
+        AO-basis v-o CP-HF solutions (``Z``, ``D_r``) already evaluated by this instance, to be used as
+        ``cphf_guess`` of the same method at a nearby geometry.
+
+        Returns
+        -------
+        dict
+        """
+        sv, so = self.sv, self.so
+        guess = {}
+        for name in ("Z", "D_r"):
+            X = getattr(self, "_" + name, NotImplemented)
+            if X is not NotImplemented:
+                X_vo = X if name == "Z" else X[sv, so]
+                guess[name] = self.Cv @ X_vo @ self.Co.T
+        return guess
+
     @property
     def U_1_vo(self):
         return self.U_1[:, self.sv, self.so]
@@ -353,14 +595,13 @@ class DerivOnceSCF(ABC):
         F_1_mo = self.F_1_mo
         U_1 = self.U_1
         e = self.e
-        Ax0_Core = self.Ax0_Core
         so, sa = self.so, self.sa
 
         pdA_F_0_mo = (
             + F_1_mo
             + einsum("Apq, p -> Apq", U_1, e)
             + einsum("Aqp, q -> Apq", U_1, e)
-            + Ax0_Core(sa, sa, sa, so)(U_1[:, :, so])
+            + self.Ax0_Core_batch((sa, sa, sa, so, U_1[:, :, so]))[0]
         )
         return pdA_F_0_mo
 
@@ -378,6 +619,12 @@ class DerivOnceSCF(ABC):
             mf.grids = self.cphf_grids
             return _gen_rhf_response(mf, mo_coeff=self.C, mo_occ=self.mo_occ, hermi=1, max_memory=self.grdit_memory)
 
+    @cached_property
+    def resp_anti(self):
+        # Response of anti-symmetric density; only exchange contributes
+        return _gen_rhf_response(self.scf_eng, mo_coeff=self.C, mo_occ=self.mo_occ, hermi=2,
+                                 max_memory=self.grdit_memory)
+
     # endregion
 
     # region Utility functions
@@ -386,7 +633,7 @@ class DerivOnceSCF(ABC):
         _, _, p0, p1 = self.mol.aoslice_by_atom()[atm_id]
         return slice(p0, p1)
 
-    def Ax0_Core(self, si, sj, sk, sl, reshape=True, in_cphf=False, C=None):
+    def Ax0_Core(self, si, sj, sk, sl, reshape=True, in_cphf=False, C=None, antisym=False):
         """
 
         Parameters
@@ -402,6 +649,9 @@ class DerivOnceSCF(ABC):
         reshape : bool
         in_cphf : bool
             if ``in_cphf``, use ``self.cphf_grids`` instead of usual grid.
+        antisym : bool
+            if ``antisym``, density is anti-symmetrized instead of symmetrized, i.e. response of imaginary orbital
+            rotations in dynamic (frequency-dependent) response; only exchange contributes.
 
         Returns
         -------
@@ -411,6 +661,8 @@ class DerivOnceSCF(ABC):
             C = self.C
         nao = self.nao
         resp = self.resp_cphf if in_cphf else self.resp
+        if antisym:
+            resp = self.resp_anti
 
         sij_none = si is None and sj is None
         skl_none = sk is None and sl is None
@@ -428,7 +680,10 @@ class DerivOnceSCF(ABC):
                     raise ValueError("if `sk`, `sl` is None, we assume that X passed in is an AO-based matrix!")
             else:
                 dm = C[:, sk] @ X @ C[:, sl].T
-            dm += dm.transpose((0, 2, 1))
+            if antisym:
+                dm -= dm.transpose((0, 2, 1))
+            else:
+                dm += dm.transpose((0, 2, 1))
 
             ax_ao = resp(dm) * 2
 
@@ -477,16 +732,110 @@ class DerivOnceSCF(ABC):
 
         return fx
 
+    def Ax0_Core_batch(self, *requests, in_cphf=False):
+        """
+        Batched and memoized ``Ax0_Core``.
+
+        Results are memoized by identity of ``X`` (data pointer, shape and strides) and slices, so ``X`` should not be
+        modified in place afterwards; requests that are not evaluated before are transformed to AO densities and
+        concatenated into one call of response function.
+
+        Parameters
+        ----------
+        requests: tuple
+            Each of ``(si, sj, sk, sl, X)``, which refers to ``Ax0_Core(si, sj, sk, sl)(X)``.
+        in_cphf : bool
+
+        Returns
+        -------
+        list of np.ndarray
+            Result of each request; should not be modified in place.
+        """
+        C = self.C
+        memo = self._Ax0_memo
+
+        def get_key(si, sj, sk, sl, X):
+            slices = tuple((s.start, s.stop, s.step) for s in (si, sj, sk, sl))
+            return slices + (X.__array_interface__["data"][0], X.shape, X.strides, in_cphf)
+
+        keys = [get_key(*req) if isinstance(req[-1], np.ndarray) else None for req in requests]
+        todo = {}
+        for key, req in zip(keys, requests):
+            if key is not None and key not in memo:
+                todo[key] = req
+
+        if todo:
+            dms = [C[:, sk] @ X.reshape((-1, ) + X.shape[-2:]) @ C[:, sl].T for _, _, sk, sl, X in todo.values()]
+            ax_ao = self.Ax0_Core(None, None, None, None, reshape=False, in_cphf=in_cphf)(np.concatenate(dms))
+            p0 = 0
+            for (key, (si, sj, _, _, X)), dm in zip(todo.items(), dms):
+                p1 = p0 + dm.shape[0]
+                ax = einsum("Auv, ui, vj -> Aij", ax_ao[p0:p1], C[:, si], C[:, sj])
+                memo[key] = (X, ax.reshape(X.shape[:-2] + ax.shape[-2:]))
+                p0 = p1
+
+        return [memo[key][1] if key is not None else 0 for key in keys]
+
     @abstractmethod
     def Ax1_Core(self, si, sj, sk, sl, reshape=True):
         pass
 
+    def directional(self, v):
+        """
+        Copy of this instance, in which all perturbations are combined into one perturbation
+        :math:`\\sum_\\mathbb{A} v_\\mathbb{A} \\mathbb{A}`, or into several perturbations by columns of ``v``.
+
+        Perturbation-independent quantities are shared with this instance. First-order AO quantities are
+        contracted with ``v``, so that responses (``U_1``, ``pdA_*``, ...) are solved for the combined perturbations
+        only; if ``U_1`` of this instance is already evaluated, it is contracted instead.
+
+        Parameters
+        ----------
+        v: np.ndarray
+            Combination coefficients, shape (number of perturbations, ) or (number of perturbations, k).
+
+        Returns
+        -------
+        DerivOnceSCF
+            Instance with one (or k) perturbations.
+        """
+        v = np.asarray(v)
+        v = v.reshape((v.shape[0], -1))
+
+        def is_perturbed(key):
+            # Cached properties of perturbation derivatives are named like ``_U_1``, ``_eri1_ao`` or ``_pdA_*``
+            names = key[1:].split("_")
+            return key.startswith("_") and (names[0] in ("pdA", "eri1") or "1" in names)
+
+        deriv = copy.copy(self)
+        deriv.__dict__ = {key: val for key, val in self.__dict__.items() if not is_perturbed(key)}
+        for name in ["H_1_ao", "F_1_ao", "S_1_ao"]:
+            X = getattr(self, name)
+            setattr(deriv, "_" + name, np.tensordot(v, X, axes=([0], [0])) if isinstance(X, np.ndarray) else X)
+        deriv._S_1_ao_block = None
+        # Orbital response is linear in perturbation
+        if isinstance(self.__dict__.get("_U_1"), np.ndarray):
+            deriv._U_1 = np.tensordot(v, self._U_1, axes=([0], [0]))
+
+        def Ax1_Core(si, sj, sk, sl, reshape=True):
+            fx_full = self.Ax1_Core(si, sj, sk, sl, reshape=reshape)
+
+            def fx(X):
+                ax = fx_full(X)
+                return np.tensordot(v, ax, axes=([0], [0])) if isinstance(ax, np.ndarray) else ax
+            return fx
+
+        deriv.Ax1_Core = Ax1_Core
+        return deriv
+
     # endregion
 
 
 # Cubic Inheritance: B1
 class DerivOnceNCDFT(DerivOnceSCF, ABC):
 
+    shared_properties = ("Z", )
+
     def __init__(self, config):
         super(DerivOnceNCDFT, self).__init__(config)
         config_nc = copy.copy(config)
@@ -496,19 +845,40 @@ class DerivOnceNCDFT(DerivOnceSCF, ABC):
         self.nc_deriv.C = self.C
         self.nc_deriv.mo_occ = self.mo_occ
         self.nc_deriv.nocc = self.nocc
+        # SCF and non-consistent functionals differ only by exchange coefficients and XC part of the same density,
+        # so Coulomb and exchange integrals are evaluated once by this instance, if evaluated the same way
+        scf_df, nc_df = getattr(self.scf_eng, "with_df", None), getattr(self.nc_deriv.scf_eng, "with_df", None)
+        if (scf_df is None and nc_df is None) or (scf_df is not None and nc_df is not None
+                                                  and scf_df.auxbasis == nc_df.auxbasis):
+            self.nc_deriv.jk_deriv = self
+            self.jk_cx = [self.cx, self.nc_deriv.cx]
 
     @property
     @abstractmethod
     def DerivOnceMethod(self):
         pass
 
+    def directional(self, v):
+        deriv = super(DerivOnceNCDFT, self).directional(v)
+        deriv.nc_deriv = self.nc_deriv.directional(v)
+        return deriv
+
+    def _get_context_signature(self):
+        # Non-consistent energy, ``Z`` and relaxed densities also depend on non-consistent functional
+        nc_deriv = self.nc_deriv
+        return super(DerivOnceNCDFT, self)._get_context_signature() + (nc_deriv.scf_eng, nc_deriv.xc, nc_deriv.cx)
+
+    def share_context(self, other):
+        if not super(DerivOnceNCDFT, self).share_context(other):
+            return False
+        self.nc_deriv.share_context(other.nc_deriv)
+        return True
+
     @cached_property
     def Z(self):
         so, sv = self.so, self.sv
-        Ax0_Core = self.Ax0_Core
-        e, mo_occ = self.e, self.mo_occ
         F_0_mo = self.nc_deriv.F_0_mo
-        Z = cphf.solve(Ax0_Core(sv, so, sv, so, in_cphf=True), e, mo_occ, F_0_mo[sv, so], max_cycle=100, tol=self.cphf_tol)[0]
+        Z = self.solve_cphf_vo(F_0_mo[sv, so], "Z")
         return Z
 
     @cached_property
@@ -529,36 +899,234 @@ class DerivOnceNCDFT(DerivOnceSCF, ABC):
 
     @cached_property
     def eng(self):
-        return self.nc_deriv.scf_eng.energy_tot(dm=self.D)
+        return self.nc_deriv._get_eng_dm()
 
 
 # Cubic Inheritance: C1
 class DerivOnceMP2(DerivOnceSCF, ABC):
 
+    shared_properties = (
+        "eng_corr", "mp2_intermediates", "D_iajb", "t_iajb", "T_iajb", "D_r_oovv", "L", "D_r", "W_I",
+        "eri0_mo_blocks", "eri0_half", "eri0_tmpfiles",
+    )
+
     def __init__(self, config):
         super(DerivOnceMP2, self).__init__(config)
         self.cc = config.get("cc", 1.)
         self.os = config.get("os", 1.)
         self.ss = config.get("ss", 1.)
+        self.frozen = config.get("frozen", 0)
+        self.eri0_memory = config.get("eri0_memory", 2000)
+        self.eri0_outcore = config.get("eri0_outcore", False)
+        self._eri0_mo_blocks = {}
+        self._eri0_half = {}
+        self._eri0_tmpfiles = []
+        self.mp2_memory = config.get("mp2_memory", 2000)
+        self._mp2_batched = config.get("mp2_batched", None)
+
+    @property
+    def sf(self):
+        # Frozen core orbitals
+        return slice(0, self.frozen)
+
+    @property
+    def sc(self):
+        # Correlated occupied orbitals
+        return slice(self.frozen, self.nocc)
+
+    @property
+    def mp2_batched(self) -> bool:
+        # By default, occupied-batched intermediates are used once amplitudes t and T do not fit in mp2_memory
+        if self._mp2_batched is None:
+            self._mp2_batched = 2 * 8 * ((self.nocc - self.frozen) * self.nvir) ** 2 > self.mp2_memory * 1e6
+        return self._mp2_batched
+
+    def _get_eri0_mo_coeff(self, b):
+        return {"o": self.Co, "c": self.C[:, self.sc], "v": self.Cv, "a": self.C}[b]
+
+    def directional(self, v):
+        deriv = super(DerivOnceMP2, self).directional(v)
+        v = np.asarray(v)
+        deriv._eri1_ao = np.tensordot(v.reshape((v.shape[0], -1)), self.eri1_ao, axes=([0], [0]))
+        return deriv
+
+    def _get_U_1(self):
+        U_1 = super(DerivOnceMP2, self)._get_U_1()
+        if self.frozen and self.rotation:
+            # Frozen-core energy is not invariant to core-correlated rotations, so these blocks of U are kept
+            # canonical, i.e. the derivative of core-correlated Fock elements is zero
+            sf, sc, sv, so = self.sf, self.sc, self.sv, self.so
+            e = self.e
+            S_1_mo = self.S_1_mo if isinstance(self.S_1_mo, np.ndarray) else np.zeros_like(U_1)
+            Ax_fc = self.Ax0_Core(sf, sc, sv, so)(U_1[:, sv, so])
+            U_1[:, sf, sc] = - (Ax_fc + self.B_1[:, sf, sc]) / (e[sf, None] - e[None, sc])
+            U_1[:, sc, sf] = - S_1_mo[:, sc, sf] - U_1[:, sf, sc].swapaxes(-1, -2)
+        return U_1
+
+    def _get_eri0_half(self, pair):
+        # Half-transformed (pq|κλ) in temporary HDF5 file, shared by all blocks of the same first orbital pair
+        if pair not in self._eri0_half:
+            C1, C2 = [self._get_eri0_mo_coeff(b) for b in pair]
+            fswap = lib.H5TmpFile()
+            ao2mo.outcore.half_e1(self.mol, (C1, C2, C1, C2), fswap, max_memory=self.eri0_memory, compact=False)
+            self._eri0_half[pair] = fswap
+        return self._eri0_half[pair]
+
+    def get_eri0_mo(self, blocks, outcore=None):
+        """
+        Electron repulsion integrals in molecular orbital basis, restricted to requested orbital blocks.
+
+        First half of transformation is performed by PySCF's shell-batched, integral-direct ``ao2mo`` (``s4`` AO
+        symmetry, limited by ``eri0_memory``), and is shared among blocks of the same first orbital pair; second
+        half is performed by row batches of the first orbital pair. Neither ``eri0_ao`` nor full ``eri0_mo`` is
+        formed. If outcore, result is stored as memory-mapped file in PySCF's temporary directory.
+        ``s8`` symmetry is not used, since it pairs AO index pairs of both halves, which are never held together in
+        batched transformation (PySCF's ``half_e1`` only accepts ``s1``, ``s2ij``, ``s2kl`` and ``s4``); it would
+        require the whole ``eri0_ao``.
+        Each block is generated only once.
+
+        Parameters
+        ----------
+        blocks: str
+            Four characters, each of ``o`` (occupied), ``c`` (correlated occupied), ``v`` (virtual) or ``a``
+            (all orbitals); e.g. ``"ovov"`` refers to ``eri0_mo[so, sv, so, sv]``.
+        outcore: bool or None
+            Whether to store result in memory-mapped file; ``eri0_outcore`` by default.
+
+        Returns
+        -------
+        np.ndarray
+        """
+        if not self.frozen:
+            blocks = blocks.replace("c", "o").replace("C", "O")
+        if blocks in self._eri0_mo_blocks:
+            return self._eri0_mo_blocks[blocks]
+        if outcore is None:
+            outcore = self.eri0_outcore
+
+        nao = self.nao
+        C3, C4 = [self._get_eri0_mo_coeff(b) for b in blocks[2:]]
+        shape = tuple(self._get_eri0_mo_coeff(b).shape[-1] for b in blocks)
+        n12, n34 = shape[0] * shape[1], shape[2] * shape[3]
+
+        if outcore:
+            tmpfile = tempfile.NamedTemporaryFile(dir=lib.param.TMPDIR)
+            self._eri0_tmpfiles.append(tmpfile)
+            eri0_mo = np.memmap(tmpfile.name, dtype=np.float64, mode="w+", shape=shape)
+        else:
+            eri0_mo = np.empty(shape)
+
+        fswap = self._get_eri0_half(blocks[:2])
+        mosym, _, mokl, klshape = ao2mo.incore._conc_mos(C3, C4, False)
+        ao_loc = self.mol.ao_loc_nr()
+        blksize = max(int(self.eri0_memory * 1e6 / 8 / (nao ** 2 + n34)), 1)
+        for p0 in range(0, n12, blksize):
+            p1 = min(p0 + blksize, n12)
+            eri0_half = ao2mo.outcore._load_from_h5g(fswap["0"], p0, p1)
+            eri0_mo.reshape((n12, n34))[p0:p1] = _ao2mo.nr_e2(eri0_half, mokl, klshape, "s4", mosym, ao_loc=ao_loc)
+
+        self._eri0_mo_blocks[blocks] = eri0_mo
+        return eri0_mo
 
     # region Properties
     @cached_property
     def eng(self):
-        return self.scf_eng.e_tot + (self.T_iajb * self.t_iajb * self.D_iajb).sum()
+        return self.scf_eng.e_tot + self.eng_corr
+
+    @cached_property
+    def eng_corr(self):
+        if self.mp2_batched:
+            return self.mp2_intermediates["eng_corr"]
+        return (self.T_iajb * self.t_iajb * self.D_iajb).sum()
+
+    @cached_property
+    def mp2_intermediates(self):
+        return self._get_mp2_intermediates()
+
+    def _get_mp2_intermediates(self):
+        """
+        Occupied-batched MP2 intermediates, without storing amplitudes ``t_iajb`` or ``T_iajb``.
+
+        Amplitudes are generated batch by batch of first correlated occupied index (``_gen_mp2_batch``) from
+        memory-mapped (ov|ov), (oo|ov) and (ov|vv) integral blocks; batch size is chosen from ``mp2_memory``. Contractions that
+        run over all occupied indices of amplitudes are rewritten by the symmetry :math:`T_{ia, jb} = T_{jb, ia}`
+        so that the summed occupied index is always the batched one.
+
+        Returns
+        -------
+        dict
+            ``eng_corr``: correlation energy; ``D_r_oovv``: occupied-occupied and virtual-virtual blocks of
+            relaxed density; ``W_I``: energy-weighted density; ``L_T``: amplitude contribution to Lagrangian.
+        """
+        nocc, nvir, nmo = self.nocc, self.nvir, self.nmo
+        so, sv, sc = self.so, self.sv, self.sc
+
+        eri0_ovov = self.get_eri0_mo("cvov", outcore=True)
+        eri0_ooov = self.get_eri0_mo("cocv", outcore=True)
+        eri0_ovvv = self.get_eri0_mo("cvvv", outcore=True)
+
+        eng_corr = 0
+        D_r_oovv = np.zeros((nmo, nmo))
+        W_I = np.zeros((nmo, nmo))
+        L_T = np.zeros((nvir, nocc))
+
+        # (ov|ov), (ov|vv) and (oo|ov) slices are read along with amplitudes;
+        # the non-batched indices of these slices run over all occupied orbitals
+        for sI, g, t, T, D in self._gen_mp2_batch(footprint=nvir ** 3 + 2 * nocc ** 2 * nvir):
+            eng_corr += (T * t * D).sum()
+            D_r_oovv[sc, sc] -= 2 * einsum("kbia, kbja -> ij", T, t)
+            D_r_oovv[sv, sv] += 2 * einsum("iajc, ibjc -> ab", T, t)
+            W_I[sc, so] -= 2 * einsum("kbia, kbja -> ij", T, np.asarray(eri0_ovov[sI]))
+            W_I[sv, sv] -= 2 * einsum("iajc, ibjc -> ab", T, g)
+            W_I[sv, so] -= 4 * einsum("jakb, jikb -> ai", T, np.asarray(eri0_ooov[sI]))
+            L_T[:, sc] += 4 * einsum("jcib, jcab -> ai", T, np.asarray(eri0_ovvv[sI]))
+
+        L_T += W_I[sv, so]
+        return {"eng_corr": eng_corr, "D_r_oovv": D_r_oovv, "W_I": W_I, "L_T": L_T}
+
+    def _gen_mp2_batch(self, footprint=0):
+        """
+        Generate MP2 amplitudes by batches of first correlated occupied index, from memory-mapped (ov|ov) block.
+
+        Parameters
+        ----------
+        footprint: int
+            Additional float64 numbers that caller holds per occupied index; batch size is chosen from
+            ``mp2_memory`` with amplitudes, integrals and denominators (four ov-ov slices) besides.
+
+        Yields
+        ------
+        tuple
+            Slice of occupied batch, and (ov|ov) integrals, amplitudes ``t``, ``T`` and denominators of this batch.
+        """
+        nvir = self.nvir
+        eo, ev = self.e[self.sc], self.ev
+        ncorr = eo.size
+        cc, os, ss = self.cc, self.os, self.ss
+        eri0_ovov = self.get_eri0_mo("cvcv", outcore=True)
+
+        blksize = max(int(self.mp2_memory * 1e6 / 8 / (4 * ncorr * nvir ** 2 + footprint)), 1)
+        for i0 in range(0, ncorr, blksize):
+            i1 = min(i0 + blksize, ncorr)
+            g = np.asarray(eri0_ovov[i0:i1])
+            D = eo[i0:i1, None, None, None] - ev[None, :, None, None] + eo[None, None, :, None] - ev[None, None, None, :]
+            t = g / D
+            T = cc * ((os + ss) * t - ss * t.swapaxes(-1, -3))
+            yield slice(i0, i1), g, t, T, D
 
     @cached_property
     def D_iajb(self):
+        eo = self.e[self.sc]
         return (
-            + self.eo[:, None, None, None]
+            + eo[:, None, None, None]
             - self.ev[None, :, None, None]
-            + self.eo[None, None, :, None]
+            + eo[None, None, :, None]
             - self.ev[None, None, None, :]
         )
 
     @cached_property
     def t_iajb(self):
-        so, sv = self.so, self.sv
-        return self.eri0_mo[so, sv, so, sv] / self.D_iajb
+        return self.get_eri0_mo("cvcv") / self.D_iajb
 
     @cached_property
     def T_iajb(self):
@@ -567,11 +1135,19 @@ class DerivOnceMP2(DerivOnceSCF, ABC):
     @cached_property
     def D_r_oovv(self):
         nmo = self.nmo
-        so, sv = self.so, self.sv
-        T_iajb, t_iajb = self.T_iajb, self.t_iajb
-        D_r_oovv = np.zeros((nmo, nmo))
-        D_r_oovv[so, so] = - 2 * np.einsum("iakb, jakb -> ij", T_iajb, t_iajb)
-        D_r_oovv[sv, sv] = 2 * np.einsum("iajc, ibjc -> ab", T_iajb, t_iajb)
+        sf, sc, sv = self.sf, self.sc, self.sv
+        if self.mp2_batched:
+            D_r_oovv = self.mp2_intermediates["D_r_oovv"]
+        else:
+            T_iajb, t_iajb = self.T_iajb, self.t_iajb
+            D_r_oovv = np.zeros((nmo, nmo))
+            D_r_oovv[sc, sc] = - 2 * einsum("iakb, jakb -> ij", T_iajb, t_iajb)
+            D_r_oovv[sv, sv] = 2 * einsum("iajc, ibjc -> ab", T_iajb, t_iajb)
+        if self.frozen:
+            # Core-correlated block, which accounts for canonical condition of core-correlated orbital rotations
+            e = self.e
+            D_r_oovv[sc, sf] = self.W_I[sc, sf] / (e[None, sf] - e[sc, None])
+            D_r_oovv[sf, sc] = D_r_oovv[sc, sf].T
         return D_r_oovv
 
     @cached_property
@@ -582,12 +1158,14 @@ class DerivOnceMP2(DerivOnceSCF, ABC):
         nvir, nocc, nmo = self.nvir, self.nocc, self.nmo
         so, sv, sa = self.so, self.sv, self.sa
         Ax0_Core = self.Ax0_Core
-        eri0_mo = self.eri0_mo
-        T_iajb, t_iajb = self.T_iajb, self.t_iajb
         L = np.zeros((nvir, nocc))
         L += Ax0_Core(sv, so, sa, sa)(self.D_r_oovv)
-        L -= 4 * np.einsum("jakb, ijbk -> ai", T_iajb, eri0_mo[so, so, sv, so])
-        L += 4 * np.einsum("ibjc, abjc -> ai", T_iajb, eri0_mo[sv, sv, so, sv])
+        if self.mp2_batched:
+            L += self.mp2_intermediates["L_T"]
+            return L
+        T_iajb = self.T_iajb
+        L -= 4 * einsum("jakb, ijbk -> ai", T_iajb, self.get_eri0_mo("ocvc"))
+        L[:, self.sc] += 4 * einsum("ibjc, abjc -> ai", T_iajb, self.get_eri0_mo("vvcv"))
         return L
 
     @cached_property
@@ -596,8 +1174,7 @@ class DerivOnceMP2(DerivOnceSCF, ABC):
         D_r = np.copy(self.D_r_oovv)
         so, sv = self.so, self.sv
         Ax0_Core = self.Ax0_Core
-        e, mo_occ = self.e, self.mo_occ
-        D_r[sv, so] = cphf.solve(Ax0_Core(sv, so, sv, so, in_cphf=True), e, mo_occ, L, max_cycle=100, tol=self.cphf_tol)[0]
+        D_r[sv, so] = self.solve_cphf_vo(L, "D_r")
         conv = (
             + D_r[sv, so] * (self.ev[:, None] - self.eo[None, :])
             + Ax0_Core(sv, so, sv, so)(D_r[sv, so]) + L
@@ -609,14 +1186,15 @@ class DerivOnceMP2(DerivOnceSCF, ABC):
 
     @cached_property
     def W_I(self):
-        so, sv = self.so, self.sv
+        if self.mp2_batched:
+            return self.mp2_intermediates["W_I"]
+        so, sv, sc = self.so, self.sv, self.sc
         nmo = self.nmo
         T_iajb = self.T_iajb
-        eri0_mo = self.eri0_mo
         W_I = np.zeros((nmo, nmo))
-        W_I[so, so] = - 2 * np.einsum("iakb, jakb -> ij", T_iajb, eri0_mo[so, sv, so, sv])
-        W_I[sv, sv] = - 2 * np.einsum("iajc, ibjc -> ab", T_iajb, eri0_mo[so, sv, so, sv])
-        W_I[sv, so] = - 4 * np.einsum("jakb, ijbk -> ai", T_iajb, eri0_mo[so, so, sv, so])
+        W_I[sc, so] = - 2 * einsum("iakb, jakb -> ij", T_iajb, self.get_eri0_mo("ovcv"))
+        W_I[sv, sv] = - 2 * einsum("iajc, ibjc -> ab", T_iajb, self.get_eri0_mo("cvcv"))
+        W_I[sv, so] = - 4 * einsum("jakb, ijbk -> ai", T_iajb, self.get_eri0_mo("ocvc"))
         return W_I
 
     @cached_property
@@ -625,26 +1203,26 @@ class DerivOnceMP2(DerivOnceSCF, ABC):
         U_1 = self.U_1
         pdA_eri0_mo = (
             + self.eri1_mo
-            + np.einsum("pjkl, Api -> Aijkl", eri0_mo, U_1)
-            + np.einsum("ipkl, Apj -> Aijkl", eri0_mo, U_1)
-            + np.einsum("ijpl, Apk -> Aijkl", eri0_mo, U_1)
-            + np.einsum("ijkp, Apl -> Aijkl", eri0_mo, U_1)
+            + einsum("pjkl, Api -> Aijkl", eri0_mo, U_1)
+            + einsum("ipkl, Apj -> Aijkl", eri0_mo, U_1)
+            + einsum("ijpl, Apk -> Aijkl", eri0_mo, U_1)
+            + einsum("ijkp, Apl -> Aijkl", eri0_mo, U_1)
         )
         return pdA_eri0_mo
 
     @cached_property
     def pdA_t_iajb(self):
-        so, sv = self.so, self.sv
+        sc, sv = self.sc, self.sv
         D_iajb = self.D_iajb
         pdA_F_0_mo = self.pdA_F_0_mo
         t_iajb = self.t_iajb
         pdA_eri0_mo = self.pdA_eri0_mo
         pdA_t_iajb = (
-            + pdA_eri0_mo[:, so, sv, so, sv]
-            - np.einsum("Aki, kajb -> Aiajb", pdA_F_0_mo[:, so, so], t_iajb)
-            - np.einsum("Akj, iakb -> Aiajb", pdA_F_0_mo[:, so, so], t_iajb)
-            + np.einsum("Aca, icjb -> Aiajb", pdA_F_0_mo[:, sv, sv], t_iajb)
-            + np.einsum("Acb, iajc -> Aiajb", pdA_F_0_mo[:, sv, sv], t_iajb)
+            + pdA_eri0_mo[:, sc, sv, sc, sv]
+            - einsum("Aki, kajb -> Aiajb", pdA_F_0_mo[:, sc, sc], t_iajb)
+            - einsum("Akj, iakb -> Aiajb", pdA_F_0_mo[:, sc, sc], t_iajb)
+            + einsum("Aca, icjb -> Aiajb", pdA_F_0_mo[:, sv, sv], t_iajb)
+            + einsum("Acb, iajc -> Aiajb", pdA_F_0_mo[:, sv, sv], t_iajb)
         ) / D_iajb
         return pdA_t_iajb
 
@@ -654,31 +1232,42 @@ class DerivOnceMP2(DerivOnceSCF, ABC):
 
     @cached_property
     def pdA_D_r_oovv(self):
-        so, sv = self.so, self.sv
+        sf, sc, sv = self.sf, self.sc, self.sv
         nmo = self.nmo
 
         pdB_D_r_oovv = np.zeros((self.pdA_t_iajb.shape[0], nmo, nmo))
-        pdB_D_r_oovv[:, so, so] -= 2 * np.einsum("iakb, Ajakb -> Aij", self.T_iajb, self.pdA_t_iajb)
-        pdB_D_r_oovv[:, sv, sv] += 2 * np.einsum("iajc, Aibjc -> Aab", self.T_iajb, self.pdA_t_iajb)
-        pdB_D_r_oovv[:, so, so] -= 2 * np.einsum("Aiakb, jakb -> Aij", self.pdA_T_iajb, self.t_iajb)
-        pdB_D_r_oovv[:, sv, sv] += 2 * np.einsum("Aiajc, ibjc -> Aab", self.pdA_T_iajb, self.t_iajb)
+        pdB_D_r_oovv[:, sc, sc] -= 2 * einsum("iakb, Ajakb -> Aij", self.T_iajb, self.pdA_t_iajb)
+        pdB_D_r_oovv[:, sv, sv] += 2 * einsum("iajc, Aibjc -> Aab", self.T_iajb, self.pdA_t_iajb)
+        pdB_D_r_oovv[:, sc, sc] -= 2 * einsum("Aiakb, jakb -> Aij", self.pdA_T_iajb, self.t_iajb)
+        pdB_D_r_oovv[:, sv, sv] += 2 * einsum("Aiajc, ibjc -> Aab", self.pdA_T_iajb, self.t_iajb)
+
+        if self.frozen:
+            # Derivative of X_iI (e_I - e_i) = W_iI, where occupied blocks of Fock derivative are not diagonal
+            e, pdA_F_0_mo = self.e, self.pdA_F_0_mo
+            D_fc = self.D_r_oovv[sc, sf]
+            pdB_D_r_oovv[:, sc, sf] = (
+                + self.pdA_W_I[:, sc, sf]
+                - einsum("iJ, AJI -> AiI", D_fc, pdA_F_0_mo[:, sf, sf])
+                + einsum("Aij, jI -> AiI", pdA_F_0_mo[:, sc, sc], D_fc)
+            ) / (e[None, sf] - e[sc, None])
+            pdB_D_r_oovv[:, sf, sc] = pdB_D_r_oovv[:, sc, sf].swapaxes(-1, -2)
 
         return pdB_D_r_oovv
 
     @cached_property
     def pdA_W_I(self):
-        so, sv = self.so, self.sv
-        natm, nmo = self.natm, self.nmo
+        so, sv, sc = self.so, self.sv, self.sc
+        nmo = self.nmo
         pdA_T_iajb, T_iajb = self.pdA_T_iajb, self.T_iajb
         eri0_mo, pdA_eri0_mo = self.eri0_mo, self.pdA_eri0_mo
 
-        pdR_W_I = np.zeros((natm * 3, nmo, nmo))
-        pdR_W_I[:, so, so] -= 2 * np.einsum("Aiakb, jakb -> Aij", pdA_T_iajb, eri0_mo[so, sv, so, sv])
-        pdR_W_I[:, sv, sv] -= 2 * np.einsum("Aiajc, ibjc -> Aab", pdA_T_iajb, eri0_mo[so, sv, so, sv])
-        pdR_W_I[:, sv, so] -= 4 * np.einsum("Ajakb, ijbk -> Aai", pdA_T_iajb, eri0_mo[so, so, sv, so])
-        pdR_W_I[:, so, so] -= 2 * np.einsum("iakb, Ajakb -> Aij", T_iajb, pdA_eri0_mo[:, so, sv, so, sv])
-        pdR_W_I[:, sv, sv] -= 2 * np.einsum("iajc, Aibjc -> Aab", T_iajb, pdA_eri0_mo[:, so, sv, so, sv])
-        pdR_W_I[:, sv, so] -= 4 * np.einsum("jakb, Aijbk -> Aai", T_iajb, pdA_eri0_mo[:, so, so, sv, so])
+        pdR_W_I = np.zeros((pdA_T_iajb.shape[0], nmo, nmo))
+        pdR_W_I[:, sc, so] -= 2 * einsum("Aiakb, jakb -> Aij", pdA_T_iajb, eri0_mo[so, sv, sc, sv])
+        pdR_W_I[:, sv, sv] -= 2 * einsum("Aiajc, ibjc -> Aab", pdA_T_iajb, eri0_mo[sc, sv, sc, sv])
+        pdR_W_I[:, sv, so] -= 4 * einsum("Ajakb, ijbk -> Aai", pdA_T_iajb, eri0_mo[so, sc, sv, sc])
+        pdR_W_I[:, sc, so] -= 2 * einsum("iakb, Ajakb -> Aij", T_iajb, pdA_eri0_mo[:, so, sv, sc, sv])
+        pdR_W_I[:, sv, sv] -= 2 * einsum("iajc, Aibjc -> Aab", T_iajb, pdA_eri0_mo[:, sc, sv, sc, sv])
+        pdR_W_I[:, sv, so] -= 4 * einsum("jakb, Aijbk -> Aai", T_iajb, pdA_eri0_mo[:, so, sc, sv, sc])
 
         return pdR_W_I
 
@@ -695,4 +1284,4 @@ class DerivOnceXDH(DerivOnceMP2, DerivOnceNCDFT, ABC):
 
     @cached_property
     def eng(self):
-        return self.nc_deriv.scf_eng.energy_tot(dm=self.D) + (self.T_iajb * self.t_iajb * self.D_iajb).sum()
+        return self.nc_deriv._get_eng_dm() + self.eng_corr
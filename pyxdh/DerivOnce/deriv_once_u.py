@@ -1,6 +1,6 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # python utilities
 from abc import ABC
 import warnings
@@ -94,6 +94,10 @@ class DerivOnceUSCF(DerivOnceSCF, ABC):
         eri0_mo[2] = einsum("uvkl, up, vq, kr, ls -> pqrs", eri0_ao, C[1], C[1], C[1], C[1])
         return eri0_mo
 
+    @cached_property
+    def F_0_ao(self) -> np.ndarray:
+        return self.scf_eng.get_fock(dm=self.D)
+
     @cached_property
     def F_0_mo(self) -> np.ndarray:
         return einsum("xup, xuv, xvq -> xpq", self.C, self.F_0_ao, self.C)
@@ -106,6 +110,8 @@ class DerivOnceUSCF(DerivOnceSCF, ABC):
 
     @cached_property
     def S_1_mo(self) -> np.ndarray:
+        if self.S_1_ao_block is not None:
+            return np.array([self.S_1_ao_block.to_mo(self.C[0]), self.S_1_ao_block.to_mo(self.C[1])])
         if not isinstance(self.S_1_ao, np.ndarray):
             return 0
         return einsum("Auv, xup, xvq -> xApq", self.S_1_ao, self.C, self.C)
@@ -194,8 +200,7 @@ class DerivOnceUSCF(DerivOnceSCF, ABC):
 
         return fx
 
-    @cached_property
-    def U_1(self):
+    def _get_U_1(self):
         B_1 = self.B_1
         S_1_mo = self.S_1_mo
         if not isinstance(S_1_mo, np.ndarray):
@@ -269,6 +274,47 @@ class DerivOnceUSCF(DerivOnceSCF, ABC):
 
         return U_1
 
+    def solve_cphf_vo(self, rhs, name=None):
+        sv, so = self.sv, self.so
+        nocc, nvir = self.nocc, self.nvir
+        Ax0_Core = self.Ax0_Core(sv, so, sv, so, in_cphf=True)
+        cycles = [0]
+
+        def fx(X):
+            cycles[0] += 1
+            X_alpha = X[:, :nocc[0] * nvir[0]].reshape((nvir[0], nocc[0]))
+            X_beta = X[:, nocc[0] * nvir[0]:].reshape((nvir[1], nocc[1]))
+            Ax = Ax0_Core((X_alpha, X_beta))
+            return np.concatenate([Ax[0].reshape(-1), Ax[1].reshape(-1)])
+
+        X0 = self._get_cphf_guess_vo(name)
+        if X0 is not None:
+            Ax_X0 = Ax0_Core(X0)
+            rhs = tuple(rhs[x] + X0[x] * (self.ev[x][:, None] - self.eo[x][None, :]) + Ax_X0[x] for x in range(2))
+        X = ucphf.solve(fx, self.e, self.mo_occ, rhs, max_cycle=100, tol=self.cphf_tol)[0]
+        if X0 is not None:
+            X = (X[0] + X0[0], X[1] + X0[1])
+        if name is not None:
+            self.cphf_cycles[name] = cycles[0]
+        return X
+
+    def _get_cphf_guess_vo(self, name):
+        if name not in self.cphf_guess:
+            return None
+        S, Co, Cv = self.S_0_ao, self.Co, self.Cv
+        return tuple(Cv[x].T @ S @ self.cphf_guess[name][x] @ S @ Co[x] for x in range(2))
+
+    def get_cphf_guess(self):
+        sv, so = self.sv, self.so
+        Co, Cv = self.Co, self.Cv
+        guess = {}
+        for name in ("Z", "D_r"):
+            X = getattr(self, "_" + name, NotImplemented)
+            if X is not NotImplemented:
+                X_vo = X if name == "Z" else (X[0][sv[0], so[0]], X[1][sv[1], so[1]])
+                guess[name] = np.array([Cv[x] @ X_vo[x] @ Co[x].T for x in range(2)])
+        return guess
+
     @cached_property
     def resp(self) -> Callable:
         return _gen_uhf_response(self.scf_eng, mo_coeff=self.C, mo_occ=self.mo_occ, hermi=1, max_memory=self.grdit_memory)
@@ -283,33 +329,148 @@ class DerivOnceUSCF(DerivOnceSCF, ABC):
             mf.grids = self.cphf_grids
             return _gen_uhf_response(mf, mo_coeff=self.C, mo_occ=self.mo_occ, hermi=1, max_memory=self.grdit_memory)
 
+    def _get_eng_dm(self):
+        return self.scf_eng.energy_tot(dm=self.D)
+
 
 class DerivOnceUNCDFT(DerivOnceUSCF, DerivOnceNCDFT):
 
     @cached_property
     def Z(self):
         so, sv = self.so, self.sv
-        nocc, nvir = self.nocc, self.nvir
-        Ax0_Core = self.Ax0_Core
-        e, mo_occ = self.e, self.mo_occ
         F_0_mo = self.nc_deriv.F_0_mo
-        def fx(X):
-            X_ = (
-                X[:, :nocc[0] * nvir[0]].reshape((nvir[0], nocc[0])),
-                X[:, nocc[0] * nvir[0]:].reshape((nvir[1], nocc[1]))
-            )
-            return np.concatenate([v.ravel() for v in Ax0_Core(sv, so, sv, so, in_cphf=True)(X_)])
-        Z = ucphf.solve(fx, e, mo_occ, (F_0_mo[0, None, sv[0], so[0]], F_0_mo[1, None, sv[1], so[1]]), max_cycle=100, tol=self.cphf_tol)[0]
-        # output Z shape is (1, nvir, nocc), we remove the first dimension
-        Z = (Z[0][0], Z[1][0])
+        Z = self.solve_cphf_vo((F_0_mo[0, sv[0], so[0]], F_0_mo[1, sv[1], so[1]]), "Z")
         return Z
 
 
 class DerivOnceUMP2(DerivOnceUSCF, DerivOnceMP2, ABC):
 
+    @property
+    def sf(self) -> Tuple[slice, slice]:
+        return slice(0, self.frozen), slice(0, self.frozen)
+
+    @property
+    def sc(self) -> Tuple[slice, slice]:
+        return slice(self.frozen, self.nocc[0]), slice(self.frozen, self.nocc[1])
+
+    @property
+    def mp2_batched(self) -> bool:
+        # Amplitudes t and T of all three spin blocks are counted
+        if self._mp2_batched is None:
+            nov = [(self.nocc[0] - self.frozen) * self.nvir[0], (self.nocc[1] - self.frozen) * self.nvir[1]]
+            self._mp2_batched = 2 * 8 * (nov[0] ** 2 + nov[0] * nov[1] + nov[1] ** 2) > self.mp2_memory * 1e6
+        return self._mp2_batched
+
+    def _get_eri0_mo_coeff(self, b):
+        # Lower case for alpha orbitals, upper case for beta orbitals
+        sc = self.sc
+        return {
+            "o": self.Co[0], "c": self.C[0][:, sc[0]], "v": self.Cv[0], "a": self.C[0],
+            "O": self.Co[1], "C": self.C[1][:, sc[1]], "V": self.Cv[1], "A": self.C[1],
+        }[b]
+
+    def _get_U_1(self):
+        U_1 = super(DerivOnceUMP2, self)._get_U_1()
+        if self.frozen and self.rotation:
+            # Core-correlated blocks of U are kept canonical, see DerivOnceMP2
+            sf, sc, sv, so = self.sf, self.sc, self.sv, self.so
+            e = self.e
+            S_1_mo = self.S_1_mo if isinstance(self.S_1_mo, np.ndarray) else np.zeros_like(U_1)
+            Ax_fc = self.Ax0_Core(sf, sc, sv, so)((U_1[0, :, sv[0], so[0]], U_1[1, :, sv[1], so[1]]))
+            for x in range(2):
+                U_1[x, :, sf[x], sc[x]] = (
+                    - (Ax_fc[x] + self.B_1[x, :, sf[x], sc[x]]) / (e[x, sf[x], None] - e[x, None, sc[x]]))
+                U_1[x, :, sc[x], sf[x]] = - S_1_mo[x, :, sc[x], sf[x]] - U_1[x, :, sf[x], sc[x]].swapaxes(-1, -2)
+        return U_1
+
+    def _get_mp2_intermediates(self):
+        """
+        Occupied-batched unrestricted MP2 intermediates, without storing amplitudes ``t_iajb`` or ``T_iajb``.
+
+        Spin blocks are processed independently, and only one batch of one spin block's amplitudes is held at a
+        time. A pass :math:`(\\sigma, \\tau)` batches first occupied index of amplitudes
+        :math:`T_{i_\\sigma a_\\sigma, j_\\tau b_\\tau}`, and contributes virtual-virtual blocks and
+        :math:`W_{ai}` of spin :math:`\\sigma`, occupied-occupied blocks and virtual-virtual part of Lagrangian of
+        spin :math:`\\tau`. Same-spin passes cover all terms of their spin block; alpha-beta amplitudes are
+        generated twice, once batched by alpha and once by beta occupied index. Integral blocks are taken from
+        ``get_eri0_mo``, so all blocks of the same first orbital pair share one half-transformation.
+
+        Returns
+        -------
+        dict
+            ``eng_corr``: correlation energy; ``D_r_oovv``: occupied-occupied and virtual-virtual blocks of
+            relaxed density; ``W_I``: energy-weighted density; ``L_T``: amplitude contribution to Lagrangian.
+        """
+        nocc, nvir, nmo = self.nocc, self.nvir, self.nmo
+        so, sv, sc = self.so, self.sv, self.sc
+
+        eng_corr = 0
+        D_r_oovv = np.zeros((2, nmo, nmo))
+        W_I = np.zeros((2, nmo, nmo))
+        L_T = (np.zeros((nvir[0], nocc[0])), np.zeros((nvir[1], nocc[1])))
+
+        for y, z in [(0, 0), (1, 1), (0, 1), (1, 0)]:
+            cy, oy, vy, oz, cz, vz = "cC"[y], "oO"[y], "vV"[y], "oO"[z], "cC"[z], "vV"[z]
+            s = 2 if y == z else 1
+            eri0_ovov = self.get_eri0_mo(cy + vy + oz + vz, outcore=True)
+            eri0_ooov = self.get_eri0_mo(cy + oy + cz + vz, outcore=True)
+            eri0_ovvv = self.get_eri0_mo(cy + vy + vz + vz, outcore=True)
+            footprint = nvir[y] * nvir[z] ** 2 + nocc[y] * nocc[z] * nvir[z] + nvir[y] * nocc[z] * nvir[z]
+            for sI, g, t, T, D in self._gen_ump2_batch(y, z, footprint=footprint):
+                # Alpha-beta energy is counted only in the pass batched by alpha index
+                if y <= z:
+                    eng_corr += (T * t * D).sum()
+                D_r_oovv[z, sc[z], sc[z]] -= s * einsum("kbia, kbja -> ij", T, t)
+                D_r_oovv[y, sv[y], sv[y]] += s * einsum("iajc, ibjc -> ab", T, t)
+                W_I[z, sc[z], so[z]] -= s * einsum("kbia, kbja -> ij", T, np.asarray(eri0_ovov[sI]))
+                W_I[y, sv[y], sv[y]] -= s * einsum("iajc, ibjc -> ab", T, g)
+                W_I[y, sv[y], so[y]] -= 2 * s * einsum("jakb, jikb -> ai", T, np.asarray(eri0_ooov[sI]))
+                L_T[z][:, sc[z]] += 2 * s * einsum("jcib, jcab -> ai", T, np.asarray(eri0_ovvv[sI]))
+
+        L_T[0][:] += W_I[0, sv[0], so[0]]
+        L_T[1][:] += W_I[1, sv[1], so[1]]
+        return {"eng_corr": eng_corr, "D_r_oovv": D_r_oovv, "W_I": W_I, "L_T": L_T}
+
+    def _gen_ump2_batch(self, y, z, footprint=0):
+        """
+        Generate MP2 amplitudes of one spin block by batches of first correlated occupied index, from
+        memory-mapped (ov|ov) block.
+
+        Parameters
+        ----------
+        y: int
+            Spin of first orbital pair (0 for alpha, 1 for beta).
+        z: int
+            Spin of second orbital pair.
+        footprint: int
+            Additional float64 numbers that caller holds per occupied index.
+
+        Yields
+        ------
+        tuple
+            Slice of occupied batch, and (ov|ov) integrals, amplitudes ``t``, ``T`` and denominators of this batch.
+        """
+        nvir = self.nvir
+        eo, ev = (self.e[0, self.sc[0]], self.e[1, self.sc[1]]), self.ev
+        ncorr = eo[0].size, eo[1].size
+        cc, os, ss = self.cc, self.os, self.ss
+        eri0_ovov = self.get_eri0_mo("cC"[y] + "vV"[y] + "cC"[z] + "vV"[z], outcore=True)
+
+        blksize = max(int(self.mp2_memory * 1e6 / 8 / (4 * nvir[y] * ncorr[z] * nvir[z] + footprint)), 1)
+        for i0 in range(0, ncorr[y], blksize):
+            i1 = min(i0 + blksize, ncorr[y])
+            g = np.asarray(eri0_ovov[i0:i1])
+            D = (
+                + eo[y][i0:i1, None, None, None] - ev[y][None, :, None, None]
+                + eo[z][None, None, :, None] - ev[z][None, None, None, :]
+            )
+            t = g / D
+            T = 0.5 * cc * ss * (t - t.swapaxes(-1, -3)) if y == z else cc * os * t
+            yield slice(i0, i1), g, t, T, D
+
     @cached_property
     def D_iajb(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        eo, ev = self.eo, self.ev
+        eo, ev = (self.e[0, self.sc[0]], self.e[1, self.sc[1]]), self.ev
         D_iajb = (
             eo[0][:, None, None, None] - ev[0][None, :, None, None] + eo[0][None, None, :, None] - ev[0][None, None, None, :],
             eo[0][:, None, None, None] - ev[0][None, :, None, None] + eo[1][None, None, :, None] - ev[1][None, None, None, :],
@@ -319,13 +480,13 @@ class DerivOnceUMP2(DerivOnceUSCF, DerivOnceMP2, ABC):
 
     @cached_property
     def t_iajb(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        so, sv = self.so, self.sv
+        sc, sv = self.sc, self.sv
         eri0_mo = self.eri0_mo
         D_iajb = self.D_iajb
         t_iajb = (
-            eri0_mo[0][so[0], sv[0], so[0], sv[0]] / D_iajb[0],
-            eri0_mo[1][so[0], sv[0], so[1], sv[1]] / D_iajb[1],
-            eri0_mo[2][so[1], sv[1], so[1], sv[1]] / D_iajb[2]
+            eri0_mo[0][sc[0], sv[0], sc[0], sv[0]] / D_iajb[0],
+            eri0_mo[1][sc[0], sv[0], sc[1], sv[1]] / D_iajb[1],
+            eri0_mo[2][sc[1], sv[1], sc[1], sv[1]] / D_iajb[2]
         )
         return t_iajb
 
@@ -342,75 +503,101 @@ class DerivOnceUMP2(DerivOnceUSCF, DerivOnceMP2, ABC):
 
     @cached_property
     def eng(self):
+        return self.scf_eng.e_tot + self.eng_corr
+
+    @cached_property
+    def eng_corr(self):
+        if self.mp2_batched:
+            return self.mp2_intermediates["eng_corr"]
         T_iajb, t_iajb, D_iajb = self.T_iajb, self.t_iajb, self.D_iajb
-        return self.scf_eng.e_tot + np.array([(T_iajb[i] * t_iajb[i] * D_iajb[i]).sum() for i in range(3)]).sum()
+        return np.array([(T_iajb[i] * t_iajb[i] * D_iajb[i]).sum() for i in range(3)]).sum()
 
     @cached_property
     def W_I(self) -> np.ndarray:
-        so, sv = self.so, self.sv
+        if self.mp2_batched:
+            return self.mp2_intermediates["W_I"]
+        so, sv, sc = self.so, self.sv, self.sc
         nmo = self.nmo
         t_iajb, T_iajb, D_iajb, eri0_mo = self.t_iajb, self.T_iajb, self.D_iajb, self.eri0_mo
         W_I = np.zeros((2, nmo, nmo))
         # occ-occ part
-        W_I[0, so[0], so[0]] = (
-                - 2 * np.einsum("iakb, jakb -> ij", T_iajb[0], t_iajb[0] * D_iajb[0])
-                - np.einsum("iakb, jakb -> ij", T_iajb[1], t_iajb[1] * D_iajb[1]))
-        W_I[1, so[1], so[1]] = (
-                - 2 * np.einsum("iakb, jakb -> ij", T_iajb[2], t_iajb[2] * D_iajb[2])
-                - np.einsum("kbia, kbja -> ij", T_iajb[1], t_iajb[1] * D_iajb[1]))
+        W_I[0, sc[0], so[0]] = (
+                - 2 * einsum("iakb, jakb -> ij", T_iajb[0], eri0_mo[0][so[0], sv[0], sc[0], sv[0]])
+                - einsum("iakb, jakb -> ij", T_iajb[1], eri0_mo[1][so[0], sv[0], sc[1], sv[1]]))
+        W_I[1, sc[1], so[1]] = (
+                - 2 * einsum("iakb, jakb -> ij", T_iajb[2], eri0_mo[2][so[1], sv[1], sc[1], sv[1]])
+                - einsum("kbia, kbja -> ij", T_iajb[1], eri0_mo[1][sc[0], sv[0], so[1], sv[1]]))
         # vir-vir part
         W_I[0, sv[0], sv[0]] = (
-                - 2 * np.einsum("iajc, ibjc -> ab", T_iajb[0], t_iajb[0] * D_iajb[0])
-                - np.einsum("iajc, ibjc -> ab", T_iajb[1], t_iajb[1] * D_iajb[1]))
+                - 2 * einsum("iajc, ibjc -> ab", T_iajb[0], t_iajb[0] * D_iajb[0])
+                - einsum("iajc, ibjc -> ab", T_iajb[1], t_iajb[1] * D_iajb[1]))
         W_I[1, sv[1], sv[1]] = (
-                - 2 * np.einsum("iajc, ibjc -> ab", T_iajb[2], t_iajb[2] * D_iajb[2])
-                - np.einsum("jcia, jcib -> ab", T_iajb[1], t_iajb[1] * D_iajb[1]))
+                - 2 * einsum("iajc, ibjc -> ab", T_iajb[2], t_iajb[2] * D_iajb[2])
+                - einsum("jcia, jcib -> ab", T_iajb[1], t_iajb[1] * D_iajb[1]))
         # vir-occ part
         W_I[0, sv[0], so[0]] = (
-                - 4 * np.einsum("jakb, ijbk -> ai", T_iajb[0], eri0_mo[0][so[0], so[0], sv[0], so[0]])
-                - 2 * np.einsum("jakb, ijbk -> ai", T_iajb[1], eri0_mo[1][so[0], so[0], sv[1], so[1]]))
+                - 4 * einsum("jakb, ijbk -> ai", T_iajb[0], eri0_mo[0][so[0], sc[0], sv[0], sc[0]])
+                - 2 * einsum("jakb, ijbk -> ai", T_iajb[1], eri0_mo[1][so[0], sc[0], sv[1], sc[1]]))
         W_I[1, sv[1], so[1]] = (
-                - 4 * np.einsum("jakb, ijbk -> ai", T_iajb[2], eri0_mo[2][so[1], so[1], sv[1], so[1]])
-                - 2 * np.einsum("kbja, bkij -> ai", T_iajb[1], eri0_mo[1][sv[0], so[0], so[1], so[1]]))
+                - 4 * einsum("jakb, ijbk -> ai", T_iajb[2], eri0_mo[2][so[1], sc[1], sv[1], sc[1]])
+                - 2 * einsum("kbja, bkij -> ai", T_iajb[1], eri0_mo[1][sv[0], sc[0], so[1], sc[1]]))
         return W_I
 
     @cached_property
     def D_r_oovv(self) -> np.ndarray:
         nmo = self.nmo
-        so, sv = self.so, self.sv
-        T_iajb, t_iajb = self.T_iajb, self.t_iajb
-        D_r_oovv = np.zeros((2, nmo, nmo))
-        D_r_oovv[0, so[0], so[0]] = (
-                - 2 * np.einsum("iakb, jakb -> ij", T_iajb[0], t_iajb[0])
-                - np.einsum("iakb, jakb -> ij", T_iajb[1], t_iajb[1]))
-        D_r_oovv[1, so[1], so[1]] = (
-                - 2 * np.einsum("iakb, jakb -> ij", T_iajb[2], t_iajb[2])
-                - np.einsum("kbia, kbja -> ij", T_iajb[1], t_iajb[1]))
-        D_r_oovv[0, sv[0], sv[0]] = (
-                + 2 * np.einsum("iajc, ibjc -> ab", T_iajb[0], t_iajb[0])
-                + np.einsum("iajc, ibjc -> ab", T_iajb[1], t_iajb[1]))
-        D_r_oovv[1, sv[1], sv[1]] = (
-                + 2 * np.einsum("iajc, ibjc -> ab", T_iajb[2], t_iajb[2])
-                + np.einsum("jcia, jcib -> ab", T_iajb[1], t_iajb[1]))
+        sf, sc, sv = self.sf, self.sc, self.sv
+        if self.mp2_batched:
+            D_r_oovv = self.mp2_intermediates["D_r_oovv"]
+        else:
+            T_iajb, t_iajb = self.T_iajb, self.t_iajb
+            D_r_oovv = np.zeros((2, nmo, nmo))
+            D_r_oovv[0, sc[0], sc[0]] = (
+                    - 2 * einsum("iakb, jakb -> ij", T_iajb[0], t_iajb[0])
+                    - einsum("iakb, jakb -> ij", T_iajb[1], t_iajb[1]))
+            D_r_oovv[1, sc[1], sc[1]] = (
+                    - 2 * einsum("iakb, jakb -> ij", T_iajb[2], t_iajb[2])
+                    - einsum("kbia, kbja -> ij", T_iajb[1], t_iajb[1]))
+            D_r_oovv[0, sv[0], sv[0]] = (
+                    + 2 * einsum("iajc, ibjc -> ab", T_iajb[0], t_iajb[0])
+                    + einsum("iajc, ibjc -> ab", T_iajb[1], t_iajb[1]))
+            D_r_oovv[1, sv[1], sv[1]] = (
+                    + 2 * einsum("iajc, ibjc -> ab", T_iajb[2], t_iajb[2])
+                    + einsum("jcia, jcib -> ab", T_iajb[1], t_iajb[1]))
+        if self.frozen:
+            e, W_I = self.e, self.W_I
+            for x in range(2):
+                D_r_oovv[x, sc[x], sf[x]] = W_I[x, sc[x], sf[x]] / (e[x, None, sf[x]] - e[x, sc[x], None])
+                D_r_oovv[x, sf[x], sc[x]] = D_r_oovv[x, sc[x], sf[x]].T
         return D_r_oovv
 
     def _get_L(self) -> Tuple[np.ndarray, np.ndarray]:
         so, sv, sa = self.so, self.sv, self.sa
         Ax0_Core = self.Ax0_Core
+        L = Ax0_Core(sv, so, sa, sa)(self.D_r_oovv)
+        if self.mp2_batched:
+            L_T = self.mp2_intermediates["L_T"]
+            L[0][:] += L_T[0]
+            L[1][:] += L_T[1]
+            return L
+        sc = self.sc
         eri0_mo = self.eri0_mo
         T_iajb, t_iajb = self.T_iajb, self.t_iajb
-        L = Ax0_Core(sv, so, sa, sa)(self.D_r_oovv)
         L[0][:] += (
-                - 4 * np.einsum("jakb, ijbk -> ai", T_iajb[0], eri0_mo[0][so[0], so[0], sv[0], so[0]])
-                - 2 * np.einsum("jakb, ijbk -> ai", T_iajb[1], eri0_mo[1][so[0], so[0], sv[1], so[1]])
-                + 4 * np.einsum("ibjc, abjc -> ai", T_iajb[0], eri0_mo[0][sv[0], sv[0], so[0], sv[0]])
-                + 2 * np.einsum("ibjc, abjc -> ai", T_iajb[1], eri0_mo[1][sv[0], sv[0], so[1], sv[1]])
+                - 4 * einsum("jakb, ijbk -> ai", T_iajb[0], eri0_mo[0][so[0], sc[0], sv[0], sc[0]])
+                - 2 * einsum("jakb, ijbk -> ai", T_iajb[1], eri0_mo[1][so[0], sc[0], sv[1], sc[1]])
+        )
+        L[0][:, sc[0]] += (
+                + 4 * einsum("ibjc, abjc -> ai", T_iajb[0], eri0_mo[0][sv[0], sv[0], sc[0], sv[0]])
+                + 2 * einsum("ibjc, abjc -> ai", T_iajb[1], eri0_mo[1][sv[0], sv[0], sc[1], sv[1]])
         )
         L[1][:] += (
-                - 4 * np.einsum("jakb, ijbk -> ai", T_iajb[2], eri0_mo[2][so[1], so[1], sv[1], so[1]])
-                - 2 * np.einsum("kbja, bkij -> ai", T_iajb[1], eri0_mo[1][sv[0], so[0], so[1], so[1]])
-                + 4 * np.einsum("ibjc, abjc -> ai", T_iajb[2], eri0_mo[2][sv[1], sv[1], so[1], sv[1]])
-                + 2 * np.einsum("jcib, jcab -> ai", T_iajb[1], eri0_mo[1][so[0], sv[0], sv[1], sv[1]])
+                - 4 * einsum("jakb, ijbk -> ai", T_iajb[2], eri0_mo[2][so[1], sc[1], sv[1], sc[1]])
+                - 2 * einsum("kbja, bkij -> ai", T_iajb[1], eri0_mo[1][sv[0], sc[0], so[1], sc[1]])
+        )
+        L[1][:, sc[1]] += (
+                + 4 * einsum("ibjc, abjc -> ai", T_iajb[2], eri0_mo[2][sv[1], sv[1], sc[1], sv[1]])
+                + 2 * einsum("jcib, jcab -> ai", T_iajb[1], eri0_mo[1][sc[0], sv[0], sv[1], sv[1]])
         )
         return L
 
@@ -419,19 +606,7 @@ class DerivOnceUMP2(DerivOnceUSCF, DerivOnceMP2, ABC):
         L = self.L
         D_r = np.copy(self.D_r_oovv)
         so, sv = self.so, self.sv
-
-        Ax0_Core = self.Ax0_Core
-        e, mo_occ = self.e, self.mo_occ
-        nvir, nocc, nmo = self.nvir, self.nocc, self.nmo
-
-        def fx(X):
-            X_alpha = X[:, :nocc[0] * nvir[0]].reshape((nvir[0], nocc[0]))
-            X_beta = X[:, nocc[0] * nvir[0]:].reshape((nvir[1], nocc[1]))
-            Ax = Ax0_Core(sv, so, sv, so, in_cphf=True)((X_alpha, X_beta))
-            result = np.concatenate([Ax[0].reshape(-1), Ax[1].reshape(-1)])
-            return result
-
-        D_r_vo = ucphf.solve(fx, e, mo_occ, L, max_cycle=100, tol=self.cphf_tol)[0]
+        D_r_vo = self.solve_cphf_vo(L, "D_r")
         D_r[0][sv[0], so[0]] = D_r_vo[0]
         D_r[1][sv[1], so[1]] = D_r_vo[1]
         return D_r
@@ -450,16 +625,16 @@ class DerivOnceUMP2(DerivOnceUSCF, DerivOnceMP2, ABC):
         ]
         for x, y, z in sigma_list:
             pdA_eri0_mo[x] += (
-                + np.einsum("pjkl, Api -> Aijkl", eri0_mo[x], U_1[y])
-                + np.einsum("ipkl, Apj -> Aijkl", eri0_mo[x], U_1[y])
-                + np.einsum("ijpl, Apk -> Aijkl", eri0_mo[x], U_1[z])
-                + np.einsum("ijkp, Apl -> Aijkl", eri0_mo[x], U_1[z])
+                + einsum("pjkl, Api -> Aijkl", eri0_mo[x], U_1[y])
+                + einsum("ipkl, Apj -> Aijkl", eri0_mo[x], U_1[y])
+                + einsum("ijpl, Apk -> Aijkl", eri0_mo[x], U_1[z])
+                + einsum("ijkp, Apl -> Aijkl", eri0_mo[x], U_1[z])
             )
         return pdA_eri0_mo
 
     @cached_property
     def pdA_t_iajb(self) -> np.ndarray:
-        so, sv = self.so, self.sv
+        sc, sv = self.sc, self.sv
         D_iajb = self.D_iajb
         pdA_F_0_mo = self.pdA_F_0_mo
         t_iajb = self.t_iajb
@@ -470,13 +645,13 @@ class DerivOnceUMP2(DerivOnceUSCF, DerivOnceMP2, ABC):
             [1, 0, 1],
             [2, 1, 1],
         ]
-        pdA_t_iajb = [np.copy(pdA_eri0_mo[x, :, so[y], sv[y], so[z], sv[z]]) for x, y, z in sigma_list]
+        pdA_t_iajb = [np.copy(pdA_eri0_mo[x, :, sc[y], sv[y], sc[z], sv[z]]) for x, y, z in sigma_list]
         for x, y, z, in sigma_list:
             pdA_t_iajb[x] += (
-                - np.einsum("Aki, kajb -> Aiajb", pdA_F_0_mo[y][:, so[y], so[y]], t_iajb[x])
-                - np.einsum("Akj, iakb -> Aiajb", pdA_F_0_mo[z][:, so[z], so[z]], t_iajb[x])
-                + np.einsum("Aca, icjb -> Aiajb", pdA_F_0_mo[y][:, sv[y], sv[y]], t_iajb[x])
-                + np.einsum("Acb, iajc -> Aiajb", pdA_F_0_mo[z][:, sv[z], sv[z]], t_iajb[x])
+                - einsum("Aki, kajb -> Aiajb", pdA_F_0_mo[y][:, sc[y], sc[y]], t_iajb[x])
+                - einsum("Akj, iakb -> Aiajb", pdA_F_0_mo[z][:, sc[z], sc[z]], t_iajb[x])
+                + einsum("Aca, icjb -> Aiajb", pdA_F_0_mo[y][:, sv[y], sv[y]], t_iajb[x])
+                + einsum("Acb, iajc -> Aiajb", pdA_F_0_mo[z][:, sv[z], sv[z]], t_iajb[x])
             )
             pdA_t_iajb[x] /= D_iajb[x]
         return pdA_t_iajb
@@ -494,73 +669,84 @@ class DerivOnceUMP2(DerivOnceUSCF, DerivOnceMP2, ABC):
 
     @cached_property
     def pdA_D_r_oovv(self):
-        so, sv = self.so, self.sv
+        sf, sc, sv = self.sf, self.sc, self.sv
         nmo = self.nmo
         T_iajb, t_iajb = self.T_iajb, self.t_iajb
         pdA_t_iajb, pdA_T_iajb = self.pdA_t_iajb, self.pdA_T_iajb
 
         pdB_D_r_oovv = np.zeros((2, pdA_t_iajb[0].shape[0], nmo, nmo))
-        pdB_D_r_oovv[0, :, so[0], so[0]] = (
-                - 2 * np.einsum("iakb, Ajakb -> Aij", T_iajb[0], pdA_t_iajb[0])
-                - np.einsum("iakb, Ajakb -> Aij", T_iajb[1], pdA_t_iajb[1])
-                - 2 * np.einsum("Aiakb, jakb -> Aij", pdA_T_iajb[0], t_iajb[0])
-                - np.einsum("Aiakb, jakb -> Aij", pdA_T_iajb[1], t_iajb[1]))
-        pdB_D_r_oovv[1, :, so[1], so[1]] = (
-                - 2 * np.einsum("iakb, Ajakb -> Aij", T_iajb[2], pdA_t_iajb[2])
-                - np.einsum("kbia, Akbja -> Aij", T_iajb[1], pdA_t_iajb[1])
-                - 2 * np.einsum("Aiakb, jakb -> Aij", pdA_T_iajb[2], t_iajb[2])
-                - np.einsum("Akbia, kbja -> Aij", pdA_T_iajb[1], t_iajb[1]))
+        pdB_D_r_oovv[0, :, sc[0], sc[0]] = (
+                - 2 * einsum("iakb, Ajakb -> Aij", T_iajb[0], pdA_t_iajb[0])
+                - einsum("iakb, Ajakb -> Aij", T_iajb[1], pdA_t_iajb[1])
+                - 2 * einsum("Aiakb, jakb -> Aij", pdA_T_iajb[0], t_iajb[0])
+                - einsum("Aiakb, jakb -> Aij", pdA_T_iajb[1], t_iajb[1]))
+        pdB_D_r_oovv[1, :, sc[1], sc[1]] = (
+                - 2 * einsum("iakb, Ajakb -> Aij", T_iajb[2], pdA_t_iajb[2])
+                - einsum("kbia, Akbja -> Aij", T_iajb[1], pdA_t_iajb[1])
+                - 2 * einsum("Aiakb, jakb -> Aij", pdA_T_iajb[2], t_iajb[2])
+                - einsum("Akbia, kbja -> Aij", pdA_T_iajb[1], t_iajb[1]))
         pdB_D_r_oovv[0, :, sv[0], sv[0]] = (
-                + 2 * np.einsum("iajc, Aibjc -> Aab", T_iajb[0], pdA_t_iajb[0])
-                + np.einsum("iajc, Aibjc -> Aab", T_iajb[1], pdA_t_iajb[1])
-                + 2 * np.einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[0], t_iajb[0])
-                + np.einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[1], t_iajb[1]))
+                + 2 * einsum("iajc, Aibjc -> Aab", T_iajb[0], pdA_t_iajb[0])
+                + einsum("iajc, Aibjc -> Aab", T_iajb[1], pdA_t_iajb[1])
+                + 2 * einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[0], t_iajb[0])
+                + einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[1], t_iajb[1]))
         pdB_D_r_oovv[1, :, sv[1], sv[1]] = (
-                + 2 * np.einsum("iajc, Aibjc -> Aab", T_iajb[2], pdA_t_iajb[2])
-                + np.einsum("jcia, Ajcib -> Aab", T_iajb[1], pdA_t_iajb[1])
-                + 2 * np.einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[2], t_iajb[2])
-                + np.einsum("Ajcia, jcib -> Aab", pdA_T_iajb[1], t_iajb[1]))
+                + 2 * einsum("iajc, Aibjc -> Aab", T_iajb[2], pdA_t_iajb[2])
+                + einsum("jcia, Ajcib -> Aab", T_iajb[1], pdA_t_iajb[1])
+                + 2 * einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[2], t_iajb[2])
+                + einsum("Ajcia, jcib -> Aab", pdA_T_iajb[1], t_iajb[1]))
+        if self.frozen:
+            # Derivative of core-correlated block, see DerivOnceMP2
+            e, pdA_F_0_mo, D_r_oovv = self.e, self.pdA_F_0_mo, self.D_r_oovv
+            for x in range(2):
+                D_fc = D_r_oovv[x, sc[x], sf[x]]
+                pdB_D_r_oovv[x, :, sc[x], sf[x]] = (
+                    + self.pdA_W_I[x, :, sc[x], sf[x]]
+                    - einsum("iJ, AJI -> AiI", D_fc, pdA_F_0_mo[x, :, sf[x], sf[x]])
+                    + einsum("Aij, jI -> AiI", pdA_F_0_mo[x, :, sc[x], sc[x]], D_fc)
+                ) / (e[x, None, sf[x]] - e[x, sc[x], None])
+                pdB_D_r_oovv[x, :, sf[x], sc[x]] = pdB_D_r_oovv[x, :, sc[x], sf[x]].swapaxes(-1, -2)
         return pdB_D_r_oovv
 
     @cached_property
     def pdA_W_I(self):
-        so, sv = self.so, self.sv
-        natm, nmo = self.natm, self.nmo
+        so, sv, sc = self.so, self.sv, self.sc
+        nmo = self.nmo
         pdA_T_iajb, T_iajb = self.pdA_T_iajb, self.T_iajb
         eri0_mo, pdA_eri0_mo = self.eri0_mo, self.pdA_eri0_mo
         pdA_W_I = np.zeros((2, pdA_T_iajb[0].shape[0], nmo, nmo))
-        pdA_W_I[0, :, so[0], so[0]] = (
-                - 2 * np.einsum("Aiakb, jakb -> Aij", pdA_T_iajb[0], eri0_mo[0][so[0], sv[0], so[0], sv[0]])
-                - 1 * np.einsum("Aiakb, jakb -> Aij", pdA_T_iajb[1], eri0_mo[1][so[0], sv[0], so[1], sv[1]])
-                - 2 * np.einsum("iakb, Ajakb -> Aij", T_iajb[0], pdA_eri0_mo[0][:, so[0], sv[0], so[0], sv[0]])
-                - 1 * np.einsum("iakb, Ajakb -> Aij", T_iajb[1], pdA_eri0_mo[1][:, so[0], sv[0], so[1], sv[1]]))
-        pdA_W_I[1, :, so[1], so[1]] = (
-                - 2 * np.einsum("Aiakb, jakb -> Aij", pdA_T_iajb[2], eri0_mo[2][so[1], sv[1], so[1], sv[1]])
-                - 1 * np.einsum("Akbia, kbja -> Aij", pdA_T_iajb[1], eri0_mo[1][so[0], sv[0], so[1], sv[1]])
-                - 2 * np.einsum("iakb, Ajakb -> Aij", T_iajb[2], pdA_eri0_mo[2][:, so[1], sv[1], so[1], sv[1]])
-                - 1 * np.einsum("kbia, Akbja -> Aij", T_iajb[1], pdA_eri0_mo[1][:, so[0], sv[0], so[1], sv[1]]))
+        pdA_W_I[0, :, sc[0], so[0]] = (
+                - 2 * einsum("Aiakb, jakb -> Aij", pdA_T_iajb[0], eri0_mo[0][so[0], sv[0], sc[0], sv[0]])
+                - 1 * einsum("Aiakb, jakb -> Aij", pdA_T_iajb[1], eri0_mo[1][so[0], sv[0], sc[1], sv[1]])
+                - 2 * einsum("iakb, Ajakb -> Aij", T_iajb[0], pdA_eri0_mo[0][:, so[0], sv[0], sc[0], sv[0]])
+                - 1 * einsum("iakb, Ajakb -> Aij", T_iajb[1], pdA_eri0_mo[1][:, so[0], sv[0], sc[1], sv[1]]))
+        pdA_W_I[1, :, sc[1], so[1]] = (
+                - 2 * einsum("Aiakb, jakb -> Aij", pdA_T_iajb[2], eri0_mo[2][so[1], sv[1], sc[1], sv[1]])
+                - 1 * einsum("Akbia, kbja -> Aij", pdA_T_iajb[1], eri0_mo[1][sc[0], sv[0], so[1], sv[1]])
+                - 2 * einsum("iakb, Ajakb -> Aij", T_iajb[2], pdA_eri0_mo[2][:, so[1], sv[1], sc[1], sv[1]])
+                - 1 * einsum("kbia, Akbja -> Aij", T_iajb[1], pdA_eri0_mo[1][:, sc[0], sv[0], so[1], sv[1]]))
         # vir-vir part
         pdA_W_I[0, :, sv[0], sv[0]] = (
-                - 2 * np.einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[0], eri0_mo[0][so[0], sv[0], so[0], sv[0]])
-                - 1 * np.einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[1], eri0_mo[1][so[0], sv[0], so[1], sv[1]])
-                - 2 * np.einsum("iajc, Aibjc -> Aab", T_iajb[0], pdA_eri0_mo[0][:, so[0], sv[0], so[0], sv[0]])
-                - 1 * np.einsum("iajc, Aibjc -> Aab", T_iajb[1], pdA_eri0_mo[1][:, so[0], sv[0], so[1], sv[1]]))
+                - 2 * einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[0], eri0_mo[0][sc[0], sv[0], sc[0], sv[0]])
+                - 1 * einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[1], eri0_mo[1][sc[0], sv[0], sc[1], sv[1]])
+                - 2 * einsum("iajc, Aibjc -> Aab", T_iajb[0], pdA_eri0_mo[0][:, sc[0], sv[0], sc[0], sv[0]])
+                - 1 * einsum("iajc, Aibjc -> Aab", T_iajb[1], pdA_eri0_mo[1][:, sc[0], sv[0], sc[1], sv[1]]))
         pdA_W_I[1, :, sv[1], sv[1]] = (
-                - 2 * np.einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[2], eri0_mo[2][so[1], sv[1], so[1], sv[1]])
-                - 1 * np.einsum("Ajcia, jcib -> Aab", pdA_T_iajb[1], eri0_mo[1][so[0], sv[0], so[1], sv[1]])
-                - 2 * np.einsum("iajc, Aibjc -> Aab", T_iajb[2], pdA_eri0_mo[2][:, so[1], sv[1], so[1], sv[1]])
-                - 1 * np.einsum("jcia, Ajcib -> Aab", T_iajb[1], pdA_eri0_mo[1][:, so[0], sv[0], so[1], sv[1]]))
+                - 2 * einsum("Aiajc, ibjc -> Aab", pdA_T_iajb[2], eri0_mo[2][sc[1], sv[1], sc[1], sv[1]])
+                - 1 * einsum("Ajcia, jcib -> Aab", pdA_T_iajb[1], eri0_mo[1][sc[0], sv[0], sc[1], sv[1]])
+                - 2 * einsum("iajc, Aibjc -> Aab", T_iajb[2], pdA_eri0_mo[2][:, sc[1], sv[1], sc[1], sv[1]])
+                - 1 * einsum("jcia, Ajcib -> Aab", T_iajb[1], pdA_eri0_mo[1][:, sc[0], sv[0], sc[1], sv[1]]))
         # vir-occ part
         pdA_W_I[0, :, sv[0], so[0]] = (
-                - 4 * np.einsum("Ajakb, ijbk -> Aai", pdA_T_iajb[0], eri0_mo[0][so[0], so[0], sv[0], so[0]])
-                - 2 * np.einsum("Ajakb, ijbk -> Aai", pdA_T_iajb[1], eri0_mo[1][so[0], so[0], sv[1], so[1]])
-                - 4 * np.einsum("jakb, Aijbk -> Aai", T_iajb[0], pdA_eri0_mo[0][:, so[0], so[0], sv[0], so[0]])
-                - 2 * np.einsum("jakb, Aijbk -> Aai", T_iajb[1], pdA_eri0_mo[1][:, so[0], so[0], sv[1], so[1]]))
+                - 4 * einsum("Ajakb, ijbk -> Aai", pdA_T_iajb[0], eri0_mo[0][so[0], sc[0], sv[0], sc[0]])
+                - 2 * einsum("Ajakb, ijbk -> Aai", pdA_T_iajb[1], eri0_mo[1][so[0], sc[0], sv[1], sc[1]])
+                - 4 * einsum("jakb, Aijbk -> Aai", T_iajb[0], pdA_eri0_mo[0][:, so[0], sc[0], sv[0], sc[0]])
+                - 2 * einsum("jakb, Aijbk -> Aai", T_iajb[1], pdA_eri0_mo[1][:, so[0], sc[0], sv[1], sc[1]]))
         pdA_W_I[1, :, sv[1], so[1]] = (
-                - 4 * np.einsum("Ajakb, ijbk -> Aai", pdA_T_iajb[2], eri0_mo[2][so[1], so[1], sv[1], so[1]])
-                - 2 * np.einsum("Akbja, bkij -> Aai", pdA_T_iajb[1], eri0_mo[1][sv[0], so[0], so[1], so[1]])
-                - 4 * np.einsum("jakb, Aijbk -> Aai", T_iajb[2], pdA_eri0_mo[2][:, so[1], so[1], sv[1], so[1]])
-                - 2 * np.einsum("kbja, Abkij -> Aai", T_iajb[1], pdA_eri0_mo[1][:, sv[0], so[0], so[1], so[1]]))
+                - 4 * einsum("Ajakb, ijbk -> Aai", pdA_T_iajb[2], eri0_mo[2][so[1], sc[1], sv[1], sc[1]])
+                - 2 * einsum("Akbja, bkij -> Aai", pdA_T_iajb[1], eri0_mo[1][sv[0], sc[0], so[1], sc[1]])
+                - 4 * einsum("jakb, Aijbk -> Aai", T_iajb[2], pdA_eri0_mo[2][:, so[1], sc[1], sv[1], sc[1]])
+                - 2 * einsum("kbja, Abkij -> Aai", T_iajb[1], pdA_eri0_mo[1][:, sv[0], sc[0], so[1], sc[1]]))
         return pdA_W_I
 
 
@@ -575,7 +761,5 @@ class DerivOnceUXDH(DerivOnceUMP2, DerivOnceUNCDFT, ABC):
 
     @cached_property
     def eng(self):
-        T_iajb, t_iajb, D_iajb = self.T_iajb, self.t_iajb, self.D_iajb
-        eng = self.nc_deriv.scf_eng.energy_tot(dm=self.D) + np.array([(T_iajb[i] * t_iajb[i] * D_iajb[i]).sum() for i in range(3)]).sum()
-        return eng
+        return self.nc_deriv.scf_eng.energy_tot(dm=self.D) + self.eng_corr
 
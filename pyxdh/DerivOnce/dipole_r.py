@@ -1,9 +1,9 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # pyxdh utilities
 from pyxdh.DerivOnce.deriv_once_r import DerivOnceSCF, DerivOnceNCDFT, DerivOnceMP2, DerivOnceXDH
-from pyxdh.Utilities import GridIterator, KernelHelper, cached_property
+from pyxdh.Utilities import GridIterator, KernelHelper, cached_property, solve_dynamic_response
 
 
 class DipoleSCF(DerivOnceSCF):
@@ -49,7 +49,11 @@ class DipoleSCF(DerivOnceSCF):
 
             # Actual calculation
 
-            grdit = GridIterator(self.mol, self.grids, self.D, deriv=3, memory=self.grdit_memory)
+            # Only AO and its first derivative (ao_0, ao_1, rho_1) are required here
+            # Per-grid intermediates: pdU_* density and kernel derivatives (ABrg), ABgu AO contraction
+            footprint = 8 * num_components * dm.shape[0] * (nao + 8)
+            grdit = GridIterator(self.mol, self.grids, self.D, deriv=1, memory=self.grdit_memory,
+                                 footprint=footprint)
             for grdh in grdit:
                 kerh = KernelHelper(grdh, self.xc, deriv=3)
 
@@ -117,6 +121,32 @@ class DipoleSCF(DerivOnceSCF):
     def eri1_ao(self):
         return 0
 
+    def get_U_1_dynamic(self, omegas):
+        """
+        Frequency-dependent v-o orbital response of dipole perturbations (see ``solve_dynamic_response``), for all
+        frequencies and components in one shared subspace.
+
+        Parameters
+        ----------
+        omegas: list of float
+            Frequencies in a.u., should be smaller than the first excitation energy.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Real (symmetric) and imaginary (anti-symmetric) parts of orbital response, each of shape
+            (nomega, ncomp, nvir, nocc). Real part at zero frequency is ``U_1[:, sv, so]``.
+        """
+        sv, so = self.sv, self.so
+        return solve_dynamic_response(
+            self.Ax0_Core(sv, so, sv, so, in_cphf=True),
+            self.Ax0_Core(sv, so, sv, so, antisym=True),
+            self.ev[:, None] - self.eo[None, :],
+            self.B_1[:, sv, so],
+            omegas,
+            tol=self.cphf_tol
+        )
+
     def _get_E_1(self):
         mol = self.mol
         H_1_ao = self.H_1_ao
@@ -146,7 +176,7 @@ class DipoleNCDFT(DerivOnceNCDFT, DipoleSCF):
 class DipoleMP2(DerivOnceMP2, DipoleSCF):
 
     def _get_E_1(self):
-        E_1 = np.einsum("pq, Apq -> A", self.D_r, self.B_1)
+        E_1 = einsum("pq, Apq -> A", self.D_r, self.B_1)
         E_1 += DipoleSCF._get_E_1(self)
         return E_1
 
@@ -154,6 +184,6 @@ class DipoleMP2(DerivOnceMP2, DipoleSCF):
 class DipoleXDH(DerivOnceXDH, DipoleMP2, DipoleNCDFT):
 
     def _get_E_1(self):
-        E_1 = np.einsum("pq, Apq -> A", self.D_r, self.B_1)
+        E_1 = einsum("pq, Apq -> A", self.D_r, self.B_1)
         E_1 += self.nc_deriv.E_1
         return E_1
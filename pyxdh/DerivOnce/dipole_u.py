@@ -1,5 +1,5 @@
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 
 from pyxdh.DerivOnce import DerivOnceUSCF, DipoleSCF, DerivOnceUMP2
 from pyxdh.Utilities import cached_property
@@ -40,6 +40,6 @@ class DipoleUMP2(DerivOnceUMP2, DipoleUSCF):
         return 0
 
     def _get_E_1(self):
-        E_1 = np.einsum("xpq, xApq -> A", self.D_r, self.B_1)
+        E_1 = einsum("xpq, xApq -> A", self.D_r, self.B_1)
         E_1 += DipoleUSCF._get_E_1(self)
         return E_1
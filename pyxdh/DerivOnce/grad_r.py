@@ -1,28 +1,61 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # pyscf utilities
-from pyscf import grad
+from pyscf import grad, ao2mo, lib
 from pyscf.scf import _vhf
+from pyscf.hessian.rhf import _get_jk
+from pyscf.hessian.rks import _get_vxc_deriv1
 # pyxdh utilities
 from pyxdh.DerivOnce import DerivOnceSCF, DerivOnceNCDFT, DerivOnceMP2, DerivOnceXDH
-from pyxdh.Utilities import GridIterator, KernelHelper, timing, cached_property
+from pyxdh.Utilities import GridIterator, KernelHelper, timing, cached_property, AtomBlockMatrix
+from pyxdh.Utilities.grid_iterator import SYM_2
 
 
 # Cubic Inheritance: A2
 class GradSCF(DerivOnceSCF):
 
-    def Ax1_Core(self, si, sj, sk, sl, reshape=True):
+    def __init__(self, config):
+        super(GradSCF, self).__init__(config)
+        # Perturbed (active) atoms; perturbation index is ordered as ``(len(atoms), 3)``
+        self.atoms = list(range(self.natm)) if config.get("atoms") is None else list(config["atoms"])
+
+    def Ax1_Core(self, si, sj, sk, sl, reshape=True, skeleton=True, U_1=None, v=None):
+        """
+        Derivative of A tensor (as in ``Ax0_Core``) on atomic coordinates, contracted with ``X``.
+
+        Parameters
+        ----------
+        skeleton: bool
+            Whether skeleton (integral and grid) derivative is included; it is indexed by atomic coordinates.
+        U_1: np.ndarray or None or 0
+            Orbital response in derivative of GGA kernel; ``self.U_1`` if None, and excluded if 0. Leading dimension
+            of response part is the same to leading dimension of ``U_1``.
+        v: np.ndarray or None
+            Combination coefficients of atomic coordinates, shape (natm * 3, k). If given, skeleton derivative is
+            contracted with ``v`` atom by atom, and only atoms of nonzero rows of ``v`` are evaluated; leading
+            dimension of skeleton part is then k.
+        """
 
         C, Co = self.C, self.Co
-        natm, nao = self.natm, self.nao
-        mol = self.mol
-        cx = self.cx
+        atoms, nao = self.atoms, self.nao
+        natm = len(atoms)
         so = self.so
-
-        dmU = C @ self.U_1[:, :, so] @ Co.T
-        dmU += dmU.swapaxes(-1, -2)
-        dmU.shape = (natm, 3, nao, nao)
+        with_U = self.xc_type == "GGA" and (U_1 is None or isinstance(U_1, np.ndarray))
+        nU = U_1.shape[0] if isinstance(U_1, np.ndarray) else natm * 3
+        # Atoms of skeleton derivative, and their combination coefficients of shape (len(skeleton atoms), 3, k)
+        if v is None:
+            sk_atoms, v_atoms = atoms, None
+        else:
+            v_atoms = v.reshape((natm, 3, -1))
+            iBs = [iB for iB in range(natm) if v_atoms[iB].any()]
+            sk_atoms, v_atoms = [atoms[iB] for iB in iBs], v_atoms[iBs]
+        nS = natm * 3 if v is None else v.shape[-1]
+
+        def get_dmU():
+            # Only GGA kernel derivative requires U_1, so it is evaluated lazily
+            dmU = C @ (self.U_1 if U_1 is None else U_1)[:, :, so] @ Co.T
+            return dmU + dmU.swapaxes(-1, -2)
 
         sij_none = si is None and sj is None
         skl_none = sk is None and sl is None
@@ -42,141 +75,131 @@ class GradSCF(DerivOnceSCF):
                 dmX = C[:, sk] @ X @ C[:, sl].T
             dmX += dmX.transpose((0, 2, 1))
 
-            ax_ao = np.empty((natm, 3, dmX.shape[0], nao, nao))
-
-            # Actual calculation
-            # (ut v | k l), (ut k | v l)
-            j_1, k_1 = _vhf.direct_mapdm(
-                mol._add_suffix('int2e_ip1'), "s2kl",
-                ("lk->s1ij", "jk->s1il"),
-                dmX, 3,
-                mol._atm, mol._bas, mol._env
-            )
-            if dmX.shape[0] == 1:  # dm shape is 1 * nao * nao, then j_1, k_1 do not retain dimension of dm.shape[0]
-                j_1, k_1 = j_1[None, :], k_1[None, :]
-            j_1, k_1 = j_1.swapaxes(0, 1), k_1.swapaxes(0, 1)
+            nX = dmX.shape[0]
 
             # HF Part
-            for A in range(natm):
-                ax = np.zeros((3, dmX.shape[0], nao, nao))
-                shl0, shl1, p0, p1 = mol.aoslice_by_atom()[A]
-                sA = slice(p0, p1)  # equivalent to mol_slice(A)
-                ax[:, :, sA, :] -= 2 * j_1[:, :, sA, :]
-                ax[:, :, :, sA] -= 2 * j_1[:, :, sA, :].swapaxes(-1, -2)
-                ax[:, :, sA, :] += cx * k_1[:, :, sA, :]
-                ax[:, :, :, sA] += cx * k_1[:, :, sA, :].swapaxes(-1, -2)
-                # (kt l | u v), (kt u | l v)
-                j_1A, k_1A = _vhf.direct_mapdm(
-                    mol._add_suffix('int2e_ip1'), "s2kl",
-                    ("ji->s1kl", "li->s1kj"),
-                    dmX[:, :, p0:p1], 3,
-                    mol._atm, mol._bas, mol._env,
-                    shls_slice=((shl0, shl1) + (0, mol.nbas) * 3)
-                )
-                if dmX.shape[0] == 1:  # dm shape is 1 * nao * nao, then j_1A, k_1A do not retain dimension of dm.shape[0]
-                    j_1A, k_1A = j_1A[None, :], k_1A[None, :]
-                j_1A, k_1A = j_1A.swapaxes(0, 1), k_1A.swapaxes(0, 1)
-                ax -= 4 * j_1A
-                ax += cx * (k_1A + k_1A.swapaxes(-1, -2))
-
-                ax_ao[A] = ax
+            if skeleton:
+                ax_ao = self._get_Ax1_HF_ao(dmX, v).reshape((nS, nX, nao, nao))
+            else:
+                ax_ao = np.zeros((nU, nX, nao, nao))
 
             # GGA Part
-            if self.xc_type == "GGA":
-                grdit = GridIterator(self.mol, self.grids, self.D, deriv=3, memory=self.grdit_memory)
+            if self.xc_type == "GGA" and (skeleton or with_U):
+                dmU = get_dmU() if with_U else None
+                # Only AO up to second derivative (ao_2T, A_rho_2) are required here
+                # Per-grid intermediates: (AtB(r)g) density and kernel derivatives, KBgu and Btgu AO contractions
+                footprint = 8 * nX * ((nS + 3) * nao + 36 * len(sk_atoms))
+                grdit = GridIterator(self.mol, self.grids, self.D, deriv=2, memory=self.grdit_memory,
+                                     footprint=footprint, atoms=sk_atoms)
                 for grdh in grdit:
                     kerh = KernelHelper(grdh, self.xc, deriv=3)
-                    # Define some kernel and density derivative alias
-                    pd_frr = kerh.frrr * grdh.A_rho_1 + kerh.frrg * grdh.A_gamma_1
-                    pd_frg = kerh.frrg * grdh.A_rho_1 + kerh.frgg * grdh.A_gamma_1
-                    pd_fgg = kerh.frgg * grdh.A_rho_1 + kerh.fggg * grdh.A_gamma_1
-                    pd_fg = kerh.frg * grdh.A_rho_1 + kerh.fgg * grdh.A_gamma_1
-                    pd_rho_1 = grdh.A_rho_2
-
                     # Form dmX density grid
                     rho_X_0 = np.array([grdh.get_rho_0(dm) for dm in dmX])
                     rho_X_1 = np.array([grdh.get_rho_1(dm) for dm in dmX])
-                    pd_rho_X_0 = np.array([grdh.get_A_rho_1(dm) for dm in dmX]).transpose((1, 2, 0, 3))
-                    pd_rho_X_1 = np.array([grdh.get_A_rho_2(dm) for dm in dmX]).transpose((1, 2, 0, 3, 4))
-
-                    # Define temporary intermediates
-                    tmp_M_0 = (
-                            + einsum("g, Bg -> Bg", kerh.frr, rho_X_0)
-                            + 2 * einsum("g, wg, Bwg -> Bg", kerh.frg, grdh.rho_1, rho_X_1)
-                    )
-                    tmp_M_1 = (
-                            + 4 * einsum("g, Bg, rg -> Brg", kerh.frg, rho_X_0, grdh.rho_1)
-                            + 8 * einsum("g, wg, Bwg, rg -> Brg", kerh.fgg, grdh.rho_1, rho_X_1, grdh.rho_1)
-                            + 4 * einsum("g, Brg -> Brg", kerh.fg, rho_X_1)
-                    )
-                    pd_tmp_M_0 = (
-                            + einsum("Atg, Bg -> AtBg", pd_frr, rho_X_0)
-                            + einsum("g, AtBg -> AtBg", kerh.frr, pd_rho_X_0)
-                            + 2 * einsum("Atg, wg, Bwg -> AtBg", pd_frg, grdh.rho_1, rho_X_1)
-                            + 2 * einsum("g, Atwg, Bwg -> AtBg", kerh.frg, pd_rho_1, rho_X_1)
-                            + 2 * einsum("g, wg, AtBwg -> AtBg", kerh.frg, grdh.rho_1, pd_rho_X_1)
-                    )
-                    pd_tmp_M_1 = (
-                            + 4 * einsum("Atg, Bg, rg -> AtBrg", pd_frg, rho_X_0, grdh.rho_1)
-                            + 4 * einsum("g, Bg, Atrg -> AtBrg", kerh.frg, rho_X_0, pd_rho_1)
-                            + 4 * einsum("g, AtBg, rg -> AtBrg", kerh.frg, pd_rho_X_0, grdh.rho_1)
-                            + 8 * einsum("Atg, wg, Bwg, rg -> AtBrg", pd_fgg, grdh.rho_1, rho_X_1, grdh.rho_1)
-                            + 8 * einsum("g, Atwg, Bwg, rg -> AtBrg", kerh.fgg, pd_rho_1, rho_X_1, grdh.rho_1)
-                            + 8 * einsum("g, wg, Bwg, Atrg -> AtBrg", kerh.fgg, grdh.rho_1, rho_X_1, pd_rho_1)
-                            + 8 * einsum("g, wg, AtBwg, rg -> AtBrg", kerh.fgg, grdh.rho_1, pd_rho_X_1, grdh.rho_1)
-                            + 4 * einsum("Atg, Brg -> AtBrg", pd_fg, rho_X_1)
-                            + 4 * einsum("g, AtBrg -> AtBrg", kerh.fg, pd_rho_X_1)
-                    )
 
-                    contrib1 = np.zeros((natm, 3, dmX.shape[0], nao, nao))
-                    contrib1 += einsum("AtBg, gu, gv -> AtBuv", pd_tmp_M_0, grdh.ao_0, grdh.ao_0)
-                    contrib1 += einsum("AtBrg, rgu, gv -> AtBuv", pd_tmp_M_1, grdh.ao_1, grdh.ao_0)
-                    contrib1 += contrib1.swapaxes(-1, -2)
-
-                    tmp_contrib = (
-                            - 2 * einsum("Bg, tgu, gv -> tBuv", tmp_M_0, grdh.ao_1, grdh.ao_0)
-                            - einsum("Brg, trgu, gv -> tBuv", tmp_M_1, grdh.ao_2, grdh.ao_0)
-                            - einsum("Brg, tgu, rgv -> tBuv", tmp_M_1, grdh.ao_1, grdh.ao_1)
-                    )
-
-                    contrib2 = np.zeros((natm, 3, dmX.shape[0], nao, nao))
-                    for A in range(natm):
-                        sA = self.mol_slice(A)
-                        contrib2[A, :, :, sA] += tmp_contrib[:, :, sA]
-
-                    contrib2 += contrib2.swapaxes(-1, -2)
+                    if skeleton:
+                        # Define some kernel and density derivative alias
+                        pd_frr = kerh.frrr * grdh.A_rho_1 + kerh.frrg * grdh.A_gamma_1
+                        pd_frg = kerh.frrg * grdh.A_rho_1 + kerh.frgg * grdh.A_gamma_1
+                        pd_fgg = kerh.frgg * grdh.A_rho_1 + kerh.fggg * grdh.A_gamma_1
+                        pd_fg = kerh.frg * grdh.A_rho_1 + kerh.fgg * grdh.A_gamma_1
+                        pd_rho_1 = grdh.A_rho_2
+
+                        pd_rho_X_0 = np.array([grdh.get_A_rho_1(dm) for dm in dmX]).transpose((1, 2, 0, 3))
+                        pd_rho_X_1 = np.array([grdh.get_A_rho_2(dm) for dm in dmX]).transpose((1, 2, 0, 3, 4))
+
+                        # Define temporary intermediates
+                        tmp_M_0 = (
+                                + einsum("g, Bg -> Bg", kerh.frr, rho_X_0)
+                                + 2 * einsum("g, wg, Bwg -> Bg", kerh.frg, grdh.rho_1, rho_X_1)
+                        )
+                        tmp_M_1 = (
+                                + 4 * einsum("g, Bg, rg -> Brg", kerh.frg, rho_X_0, grdh.rho_1)
+                                + 8 * einsum("g, wg, Bwg, rg -> Brg", kerh.fgg, grdh.rho_1, rho_X_1, grdh.rho_1)
+                                + 4 * einsum("g, Brg -> Brg", kerh.fg, rho_X_1)
+                        )
+                        pd_tmp_M_0 = (
+                                + einsum("Atg, Bg -> AtBg", pd_frr, rho_X_0)
+                                + einsum("g, AtBg -> AtBg", kerh.frr, pd_rho_X_0)
+                                + 2 * einsum("Atg, wg, Bwg -> AtBg", pd_frg, grdh.rho_1, rho_X_1)
+                                + 2 * einsum("g, Atwg, Bwg -> AtBg", kerh.frg, pd_rho_1, rho_X_1)
+                                + 2 * einsum("g, wg, AtBwg -> AtBg", kerh.frg, grdh.rho_1, pd_rho_X_1)
+                        )
+                        pd_tmp_M_1 = (
+                                + 4 * einsum("Atg, Bg, rg -> AtBrg", pd_frg, rho_X_0, grdh.rho_1)
+                                + 4 * einsum("g, Bg, Atrg -> AtBrg", kerh.frg, rho_X_0, pd_rho_1)
+                                + 4 * einsum("g, AtBg, rg -> AtBrg", kerh.frg, pd_rho_X_0, grdh.rho_1)
+                                + 8 * einsum("Atg, wg, Bwg, rg -> AtBrg", pd_fgg, grdh.rho_1, rho_X_1, grdh.rho_1)
+                                + 8 * einsum("g, Atwg, Bwg, rg -> AtBrg", kerh.fgg, pd_rho_1, rho_X_1, grdh.rho_1)
+                                + 8 * einsum("g, wg, Bwg, Atrg -> AtBrg", kerh.fgg, grdh.rho_1, rho_X_1, pd_rho_1)
+                                + 8 * einsum("g, wg, AtBwg, rg -> AtBrg", kerh.fgg, grdh.rho_1, pd_rho_X_1, grdh.rho_1)
+                                + 4 * einsum("Atg, Brg -> AtBrg", pd_fg, rho_X_1)
+                                + 4 * einsum("g, AtBrg -> AtBrg", kerh.fg, pd_rho_X_1)
+                        )
+
+                        # Atomic coordinates are contracted with v before AO pairs are formed
+                        if v is None:
+                            pd_tmp_M_0 = pd_tmp_M_0.reshape((nS, nX, grdh.ngrid))
+                            pd_tmp_M_1 = pd_tmp_M_1.reshape((nS, nX, 3, grdh.ngrid))
+                        else:
+                            pd_tmp_M_0 = einsum("AtBg, AtK -> KBg", pd_tmp_M_0, v_atoms)
+                            pd_tmp_M_1 = einsum("AtBrg, AtK -> KBrg", pd_tmp_M_1, v_atoms)
+
+                        contrib1 = np.zeros((nS, nX, nao, nao))
+                        contrib1 += einsum("KBg, gu, gv -> KBuv", pd_tmp_M_0, grdh.ao_0, grdh.ao_0)
+                        contrib1 += einsum("KBrg, rgu, gv -> KBuv", pd_tmp_M_1, grdh.ao_1, grdh.ao_0)
+                        contrib1 += contrib1.swapaxes(-1, -2)
+
+                        tmp_contrib = (
+                                - 2 * einsum("Bg, tgu, gv -> tBuv", tmp_M_0, grdh.ao_1, grdh.ao_0)
+                                - einsum("Brg, trT, Tgu, gv -> tBuv", tmp_M_1, SYM_2, grdh.ao_2T, grdh.ao_0)
+                                - einsum("Brg, tgu, rgv -> tBuv", tmp_M_1, grdh.ao_1, grdh.ao_1)
+                        )
+
+                        contrib2 = np.zeros((nS, nX, nao, nao))
+                        for iA, A in enumerate(sk_atoms):
+                            sA = self.mol_slice(A)
+                            if v is None:
+                                contrib2[3 * iA:3 * iA + 3, :, sA] += tmp_contrib[:, :, sA]
+                            else:
+                                contrib2[:, :, sA] += einsum("tK, tBuv -> KBuv", v_atoms[iA], tmp_contrib[:, :, sA])
+
+                        contrib2 += contrib2.swapaxes(-1, -2)
+
+                        ax_ao += contrib1 + contrib2
+
+                    if not with_U:
+                        continue
 
                     # U contribution to \partial_{A_t} A
-                    rho_U_0 = einsum("Atuv, gu, gv -> Atg", dmU, grdh.ao_0, grdh.ao_0)
-                    rho_U_1 = 2 * einsum("Atuv, rgu, gv -> Atrg", dmU, grdh.ao_1, grdh.ao_0)
-                    gamma_U_0 = 2 * einsum("rg, Atrg -> Atg", grdh.rho_1, rho_U_1)
+                    rho_U_0 = einsum("Auv, gu, gv -> Ag", dmU, grdh.ao_0, grdh.ao_0)
+                    rho_U_1 = 2 * einsum("Auv, rgu, gv -> Arg", dmU, grdh.ao_1, grdh.ao_0)
+                    gamma_U_0 = 2 * einsum("rg, Arg -> Ag", grdh.rho_1, rho_U_1)
                     pdU_frr = kerh.frrr * rho_U_0 + kerh.frrg * gamma_U_0
                     pdU_frg = kerh.frrg * rho_U_0 + kerh.frgg * gamma_U_0
                     pdU_fgg = kerh.frgg * rho_U_0 + kerh.fggg * gamma_U_0
                     pdU_fg = kerh.frg * rho_U_0 + kerh.fgg * gamma_U_0
                     pdU_rho_1 = rho_U_1
                     pdU_tmp_M_0 = (
-                            + einsum("Atg, Bg -> AtBg", pdU_frr, rho_X_0)
-                            + 2 * einsum("Atg, wg, Bwg -> AtBg", pdU_frg, grdh.rho_1, rho_X_1)
-                            + 2 * einsum("g, Atwg, Bwg -> AtBg", kerh.frg, pdU_rho_1, rho_X_1)
+                            + einsum("Ag, Bg -> ABg", pdU_frr, rho_X_0)
+                            + 2 * einsum("Ag, wg, Bwg -> ABg", pdU_frg, grdh.rho_1, rho_X_1)
+                            + 2 * einsum("g, Awg, Bwg -> ABg", kerh.frg, pdU_rho_1, rho_X_1)
                     )
                     pdU_tmp_M_1 = (
-                            + 4 * einsum("Atg, Bg, rg -> AtBrg", pdU_frg, rho_X_0, grdh.rho_1)
-                            + 4 * einsum("g, Bg, Atrg -> AtBrg", kerh.frg, rho_X_0, pdU_rho_1)
-                            + 8 * einsum("Atg, wg, Bwg, rg -> AtBrg", pdU_fgg, grdh.rho_1, rho_X_1, grdh.rho_1)
-                            + 8 * einsum("g, Atwg, Bwg, rg -> AtBrg", kerh.fgg, pdU_rho_1, rho_X_1, grdh.rho_1)
-                            + 8 * einsum("g, wg, Bwg, Atrg -> AtBrg", kerh.fgg, grdh.rho_1, rho_X_1, pdU_rho_1)
-                            + 4 * einsum("Atg, Brg -> AtBrg", pdU_fg, rho_X_1)
+                            + 4 * einsum("Ag, Bg, rg -> ABrg", pdU_frg, rho_X_0, grdh.rho_1)
+                            + 4 * einsum("g, Bg, Arg -> ABrg", kerh.frg, rho_X_0, pdU_rho_1)
+                            + 8 * einsum("Ag, wg, Bwg, rg -> ABrg", pdU_fgg, grdh.rho_1, rho_X_1, grdh.rho_1)
+                            + 8 * einsum("g, Awg, Bwg, rg -> ABrg", kerh.fgg, pdU_rho_1, rho_X_1, grdh.rho_1)
+                            + 8 * einsum("g, wg, Bwg, Arg -> ABrg", kerh.fgg, grdh.rho_1, rho_X_1, pdU_rho_1)
+                            + 4 * einsum("Ag, Brg -> ABrg", pdU_fg, rho_X_1)
                     )
 
-                    contrib3 = np.zeros((natm, 3, dmX.shape[0], nao, nao))
-                    contrib3 += einsum("AtBg, gu, gv -> AtBuv", pdU_tmp_M_0, grdh.ao_0, grdh.ao_0)
-                    contrib3 += einsum("AtBrg, rgu, gv -> AtBuv", pdU_tmp_M_1, grdh.ao_1, grdh.ao_0)
+                    contrib3 = np.zeros((dmU.shape[0], nX, nao, nao))
+                    contrib3 += einsum("ABg, gu, gv -> ABuv", pdU_tmp_M_0, grdh.ao_0, grdh.ao_0)
+                    contrib3 += einsum("ABrg, rgu, gv -> ABuv", pdU_tmp_M_1, grdh.ao_1, grdh.ao_0)
                     contrib3 += contrib3.swapaxes(-1, -2)
 
-                    ax_ao += contrib1 + contrib2 + contrib3
-
-            ax_ao.shape = (natm * 3, dmX.shape[0], nao, nao)
+                    ax_ao += contrib3
 
             if not sij_none:
                 ax_ao = einsum("ABuv, ui, vj -> ABij", ax_ao, C[:, si], C[:, sj])
@@ -192,72 +215,232 @@ class GradSCF(DerivOnceSCF):
 
         return fx
 
+    def directional(self, v):
+        deriv = super(GradSCF, self).directional(v)
+        v = np.asarray(v)
+        v = v.reshape((v.shape[0], -1))
+
+        def Ax1_Core(si, sj, sk, sl, reshape=True):
+            # Skeleton derivative is contracted with v inside; GGA kernel response is evaluated by U_1 of combined
+            # perturbation
+            def fx(X):
+                if not isinstance(X, np.ndarray):
+                    return 0
+                U_1 = deriv.U_1 if self.xc_type == "GGA" else 0
+                return self.Ax1_Core(si, sj, sk, sl, reshape=reshape, U_1=U_1, v=v)(X)
+            return fx
+
+        deriv.Ax1_Core = Ax1_Core
+        return deriv
+
+    def _get_Ax1_HF_ao(self, dmX, v=None):
+        """
+        Skeleton (integral) derivative of HF-like part of A tensor contracted with AO density matrices,
+
+        .. math::
+
+            2 (\\mu \\nu | \\kappa \\lambda)^{A_t} X_{\\kappa \\lambda}
+            - c_\\mathrm{x} (\\mu \\kappa | \\nu \\lambda)^{A_t} X_{\\kappa \\lambda}
+
+        Parameters
+        ----------
+        dmX: np.ndarray
+            Symmetric AO density matrices, shape (nX, nao, nao).
+        v: np.ndarray or None
+            Combination coefficients of atomic coordinates, shape (len(atoms) * 3, k); atoms of zero rows are skipped.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (len(atoms), 3, nX, nao, nao), or (k, nX, nao, nao) if ``v`` is given.
+        """
+        j_1, k_1 = self._get_Ax1_JK_ao(dmX, v)
+        return 2 * j_1 - self.cx * k_1
+
+    def _get_Ax1_JK_ao(self, dmX, v=None):
+        """
+        Skeleton derivatives of Coulomb and exchange integrals contracted with AO density matrices,
+        :math:`(\\mu \\nu | \\kappa \\lambda)^{A_t} X_{\\kappa \\lambda}` and
+        :math:`(\\mu \\kappa | \\nu \\lambda)^{A_t} X_{\\kappa \\lambda}`, integral-directly by ``int2e_ip1``.
+
+        Parameters
+        ----------
+        dmX: np.ndarray
+            Symmetric AO density matrices, shape (nX, nao, nao).
+        v: np.ndarray or None
+            Combination coefficients of atomic coordinates, shape (len(atoms) * 3, k); if given, derivative of each
+            atom is contracted with its rows of ``v`` once formed, and atoms of zero rows are skipped.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Each of shape (len(atoms), 3, nX, nao, nao), or (k, nX, nao, nao) if ``v`` is given.
+        """
+        atoms, nao = self.atoms, self.nao
+        mol = self.mol
+
+        if v is None:
+            ax_j = np.empty((len(atoms), 3, dmX.shape[0], nao, nao))
+            ax_k = np.empty((len(atoms), 3, dmX.shape[0], nao, nao))
+        else:
+            v = v.reshape((len(atoms), 3, -1))
+            ax_j = np.zeros((v.shape[-1], dmX.shape[0], nao, nao))
+            ax_k = np.zeros((v.shape[-1], dmX.shape[0], nao, nao))
+
+        # (ut v | k l), (ut k | v l)
+        j_1, k_1 = _vhf.direct_mapdm(
+            mol._add_suffix('int2e_ip1'), "s2kl",
+            ("lk->s1ij", "jk->s1il"),
+            dmX, 3,
+            mol._atm, mol._bas, mol._env
+        )
+        if dmX.shape[0] == 1:  # dm shape is 1 * nao * nao, then j_1, k_1 do not retain dimension of dm.shape[0]
+            j_1, k_1 = j_1[None, :], k_1[None, :]
+        j_1, k_1 = j_1.swapaxes(0, 1), k_1.swapaxes(0, 1)
+
+        for iA, A in enumerate(atoms):
+            if v is not None and not v[iA].any():
+                continue
+            aj, ak = np.zeros((3, dmX.shape[0], nao, nao)), np.zeros((3, dmX.shape[0], nao, nao))
+            shl0, shl1, p0, p1 = mol.aoslice_by_atom()[A]
+            sA = slice(p0, p1)  # equivalent to mol_slice(A)
+            aj[:, :, sA, :] -= j_1[:, :, sA, :]
+            aj[:, :, :, sA] -= j_1[:, :, sA, :].swapaxes(-1, -2)
+            ak[:, :, sA, :] -= k_1[:, :, sA, :]
+            ak[:, :, :, sA] -= k_1[:, :, sA, :].swapaxes(-1, -2)
+            # (kt l | u v), (kt u | l v)
+            j_1A, k_1A = _vhf.direct_mapdm(
+                mol._add_suffix('int2e_ip1'), "s2kl",
+                ("ji->s1kl", "li->s1kj"),
+                dmX[:, :, p0:p1], 3,
+                mol._atm, mol._bas, mol._env,
+                shls_slice=((shl0, shl1) + (0, mol.nbas) * 3)
+            )
+            if dmX.shape[0] == 1:  # dm shape is 1 * nao * nao, then j_1A, k_1A do not retain dimension of dm.shape[0]
+                j_1A, k_1A = j_1A[None, :], k_1A[None, :]
+            j_1A, k_1A = j_1A.swapaxes(0, 1), k_1A.swapaxes(0, 1)
+            aj -= 2 * j_1A
+            ak -= k_1A + k_1A.swapaxes(-1, -2)
+
+            if v is None:
+                ax_j[iA], ax_k[iA] = aj, ak
+            else:
+                ax_j += einsum("tK, tXuv -> KXuv", v[iA], aj)
+                ax_k += einsum("tK, tXuv -> KXuv", v[iA], ak)
+
+        return ax_j, ax_k
+
     @cached_property
     def H_1_ao(self):
-        return np.array([self.scf_grad.hcore_generator()(A) for A in range(self.natm)])\
+        return np.array([self.scf_grad.hcore_generator()(A) for A in self.atoms])\
             .reshape((-1, self.nao, self.nao))
 
+    @cached_property
+    def jk_1_ao(self):
+        """
+        Skeleton derivative of Coulomb and exchange matrices of density D, as in PySCF's ``make_h1`` of Hessian.
+
+        For each atom :math:`A` in ``atoms``, ``vj1`` and ``vk1`` are :math:`- (\\mu \\nu | \\kappa_t \\lambda)
+        D_{\\kappa \\lambda}` and :math:`- (\\mu \\kappa_t | \\nu \\lambda) D_{\\kappa \\lambda}` of
+        :math:`\\kappa \\in A`; ``vj2`` and ``vk2`` are :math:`- (\\mu_t \\nu | \\kappa \\lambda) D_{\\kappa \\lambda}`
+        and :math:`- (\\mu_t \\kappa | \\nu \\lambda) D_{\\kappa \\lambda}` of rows :math:`\\mu \\in A`.
+        Exchange is None if no instance sharing J/K (``jk_cx``) requires it.
+
+        Returns
+        -------
+        list of tuple
+            ``(vj1, vj2, vk1, vk2)`` for each atom.
+        """
+        if self.jk_deriv is not self:
+            return self.jk_deriv.jk_1_ao
+        mol, D = self.mol, self.D
+        with_k = any(cx != 0 for cx in self.jk_cx)
+        jk_1_ao = []
+        for A in self.atoms:
+            shl0, shl1, p0, p1 = mol.aoslice_by_atom()[A]
+            shls_slice = (shl0, shl1) + (0, mol.nbas) * 3
+            if with_k:
+                vj1, vj2, vk1, vk2 = _get_jk(mol, "int2e_ip1", 3, "s2kl",
+                                             ["ji->s2kl", -D[:, p0:p1], "lk->s1ij", -D,
+                                              "li->s1kj", -D[:, p0:p1], "jk->s1il", -D], shls_slice=shls_slice)
+            else:
+                vj1, vj2 = _get_jk(mol, "int2e_ip1", 3, "s2kl",
+                                   ["ji->s2kl", -D[:, p0:p1], "lk->s1ij", -D], shls_slice=shls_slice)
+                vk1, vk2 = None, None
+            jk_1_ao.append((vj1, vj2, vk1, vk2))
+        return jk_1_ao
+
     @cached_property
     def F_1_ao(self):
-        return np.array(self.scf_hess.make_h1(self.C, self.mo_occ)).reshape((-1, self.nao, self.nao))
+        if self.is_rsh or self.is_nlc:
+            # PySCF gives list of all atoms, in which atoms not in ``atmlst`` are None
+            F_1_ao = self.scf_hess.make_h1(self.C, self.mo_occ, atmlst=self.atoms)
+            return np.array([F_1_ao[A] for A in self.atoms]).reshape((-1, self.nao, self.nao))
+
+        cx = self.cx
+        F_1_ao = self.H_1_ao.reshape((len(self.atoms), 3, self.nao, self.nao)).copy()
+        if self.xc_type != "HF":
+            max_memory = max(2000, self.scf_eng.max_memory * .9 - lib.current_memory()[0])
+            vxc_1 = _get_vxc_deriv1(self.scf_hess, self.C, self.mo_occ, max_memory)
+            F_1_ao += vxc_1[self.atoms]
+        for iA, (A, (vj1, vj2, vk1, vk2)) in enumerate(zip(self.atoms, self.jk_1_ao)):
+            sA = self.mol_slice(A)
+            veff = vj1.copy()
+            veff[:, sA] += vj2
+            if cx != 0:
+                veff -= 0.5 * cx * vk1
+                veff[:, sA] -= 0.5 * cx * vk2
+            F_1_ao[iA] += veff + veff.swapaxes(-1, -2)
+        return F_1_ao.reshape((-1, self.nao, self.nao))
 
     @cached_property
     def S_1_ao(self):
-        int1e_ipovlp = self.mol.intor("int1e_ipovlp")
+        return self.S_1_ao_block.to_ao()
 
-        def get_S_S_ao(A):
-            ao_matrix = np.zeros((3, self.nao, self.nao))
+    @cached_property
+    def S_1_ao_block(self):
+        # Only rows (and columns) of atom A are nonzero in derivative of atom A
+        int1e_ipovlp = self.mol.intor("int1e_ipovlp")
+        S_1_ao_block = AtomBlockMatrix(self.natm, self.nao, atoms=self.atoms)
+        for A in self.atoms:
             sA = self.mol_slice(A)
-            ao_matrix[:, sA] = -int1e_ipovlp[:, sA]
-            return ao_matrix + ao_matrix.swapaxes(1, 2)
-
-        S_1_ao = np.array([get_S_S_ao(A) for A in range(self.natm)]).reshape((-1, self.nao, self.nao))
-        return S_1_ao
+            S_1_ao_block.add((A, ), sA, slice(None), -int1e_ipovlp[:, sA])
+        return S_1_ao_block
 
     @cached_property
     def eri1_ao(self):
         nao = self.nao
-        natm = self.natm
         int2e_ip1 = self.mol.intor("int2e_ip1")
-        eri1_ao = np.zeros((natm, 3, nao, nao, nao, nao))
-        for A in range(natm):
+        eri1_ao = np.zeros((len(self.atoms), 3, nao, nao, nao, nao))
+        for iA, A in enumerate(self.atoms):
             sA = self.mol_slice(A)
-            eri1_ao[A, :, sA, :, :, :] -= int2e_ip1[:, sA]
-            eri1_ao[A, :, :, sA, :, :] -= int2e_ip1[:, sA].transpose(0, 2, 1, 3, 4)
-            eri1_ao[A, :, :, :, sA, :] -= int2e_ip1[:, sA].transpose(0, 3, 4, 1, 2)
-            eri1_ao[A, :, :, :, :, sA] -= int2e_ip1[:, sA].transpose(0, 3, 4, 2, 1)
+            eri1_ao[iA, :, sA, :, :, :] -= int2e_ip1[:, sA]
+            eri1_ao[iA, :, :, sA, :, :] -= int2e_ip1[:, sA].transpose(0, 2, 1, 3, 4)
+            eri1_ao[iA, :, :, :, sA, :] -= int2e_ip1[:, sA].transpose(0, 3, 4, 1, 2)
+            eri1_ao[iA, :, :, :, :, sA] -= int2e_ip1[:, sA].transpose(0, 3, 4, 2, 1)
         return eri1_ao.reshape((-1, self.nao, self.nao, self.nao, self.nao))
 
     def _get_E_1(self):
-        cx, xc = self.cx, self.xc
+        xc = self.xc
         so = self.so
-        mol, natm = self.mol, self.natm
+        mol, atoms = self.mol, self.atoms
+        natm = len(atoms)
         D = self.D
         H_1_ao = self.H_1_ao
         S_1_mo = self.S_1_mo
         F_0_mo = self.F_0_mo
         grids = self.grids
         grdit_memory = self.grdit_memory
-        scf_grad = self.scf_grad
-
-        grad_total = np.zeros(natm * 3)
-
-        # From memory consumption point, we use higher subroutines in PySCF to generate ERI contribution
-        jk_1 = (
-            + 2 * scf_grad.get_j(dm=D)
-            - cx * scf_grad.get_k(dm=D)
-        )
-        for A in range(natm):
-            sA = self.mol_slice(A)
-            grad_total[3 * A: 3 * (A + 1)] += einsum("tuv, uv -> t", jk_1[:, sA], D[sA])
 
+        grad_total = self._get_E_1_jk().reshape(-1)
         grad_total += einsum("Auv, uv -> A", H_1_ao, D)
         grad_total -= 2 * einsum("Aij, ij -> A", S_1_mo[:, so, so], F_0_mo[so, so])
-        grad_total += grad.rhf.grad_nuc(mol).reshape(-1)
+        grad_total += grad.rhf.grad_nuc(mol, atmlst=atoms).reshape(-1)
 
         # GGA part contiribution
         if self.xc_type == "GGA":
-            grdit = GridIterator(mol, grids, D, deriv=2, memory=grdit_memory)
+            # Per-grid intermediates: A_rho_1, A_rho_2
+            grdit = GridIterator(mol, grids, D, deriv=2, memory=grdit_memory, footprint=8 * 12 * natm, atoms=atoms)
             for grdh in grdit:
                 kerh = KernelHelper(grdh, xc)
                 grad_total += (
@@ -267,6 +450,35 @@ class GradSCF(DerivOnceSCF):
 
         return grad_total.reshape(natm, 3)
 
+    def _get_E_1_jk(self):
+        """
+        Coulomb and exchange contribution to gradient. If J/K are shared with another instance (``jk_deriv``), their
+        derivatives in ``F_1_ao`` of that instance are reused; otherwise they are evaluated by PySCF's gradient
+        ``get_j`` and ``get_k``, without per-atom storage.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (len(atoms), 3).
+        """
+        cx, D = self.cx, self.D
+        E_1_jk = np.zeros((len(self.atoms), 3))
+        if self.jk_deriv is not self:
+            for iA, (A, (_, vj2, _, vk2)) in enumerate(zip(self.atoms, self.jk_deriv.jk_1_ao)):
+                sA = self.mol_slice(A)
+                jk_1 = 2 * vj2 - cx * vk2 if cx != 0 else 2 * vj2
+                E_1_jk[iA] = einsum("tuv, uv -> t", jk_1, D[sA])
+            return E_1_jk
+
+        # From memory consumption point, we use higher subroutines in PySCF to generate ERI contribution
+        jk_1 = 2 * self.scf_grad.get_j(dm=D)
+        if cx != 0:
+            jk_1 -= cx * self.scf_grad.get_k(dm=D)
+        for iA, A in enumerate(self.atoms):
+            sA = self.mol_slice(A)
+            E_1_jk[iA] = einsum("tuv, uv -> t", jk_1[:, sA], D[sA])
+        return E_1_jk
+
 
 # Cubic Inheritance: B2
 class GradNCDFT(DerivOnceNCDFT, GradSCF):
@@ -276,11 +488,10 @@ class GradNCDFT(DerivOnceNCDFT, GradSCF):
         return GradSCF
 
     def _get_E_1(self):
-        natm = self.natm
         so, sv = self.so, self.sv
         B_1 = self.B_1
         Z = self.Z
-        E_1 = 4 * einsum("ai, Aai -> A", Z, B_1[:, sv, so]).reshape((natm, 3))
+        E_1 = 4 * einsum("ai, Aai -> A", Z, B_1[:, sv, so]).reshape((-1, 3))
         E_1 += self.nc_deriv.E_1
         return E_1
 
@@ -288,14 +499,51 @@ class GradNCDFT(DerivOnceNCDFT, GradSCF):
 # Cubic Inheritance: C2
 class GradMP2(DerivOnceMP2, GradSCF):
 
+    @cached_property
+    def E_1_T(self):
+        """
+        Skeleton derivative contribution of amplitudes, :math:`2 T_{ia, jb} (ia|jb)^{A_t}`.
+
+        If ``mp2_batched``, amplitudes are generated by occupied batches, and contracted with
+        :math:`(\\partial_t \\mu \\, a|jb)` and :math:`(\\partial_t \\mu \\, i|jb)` which are transformed
+        integral-directly from ``int2e_ip1`` for each batch of :math:`j`; ``eri1_ao`` is not formed.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (len(atoms), 3).
+        """
+        sc, sv = self.sc, self.sv
+        nao, nvir = self.nao, self.nvir
+        if not self.mp2_batched:
+            return 2 * einsum("iajb, Aiajb -> A", self.T_iajb, self.eri1_mo[:, sc, sv, sc, sv]).reshape((-1, 3))
+
+        mol, Cc, Cv = self.mol, self.C[:, sc], self.Cv
+        ncorr = Cc.shape[-1]
+        I_ao = np.eye(nao)
+        E_1_T_ao = np.zeros((3, nao))
+        for sJ, _, _, T, _ in self._gen_mp2_batch(footprint=3 * nao * (ncorr + nvir) * nvir):
+            nJ = T.shape[0]
+            int2e_ip1_v = ao2mo.general(mol, (I_ao, Cv, Cc[:, sJ], Cv), intor="int2e_ip1", aosym="s2kl", comp=3,
+                                        compact=False, max_memory=self.mp2_memory).reshape((3, nao, nvir, nJ, nvir))
+            int2e_ip1_o = ao2mo.general(mol, (I_ao, Cc, Cc[:, sJ], Cv), intor="int2e_ip1", aosym="s2kl", comp=3,
+                                        compact=False, max_memory=self.mp2_memory).reshape((3, nao, ncorr, nJ, nvir))
+            # Four centers contribute equally by symmetry of T and ERI; nuclear derivative is negative of ip1
+            E_1_T_ao -= 4 * einsum("tuajb, ui, jbia -> tu", int2e_ip1_v, Cc, T)
+            E_1_T_ao -= 4 * einsum("tuijb, ua, jbia -> tu", int2e_ip1_o, Cv, T)
+
+        E_1_T = np.zeros((len(self.atoms), 3))
+        for iA, A in enumerate(self.atoms):
+            _, _, p0, p1 = mol.aoslice_by_atom()[A]
+            E_1_T[iA] = E_1_T_ao[:, p0:p1].sum(axis=1)
+        return E_1_T
+
     def _get_E_1(self):
-        so, sv = self.so, self.sv
-        natm = self.natm
         E_1 = (
-            + np.einsum("pq, Apq -> A", self.D_r, self.B_1)
-            + np.einsum("pq, Apq -> A", self.W_I, self.S_1_mo)
-            + 2 * np.einsum("iajb, Aiajb -> A", self.T_iajb, self.eri1_mo[:, so, sv, so, sv])
-        ).reshape(natm, 3)
+            + einsum("pq, Apq -> A", self.D_r, self.B_1)
+            + einsum("pq, Apq -> A", self.W_I, self.S_1_mo)
+        ).reshape(-1, 3)
+        E_1 += self.E_1_T
         E_1 += super(GradMP2, self)._get_E_1()
         return E_1
 
@@ -304,12 +552,10 @@ class GradMP2(DerivOnceMP2, GradSCF):
 class GradXDH(DerivOnceXDH, GradMP2, GradNCDFT):
 
     def _get_E_1(self):
-        so, sv = self.so, self.sv
-        natm = self.natm
         E_1 = (
-            + np.einsum("pq, Apq -> A", self.D_r, self.B_1)
-            + np.einsum("pq, Apq -> A", self.W_I, self.S_1_mo)
-            + 2 * np.einsum("iajb, Aiajb -> A", self.T_iajb, self.eri1_mo[:, so, sv, so, sv])
-        ).reshape(natm, 3)
+            + einsum("pq, Apq -> A", self.D_r, self.B_1)
+            + einsum("pq, Apq -> A", self.W_I, self.S_1_mo)
+        ).reshape(-1, 3)
+        E_1 += self.E_1_T
         E_1 += self.nc_deriv.E_1
         return E_1
@@ -1,22 +1,186 @@
+import numpy as np
+from pyxdh.Utilities.contraction import contract as einsum
+from scipy.linalg import solve_triangular
+from pyscf.df.grad.rhf import _int3c_wrapper as int3c_wrapper
 
-
-from pyxdh.DerivOnce import DerivOnceDFSCF, DerivOnceDFMP2, GradSCF, GradMP2
+from pyxdh.DerivOnce import DerivOnceDFSCF, DerivOnceDFNCDFT, DerivOnceDFMP2, DerivOnceDFXDH
+from pyxdh.DerivOnce import GradSCF, GradNCDFT, GradMP2, GradXDH
+from pyxdh.Utilities import cached_property
 
 
 class GradDFSCF(DerivOnceDFSCF, GradSCF):
 
-    def _get_E_1(self):
-        E_1 = GradSCF._get_E_1(self)
-        j_1 = self.scf_grad.get_j(dm=self.D)
-        k_1 = self.scf_grad.get_k(dm=self.D)
-        v_aux = j_1.aux - 0.5 * self.cx * k_1.aux
-        E_1 += v_aux
-        return E_1
+    def _get_Ax1_HF_ao(self, dmX, v=None):
+        """
+        Density-fitted counterpart of ``GradSCF._get_Ax1_HF_ao``, built from 3-center (``int3c2e_ip1``,
+        ``int3c2e_ip2``) and 2-center metric (``int2c2e_ip1``) derivative integrals of ``aux_jk``.
+
+        With fitting coefficient tensor :math:`W_{\\mu \\nu, P} = (\\mu \\nu | Q) (J^{-1})_{QP}`, the fitted
+        Coulomb and exchange integrals are :math:`(\\mu \\nu | Q) (J^{-1})_{QP} (P | \\kappa \\lambda)`; all three
+        factors are differentiated.
+
+        Parameters
+        ----------
+        dmX: np.ndarray
+            Symmetric AO density matrices, shape (nX, nao, nao).
+        v: np.ndarray or None
+            Combination coefficients of atomic coordinates, shape (len(atoms) * 3, k); atoms of zero rows are skipped.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (len(atoms), 3, nX, nao, nao), or (k, nX, nao, nao) if ``v`` is given.
+        """
+        mol, aux_jk = self.mol, self.aux_jk
+        atoms, nao, naux = self.atoms, self.nao, aux_jk.nao
+        cx = self.cx
+        W = self.int3c2e_fit_jk
+        ip1, ip2, ip1_2c = self.int3c2e_ip1_jk, self.int3c2e_ip2_jk, self.int2c2e_ip1_jk
+
+        if v is None:
+            ax_ao = np.empty((len(atoms), 3, dmX.shape[0], nao, nao))
+        else:
+            v = v.reshape((len(atoms), 3, -1))
+            ax_ao = np.zeros((v.shape[-1], dmX.shape[0], nao, nao))
+
+        for idx, X in enumerate(dmX):
+            # Fitted density, and half-fitted exchange density
+            c = einsum("klP, kl -> P", W, X)
+            Z = einsum("vlP, lk -> vkP", W, X)
+            # Atom-independent intermediates
+            ip1_c = einsum("tuvP, P -> tuv", ip1, c)
+            ip1_X = einsum("tukP, uk -> tuP", ip1, X)
+            ip2_X = einsum("tklP, kl -> tP", ip2, X)
+            ip1_2c_c = einsum("tPQ, Q -> tP", ip1_2c, c)
+            ip1_Z = einsum("tukP, vkP -> tuv", ip1, Z)
+            ip1_2c_Z = einsum("tPQ, vkQ -> tvkP", ip1_2c, Z)
+
+            for iA, A in enumerate(atoms):
+                if v is not None and not v[iA].any():
+                    continue
+                _, _, p0, p1 = mol.aoslice_by_atom()[A]
+                _, _, p0_aux, p1_aux = aux_jk.aoslice_by_atom()[A]
+                sA, sP = slice(p0, p1), slice(p0_aux, p1_aux)
+
+                # Coulomb: derivative of (P|kl) X_kl - J_PQ c_Q, then contracted with fitting coefficients
+                e = - 2 * ip1_X[:, sA].sum(axis=1)
+                e[:, sP] -= ip2_X[:, sP]
+                e[:, sP] += ip1_2c_c[:, sP]
+                e += einsum("tQP, Q -> tP", ip1_2c[:, sP], c[sP])
+                j_1A = einsum("uvP, tP -> tuv", W, e)
+                j_1A[:, sA] -= ip1_c[:, sA]
+                j_1A[:, :, sA] -= ip1_c[:, sA].swapaxes(-1, -2)
+                j_1A -= einsum("tuvP, P -> tuv", ip2[:, :, :, sP], c[sP])
+
+                # Exchange: k_1A = S + S^T
+                k_1A = np.zeros((3, nao, nao))
+                k_1A[:, sA] -= ip1_Z[:, sA]
+                k_1A -= einsum("tkuP, vkP -> tuv", ip1[:, sA], Z[:, sA])
+                k_1A -= einsum("tukP, vkP -> tuv", ip2[:, :, :, sP], Z[:, :, sP])
+                k_1A += einsum("ukP, tvkP -> tuv", W[:, :, sP], ip1_2c_Z[:, :, :, sP])
+                k_1A += k_1A.swapaxes(-1, -2)
+
+                if v is None:
+                    ax_ao[iA, :, idx] = 2 * j_1A - cx * k_1A
+                else:
+                    ax_ao[:, idx] += einsum("tK, tuv -> Kuv", v[iA], 2 * j_1A - cx * k_1A)
+
+        return ax_ao
+
+    @cached_property
+    def F_1_ao(self):
+        # Density fitting J/K derivatives are evaluated by PySCF's DF Hessian
+        F_1_ao = self.scf_hess.make_h1(self.C, self.mo_occ, atmlst=self.atoms)
+        return np.array([F_1_ao[A] for A in self.atoms]).reshape((-1, self.nao, self.nao))
+
+    def _get_E_1_jk(self):
+        # Coulomb and exchange derivatives of AO and auxiliary basis, by one pass of each of J and K
+        D = self.D
+        j_1 = self.scf_grad.get_j(dm=D)
+        k_1 = self.scf_grad.get_k(dm=D)
+        jk_1 = 2 * j_1 - self.cx * k_1
+        E_1_jk = (j_1.aux - 0.5 * self.cx * k_1.aux).reshape((self.natm, 3))[self.atoms]
+        for iA, A in enumerate(self.atoms):
+            sA = self.mol_slice(A)
+            E_1_jk[iA] += einsum("tuv, uv -> t", jk_1[:, sA], D[sA])
+        return E_1_jk
+
+
+class GradDFNCDFT(DerivOnceDFNCDFT, GradNCDFT, GradDFSCF):
+
+    @property
+    def DerivOnceMethod(self):
+        return GradDFSCF
 
 
 class GradDFMP2(DerivOnceDFMP2, GradMP2):
-    pass
 
+    # GradDFSCF is not base class of GradDFMP2, but density fitting J/K derivatives are the same
+    F_1_ao = GradDFSCF.F_1_ao
+    _get_E_1_jk = GradDFSCF._get_E_1_jk
+
+    @cached_property
+    def E_1_ri(self):
+        """
+        Skeleton derivative contribution of RI integrals; RI counterpart of
+        ``2 * einsum("iajb, Aiajb -> A", T_iajb, eri1_mo[:, so, sv, so, sv])``, without 4-index tensors.
+
+        .. math::
+
+            2 T_{ia, jb} (ia|jb)^{A_t} = 4 \\tilde G_{ia, Q} (ia|Q)^{A_t}
+                - 2 \\tilde Y_{ia, Q} \\tilde G_{ia, R} (Q|R)^{A_t}
+
+        where :math:`\\tilde X_Q = (L^{-T})_{QP} X_P` transforms RI factors back to original auxiliary basis.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (len(atoms), 3).
+        """
+        mol, aux_ri = self.mol, self.aux_ri
+        nocc, nvir, naux = self.nocc, self.nvir, aux_ri.nao
+        Co, Cv, L_ri = self.Co, self.Cv, self.L_ri
+
+        Y_ia = solve_triangular(L_ri, self.Y_ia_ri.reshape(-1, naux).T, lower=True, trans="T")
+        G_ia = solve_triangular(L_ri, self.G_ia_ri.reshape(-1, naux).T, lower=True, trans="T")
+        G_ao = einsum("Qia, ui, va -> uvQ", G_ia.reshape((naux, nocc, nvir)), Co, Cv)
+        G_ao_sym = G_ao + G_ao.swapaxes(0, 1)
+        G_aux = Y_ia @ G_ia.T
+        G_aux += G_aux.T
 
+        int3c2e_ip1 = int3c_wrapper(mol, aux_ri, "int3c2e_ip1", "s1")
+        int3c2e_ip2 = int3c_wrapper(mol, aux_ri, "int3c2e_ip2", "s1")
+        int2c2e_ip1 = aux_ri.intor("int2c2e_ip1")
 
+        E_1_ri = np.zeros((len(self.atoms), 3))
+        for iA, A in enumerate(self.atoms):
+            shl0, shl1, p0, p1 = mol.aoslice_by_atom()[A]
+            shl0_aux, shl1_aux, p0_aux, p1_aux = aux_ri.aoslice_by_atom()[A]
+            sA, sP = slice(p0, p1), slice(p0_aux, p1_aux)
+            E_1_ri[iA] -= 4 * einsum("tuvQ, uvQ -> t",
+                                     int3c2e_ip1((shl0, shl1, 0, mol.nbas, 0, aux_ri.nbas)), G_ao_sym[sA])
+            E_1_ri[iA] -= 4 * einsum("tuvQ, uvQ -> t",
+                                     int3c2e_ip2((0, mol.nbas, 0, mol.nbas, shl0_aux, shl1_aux)), G_ao[:, :, sP])
+            E_1_ri[iA] += 2 * einsum("tPQ, PQ -> t", int2c2e_ip1[:, sP], G_aux[sP])
+        return E_1_ri
 
+    def _get_E_1_corr(self):
+        E_1 = (
+            + einsum("pq, Apq -> A", self.D_r, self.B_1)
+            + einsum("pq, Apq -> A", self.W_I, self.S_1_mo)
+        ).reshape(-1, 3)
+        E_1 += self.E_1_ri
+        return E_1
+
+    def _get_E_1(self):
+        return self._get_E_1_corr() + GradDFSCF._get_E_1(self)
+
+
+class GradDFXDH(DerivOnceDFXDH, GradDFMP2, GradXDH):
+
+    @property
+    def DerivOnceMethod(self):
+        return GradDFSCF
+
+    def _get_E_1(self):
+        return self._get_E_1_corr() + self.nc_deriv.E_1
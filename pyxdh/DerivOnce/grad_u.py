@@ -1,92 +1,185 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # pyscf utilities
-from pyscf import grad
+from pyscf import grad, ao2mo
 # pyxdh utilities
 from pyxdh.DerivOnce import DerivOnceUSCF, GradSCF, DerivOnceUNCDFT, DerivOnceUMP2, DerivOnceUXDH
-from pyxdh.Utilities import GridIterator, KernelHelper, timing, cached_property
+from pyxdh.Utilities import GridIteratorU, KernelHelper, timing, cached_property
 
 
 class GradUSCF(DerivOnceUSCF, GradSCF):
 
+    def __init__(self, config):
+        super(GradUSCF, self).__init__(config)
+        if len(self.atoms) != self.natm:
+            raise NotImplementedError("Perturbation of selected atoms is only implemented for restricted references!")
+
     @cached_property
     def F_1_ao(self) -> np.ndarray:
         return np.array(self.scf_hess.make_h1(self.C, self.mo_occ)).reshape((2, self.natm * 3, self.nao, self.nao))
 
     def _get_E_1(self):
         mol = self.mol
-        natm = self.natm
+        natm, nao = self.natm, self.nao
         cx, xc = self.cx, self.xc
         H_1_ao = self.H_1_ao
-        eri1_ao = self.eri1_ao
         S_1_mo = self.S_1_mo
         F_0_mo = self.F_0_mo
         occ = self.occ
         D = self.D
         grids = self.grids
 
+        # Skeleton derivative of Coulomb and exchange is evaluated integral-directly; eri1_ao is not formed
+        j_1, k_1 = self._get_Ax1_JK_ao(D)
+        j_1, k_1 = j_1.reshape((natm * 3, 2, nao, nao)), k_1.reshape((natm * 3, 2, nao, nao))
+
         E_1 = (
                 + einsum("Auv, xuv -> A", H_1_ao, D)
-                + 0.5 * einsum("Auvkl, yuv, xkl -> A", eri1_ao, D, D)
-                - 0.5 * cx * einsum("Aukvl, xuv, xkl -> A", eri1_ao, D, D)
+                + 0.5 * einsum("Ayuv, xuv -> A", j_1, D)
+                - 0.5 * cx * einsum("Axuv, xuv -> A", k_1, D)
                 - einsum("xApq, xpq, xp, xq -> A", S_1_mo, F_0_mo, occ, occ)
                 + grad.rhf.grad_nuc(mol).reshape(-1)
         )
 
         # GGA part contiribution
         if self.xc_type == "GGA":
-            grdit = zip(GridIterator(mol, grids, D[0], deriv=2), GridIterator(mol, grids, D[1], deriv=2))
+            # AO grid is shared by both spins; per-grid intermediates: A_rho_1, A_rho_2 of each spin
+            grdit = GridIteratorU(mol, grids, D, deriv=2, memory=self.grdit_memory, footprint=2 * 8 * 12 * natm)
             for grdh in grdit:
                 kerh = KernelHelper(grdh, xc)
+                # fg[x, y]: coefficient of spin-y rho_1 in f derivative w.r.t. spin-x rho_1 (from aa, ab, bb sigma)
+                fg = np.array([[2 * kerh.fg[0], kerh.fg[1]], [kerh.fg[1], 2 * kerh.fg[2]]])
                 E_1 += (
-                    + einsum("g, Atg -> At", kerh.fr[0], grdh[0].A_rho_1)
-                    + einsum("g, Atg -> At", kerh.fr[1], grdh[1].A_rho_1)
-                    + 2 * einsum("g, rg, Atrg -> At", kerh.fg[0], grdh[0].rho_1, grdh[0].A_rho_2)
-                    + 2 * einsum("g, rg, Atrg -> At", kerh.fg[2], grdh[1].rho_1, grdh[1].A_rho_2)
-                    + 1 * einsum("g, rg, Atrg -> At", kerh.fg[1], grdh[1].rho_1, grdh[0].A_rho_2)
-                    + 1 * einsum("g, rg, Atrg -> At", kerh.fg[1], grdh[0].rho_1, grdh[1].A_rho_2)
+                    + einsum("xg, xAtg -> At", kerh.fr, grdh.A_rho_1)
+                    + einsum("xyg, yrg, xAtrg -> At", fg, grdh.rho_1, grdh.A_rho_2)
                 ).reshape(-1)
 
         return E_1.reshape((natm, 3))
 
-    def Ax1_Core(self, si, sj, sk, sl, reshape=True):
+    def Ax1_Core(self, si, sj, sk, sl, reshape=True, skeleton=True, U_1=None):
+        """
+        Derivative of A tensor (as in ``Ax0_Core``) on atomic coordinates, contracted with ``X`` of both spins.
+
+        Coulomb and exchange derivatives are evaluated integral-directly (``_get_Ax1_JK_ao``) with spin-resolved
+        density matrices, so ``eri1_ao`` is not formed.
+
+        Parameters
+        ----------
+        skeleton: bool
+            Whether skeleton (integral and grid) derivative is included; it is indexed by atomic coordinates.
+        U_1: np.ndarray or None or 0
+            Orbital response in derivative of GGA kernel, shape (2, nU, nmo, nmo); ``self.U_1`` if None, and excluded
+            if 0. Leading dimension of response part is ``nU``.
+        """
 
         C, Co = self.C, self.Co
         natm, nao = self.natm, self.nao
         cx = self.cx
-        eri1_ao = self.eri1_ao
+        so = self.so
+        with_U = self.xc_type == "GGA" and (U_1 is None or isinstance(U_1, np.ndarray))
+        nU = U_1.shape[1] if isinstance(U_1, np.ndarray) else natm * 3
+
+        def get_dmU():
+            # Only GGA kernel derivative requires U_1, so it is evaluated lazily
+            U = self.U_1 if U_1 is None else U_1
+            dmU = np.array([C[x] @ U[x][:, :, so[x]] @ Co[x].T for x in range(2)])
+            return dmU + dmU.swapaxes(-1, -2)
 
         @timing
         def fx(X_):
-            if self.xc_type != "HF":
-                raise NotImplementedError("DFT is not implemented!")
-
             if not isinstance(X_[0], np.ndarray):
                 return 0
 
-            have_first_dim = len(X_[0].shape) >= 3
-            prop_dim = X_[0].shape[0] if have_first_dim else 1
             restore_shape = list(X_[0].shape[:-2])
+            X = [X_[x].reshape((-1, ) + X_[x].shape[-2:]) for x in range(2)]
+            nX = X[0].shape[0]
 
-            dmX = np.zeros((2, prop_dim, nao, nao))
-            dmX[0] = C[0][:, sk[0]] @ X_[0] @ C[0][:, sl[0]].T
-            dmX[1] = C[1][:, sk[1]] @ X_[1] @ C[1][:, sl[1]].T
+            dmX = np.array([C[x][:, sk[x]] @ X[x] @ C[x][:, sl[x]].T for x in range(2)])
             dmX += dmX.swapaxes(-1, -2)
 
-            ax_ao = (
-                + einsum("Auvkl, xBkl -> ABuv", eri1_ao, dmX)
-                - cx * einsum("Aukvl, xBkl -> xABuv", eri1_ao, dmX)
-            )
-            ax_ao = (
-                einsum("ABuv, ui, vj -> ABij", ax_ao[0], C[0][:, si[0]], C[0][:, sj[0]]),
-                einsum("ABuv, ui, vj -> ABij", ax_ao[1], C[1][:, si[1]], C[1][:, sj[1]]),
-            )
-            ax_ao[0].shape = tuple([ax_ao[0].shape[0]] + restore_shape + list(ax_ao[0].shape[-2:]))
-            ax_ao[1].shape = tuple([ax_ao[1].shape[0]] + restore_shape + list(ax_ao[1].shape[-2:]))
-            return ax_ao
+            # HF Part
+            if skeleton:
+                j_1, k_1 = self._get_Ax1_JK_ao(dmX.reshape((2 * nX, nao, nao)))
+                j_1 = j_1.reshape((natm * 3, 2, nX, nao, nao)).sum(axis=1)
+                k_1 = k_1.reshape((natm * 3, 2, nX, nao, nao)).swapaxes(0, 1)
+                ax_ao = j_1 - cx * k_1
+            else:
+                ax_ao = np.zeros((2, nU, nX, nao, nao))
+
+            # GGA Part
+            if self.xc_type == "GGA" and (skeleton or with_U):
+                ax_ao += self._get_Ax1_GGA_ao(dmX, skeleton, get_dmU() if with_U else None)
+
+            ax = [einsum("ABuv, ui, vj -> ABij", ax_ao[x], C[x][:, si[x]], C[x][:, sj[x]]) for x in range(2)]
+            if reshape:
+                ax = [a.reshape([a.shape[0]] + restore_shape + list(a.shape[-2:])) for a in ax]
+            return tuple(ax)
+
         return fx
 
+    def _get_Ax1_GGA_ao(self, dmX, skeleton=True, dmU=None):
+        """
+        GGA kernel part of ``Ax1_Core`` in AO basis, by spin-resolved kernel derivatives on :math:`(\\rho, \\rho_r)`.
+
+        Parameters
+        ----------
+        dmX: np.ndarray
+            Symmetric AO density matrices of both spins, shape (2, nX, nao, nao).
+        skeleton: bool
+            Whether grid and kernel derivative on atomic coordinates is included.
+        dmU: np.ndarray or None
+            Symmetric AO density response of orbital response, shape (2, nU, nao, nao); excluded if None.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (2, natm * 3, nX, nao, nao), or (2, nU, nX, nao, nao) if not ``skeleton``.
+        """
+        natm, nao = self.natm, self.nao
+        nX = dmX.shape[1]
+        ax_ao = np.zeros((2, natm * 3 if skeleton else dmU.shape[1], nX, nao, nao))
+
+        # Only AO up to second derivative (ao_2T, A_rho_2) are required here
+        # Per-grid intermediates: (xAtB(i)g) density and kernel derivatives, AtBgu and Btgu AO contractions
+        footprint = 8 * nX * (6 * (natm + 1) * (nao + 8) + 64)
+        grdit = GridIteratorU(self.mol, self.grids, self.D, deriv=2, memory=self.grdit_memory, footprint=footprint)
+        for grdh in grdit:
+            _, fxc, kxc = grdh.get_xc_eff(self.xc, deriv=3)
+            rho_X = grdh.get_rho_01(dmX)
+            kxc_X = einsum("xiyjzkg, zBkg -> xiyjBg", kxc, rho_X)
+
+            if skeleton:
+                pd_rho_X = np.array([grdh.get_A_rho_01(dm) for dm in dmX.reshape((2 * nX, nao, nao))])
+                pd_rho_X = pd_rho_X.reshape((2, nX, natm, 3, 4, grdh.ngrid))
+                # Derivative of kernel and of density of dmX
+                pd_M = (
+                    + einsum("xiyjBg, yAtjg -> xAtBig", kxc_X, grdh.get_A_rho_01())
+                    + einsum("xizkg, zBAtkg -> xAtBig", fxc, pd_rho_X)
+                )
+                contrib1 = grdh.get_pair_0(pd_M.reshape((-1, 4, grdh.ngrid)))
+                ax_ao += contrib1.reshape((2, natm * 3, nX, nao, nao))
+
+                # Derivative of AO pairs
+                M = einsum("xizkg, zBkg -> xBig", fxc, rho_X)
+                tmp_contrib = grdh.get_pair_1(M.reshape((-1, 4, grdh.ngrid))).reshape((3, 2, nX, nao, nao))
+                contrib2 = np.zeros((2, natm, 3, nX, nao, nao))
+                for A in range(natm):
+                    sA = self.mol_slice(A)
+                    contrib2[:, A, :, :, sA] += tmp_contrib[:, :, :, sA].swapaxes(0, 1)
+                contrib2 += contrib2.swapaxes(-1, -2)
+                ax_ao += contrib2.reshape((2, natm * 3, nX, nao, nao))
+
+            if dmU is None:
+                continue
+
+            # U contribution to \partial_{A_t} A
+            pdU_M = einsum("xiyjBg, yAjg -> xABig", kxc_X, grdh.get_rho_01(dmU))
+            contrib3 = grdh.get_pair_0(pdU_M.reshape((-1, 4, grdh.ngrid)))
+            ax_ao += contrib3.reshape((2, dmU.shape[1], nX, nao, nao))
+
+        return ax_ao
+
 
 class GradUNCDFT(DerivOnceUNCDFT, GradUSCF):
 
@@ -109,17 +202,63 @@ class GradUNCDFT(DerivOnceUNCDFT, GradUSCF):
 
 class GradUMP2(DerivOnceUMP2, GradUSCF):
 
+    @cached_property
+    def E_1_T(self):
+        """
+        Skeleton derivative contribution of amplitudes, :math:`2 T_{ia, jb} (ia|jb)^{A_t}` summed over spin blocks.
+
+        If ``mp2_batched``, amplitudes of each pass of ``_get_mp2_intermediates`` are generated by correlated occupied
+        batches of first orbital pair, and contracted with derivative integrals of second orbital pair, which are
+        transformed integral-directly from ``int2e_ip1``; ``eri1_ao`` is not formed.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (natm, 3).
+        """
+        sc, sv = self.sc, self.sv
+        natm, nao, nvir = self.natm, self.nao, self.nvir
+        if not self.mp2_batched:
+            T_iajb, eri1_mo = self.T_iajb, self.eri1_mo
+            return (
+                + 2 * einsum("iajb, Aiajb -> A", T_iajb[0], eri1_mo[0][:, sc[0], sv[0], sc[0], sv[0]])
+                + 2 * einsum("iajb, Aiajb -> A", T_iajb[1], eri1_mo[1][:, sc[0], sv[0], sc[1], sv[1]])
+                + 2 * einsum("iajb, Aiajb -> A", T_iajb[2], eri1_mo[2][:, sc[1], sv[1], sc[1], sv[1]])
+            ).reshape((natm, 3))
+
+        mol, Cv = self.mol, self.Cv
+        Cc = self.C[0][:, sc[0]], self.C[1][:, sc[1]]
+        ncorr = Cc[0].shape[1], Cc[1].shape[1]
+        I_ao = np.eye(nao)
+        E_1_T_ao = np.zeros((3, nao))
+        for y, z in [(0, 0), (1, 1), (0, 1), (1, 0)]:
+            # Same-spin passes also account for centers of their first orbital pair by symmetry
+            s = 2 if y == z else 1
+            footprint = 3 * nao * (ncorr[z] + nvir[z]) * nvir[y]
+            for sJ, _, _, T, _ in self._gen_ump2_batch(y, z, footprint=footprint):
+                nJ = T.shape[0]
+                int2e_ip1_v = ao2mo.general(mol, (I_ao, Cv[z], Cc[y][:, sJ], Cv[y]), intor="int2e_ip1",
+                                            aosym="s2kl", comp=3, compact=False, max_memory=self.mp2_memory)
+                int2e_ip1_o = ao2mo.general(mol, (I_ao, Cc[z], Cc[y][:, sJ], Cv[y]), intor="int2e_ip1",
+                                            aosym="s2kl", comp=3, compact=False, max_memory=self.mp2_memory)
+                int2e_ip1_v = int2e_ip1_v.reshape((3, nao, nvir[z], nJ, nvir[y]))
+                int2e_ip1_o = int2e_ip1_o.reshape((3, nao, ncorr[z], nJ, nvir[y]))
+                E_1_T_ao -= 2 * s * einsum("tuajb, ui, jbia -> tu", int2e_ip1_v, Cc[z], T)
+                E_1_T_ao -= 2 * s * einsum("tuijb, ua, jbia -> tu", int2e_ip1_o, Cv[z], T)
+
+        E_1_T = np.zeros((natm, 3))
+        for A in range(natm):
+            _, _, p0, p1 = mol.aoslice_by_atom()[A]
+            E_1_T[A] = E_1_T_ao[:, p0:p1].sum(axis=1)
+        return E_1_T
+
     def _get_E_1(self):
-        so, sv = self.so, self.sv
         natm = self.natm
-        D_r, B_1, W_I, S_1_mo, T_iajb, eri1_mo = self.D_r, self.B_1, self.W_I, self.S_1_mo, self.T_iajb, self.eri1_mo
         E_1 = (
-            + np.einsum("xpq, xApq -> A", self.D_r, self.B_1)
-            + np.einsum("xpq, xApq -> A", self.W_I, self.S_1_mo)
-            + 2 * np.einsum("iajb, Aiajb -> A", T_iajb[0], eri1_mo[0][:, so[0], sv[0], so[0], sv[0]])
-            + 2 * np.einsum("iajb, Aiajb -> A", T_iajb[1], eri1_mo[1][:, so[0], sv[0], so[1], sv[1]])
-            + 2 * np.einsum("iajb, Aiajb -> A", T_iajb[2], eri1_mo[2][:, so[1], sv[1], so[1], sv[1]])
+            + einsum("xpq, xApq -> A", self.D_r, self.B_1)
+            + einsum("xpq, xApq -> A", self.W_I, self.S_1_mo)
         ).reshape((natm, 3))
+        E_1 += self.E_1_T
         E_1 += GradUSCF._get_E_1(self)
         return E_1
 
@@ -127,15 +266,11 @@ class GradUMP2(DerivOnceUMP2, GradUSCF):
 class GradUXDH(DerivOnceUXDH, GradUMP2, GradUNCDFT):
 
     def _get_E_1(self):
-        so, sv = self.so, self.sv
         natm = self.natm
-        D_r, B_1, W_I, S_1_mo, T_iajb, eri1_mo = self.D_r, self.B_1, self.W_I, self.S_1_mo, self.T_iajb, self.eri1_mo
         E_1 = (
-            + np.einsum("xpq, xApq -> A", self.D_r, self.B_1)
-            + np.einsum("xpq, xApq -> A", self.W_I, self.S_1_mo)
-            + 2 * np.einsum("iajb, Aiajb -> A", T_iajb[0], eri1_mo[0][:, so[0], sv[0], so[0], sv[0]])
-            + 2 * np.einsum("iajb, Aiajb -> A", T_iajb[1], eri1_mo[1][:, so[0], sv[0], so[1], sv[1]])
-            + 2 * np.einsum("iajb, Aiajb -> A", T_iajb[2], eri1_mo[2][:, so[1], sv[1], so[1], sv[1]])
+            + einsum("xpq, xApq -> A", self.D_r, self.B_1)
+            + einsum("xpq, xApq -> A", self.W_I, self.S_1_mo)
         ).reshape((natm, 3))
+        E_1 += self.E_1_T
         E_1 += self.nc_deriv.E_1
         return E_1
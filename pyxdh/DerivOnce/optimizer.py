@@ -0,0 +1,156 @@
+# basic utilities
+import numpy as np
+# python utilities
+import copy
+from time import time
+# pyscf utilities
+from pyscf import gto, lib, df
+# pyxdh utilities
+from pyxdh.DerivOnce.deriv_once_r import DerivOnceSCF
+
+
+class GeomOptimizer:
+    """
+    Geometry optimization of gradient instances (``GradSCF``, ``GradNCDFT``, ``GradMP2``, ``GradXDH``, their
+    unrestricted and density-fitted variants) by pyberny.
+
+    At each new geometry, a gradient instance of the same class and configuration is built. If ``warm_start``, the
+    following quantities of the previous step are reused:
+
+    - SCF density as initial guess (``dm0``) of SCF;
+    - layout of DFT grids (CP-HF grids included) and auxiliary basis of density fitting; grids and RI factors
+      themselves depend on geometry, so they are re-generated on the new geometry;
+    - v-o CP-HF solutions ``Z`` and ``D_r`` as AO-basis guesses (``cphf_guess``).
+
+    Cost and numbers of SCF and CP-HF iterations of each step are recorded in ``history``. SCF of initial geometry
+    is performed again from scratch at the first step, so that its number of iterations is recorded as well.
+    """
+
+    def __init__(self, deriv, maxsteps=100, warm_start=True, verbose=False, **berny_params):
+        """
+        Parameters
+        ----------
+        deriv: DerivOnceSCF
+            Gradient instance of initial geometry.
+        maxsteps: int
+        warm_start: bool
+        verbose: bool
+            Whether to print summary of each step.
+        berny_params
+            Convergence parameters of ``berny.Berny``, e.g. ``gradientmax``.
+        """
+        self.deriv = deriv  # type: DerivOnceSCF
+        self.maxsteps = maxsteps
+        self.warm_start = warm_start
+        self.verbose = verbose
+        self.berny_params = berny_params
+        self.history = []  # type: list[dict]
+        self.converged = False
+        # Number of SCF iterations of the last geometry built by ``new_deriv``
+        self.scf_cycles = None
+
+    @property
+    def mol(self) -> gto.Mole:
+        return self.deriv.mol
+
+    def new_deriv(self, mol, warm_start=None):
+        """
+        Gradient instance of the same class and configuration as ``deriv`` at geometry of ``mol``; SCF is performed.
+
+        Parameters
+        ----------
+        mol: gto.Mole
+        warm_start: bool or None
+            Whether to reuse quantities of ``deriv``; ``self.warm_start`` if None.
+
+        Returns
+        -------
+        DerivOnceSCF
+        """
+        prev = self.deriv
+        config = copy.copy(prev.config)
+        # Grids (and DF objects) shared by configuration entries should be still shared in the new configuration
+        memo = {}
+
+        def reset(obj):
+            if id(obj) not in memo:
+                memo[id(obj)] = copy.copy(obj).reset(mol)
+            return memo[id(obj)]
+
+        for key in ("scf_eng", "nc_eng"):
+            if key not in config:
+                continue
+            eng = copy.copy(config[key])
+            for attr in ("grids", "nlcgrids", "with_df"):
+                if getattr(eng, attr, None) is not None:
+                    setattr(eng, attr, reset(getattr(eng, attr)))
+            config[key] = eng.reset(mol)
+        if config.get("cphf_grids") is not None:
+            config["cphf_grids"] = reset(config["cphf_grids"])
+        if config.get("aux_ri") is not None:
+            config["aux_ri"] = df.make_auxmol(mol, config["aux_ri"].basis)
+        config.pop("cphf_guess", None)
+
+        dm0 = None
+        if self.warm_start if warm_start is None else warm_start:
+            dm0 = prev.D
+            config["cphf_guess"] = prev.get_cphf_guess()
+
+        # Count SCF iterations by callback of each cycle
+        scf_eng = config["scf_eng"]
+        eng_callback = scf_eng.callback
+        self.scf_cycles = 0
+
+        def callback(envs):
+            self.scf_cycles += 1
+            if callable(eng_callback):
+                eng_callback(envs)
+
+        scf_eng.callback = callback
+        scf_eng.kernel(dm0=dm0)
+        scf_eng.callback = eng_callback
+        return type(prev)(config)
+
+    def _run_step(self, deriv, scf_cycles, t0):
+        E_1 = deriv.E_1
+        step = {
+            "eng": deriv.eng,
+            "grad_max": abs(E_1).max(),
+            "time": time() - t0,
+            "scf_cycles": scf_cycles,
+            "cphf_cycles": dict(deriv.cphf_cycles),
+        }
+        if hasattr(deriv, "nc_deriv"):
+            step["cphf_cycles"].update(deriv.nc_deriv.cphf_cycles)
+        self.history.append(step)
+        if self.verbose:
+            print("Step {:3d}: E = {:18.10f}, max |grad| = {:10.3e}, time = {:8.2f} s, SCF cycles = {}, "
+                  "CP-HF cycles = {}".format(len(self.history), step["eng"], step["grad_max"], step["time"],
+                                             scf_cycles, step["cphf_cycles"]))
+        return step["eng"], E_1
+
+    def kernel(self):
+        """
+        Returns
+        -------
+        gto.Mole
+            Molecule of optimized geometry; gradient instance of the last step is ``deriv``.
+        """
+        from berny import Berny, geomlib
+
+        mol = self.mol
+        symbols = [mol.atom_symbol(A) for A in range(mol.natm)]
+        geom = geomlib.Geometry(symbols, mol.atom_coords() * lib.param.BOHR)
+        optimizer = Berny(geom, maxsteps=self.maxsteps, **self.berny_params)
+
+        for n, geom in enumerate(optimizer):
+            t0 = time()
+            if n == 0:
+                self.deriv = self.new_deriv(self.mol, warm_start=False)
+            else:
+                mol = self.mol.copy()
+                mol.set_geom_(np.asarray(geom.coords), unit="Angstrom")
+                self.deriv = self.new_deriv(mol)
+            optimizer.send(self._run_step(self.deriv, self.scf_cycles, t0))
+        self.converged = optimizer.converged
+        return self.mol
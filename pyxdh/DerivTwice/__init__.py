@@ -1,6 +1,7 @@
 __all__ = [
     "DerivTwiceSCF", "DerivTwiceNCDFT", "DerivTwiceMP2", "DerivTwiceXDH",
     "HessSCF", "HessNCDFT", "HessMP2", "HessXDH",
+    "HessDFSCF", "HessDFNCDFT",
     "PolarSCF", "PolarNCDFT", "PolarMP2", "PolarXDH",
     "DipDerivSCF", "DipDerivNCDFT", "DipDerivMP2", "DipDerivXDH",
     "DerivTwiceUSCF", "DerivTwiceUMP2",
@@ -10,6 +11,7 @@ __all__ = [
 
 from pyxdh.DerivTwice.deriv_twice_r import DerivTwiceSCF, DerivTwiceNCDFT, DerivTwiceMP2, DerivTwiceXDH
 from pyxdh.DerivTwice.hess_r import HessSCF, HessNCDFT, HessMP2, HessXDH
+from pyxdh.DerivTwice.hess_rdf import HessDFSCF, HessDFNCDFT
 from pyxdh.DerivTwice.polar_r import PolarSCF, PolarNCDFT, PolarMP2, PolarXDH
 from pyxdh.DerivTwice.dipderiv_r import DipDerivSCF, DipDerivNCDFT, DipDerivMP2, DipDerivXDH
 
@@ -1,8 +1,9 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # python utilities
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 import warnings
 # pyscf utilities
 from pyscf.scf import cphf
@@ -27,6 +28,12 @@ class DerivTwiceSCF(ABC):
         self.grdit_memory = 2000
         if "grdit_memory" in config:
             self.grdit_memory = config["grdit_memory"]
+        # Contraction matrix of perturbation B, shape (nB, k); only set in Hessian-vector product or blocked
+        # Hessian, where B is directional with k combined perturbations
+        self.v_B = None  # type: np.ndarray or None
+        # Whether orbital response of A is contracted by adjoint CP-HF instead of solving CP-HF of all perturbations
+        # of A; only valid if B has few perturbations, and `rotation` is True for both A and B
+        self.adjoint_A = False
 
         # Make assertion on coefficient idential of deriv_A and deriv_B instances
         # for some molecules which have degenerate orbital energies,
@@ -34,6 +41,8 @@ class DerivTwiceSCF(ABC):
         assert(np.allclose(self.A.C, self.B.C))
         # After assertion passed, then we can say things may work; however we should not detect intended sabotage
         # So it is recommended to initialize deriv_A and deriv_B with the same runned scf.RHF instance
+        # Perturbation-independent quantities (MP2 amplitudes, relaxed densities, ERI, ...) are then evaluated once
+        self.B.share_context(self.A)
 
         # Basic Information
 
@@ -46,6 +55,17 @@ class DerivTwiceSCF(ABC):
         _, _, p0, p1 = self.mol.aoslice_by_atom()[atm_id]
         return slice(p0, p1)
 
+    def _contract_v_B(self, X):
+        # Contract perturbation B of full second derivative quantities with v_B, if in directional mode
+        if self.v_B is None or not isinstance(X, np.ndarray):
+            return X
+        return np.moveaxis(np.tensordot(X, self.v_B, axes=([1], [0])), -1, 1)
+
+    def _block_to_mo(self, block):
+        if self.v_B is None:
+            return block.to_mo(self.C)
+        return np.stack([block.contract(v).to_mo(self.C) for v in self.v_B.T], axis=1)
+
     # region Basic Properties
 
     @property
@@ -130,18 +150,32 @@ class DerivTwiceSCF(ABC):
     def H_2_ao(self):
         pass
 
+    @cached_property
+    def H_2_ao_block(self):
+        # Atom-block-sparse form of H_2_ao (AtomBlockMatrix), if perturbations are local to atoms
+        return None
+
     @cached_property
     def H_2_mo(self):
-        return self.C.T @ self.H_2_ao @ self.C
+        if self.H_2_ao_block is not None:
+            return self._block_to_mo(self.H_2_ao_block)
+        return self.C.T @ self._contract_v_B(self.H_2_ao) @ self.C
 
     @cached_property
     @abstractmethod
     def S_2_ao(self):
         pass
 
+    @cached_property
+    def S_2_ao_block(self):
+        # Atom-block-sparse form of S_2_ao (AtomBlockMatrix), if perturbations are local to atoms
+        return None
+
     @cached_property
     def S_2_mo(self):
-        return self.C.T @ self.S_2_ao @ self.C
+        if self.S_2_ao_block is not None:
+            return self._block_to_mo(self.S_2_ao_block)
+        return self.C.T @ self._contract_v_B(self.S_2_ao) @ self.C
 
     @cached_property
     @abstractmethod
@@ -167,6 +201,10 @@ class DerivTwiceSCF(ABC):
 
     @cached_property
     def F_2_mo(self):
+        if self.H_2_ao_block is not None:
+            # Dense H_2_ao is not formed
+            F_2_ao_2e = self.F_2_ao_Jcontrib - 0.5 * self.cx * self.F_2_ao_Kcontrib + self.F_2_ao_GGAcontrib
+            return self.H_2_mo + self.C.T @ F_2_ao_2e @ self.C
         return self.C.T @ self.F_2_ao @ self.C
 
     @cached_property
@@ -193,12 +231,24 @@ class DerivTwiceSCF(ABC):
 
         sa, so = self.sa, self.so
         e = self.e
+        C, Co = self.C, A.Co
+
+        # Responses of lines 1 and 4 are evaluated by one AO density
+        dm_AB = (
+            - 0.5 * einsum("ABkl, uk, vl -> ABuv", self.Xi_2[:, :, so, so], Co, Co)
+            + 0.5 * einsum("ABkl, uk, vl -> ABuv", (
+                + einsum("Akm, Blm -> ABkl", A.U_1[:, :, so], B.U_1[:, :, so])
+                + einsum("Bkm, Alm -> ABkl", B.U_1[:, :, so], A.U_1[:, :, so])
+            ), C, C)
+        )
+        # Responses of lines 5 and 6 are batched, and shared with ``pdA_F_0_mo`` of A and B
+        Ax_B_U, Ax_A_U = A.Ax0_Core_batch((sa, sa, sa, so, B.U_1[:, :, so]), (sa, sa, sa, so, A.U_1[:, :, so]))
 
         B_2 = (
-            # line 1
+            # line 1 and 4
             + self.F_2_mo
             - einsum("ABai, i -> ABai", self.Xi_2, e)
-            - 0.5 * Ax0_Core(sa, sa, so, so)(self.Xi_2[:, :, so, so])
+            + Ax0_Core(sa, sa, None, None)(dm_AB)
             # line 2
             + einsum("Apa, Bpi -> ABai", A.U_1, B.F_1_mo)
             + einsum("Api, Bpa -> ABai", A.U_1, B.F_1_mo)
@@ -207,17 +257,12 @@ class DerivTwiceSCF(ABC):
             # line 3
             + einsum("Apa, Bpi, p -> ABai", A.U_1, B.U_1, e)
             + einsum("Bpa, Api, p -> ABai", B.U_1, A.U_1, e)
-            # line 4
-            + 0.5 * Ax0_Core(sa, sa, sa, sa)(
-                + einsum("Akm, Blm -> ABkl", A.U_1[:, :, so], B.U_1[:, :, so])
-                + einsum("Bkm, Alm -> ABkl", B.U_1[:, :, so], A.U_1[:, :, so])
-            )
             # line 5
-            + einsum("Apa, Bpi -> ABai", A.U_1, Ax0_Core(sa, sa, sa, so)(B.U_1[:, :, so]))
-            + einsum("Bpa, Api -> ABai", B.U_1, Ax0_Core(sa, sa, sa, so)(A.U_1[:, :, so]))
+            + einsum("Apa, Bpi -> ABai", A.U_1, Ax_B_U)
+            + einsum("Bpa, Api -> ABai", B.U_1, Ax_A_U)
             # line 6
-            + einsum("Api, Bpa -> ABai", A.U_1, Ax0_Core(sa, sa, sa, so)(B.U_1[:, :, so]))
-            + einsum("Bpi, Apa -> ABai", B.U_1, Ax0_Core(sa, sa, sa, so)(A.U_1[:, :, so]))
+            + einsum("Api, Bpa -> ABai", A.U_1, Ax_B_U)
+            + einsum("Bpi, Apa -> ABai", B.U_1, Ax_A_U)
             # line 7
             + A.Ax1_Core(sa, sa, sa, so)(B.U_1[:, :, so])
             + B.Ax1_Core(sa, sa, sa, so)(A.U_1[:, :, so]).swapaxes(0, 1)
@@ -284,6 +329,23 @@ class DerivTwiceSCF(ABC):
     def eri2_mo(self):
         return einsum("ABuvkl, up, vq, kr, ls -> ABpqrs", self.eri2_ao, self.C, self.C, self.C, self.C)
 
+    @contextmanager
+    def _scope_Ax0_memo(self):
+        """
+        Scope of memoized responses of ``Ax0_Core_batch`` during evaluation of ``E_2``.
+
+        Responses memoized inside this scope (e.g. on ``U_1`` of each block of perturbation B) are evicted on exit, so
+        that the memo in the shared context does not grow with each evaluation; responses memoized before are kept.
+        """
+        memos = list({id(deriv._Ax0_memo): deriv._Ax0_memo for deriv in (self.A, self.B)}.values())
+        kept = [set(memo) for memo in memos]
+        try:
+            yield
+        finally:
+            for memo, keys in zip(memos, kept):
+                for key in set(memo) - keys:
+                    del memo[key]
+
     @cached_property
     def E_2_Skeleton(self):
         return self._get_E_2_Skeleton()
@@ -294,7 +356,8 @@ class DerivTwiceSCF(ABC):
 
     @cached_property
     def E_2(self):
-        return self._get_E_2()
+        with self._scope_Ax0_memo():
+            return self._get_E_2()
 
     @cached_property
     def pdB_F_A_mo(self):
@@ -304,8 +367,12 @@ class DerivTwiceSCF(ABC):
             + self.F_2_mo
             + einsum("Apm, Bmq -> ABpq", A.F_1_mo, B.U_1)
             + einsum("Amq, Bmp -> ABpq", A.F_1_mo, B.U_1)
-            + A.Ax1_Core(sa, sa, sa, so)(B.U_1[:, :, so])
         )
+        if not self.adjoint_A:
+            pdB_F_A_mo += A.Ax1_Core(sa, sa, sa, so)(B.U_1[:, :, so])
+        else:
+            # GGA kernel response of A is not evaluated; see _get_pdB_B_A_U_1_A_y
+            pdB_F_A_mo += A.Ax1_Core(sa, sa, sa, so, U_1=0)(B.U_1[:, :, so])
         return pdB_F_A_mo
 
     @cached_property
@@ -322,17 +389,27 @@ class DerivTwiceSCF(ABC):
     def pdB_B_A(self):
         A, B = self.A, self.B
         so, sa = self.so, self.sa
+        C, Co = self.C, A.Co
         Ax0_Core = A.Ax0_Core
+        # Responses of pdB_S_A_mo and U_1 S_1_mo terms are evaluated by one AO density;
+        # response of S_1_mo of A is shared with ``B_1`` of A
+        dm_AB = (
+            + 0.5 * einsum("ABkl, uk, vl -> ABuv", self.pdB_S_A_mo[:, :, so, so], Co, Co)
+            + einsum("ABmk, um, vk -> ABuv", einsum("Bml, Akl -> ABmk", B.U_1[:, :, so], A.S_1_mo[:, so, so]), C, Co)
+        )
+        Ax_A_S = A.Ax0_Core_batch((sa, sa, so, so, A.S_1_mo[:, so, so]))[0]
         pdB_B_A = (
             + self.pdB_F_A_mo
             - self.pdB_S_A_mo * self.e
             - einsum("Apm, Bqm -> ABpq", A.S_1_mo, B.pdA_F_0_mo)
-            - 0.5 * B.Ax1_Core(sa, sa, so, so)(A.S_1_mo[:, so, so]).swapaxes(0, 1)
-            - 0.5 * Ax0_Core(sa, sa, so, so)(self.pdB_S_A_mo[:, :, so, so])
-            - Ax0_Core(sa, sa, sa, so)(einsum("Bml, Akl -> ABmk", B.U_1[:, :, so], A.S_1_mo[:, so, so]))
-            - 0.5 * einsum("Bmp, Amq -> ABpq", B.U_1, Ax0_Core(sa, sa, so, so)(A.S_1_mo[:, so, so]))
-            - 0.5 * einsum("Bmq, Amp -> ABpq", B.U_1, Ax0_Core(sa, sa, so, so)(A.S_1_mo[:, so, so]))
+            - Ax0_Core(sa, sa, None, None)(dm_AB)
+            - 0.5 * einsum("Bmp, Amq -> ABpq", B.U_1, Ax_A_S)
+            - 0.5 * einsum("Bmq, Amp -> ABpq", B.U_1, Ax_A_S)
         )
+        # Ax1_Core of B could be zero, e.g. B being dipole in HF
+        pdB_B_A_Ax1 = B.Ax1_Core(sa, sa, so, so)(A.S_1_mo[:, so, so])
+        if isinstance(pdB_B_A_Ax1, np.ndarray):
+            pdB_B_A -= 0.5 * pdB_B_A_Ax1.swapaxes(0, 1)
         return pdB_B_A
 
     @cached_property
@@ -344,6 +421,54 @@ class DerivTwiceSCF(ABC):
 
     # endregion
 
+    # region Adjoint orbital response utilities
+
+    def _contract_A_U_1(self, y):
+        """
+        Contraction of occupied columns of ``A.U_1`` with ``y``, i.e.
+        :math:`\\sum_{pi} U_{pi}^\\mathbb{A} y_{pi}^\\mathbb{B}`.
+
+        In adjoint mode, ``A.U_1`` is not evaluated; by symmetry of the CP-HF equation, one adjoint CP-HF
+        equation of ``y`` is solved instead of CP-HF equations of all perturbations of A.
+
+        Parameters
+        ----------
+        y: np.ndarray
+            Shape (nB, nmo, nocc).
+
+        Returns
+        -------
+        np.ndarray
+            Shape (nA, nB).
+        """
+        A = self.A
+        so, sv = self.so, self.sv
+        if not self.adjoint_A:
+            return einsum("Api, Bpi -> AB", A.U_1[:, :, so], y)
+        z = cphf.solve(
+            A.Ax0_Core(sv, so, sv, so, in_cphf=True),
+            self.e,
+            A.scf_eng.mo_occ,
+            y[:, sv, so],
+            max_cycle=100,
+            tol=A.cphf_tol,
+            hermi=False
+        )[0].reshape(y[:, sv, so].shape)
+        return (
+            + einsum("Aai, Bai -> AB", A.B_1[:, sv, so], z)
+            - 0.5 * einsum("Aki, Bki -> AB", A.S_1_mo[:, so, so], y[:, so])
+        )
+
+    def _get_pdB_B_A_U_1_A_y(self, Y):
+        # In adjoint mode, GGA kernel response of A in pdB_B_A (contracted with Y) is not evaluated; this gives
+        # its equivalent y in _contract_A_U_1, by symmetry of the third functional derivative
+        if not self.adjoint_A or self.xc_type != "GGA":
+            return 0
+        W = self.A.Ax1_Core(None, None, self.sa, self.sa, skeleton=False, U_1=self.B.U_1)(Y)
+        return einsum("Buv, up, vi -> Bpi", W, self.C, self.Co)
+
+    # endregion
+
     # region Getters
 
     @abstractmethod
@@ -352,11 +477,19 @@ class DerivTwiceSCF(ABC):
 
     def _get_E_2_U(self):
         A, B = self.A, self.B
-        Xi_2 = self.Xi_2
         so, sa = self.so, self.sa
         e, eo = self.e, self.eo
         Ax0_Core = self.A.Ax0_Core
 
+        if self.adjoint_A:
+            # Orbital response of A is not required, by variational property of SCF energy
+            E_2_U = 4 * einsum("Bpi, Api -> AB", B.U_1[:, :, so], A.F_1_mo[:, :, so] - A.S_1_mo[:, :, so] * eo)
+            E_2_U -= 2 * einsum("Aki, Bki -> AB", A.S_1_mo[:, so, so], B.pdA_F_0_mo[:, so, so])
+            if isinstance(self.S_2_mo, np.ndarray):
+                E_2_U -= 2 * einsum("ABi, i -> AB", self.S_2_mo.diagonal(0, -1, -2)[:, :, so], eo)
+            return E_2_U
+
+        Xi_2 = self.Xi_2
         E_2_U = - 2 * einsum("ABi, i -> AB", Xi_2.diagonal(0, -1, -2)[:, :, so], eo)
         E_2_U += 4 * einsum("Bpi, Api -> AB", B.U_1[:, :, so], A.F_1_mo[:, :, so])
         E_2_U += 4 * einsum("Api, Bpi -> AB", A.U_1[:, :, so], B.F_1_mo[:, :, so])
@@ -403,8 +536,13 @@ class DerivTwiceNCDFT(DerivTwiceSCF, ABC):
     def _get_E_2_U(self):
         A, B = self.A, self.B
         so, sv = self.so, self.sv
+        Z_mo = np.zeros((self.nmo, self.nmo))
+        Z_mo[sv, so] = self.Z
+        y = np.zeros((B.U_1.shape[0], self.nmo, self.nocc))
+        y[:, sv] = 4 * self.RHS_B
+        y += 4 * self._get_pdB_B_A_U_1_A_y(Z_mo)
         E_2_U = 4 * einsum("Bpi, Api -> AB", B.U_1[:, :, so], A.nc_deriv.F_1_mo[:, :, so])
-        E_2_U += 4 * einsum("Aai, Bai -> AB", A.U_1[:, sv, so], self.RHS_B)
+        E_2_U += self._contract_A_U_1(y)
         E_2_U += 4 * einsum("ABai, ai -> AB", self.pdB_B_A[:, :, sv, so], self.Z)
         E_2_U -= 2 * einsum("Aki, Bki -> AB", A.S_1_mo[:, so, so], B.pdA_nc_F_0_mo[:, so, so])
         E_2_U -= 2 * einsum("ABki, ki -> AB", self.pdB_S_A_mo[:, :, so, so], A.nc_deriv.F_0_mo[so, so])
@@ -435,24 +573,30 @@ class DerivTwiceMP2(DerivTwiceSCF, ABC):
 
     # region Properties
 
+    @property
+    def sc(self):
+        return self.A.sc
+
     @property
     def pdB_pdpA_eri0_iajb(self):
         A, B = self.A, self.B
-        so, sv = self.so, self.sv
+        sc, sv = self.sc, self.sv
         eri1_mo, U_1 = A.eri1_mo, B.U_1
+        Cc = self.C[:, sc]
         pdB_pdpA_eri0_iajb = (
-            + np.einsum("ABuvkl, up, vq, kr, ls -> ABpqrs", self.eri2_ao, self.Co, self.Cv, self.Co, self.Cv)
-            + np.einsum("Apjkl, Bpi -> ABijkl", eri1_mo[:, :, sv, so, sv], U_1[:, :, so])
-            + np.einsum("Aipkl, Bpj -> ABijkl", eri1_mo[:, so, :, so, sv], U_1[:, :, sv])
-            + np.einsum("Aijpl, Bpk -> ABijkl", eri1_mo[:, so, sv, :, sv], U_1[:, :, so])
-            + np.einsum("Aijkp, Bpl -> ABijkl", eri1_mo[:, so, sv, so, :], U_1[:, :, sv])
+            + einsum("Apjkl, Bpi -> ABijkl", eri1_mo[:, :, sv, sc, sv], U_1[:, :, sc])
+            + einsum("Aipkl, Bpj -> ABijkl", eri1_mo[:, sc, :, sc, sv], U_1[:, :, sv])
+            + einsum("Aijpl, Bpk -> ABijkl", eri1_mo[:, sc, sv, :, sv], U_1[:, :, sc])
+            + einsum("Aijkp, Bpl -> ABijkl", eri1_mo[:, sc, sv, sc, :], U_1[:, :, sv])
         )
+        if isinstance(self.eri2_ao, np.ndarray):
+            pdB_pdpA_eri0_iajb += einsum("ABuvkl, up, vq, kr, ls -> ABpqrs", self.eri2_ao, Cc, self.Cv, Cc, self.Cv)
         return pdB_pdpA_eri0_iajb
 
     def _get_RHS_B(self):
         B = self.B
-        so, sv, sa = self.so, self.sv, self.sa
-        U_1, D_r, pdB_F_0_mo, eri0_mo = B.U_1, B.D_r, B.pdA_F_0_mo, B.eri0_mo
+        so, sv, sa, sc = self.so, self.sv, self.sa, self.sc
+        U_1, D_r, pdB_F_0_mo = B.U_1, B.D_r, B.pdA_F_0_mo
         Ax0_Core, Ax1_Core = B.Ax0_Core, B.Ax1_Core
         pdB_D_r_oovv = B.pdA_D_r_oovv
 
@@ -463,36 +607,56 @@ class DerivTwiceMP2(DerivTwiceSCF, ABC):
         # D_r Part
         RHS_B += Ax0_Core(sv, so, sa, sa)(pdB_D_r_oovv)
         RHS_B += Ax1_Core(sv, so, sa, sa)(D_r)
-        RHS_B += np.einsum("Apa, pi -> Aai", U_1[:, :, sv], Ax0_Core(sa, so, sa, sa)(D_r))
-        RHS_B += np.einsum("Api, ap -> Aai", U_1[:, :, so], Ax0_Core(sv, sa, sa, sa)(D_r))
-        RHS_B += Ax0_Core(sv, so, sa, sa)(np.einsum("Amp, pq -> Amq", U_1, D_r))
-        RHS_B += Ax0_Core(sv, so, sa, sa)(np.einsum("Amq, pq -> Apm", U_1, D_r))
+        RHS_B += einsum("Apa, pi -> Aai", U_1[:, :, sv], Ax0_Core(sa, so, sa, sa)(D_r))
+        RHS_B += einsum("Api, ap -> Aai", U_1[:, :, so], Ax0_Core(sv, sa, sa, sa)(D_r))
+        RHS_B += Ax0_Core(sv, so, sa, sa)(einsum("Amp, pq -> Amq", U_1, D_r))
+        RHS_B += Ax0_Core(sv, so, sa, sa)(einsum("Amq, pq -> Apm", U_1, D_r))
         # (ea - ei) * Dai
-        RHS_B += np.einsum("Aca, ci -> Aai", pdB_F_0_mo[:, sv, sv], D_r[sv, so])
-        RHS_B -= np.einsum("Aki, ak -> Aai", pdB_F_0_mo[:, so, so], D_r[sv, so])
+        RHS_B += einsum("Aca, ci -> Aai", pdB_F_0_mo[:, sv, sv], D_r[sv, so])
+        RHS_B -= einsum("Aki, ak -> Aai", pdB_F_0_mo[:, so, so], D_r[sv, so])
         # 2-pdm part
-        RHS_B -= 4 * np.einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb, eri0_mo[so, so, sv, so])
-        RHS_B += 4 * np.einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb, eri0_mo[sv, sv, so, sv])
-        RHS_B -= 4 * np.einsum("jakb, Aijbk -> Aai", B.T_iajb, pdA_eri0_mo[:, so, so, sv, so])
-        RHS_B += 4 * np.einsum("ibjc, Aabjc -> Aai", B.T_iajb, pdA_eri0_mo[:, sv, sv, so, sv])
+        RHS_B -= 4 * einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb, B.get_eri0_mo("ocvc"))
+        RHS_B[:, :, sc] += 4 * einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb, B.get_eri0_mo("vvcv"))
+        RHS_B -= 4 * einsum("jakb, Aijbk -> Aai", B.T_iajb, pdA_eri0_mo[:, so, sc, sv, sc])
+        RHS_B[:, :, sc] += 4 * einsum("ibjc, Aabjc -> Aai", B.T_iajb, pdA_eri0_mo[:, sv, sv, sc, sv])
 
         return RHS_B
 
+    def _contract_A_U_1(self, y):
+        A = self.A
+        if not self.adjoint_A or not A.frozen:
+            return super(DerivTwiceMP2, self)._contract_A_U_1(y)
+        # Core-correlated blocks of U_1 (see DerivOnceMP2._get_U_1) are linear in v-o block of U_1
+        sf, sc, sv, so = self.A.sf, self.sc, self.sv, self.so
+        e = self.e
+        y_fc = y[:, sf, sc] - y[:, sc, sf].swapaxes(-1, -2)
+        g = y_fc / (e[sf, None] - e[None, sc])
+        y = y.copy()
+        y[:, sv, so] -= A.Ax0_Core(sv, so, sf, sc)(g)
+        return (
+            + super(DerivTwiceMP2, self)._contract_A_U_1(y)
+            - einsum("AIi, BIi -> AB", A.B_1[:, sf, sc], g)
+            + 0.5 * einsum("AIi, BIi -> AB", A.S_1_mo[:, sf, sc], y_fc)
+        )
+
     def _get_E_2_MP2_Contrib(self):
         A, B = self.A, self.B
-        so, sv = self.so, self.sv
+        so, sv, sc = self.so, self.sv, self.sc
 
+        y = np.zeros((B.U_1.shape[0], self.nmo, self.nocc))
+        y[:, sv] = self.RHS_B
+        y += self._get_pdB_B_A_U_1_A_y(self.D_r)
         E_2_MP2_Contrib = (
             # D_r * B
-            + np.einsum("pq, ABpq -> AB", self.D_r, self.pdB_B_A)
-            + np.einsum("Bpq, Apq -> AB", B.pdA_D_r_oovv, A.B_1)
-            + np.einsum("Aai, Bai -> AB", A.U_1[:, sv, so], self.RHS_B)
+            + einsum("pq, ABpq -> AB", self.D_r, self.pdB_B_A)
+            + einsum("Bpq, Apq -> AB", B.pdA_D_r_oovv, A.B_1)
+            + self._contract_A_U_1(y)
             # W_I * S
-            + np.einsum("pq, ABpq -> AB", self.W_I, self.pdB_S_A_mo)
-            + np.einsum("Bpq, Apq -> AB", B.pdA_W_I, A.S_1_mo)
+            + einsum("pq, ABpq -> AB", self.W_I, self.pdB_S_A_mo)
+            + einsum("Bpq, Apq -> AB", B.pdA_W_I, A.S_1_mo)
             # T * g
-            + 2 * np.einsum("Biajb, Aiajb -> AB", B.pdA_T_iajb, A.eri1_mo[:, so, sv, so, sv])
-            + 2 * np.einsum("iajb, ABiajb -> AB", self.T_iajb, self.pdB_pdpA_eri0_iajb)
+            + 2 * einsum("Biajb, Aiajb -> AB", B.pdA_T_iajb, A.eri1_mo[:, sc, sv, sc, sv])
+            + 2 * einsum("iajb, ABiajb -> AB", self.T_iajb, self.pdB_pdpA_eri0_iajb)
         )
         return E_2_MP2_Contrib
 
@@ -520,7 +684,7 @@ class DerivTwiceXDH(DerivTwiceMP2, DerivTwiceNCDFT, ABC):
     def _get_E_2_U(self):
         A, B = self.A, self.B
         so = self.so
-        E_2_U = 4 * np.einsum("Bpi, Api -> AB", B.U_1[:, :, so], A.nc_deriv.F_1_mo[:, :, so])
-        E_2_U -= 2 * np.einsum("Aki, Bki -> AB", A.S_1_mo[:, so, so], B.pdA_nc_F_0_mo[:, so, so])
-        E_2_U -= 2 * np.einsum("ABki, ki -> AB", self.pdB_S_A_mo[:, :, so, so], A.nc_deriv.F_0_mo[so, so])
+        E_2_U = 4 * einsum("Bpi, Api -> AB", B.U_1[:, :, so], A.nc_deriv.F_1_mo[:, :, so])
+        E_2_U -= 2 * einsum("Aki, Bki -> AB", A.S_1_mo[:, so, so], B.pdA_nc_F_0_mo[:, so, so])
+        E_2_U -= 2 * einsum("ABki, ki -> AB", self.pdB_S_A_mo[:, :, so, so], A.nc_deriv.F_0_mo[so, so])
         return E_2_U
@@ -1,6 +1,6 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # python utilities
 from abc import ABC
 # pyxdh utilities
@@ -20,14 +20,28 @@ class DerivTwiceUSCF(DerivTwiceSCF, ABC):
     def F_2_ao(self):
         return self.H_2_ao + self.F_2_ao_Jcontrib - self.cx * self.F_2_ao_Kcontrib + self.F_2_ao_GGAcontrib
 
+    @cached_property
+    def H_2_mo(self):
+        if self.H_2_ao_block is not None:
+            return np.array([self.H_2_ao_block.to_mo(self.C[0]), self.H_2_ao_block.to_mo(self.C[1])])
+        if not isinstance(self.H_2_ao, np.ndarray):
+            return 0
+        return einsum("ABuv, xup, xvq -> xABpq", self.H_2_ao, self.C, self.C)
+
     @cached_property
     def S_2_mo(self):
+        if self.S_2_ao_block is not None:
+            return np.array([self.S_2_ao_block.to_mo(self.C[0]), self.S_2_ao_block.to_mo(self.C[1])])
         if not isinstance(self.S_2_ao, np.ndarray):
             return 0
         return einsum("ABuv, xup, xvq -> xABpq", self.S_2_ao, self.C, self.C)
 
     @cached_property
     def F_2_mo(self):
+        if self.H_2_ao_block is not None:
+            # Dense H_2_ao is not formed
+            F_2_ao_2e = self.F_2_ao_Jcontrib - self.cx * self.F_2_ao_Kcontrib + self.F_2_ao_GGAcontrib
+            return self.H_2_mo + einsum("xABuv, xup, xvq -> xABpq", F_2_ao_2e, self.C, self.C)
         if not isinstance(self.F_2_ao, np.ndarray):
             return 0
         return einsum("xABuv, xup, xvq -> xABpq", self.F_2_ao, self.C, self.C)
@@ -121,8 +135,9 @@ class DerivTwiceUMP2(DerivTwiceMP2, DerivTwiceUSCF, DerivTwiceSCF, ABC):
     @cached_property
     def pdB_pdpA_eri0_iajb(self):
         A, B = self.A, self.B
-        so, sv, sa = self.so, self.sv, self.sa
+        sv, sa, sc = self.sv, self.sa, self.sc
         eri1_mo, U_1 = A.eri1_mo, B.U_1
+        Cc = self.C[0][:, sc[0]], self.C[1][:, sc[1]]
         sigma_list = [
             [0, 0, 0],
             [1, 0, 1],
@@ -131,17 +146,17 @@ class DerivTwiceUMP2(DerivTwiceMP2, DerivTwiceUSCF, DerivTwiceSCF, ABC):
         pdB_pdpA_eri0_iajb = [None, None, None]
         for x, y, z in sigma_list:
             pdB_pdpA_eri0_iajb[x] = (
-                + np.einsum("ABuvkl, up, vq, kr, ls -> ABpqrs", self.eri2_ao, self.Co[y], self.Cv[y], self.Co[z], self.Cv[z])
-                + np.einsum("Apjkl, Bpi -> ABijkl", eri1_mo[x][:, sa[y], sv[y], so[z], sv[z]], U_1[y][:, :, so[y]])
-                + np.einsum("Aipkl, Bpj -> ABijkl", eri1_mo[x][:, so[y], sa[y], so[z], sv[z]], U_1[y][:, :, sv[y]])
-                + np.einsum("Aijpl, Bpk -> ABijkl", eri1_mo[x][:, so[y], sv[y], sa[z], sv[z]], U_1[z][:, :, so[z]])
-                + np.einsum("Aijkp, Bpl -> ABijkl", eri1_mo[x][:, so[y], sv[y], so[z], sa[z]], U_1[z][:, :, sv[z]])
+                + einsum("ABuvkl, up, vq, kr, ls -> ABpqrs", self.eri2_ao, Cc[y], self.Cv[y], Cc[z], self.Cv[z])
+                + einsum("Apjkl, Bpi -> ABijkl", eri1_mo[x][:, sa[y], sv[y], sc[z], sv[z]], U_1[y][:, :, sc[y]])
+                + einsum("Aipkl, Bpj -> ABijkl", eri1_mo[x][:, sc[y], sa[y], sc[z], sv[z]], U_1[y][:, :, sv[y]])
+                + einsum("Aijpl, Bpk -> ABijkl", eri1_mo[x][:, sc[y], sv[y], sa[z], sv[z]], U_1[z][:, :, sc[z]])
+                + einsum("Aijkp, Bpl -> ABijkl", eri1_mo[x][:, sc[y], sv[y], sc[z], sa[z]], U_1[z][:, :, sv[z]])
             )
         return pdB_pdpA_eri0_iajb
 
     def _get_RHS_B(self):
         B = self.B
-        so, sv, sa = self.so, self.sv, self.sa
+        so, sv, sa, sc = self.so, self.sv, self.sa, self.sc
         U_1, D_r, pdB_F_0_mo, eri0_mo = B.U_1, B.D_r, B.pdA_F_0_mo, B.eri0_mo
         Ax0_Core, Ax1_Core = B.Ax0_Core, B.Ax1_Core
         pdB_D_r_oovv = B.pdA_D_r_oovv
@@ -157,58 +172,58 @@ class DerivTwiceUMP2(DerivTwiceMP2, DerivTwiceUSCF, DerivTwiceSCF, ABC):
         Ax1_D_r = Ax1_Core(sv, so, sa, sa)(D_r)
         Ax0_D_r = Ax0_Core(sa, sa, sa, sa)(D_r)
         Ax0_U_D = Ax0_Core(sv, so, sa, sa)((
-            np.einsum("Amp, pq -> Amq", U_1[0], D_r[0]) + np.einsum("Amq, pq -> Apm", U_1[0], D_r[0]),
-            np.einsum("Amp, pq -> Amq", U_1[1], D_r[1]) + np.einsum("Amq, pq -> Apm", U_1[1], D_r[1]),
+            einsum("Amp, pq -> Amq", U_1[0], D_r[0]) + einsum("Amq, pq -> Apm", U_1[0], D_r[0]),
+            einsum("Amp, pq -> Amq", U_1[1], D_r[1]) + einsum("Amq, pq -> Apm", U_1[1], D_r[1]),
         ))
         for x in range(2):
             RHS_B[x] = Ax0_pdB_D_r_oovv[x]
             if isinstance(Ax1_D_r, np.ndarray):
                 RHS_B[x] += Ax1_D_r[x]
-            RHS_B[x] += np.einsum("Apa, pi -> Aai", U_1[x][:, sa[x], sv[x]], Ax0_D_r[x][sa[x], so[x]])
-            RHS_B[x] += np.einsum("Api, ap -> Aai", U_1[x][:, sa[x], so[x]], Ax0_D_r[x][sv[x], sa[x]])
+            RHS_B[x] += einsum("Apa, pi -> Aai", U_1[x][:, sa[x], sv[x]], Ax0_D_r[x][sa[x], so[x]])
+            RHS_B[x] += einsum("Api, ap -> Aai", U_1[x][:, sa[x], so[x]], Ax0_D_r[x][sv[x], sa[x]])
             RHS_B[x] += Ax0_U_D[x]
         # (ea - ei) * Dai
         for x in range(2):
-            RHS_B[x] += np.einsum("Aca, ci -> Aai", pdB_F_0_mo[x][:, sv[x], sv[x]], D_r[x][sv[x], so[x]])
-            RHS_B[x] -= np.einsum("Aki, ak -> Aai", pdB_F_0_mo[x][:, so[x], so[x]], D_r[x][sv[x], so[x]])
+            RHS_B[x] += einsum("Aca, ci -> Aai", pdB_F_0_mo[x][:, sv[x], sv[x]], D_r[x][sv[x], so[x]])
+            RHS_B[x] -= einsum("Aki, ak -> Aai", pdB_F_0_mo[x][:, so[x], so[x]], D_r[x][sv[x], so[x]])
         # 2-pdm part
         RHS_B[0] += (
-            - 4 * np.einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb[0], eri0_mo[0][   so[0], so[0], sv[0], so[0]])
-            + 4 * np.einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb[0], eri0_mo[0][   sv[0], sv[0], so[0], sv[0]])
-            - 4 * np.einsum("jakb, Aijbk -> Aai", B.T_iajb[0], pdA_eri0_mo[0][:, so[0], so[0], sv[0], so[0]])
-            + 4 * np.einsum("ibjc, Aabjc -> Aai", B.T_iajb[0], pdA_eri0_mo[0][:, sv[0], sv[0], so[0], sv[0]]))
-        RHS_B[0] += (
-            - 2 * np.einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   so[0], so[0], sv[1], so[1]])
-            + 2 * np.einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   sv[0], sv[0], so[1], sv[1]])
-            - 2 * np.einsum("jakb, Aijbk -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, so[0], so[0], sv[1], so[1]])
-            + 2 * np.einsum("ibjc, Aabjc -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, sv[0], sv[0], so[1], sv[1]]))
-        RHS_B[1] += (
-            - 4 * np.einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb[2], eri0_mo[2][   so[1], so[1], sv[1], so[1]])
-            + 4 * np.einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb[2], eri0_mo[2][   sv[1], sv[1], so[1], sv[1]])
-            - 4 * np.einsum("jakb, Aijbk -> Aai", B.T_iajb[2], pdA_eri0_mo[2][:, so[1], so[1], sv[1], so[1]])
-            + 4 * np.einsum("ibjc, Aabjc -> Aai", B.T_iajb[2], pdA_eri0_mo[2][:, sv[1], sv[1], so[1], sv[1]]))
+            - 4 * einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb[0], eri0_mo[0][   so[0], sc[0], sv[0], sc[0]])
+            - 4 * einsum("jakb, Aijbk -> Aai", B.T_iajb[0], pdA_eri0_mo[0][:, so[0], sc[0], sv[0], sc[0]])
+            - 2 * einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   so[0], sc[0], sv[1], sc[1]])
+            - 2 * einsum("jakb, Aijbk -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, so[0], sc[0], sv[1], sc[1]]))
+        RHS_B[0][:, :, sc[0]] += (
+            + 4 * einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb[0], eri0_mo[0][   sv[0], sv[0], sc[0], sv[0]])
+            + 4 * einsum("ibjc, Aabjc -> Aai", B.T_iajb[0], pdA_eri0_mo[0][:, sv[0], sv[0], sc[0], sv[0]])
+            + 2 * einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   sv[0], sv[0], sc[1], sv[1]])
+            + 2 * einsum("ibjc, Aabjc -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, sv[0], sv[0], sc[1], sv[1]]))
         RHS_B[1] += (
-            - 2 * np.einsum("Akbja, bkij -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   sv[0], so[0], so[1], so[1]])
-            + 2 * np.einsum("Ajcib, jcab -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   so[0], sv[0], sv[1], sv[1]])
-            - 2 * np.einsum("kbja, Abkij -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, sv[0], so[0], so[1], so[1]])
-            + 2 * np.einsum("jcib, Ajcab -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, so[0], sv[0], sv[1], sv[1]]))
+            - 4 * einsum("Ajakb, ijbk -> Aai", B.pdA_T_iajb[2], eri0_mo[2][   so[1], sc[1], sv[1], sc[1]])
+            - 4 * einsum("jakb, Aijbk -> Aai", B.T_iajb[2], pdA_eri0_mo[2][:, so[1], sc[1], sv[1], sc[1]])
+            - 2 * einsum("Akbja, bkij -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   sv[0], sc[0], so[1], sc[1]])
+            - 2 * einsum("kbja, Abkij -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, sv[0], sc[0], so[1], sc[1]]))
+        RHS_B[1][:, :, sc[1]] += (
+            + 4 * einsum("Aibjc, abjc -> Aai", B.pdA_T_iajb[2], eri0_mo[2][   sv[1], sv[1], sc[1], sv[1]])
+            + 4 * einsum("ibjc, Aabjc -> Aai", B.T_iajb[2], pdA_eri0_mo[2][:, sv[1], sv[1], sc[1], sv[1]])
+            + 2 * einsum("Ajcib, jcab -> Aai", B.pdA_T_iajb[1], eri0_mo[1][   sc[0], sv[0], sv[1], sv[1]])
+            + 2 * einsum("jcib, Ajcab -> Aai", B.T_iajb[1], pdA_eri0_mo[1][:, sc[0], sv[0], sv[1], sv[1]]))
 
         return tuple(RHS_B)
 
     def _get_E_2_MP2_Contrib(self):
         A, B = self.A, self.B
-        so, sv = self.so, self.sv
+        so, sv, sc = self.so, self.sv, self.sc
 
         E_2_MP2_Contrib = np.zeros((A.U_1[0].shape[0], B.U_1[0].shape[0]))
         for x in range(2):
             E_2_MP2_Contrib += (
                 # D_r * B
-                + np.einsum("pq, ABpq -> AB", self.D_r[x], self.pdB_B_A[x])
-                + np.einsum("Bpq, Apq -> AB", B.pdA_D_r_oovv[x], A.B_1[x])
-                + np.einsum("Aai, Bai -> AB", A.U_1[x][:, sv[x], so[x]], self.RHS_B[x])
+                + einsum("pq, ABpq -> AB", self.D_r[x], self.pdB_B_A[x])
+                + einsum("Bpq, Apq -> AB", B.pdA_D_r_oovv[x], A.B_1[x])
+                + einsum("Aai, Bai -> AB", A.U_1[x][:, sv[x], so[x]], self.RHS_B[x])
                 # W_I * S
-                + np.einsum("pq, ABpq -> AB", self.W_I[x], self.pdB_S_A_mo[x])
-                + np.einsum("Bpq, Apq -> AB", B.pdA_W_I[x], A.S_1_mo[x])
+                + einsum("pq, ABpq -> AB", self.W_I[x], self.pdB_S_A_mo[x])
+                + einsum("Bpq, Apq -> AB", B.pdA_W_I[x], A.S_1_mo[x])
             )
         # T * g
         sigma_list = [
@@ -218,7 +233,7 @@ class DerivTwiceUMP2(DerivTwiceMP2, DerivTwiceUSCF, DerivTwiceSCF, ABC):
         ]
         for x, y, z in sigma_list:
             E_2_MP2_Contrib += (
-                + 2 * np.einsum("Biajb, Aiajb -> AB", B.pdA_T_iajb[x], A.eri1_mo[x][:, so[y], sv[y], so[z], sv[z]])
-                + 2 * np.einsum("iajb, ABiajb -> AB", self.T_iajb[x], self.pdB_pdpA_eri0_iajb[x])
+                + 2 * einsum("Biajb, Aiajb -> AB", B.pdA_T_iajb[x], A.eri1_mo[x][:, sc[y], sv[y], sc[z], sv[z]])
+                + 2 * einsum("iajb, ABiajb -> AB", self.T_iajb[x], self.pdB_pdpA_eri0_iajb[x])
             )
         return E_2_MP2_Contrib
@@ -1,34 +1,69 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
+# python utilities
+import copy
 # pyxdh utilities
 from pyxdh.DerivTwice import DerivTwiceSCF, DerivTwiceNCDFT, DerivTwiceMP2, DerivTwiceXDH
 from pyxdh.Utilities import cached_property
 
 
 class DipDerivSCF(DerivTwiceSCF):
+    """
+    Dipole derivatives, with ``deriv_A`` being dipole and ``deriv_B`` being nuclear coordinate derivative instances.
+
+    By the interchange theorem, ``E_2`` is evaluated as transpose of the same quantity with A and B exchanged, in
+    which orbital response of nuclear coordinates is contracted by adjoint CP-HF equations of three dipole
+    components (see ``DerivTwiceSCF._contract_A_U_1``); so CP-HF equations of 3 * natm nuclear perturbations are
+    not solved. This requires ``rotation`` of both instances to be True; otherwise the direct formulation is used.
+    """
 
     @property
     def A_is_B(self) -> bool:
         return False
 
+    @property
+    def grad_deriv(self):
+        # Nuclear coordinate derivative instance, which is A in adjoint mode
+        return self.A if self.adjoint_A else self.B
+
+    def _get_adjoint_swap(self):
+        swap = copy.copy(self)
+        swap.__dict__ = {key: val for key, val in self.__dict__.items() if not key.startswith("_")}
+        swap.A, swap.B = self.B, self.A
+        swap.adjoint_A = True
+        return swap
+
+    @cached_property
+    def E_2(self):
+        if not self.adjoint_A and self.A.rotation and self.B.rotation:
+            return self._get_adjoint_swap().E_2.T
+        with self._scope_Ax0_memo():
+            return self._get_E_2()
+
     @cached_property
     def H_2_ao(self):
         mol = self.mol
-        natm, nao = mol.natm, mol.nao
+        atoms, nao = self.grad_deriv.atoms, mol.nao
+        natm = len(atoms)
         mol_slice = self.A.mol_slice
         int1e_irp = mol.intor("int1e_irp").reshape(3, 3, nao, nao)
         H_2_ao = np.zeros((3, natm, 3, nao, nao))
-        for A in range(natm):
+        for iA, A in enumerate(atoms):
             sA = mol_slice(A)
-            H_2_ao[:, A, :, :, sA] = int1e_irp[:, :, :, sA]
+            H_2_ao[:, iA, :, :, sA] = int1e_irp[:, :, :, sA]
         H_2_ao += H_2_ao.swapaxes(-1, -2)
-        return H_2_ao.reshape((3, 3 * natm, nao, nao))
+        H_2_ao.shape = (3, 3 * natm, nao, nao)
+        return H_2_ao.swapaxes(0, 1) if self.adjoint_A else H_2_ao
 
     @cached_property
     def S_2_ao(self):
         return 0
 
+    @cached_property
+    def S_2_mo(self):
+        return 0
+
     @cached_property
     def F_2_ao_JKcontrib(self):
         return 0, 0
@@ -45,23 +80,30 @@ class DipDerivSCF(DerivTwiceSCF):
         return einsum("ABuv, uv -> AB", self.H_2_ao, self.A.D)
 
     def _get_E_2_U(self):
+        if self.adjoint_A:
+            return super(DipDerivSCF, self)._get_E_2_U()
         A, B = self.A, self.B
         so = self.so
         return 4 * einsum("Api, Bpi -> AB", A.H_1_mo[:, :, so], B.U_1[:, :, so])
 
     def _get_E_2(self):
         mol = self.mol
-        natm = mol.natm
+        atoms = self.grad_deriv.atoms
+        natm = len(atoms)
         dipderiv_nuc = np.zeros((3, natm, 3))
-        for A in range(natm):
-            dipderiv_nuc[:, A, :] = np.eye(3) * mol.atom_charge(A)
+        for iA, A in enumerate(atoms):
+            dipderiv_nuc[:, iA, :] = np.eye(3) * mol.atom_charge(A)
         dipderiv_nuc.shape = (3, 3 * natm)
+        if self.adjoint_A:
+            dipderiv_nuc = dipderiv_nuc.T
         return self._get_E_2_Skeleton() + self._get_E_2_U() + dipderiv_nuc
 
 
 class DipDerivNCDFT(DerivTwiceNCDFT, DipDerivSCF):
 
     def _get_E_2_U(self):
+        if self.adjoint_A:
+            return DerivTwiceNCDFT._get_E_2_U(self)
         A, B = self.A, self.B
         so, sv = self.so, self.sv
         E_2_U = 4 * einsum("Bpi, Api -> AB", B.U_1[:, :, so], A.nc_deriv.F_1_mo[:, :, so])
@@ -73,13 +115,15 @@ class DipDerivNCDFT(DerivTwiceNCDFT, DipDerivSCF):
 class DipDerivMP2(DerivTwiceMP2, DipDerivSCF):
 
     def _get_E_2_MP2_Contrib(self):
+        if self.adjoint_A:
+            return DerivTwiceMP2._get_E_2_MP2_Contrib(self)
         A, B = self.A, self.B
         so, sv = self.so, self.sv
 
         E_2_MP2_Contrib = (
-            + np.einsum("Bpq, Apq -> AB", B.pdA_D_r_oovv, A.B_1)
-            + np.einsum("Aai, Bai -> AB", A.U_1[:, sv, so], self.RHS_B)
-            + np.einsum("pq, ABpq -> AB", self.D_r, self.pdB_F_A_mo)
+            + einsum("Bpq, Apq -> AB", B.pdA_D_r_oovv, A.B_1)
+            + einsum("Aai, Bai -> AB", A.U_1[:, sv, so], self.RHS_B)
+            + einsum("pq, ABpq -> AB", self.D_r, self.pdB_F_A_mo)
         )
         return E_2_MP2_Contrib
 
@@ -87,6 +131,8 @@ class DipDerivMP2(DerivTwiceMP2, DipDerivSCF):
 class DipDerivXDH(DerivTwiceXDH, DipDerivMP2, DipDerivNCDFT):
 
     def _get_E_2_U(self):
+        if self.adjoint_A:
+            return DerivTwiceXDH._get_E_2_U(self)
         return DipDerivMP2._get_E_2_U(self)
 
 
@@ -1,45 +1,103 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
+# python utilities
+import copy
 # pyscf utilities
+from pyscf import gto
 from pyscf.scf import _vhf
 # pyxdh utilities
 from pyxdh.DerivTwice import DerivTwiceSCF, DerivTwiceNCDFT, DerivTwiceMP2, DerivTwiceXDH
-from pyxdh.Utilities import timing, GridIterator, KernelHelper, cached_property
+from pyxdh.Utilities import timing, GridIterator, KernelHelper, cached_property, AtomBlockMatrix
+from pyxdh.Utilities.grid_iterator import IDX_2, SYM_2, SYM_3T
 
 
 # Cubic Inheritance: A2
 class HessSCF(DerivTwiceSCF):
 
+    def __init__(self, config):
+        super(HessSCF, self).__init__(config)
+        # Number of perturbations of B in each block of E_2; if None, E_2 is evaluated in one pass
+        self.E_2_blocksize = config.get("E_2_blocksize", None)  # type: int or None
+        # GGA skeleton Hessian of all perturbations, by (grids, xc); shared with copies of blocks of B
+        self._E_2_Skeleton_GGA = {}  # type: dict
+
     # Assert A and B are the same GradSCF instance
     @property
     def A_is_B(self) -> bool:
         return True
 
+    @property
+    def atoms(self):
+        # Perturbed (active) atoms of GradSCF instance
+        return self.A.atoms
+
     @cached_property
     def H_2_ao(self):
-        scf_hess = self.A.scf_hess
-        dhess, nao = self.natm * 3, self.nao
-        H_2_ao = np.array([[scf_hess.hcore_generator()(A, B) for B in range(self.natm)] for A in range(self.natm)])
-        return H_2_ao.swapaxes(1, 2).reshape((dhess, dhess, nao, nao))
+        return self.H_2_ao_block.to_ao()
+
+    @cached_property
+    def H_2_ao_block(self):
+        """
+        Atom-block-sparse form of ``H_2_ao``; same terms to PySCF's ``hcore_generator``.
+
+        AO derivative integrals (kinetic and nuclear attraction) only occupy atom blocks; nuclear attraction
+        operator derivatives of atom :math:`C` occupy full-width rows of the other atom when :math:`A \\neq B`, and
+        the whole matrix when :math:`A = B = C`, so that storage is :math:`O(n_\\mathrm{atom} n_\\mathrm{AO}^2)`.
+
+        Returns
+        -------
+        AtomBlockMatrix
+        """
+        mol, atoms, nao = self.mol, self.atoms, self.nao
+        h1aa, h1ab = self.A.scf_hess.get_hcore(mol)
+        ecp_atoms = set(mol._ecpbas[:, gto.ATOM_OF]) if mol.has_ecp() else set()
+
+        # Operator derivative of nucleus C only contributes to perturbations of C itself
+        H_2_ao_block = AtomBlockMatrix(self.natm, nao, order=2, atoms=atoms)
+        for C in atoms:
+            sC = self.mol_slice(C)
+            with mol.with_rinv_at_nucleus(C):
+                rinv2aa = mol.intor("int1e_ipiprinv") * mol.atom_charge(C)
+                rinv2ab = mol.intor("int1e_iprinvip") * mol.atom_charge(C)
+                if C in ecp_atoms:
+                    rinv2aa -= mol.intor("ECPscalar_ipiprinv")
+                    rinv2ab -= mol.intor("ECPscalar_iprinvip")
+            rinv2aa, rinv2ab = rinv2aa.reshape((3, 3, nao, nao)), rinv2ab.reshape((3, 3, nao, nao))
+            # A = B = C: operator derivative spans the whole matrix
+            h_CC = - rinv2aa - rinv2ab
+            h_CC[:, :, sC] += h1aa[:, :, sC] + 2 * rinv2aa[:, :, sC] + rinv2ab[:, :, sC]
+            h_CC[:, :, sC] += rinv2ab[:, :, :, sC].swapaxes(-1, -2)
+            h_CC[:, :, sC, sC] += h1ab[:, :, sC, sC]
+            H_2_ao_block.add((C, C), slice(None), slice(None), h_CC)
+            # A != B: operator derivative of one atom, on AO rows of the other atom
+            for X in atoms:
+                if X == C:
+                    continue
+                sX = self.mol_slice(X)
+                H_2_ao_block.add((C, X), sC, sX, h1ab[:, :, sC, sX])
+                H_2_ao_block.add((C, X), sX, slice(None), rinv2aa[:, :, sX] + rinv2ab[:, :, sX].swapaxes(0, 1))
+                H_2_ao_block.add((X, C), sX, slice(None), rinv2aa[:, :, sX] + rinv2ab[:, :, sX])
+        return H_2_ao_block
 
     @cached_property
     def S_2_ao(self):
-        int1e_ipovlpip = self.mol.intor("int1e_ipovlpip")
-        int1e_ipipovlp = self.mol.intor("int1e_ipipovlp")
+        return self.S_2_ao_block.to_ao()
 
-        def get_S_SS_ao(A, B):
-            ao_matrix = np.zeros((9, self.nao, self.nao))
+    @cached_property
+    def S_2_ao_block(self):
+        # Only atom blocks (A, A) and (A, B) are nonzero in derivative of atoms A and B
+        nao = self.nao
+        int1e_ipovlpip = self.mol.intor("int1e_ipovlpip").reshape((3, 3, nao, nao))
+        int1e_ipipovlp = self.mol.intor("int1e_ipipovlp").reshape((3, 3, nao, nao))
+        S_2_ao_block = AtomBlockMatrix(self.natm, nao, order=2, atoms=self.atoms)
+        for A in self.atoms:
             sA = self.mol_slice(A)
-            sB = self.mol_slice(B)
-            ao_matrix[:, sA, sB] = int1e_ipovlpip[:, sA, sB]
-            if A == B:
-                ao_matrix[:, sA] += int1e_ipipovlp[:, sA]
-            return (ao_matrix + ao_matrix.swapaxes(1, 2)).reshape(3, 3, self.nao, self.nao)
-
-        dhess, nao = self.natm * 3, self.nao
-        S_2_ao = np.array([[get_S_SS_ao(A, B) for B in range(self.natm)] for A in range(self.natm)])
-        return S_2_ao.swapaxes(1, 2).reshape((dhess, dhess, nao, nao))
+            S_2_ao_block.add((A, A), sA, slice(None), int1e_ipipovlp[:, :, sA])
+            for B in self.atoms:
+                sB = self.mol_slice(B)
+                S_2_ao_block.add((A, B), sA, sB, int1e_ipovlpip[:, :, sA, sB])
+        return S_2_ao_block
 
     @cached_property
     @timing
@@ -207,18 +265,47 @@ class HessSCF(DerivTwiceSCF):
         return (Jcontrib.swapaxes(1, 2).reshape((dhess, dhess, nao, nao)),
                 Kcontrib.swapaxes(1, 2).reshape((dhess, dhess, nao, nao)))
 
+    def _get_B_atoms(self):
+        # Indices (in ``atoms``) of perturbation B that are not discarded by v_B, and v_B restricted to them
+        natm = len(self.atoms)
+        if self.v_B is None:
+            return list(range(natm)), None
+        iBs = [iB for iB in range(natm) if self.v_B[3 * iB:3 * iB + 3].any()]
+        return iBs, self.v_B.reshape((natm, 3, -1))[iBs].reshape((3 * len(iBs), -1))
+
     @cached_property
     @timing
     def F_2_ao_GGAcontrib(self):
         if self.xc_type != "GGA":
             return 0
 
-        natm = self.natm
+        atoms = self.atoms
+        natm = len(atoms)
         nao = self.nao
-
-        F_2_ao_GGA = np.zeros((natm, natm, 3, 3, nao, nao))
-
-        grdit = GridIterator(self.mol, self.grids, self.D, deriv=3, memory=self.grdit_memory)
+        dhess = natm * 3
+        # Only atoms of B that contribute to v_B are evaluated
+        iBs, v_B = self._get_B_atoms()
+        nB = len(iBs)
+        if nB == 0:
+            return np.zeros((dhess, v_B.shape[1], nao, nao))
+
+        def contract_v_B(contrib):
+            # Perturbation B is contracted in each grid batch, so only contracted matrices are accumulated
+            contrib = contrib.swapaxes(1, 2).reshape((dhess, nB * 3, nao, nao))
+            if v_B is None:
+                return contrib
+            return np.moveaxis(np.tensordot(contrib, v_B, axes=([1], [0])), -1, 1)
+
+        F_2_ao_GGA = 0
+
+        # Fixed cost of each grid batch: two (natm, nB, 3, 3, nao, nao) contributions alive at once, and Btsuv
+        # intermediates of all atoms; grid batches are sized from the remaining memory
+        fixed = 8 * 9 * natm * nao ** 2 * (2 * nB + 1)
+        memory = max(self.grdit_memory - fixed / 1e6, 0)
+        # Per-grid intermediates: AB_rho_2, AB_gamma_2, AB_rho_3 of all atoms, pdpd_* (ABtsg) and ABtsgu, Btsgu AO
+        # contractions of atoms of B
+        footprint = 8 * (45 * natm ** 2 + 9 * natm * nB * (nao + 5) + 9 * natm * nao)
+        grdit = GridIterator(self.mol, self.grids, self.D, deriv=3, memory=memory, footprint=footprint, atoms=atoms)
         for grdh in grdit:
             kerh = KernelHelper(grdh, self.xc, deriv=3)
             pd_fr = kerh.frr * grdh.A_rho_1 + kerh.frg * grdh.A_gamma_1
@@ -228,75 +315,80 @@ class HessSCF(DerivTwiceSCF):
             pd_frg = kerh.frrg * grdh.A_rho_1 + kerh.frgg * grdh.A_gamma_1
             pd_fgg = kerh.frgg * grdh.A_rho_1 + kerh.fggg * grdh.A_gamma_1
             pdpd_fr = (
-                    + einsum("Bsg, Atg -> ABtsg", pd_frr, grdh.A_rho_1)
-                    + einsum("Bsg, Atg -> ABtsg", pd_frg, grdh.A_gamma_1)
-                    + kerh.frr * grdh.AB_rho_2 + kerh.frg * grdh.AB_gamma_2
+                    + einsum("Bsg, Atg -> ABtsg", pd_frr[iBs], grdh.A_rho_1)
+                    + einsum("Bsg, Atg -> ABtsg", pd_frg[iBs], grdh.A_gamma_1)
+                    + kerh.frr * grdh.AB_rho_2[:, iBs] + kerh.frg * grdh.AB_gamma_2[:, iBs]
             )
             pdpd_fg = (
-                    + einsum("Bsg, Atg -> ABtsg", pd_frg, grdh.A_rho_1)
-                    + einsum("Bsg, Atg -> ABtsg", pd_fgg, grdh.A_gamma_1)
-                    + kerh.frg * grdh.AB_rho_2 + kerh.fgg * grdh.AB_gamma_2
+                    + einsum("Bsg, Atg -> ABtsg", pd_frg[iBs], grdh.A_rho_1)
+                    + einsum("Bsg, Atg -> ABtsg", pd_fgg[iBs], grdh.A_gamma_1)
+                    + kerh.frg * grdh.AB_rho_2[:, iBs] + kerh.fgg * grdh.AB_gamma_2[:, iBs]
             )
-            pdpd_rho_1 = grdh.AB_rho_3
+            pdpd_rho_1 = grdh.AB_rho_3[:, iBs]
 
             # Contrib 1
             contrib1 = (
                     + 0.5 * einsum("ABtsg, gu, gv -> ABtsuv", pdpd_fr, grdh.ao_0, grdh.ao_0)
                     + 2 * einsum("ABtsg, rg, rgu, gv -> ABtsuv", pdpd_fg, grdh.rho_1, grdh.ao_1, grdh.ao_0)
-                    + 2 * einsum("Atg, Bsrg, rgu, gv -> ABtsuv", pd_fg, pd_rho_1, grdh.ao_1, grdh.ao_0)
-                    + 2 * einsum("Bsg, Atrg, rgu, gv -> ABtsuv", pd_fg, pd_rho_1, grdh.ao_1, grdh.ao_0)
+                    + 2 * einsum("Atg, Bsrg, rgu, gv -> ABtsuv", pd_fg, pd_rho_1[iBs], grdh.ao_1, grdh.ao_0)
+                    + 2 * einsum("Bsg, Atrg, rgu, gv -> ABtsuv", pd_fg[iBs], pd_rho_1, grdh.ao_1, grdh.ao_0)
                     + 2 * einsum("g, ABtsrg, rgu, gv -> ABtsuv", kerh.fg, pdpd_rho_1, grdh.ao_1, grdh.ao_0)
             )
             contrib1 += contrib1.swapaxes(-1, -2)
-            F_2_ao_GGA += contrib1
+            F_2_ao_GGA += contract_v_B(contrib1)
+            contrib1 = None
 
             # Contrib 2
             tmp_contrib = (
                     - einsum("Bsg, tgu, gv -> Btsuv", pd_fr, grdh.ao_1, grdh.ao_0)
                     - 2 * einsum("Bsg, rg, tgu, rgv -> Btsuv", pd_fg, grdh.rho_1, grdh.ao_1, grdh.ao_1)
-                    - 2 * einsum("Bsg, rg, trgu, gv -> Btsuv", pd_fg, grdh.rho_1, grdh.ao_2, grdh.ao_0)
+                    - 2 * einsum("Bsg, rg, trT, Tgu, gv -> Btsuv", pd_fg, grdh.rho_1, SYM_2, grdh.ao_2T, grdh.ao_0)
                     - 2 * einsum("g, Bsrg, tgu, rgv -> Btsuv", kerh.fg, pd_rho_1, grdh.ao_1, grdh.ao_1)
-                    - 2 * einsum("g, Bsrg, trgu, gv -> Btsuv", kerh.fg, pd_rho_1, grdh.ao_2, grdh.ao_0)
+                    - 2 * einsum("g, Bsrg, trT, Tgu, gv -> Btsuv", kerh.fg, pd_rho_1, SYM_2, grdh.ao_2T, grdh.ao_0)
             )
-            contrib2 = np.zeros((natm, natm, 3, 3, nao, nao))
-            for A in range(natm):
+            # Rows of A with perturbation B, and rows of B with perturbation A (exchange of A and B)
+            contrib2 = np.zeros((natm, nB, 3, 3, nao, nao))
+            for iA, A in enumerate(atoms):
                 sA = self.mol_slice(A)
-                contrib2[A, :, :, :, sA] += tmp_contrib[:, :, :, sA]
-            contrib2 += contrib2.transpose((0, 1, 2, 3, 5, 4))
-            contrib2 += contrib2.transpose((1, 0, 3, 2, 4, 5))
-            F_2_ao_GGA += contrib2
+                contrib2[iA, :, :, :, sA] += tmp_contrib[iBs][:, :, :, sA]
+            for jB, iB in enumerate(iBs):
+                sB = self.mol_slice(atoms[iB])
+                contrib2[:, jB, :, :, sB] += tmp_contrib[:, :, :, sB].swapaxes(1, 2)
+            contrib2 += contrib2.swapaxes(-1, -2)
+            F_2_ao_GGA += contract_v_B(contrib2)
+            contrib2 = None
 
             # Contrib 3
-            contrib3 = np.zeros((natm, natm, 3, 3, nao, nao))
+            contrib3 = np.zeros((natm, nB, 3, 3, nao, nao))
 
             tmp_contrib = (
-                    + einsum("g, tsgu, gv -> tsuv", kerh.fr, grdh.ao_2, grdh.ao_0)
-                    + 2 * einsum("g, rg, tsrgu, gv -> tsuv", kerh.fg, grdh.rho_1, grdh.ao_3, grdh.ao_0)
-                    + 2 * einsum("g, rg, tsgu, rgv -> tsuv", kerh.fg, grdh.rho_1, grdh.ao_2, grdh.ao_1)
-            )
-            for A in range(natm):
-                sA = self.mol_slice(A)
-                contrib3[A, A, :, :, sA] += tmp_contrib[:, :, sA]
+                    + einsum("g, Tgu, gv -> Tuv", kerh.fr, grdh.ao_2T, grdh.ao_0)
+                    + 2 * einsum("g, rg, rTP, Pgu, gv -> Tuv", kerh.fg, grdh.rho_1, SYM_3T, grdh.ao_3P, grdh.ao_0)
+                    + 2 * einsum("g, rg, Tgu, rgv -> Tuv", kerh.fg, grdh.rho_1, grdh.ao_2T, grdh.ao_1)
+            )[IDX_2]
+            for jB, iB in enumerate(iBs):
+                sB = self.mol_slice(atoms[iB])
+                contrib3[iB, jB, :, :, sB] += tmp_contrib[:, :, sB]
             tmp_contrib = (
                     + einsum("g, tgu, sgv -> tsuv", kerh.fr, grdh.ao_1, grdh.ao_1)
-                    + 2 * einsum("g, rg, trgu, sgv -> tsuv", kerh.fg, grdh.rho_1, grdh.ao_2, grdh.ao_1)
-                    + 2 * einsum("g, rg, tgu, srgv -> tsuv", kerh.fg, grdh.rho_1, grdh.ao_1, grdh.ao_2)
+                    + 2 * einsum("g, rg, trT, Tgu, sgv -> tsuv", kerh.fg, grdh.rho_1, SYM_2, grdh.ao_2T, grdh.ao_1)
+                    + 2 * einsum("g, rg, tgu, srT, Tgv -> tsuv", kerh.fg, grdh.rho_1, grdh.ao_1, SYM_2, grdh.ao_2T)
             )
-            for A in range(natm):
-                for B in range(natm):
-                    sA, sB = self.mol_slice(A), self.mol_slice(B)
-                    contrib3[A, B, :, :, sA, sB] += tmp_contrib[:, :, sA, sB]
+            for iA, A in enumerate(atoms):
+                for jB, iB in enumerate(iBs):
+                    sA, sB = self.mol_slice(A), self.mol_slice(atoms[iB])
+                    contrib3[iA, jB, :, :, sA, sB] += tmp_contrib[:, :, sA, sB]
             contrib3 += contrib3.swapaxes(-1, -2)
-            F_2_ao_GGA += contrib3
+            F_2_ao_GGA += contract_v_B(contrib3)
+            contrib3 = None
 
-        # Finalize
-        dhess = natm * 3
-        return F_2_ao_GGA.swapaxes(1, 2).reshape((dhess, dhess, nao, nao))
+        return F_2_ao_GGA
 
     @cached_property
     @timing
     def eri2_ao(self):
-        natm = self.natm
+        atoms = self.atoms
+        natm = len(atoms)
         nao = self.nao
         mol_slice = self.mol_slice
 
@@ -328,17 +420,31 @@ class HessSCF(DerivTwiceSCF):
 
             return eri2.reshape((3, 3, nao, nao, nao, nao))
 
-        return np.array([[get_eri2(A, B) for B in range(natm)] for A in range(natm)])\
+        if self.v_B is not None:
+            # Only one atom pair is stored at a time; atoms of B not in v_B are skipped
+            nv = self.v_B.shape[1]
+            eri2_v = np.zeros((natm, 3, nv, nao, nao, nao, nao))
+            for iA, A in enumerate(atoms):
+                for iB, B in enumerate(atoms):
+                    vB = self.v_B[3 * iB:3 * iB + 3]
+                    if vB.any():
+                        eri2_v[iA] += einsum("tsuvkl, sK -> tKuvkl", get_eri2(A, B), vB)
+            return eri2_v.reshape((natm * 3, nv, nao, nao, nao, nao))
+
+        return np.array([[get_eri2(A, B) for B in atoms] for A in atoms])\
             .swapaxes(1, 2).reshape((natm * 3, natm * 3, nao, nao, nao, nao))
 
+    @cached_property
+    def E_2(self):
+        with self._scope_Ax0_memo():
+            if self.E_2_blocksize is None or self.v_B is not None:
+                return self._get_E_2()
+            return self._get_E_2_blocked()
+
     @timing
     def _get_E_2_Skeleton(self, grids=None, xc=None, cx=None, xc_type=None):
 
-        mol = self.mol
-        mol_slice = self.mol_slice
-        natm = self.natm
         D = self.D
-        dhess = natm * 3
 
         if grids is None:
             grids = self.grids
@@ -349,64 +455,141 @@ class HessSCF(DerivTwiceSCF):
         if xc_type is None:
             xc_type = self.xc_type
 
-        # GGA Contribution
-        E_SS_GGA_contrib1 = np.zeros((natm, natm, 3, 3))
-        E_SS_GGA_contrib2 = np.zeros((natm, natm, 3, 3))
-        E_SS_GGA_contrib3 = np.zeros((natm, natm, 3, 3))
+        # GGA Contribution; evaluated once for all perturbations B, and contracted by v_B of each block
+        E_SS_GGA_contrib = 0
         if xc_type == "GGA":
-            grdit = GridIterator(mol, grids, D, deriv=3, memory=self.grdit_memory)
-            for grdh in grdit:
-                kerh = KernelHelper(grdh, xc)
-
-                tmp_tensor_1 = (
-                        + 2 * einsum("g, Tgu, gv -> Tuv", kerh.fr, grdh.ao_2T, grdh.ao_0)
-                        + 4 * einsum("g, rg, rTgu, gv -> Tuv", kerh.fg, grdh.rho_1, grdh.ao_3T, grdh.ao_0)
-                        + 4 * einsum("g, rg, Tgu, rgv -> Tuv", kerh.fg, grdh.rho_1, grdh.ao_2T, grdh.ao_1)
-                )
-                XX, XY, XZ, YY, YZ, ZZ = range(6)
-                for A in range(natm):
-                    sA = mol_slice(A)
-                    E_SS_GGA_contrib1[A, A] += einsum("Tuv, uv -> T", tmp_tensor_1[:, sA], D[sA])[
-                        [XX, XY, XZ, XY, YY, YZ, XZ, YZ, ZZ]].reshape(3, 3)
-
-                tmp_tensor_2 = 4 * einsum("g, rg, trgu, sgv -> tsuv", kerh.fg, grdh.rho_1, grdh.ao_2, grdh.ao_1)
-                tmp_tensor_2 += tmp_tensor_2.transpose((1, 0, 3, 2))
-                tmp_tensor_2 += 2 * einsum("g, tgu, sgv -> tsuv", kerh.fr, grdh.ao_1, grdh.ao_1)
-                E_SS_GGA_contrib2_inbatch = np.zeros((natm, natm, 3, 3))
-                for A in range(natm):
-                    sA = mol_slice(A)
-                    for B in range(A + 1):
-                        sB = mol_slice(B)
-                        E_SS_GGA_contrib2_inbatch[A, B] += einsum("tsuv, uv -> ts",
-                                                                     tmp_tensor_2[:, :, sA, sB], D[sA, sB])
-                        if A != B:
-                            E_SS_GGA_contrib2_inbatch[B, A] += E_SS_GGA_contrib2_inbatch[A, B].T
-                E_SS_GGA_contrib2 += E_SS_GGA_contrib2_inbatch
-
-                E_SS_GGA_contrib3 += (
-                        + einsum("g, Atg, Bsg -> ABts", kerh.frr, grdh.A_rho_1, grdh.A_rho_1)
-                        + 2 * einsum("g, wg, Atwg, Bsg -> ABts", kerh.frg, grdh.rho_1, grdh.A_rho_2, grdh.A_rho_1)
-                        + 2 * einsum("g, Atg, rg, Bsrg -> ABts", kerh.frg, grdh.A_rho_1, grdh.rho_1, grdh.A_rho_2)
-                        + 4 * einsum("g, wg, Atwg, rg, Bsrg -> ABts", kerh.fgg, grdh.rho_1, grdh.A_rho_2, grdh.rho_1,
-                                        grdh.A_rho_2)
-                        + 2 * einsum("g, Atrg, Bsrg -> ABts", kerh.fg, grdh.A_rho_2, grdh.A_rho_2)
-                )
-
-        E_SS_GGA_contrib = E_SS_GGA_contrib1 + E_SS_GGA_contrib2 + E_SS_GGA_contrib3
-        E_SS_GGA_contrib = E_SS_GGA_contrib.swapaxes(1, 2).reshape((dhess, dhess))
+            key = (id(grids), xc)
+            if key not in self._E_2_Skeleton_GGA:
+                self._E_2_Skeleton_GGA[key] = self._get_E_2_Skeleton_GGA(grids, xc)
+            E_SS_GGA_contrib = self._contract_v_B(self._E_2_Skeleton_GGA[key])
 
         # HF Contribution
         E_SS_HF_contrib = (
-                + einsum("ABuv, uv -> AB", self.H_2_ao, D)
+                + self._contract_v_B(self.H_2_ao_block.dot(D))
                 + 0.5 * einsum("ABuv, uv -> AB", self.F_2_ao_Jcontrib - 0.5 * cx * self.F_2_ao_Kcontrib, D)
         )
 
         E_SS = E_SS_GGA_contrib + E_SS_HF_contrib
         return E_SS
 
+    @timing
+    def _get_E_2_Skeleton_GGA(self, grids, xc):
+        # GGA part of skeleton Hessian of all perturbations B, i.e. not contracted by v_B
+        mol = self.mol
+        mol_slice = self.mol_slice
+        atoms = self.atoms
+        natm = len(atoms)
+        D = self.D
+        dhess = natm * 3
+
+        E_SS_GGA_contrib1 = np.zeros((natm, natm, 3, 3))
+        E_SS_GGA_contrib2 = np.zeros((natm, natm, 3, 3))
+        E_SS_GGA_contrib3 = np.zeros((natm, natm, 3, 3))
+        # Per-grid intermediates: A_rho_1, A_rho_2, and Tgu, tsgu AO contractions
+        footprint = 8 * (12 * natm + 16 * self.nao)
+        grdit = GridIterator(mol, grids, D, deriv=3, memory=self.grdit_memory, footprint=footprint, atoms=atoms)
+        for grdh in grdit:
+            kerh = KernelHelper(grdh, xc)
+
+            tmp_tensor_1 = (
+                    + 2 * einsum("g, Tgu, gv -> Tuv", kerh.fr, grdh.ao_2T, grdh.ao_0)
+                    + 4 * einsum("g, rg, rTP, Pgu, gv -> Tuv", kerh.fg, grdh.rho_1, SYM_3T, grdh.ao_3P, grdh.ao_0)
+                    + 4 * einsum("g, rg, Tgu, rgv -> Tuv", kerh.fg, grdh.rho_1, grdh.ao_2T, grdh.ao_1)
+            )
+            for iA, A in enumerate(atoms):
+                sA = mol_slice(A)
+                E_SS_GGA_contrib1[iA, iA] += einsum("Tuv, uv -> T", tmp_tensor_1[:, sA], D[sA])[IDX_2]
+
+            tmp_tensor_2 = 4 * einsum("g, rg, trT, Tgu, sgv -> tsuv", kerh.fg, grdh.rho_1, SYM_2, grdh.ao_2T, grdh.ao_1)
+            tmp_tensor_2 += tmp_tensor_2.transpose((1, 0, 3, 2))
+            tmp_tensor_2 += 2 * einsum("g, tgu, sgv -> tsuv", kerh.fr, grdh.ao_1, grdh.ao_1)
+            E_SS_GGA_contrib2_inbatch = np.zeros((natm, natm, 3, 3))
+            for iA, A in enumerate(atoms):
+                sA = mol_slice(A)
+                for iB, B in enumerate(atoms[:iA + 1]):
+                    sB = mol_slice(B)
+                    E_SS_GGA_contrib2_inbatch[iA, iB] += einsum("tsuv, uv -> ts",
+                                                                   tmp_tensor_2[:, :, sA, sB], D[sA, sB])
+                    if A != B:
+                        E_SS_GGA_contrib2_inbatch[iB, iA] += E_SS_GGA_contrib2_inbatch[iA, iB].T
+            E_SS_GGA_contrib2 += E_SS_GGA_contrib2_inbatch
+
+            E_SS_GGA_contrib3 += (
+                    + einsum("g, Atg, Bsg -> ABts", kerh.frr, grdh.A_rho_1, grdh.A_rho_1)
+                    + 2 * einsum("g, wg, Atwg, Bsg -> ABts", kerh.frg, grdh.rho_1, grdh.A_rho_2, grdh.A_rho_1)
+                    + 2 * einsum("g, Atg, rg, Bsrg -> ABts", kerh.frg, grdh.A_rho_1, grdh.rho_1, grdh.A_rho_2)
+                    + 4 * einsum("g, wg, Atwg, rg, Bsrg -> ABts", kerh.fgg, grdh.rho_1, grdh.A_rho_2, grdh.rho_1,
+                                    grdh.A_rho_2)
+                    + 2 * einsum("g, Atrg, Bsrg -> ABts", kerh.fg, grdh.A_rho_2, grdh.A_rho_2)
+            )
+
+        E_SS_GGA_contrib = E_SS_GGA_contrib1 + E_SS_GGA_contrib2 + E_SS_GGA_contrib3
+        return E_SS_GGA_contrib.swapaxes(1, 2).reshape((dhess, dhess))
+
     def _get_E_2(self):
-        dhess = self.natm * 3
-        return self.E_2_Skeleton + self.E_2_U + self.A.scf_hess.hess_nuc().swapaxes(1, 2).reshape((dhess, dhess))
+        dhess = len(self.atoms) * 3
+        E_2_nuc = self.A.scf_hess.hess_nuc(atmlst=self.atoms).swapaxes(1, 2).reshape((dhess, dhess))
+        return self.E_2_Skeleton + self.E_2_U + self._contract_v_B(E_2_nuc)
+
+    def hessian_vector_product(self, v):
+        """
+        Hessian-vector product :math:`\\sum_\\mathbb{B} E^{\\mathbb{A} \\mathbb{B}} v_\\mathbb{B}`, without forming
+        the full Hessian.
+
+        Perturbation B is combined by ``v`` into one perturbation (``DerivOnceSCF.directional``), so that only one
+        CP-HF equation is solved for B, and one adjoint CP-HF equation replaces orbital response of A in
+        non-variational methods. Second derivative integrals are contracted with ``v`` atom pair by atom pair.
+
+        Parameters
+        ----------
+        v: np.ndarray
+            Shape (natm * 3, ) or (natm, 3); ``natm`` is number of perturbed ``atoms``.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (natm * 3, ).
+        """
+        v = np.asarray(v, dtype=float).reshape(-1)
+        if not self.A.rotation:
+            raise ValueError("Hessian-vector product requires `rotation` of deriv_A to be True!")
+        return self._contract_B(v[:, None], adjoint_A=True).E_2[:, 0]
+
+    def _get_E_2_blocked(self):
+        """
+        Hessian assembled block by block of ``E_2_blocksize`` perturbations of B.
+
+        Each block is evaluated by a copy of this instance, in which B is combined by columns of identity matrix
+        (``DerivOnceSCF.directional``); orbital response of A is evaluated once, and that of B is contracted from
+        it. MO second derivative intermediates (``Xi_2``, ``pdB_F_A_mo``, ``pdB_B_A``, ...) are then of shape
+        (natm * 3, blocksize, nmo, nmo), and are discarded after reduction to the Hessian block.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (natm * 3, natm * 3).
+        """
+        dhess = len(self.atoms) * 3
+        eye = np.eye(dhess)
+        # Orbital response of A and GGA skeleton Hessian are shared by all blocks
+        _ = self.A.U_1
+        E_2 = np.zeros((dhess, dhess))
+        for p0 in range(0, dhess, self.E_2_blocksize):
+            p1 = min(p0 + self.E_2_blocksize, dhess)
+            E_2[:, p0:p1] = self._contract_B(eye[:, p0:p1]).E_2
+        return E_2
+
+    def _contract_B(self, v_B, adjoint_A=False):
+        # Copy of this instance, in which perturbation B is combined by columns of v_B, of shape (natm * 3, k)
+        deriv = copy.copy(self)
+        # Cached second derivative quantities are not shared, except atom-block matrices and GGA skeleton Hessian of
+        # all perturbations, which are contracted later
+        deriv.__dict__ = {key: val for key, val in self.__dict__.items()
+                          if not key.startswith("_") or key in ("_H_2_ao_block", "_S_2_ao_block", "_E_2_Skeleton_GGA")}
+        deriv.B = self.A.directional(v_B)
+        deriv.v_B = v_B
+        deriv.adjoint_A = adjoint_A
+        return deriv
 
 
 class HessNCDFT(DerivTwiceNCDFT, HessSCF):
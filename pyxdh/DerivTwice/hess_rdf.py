@@ -0,0 +1,204 @@
+# basic utilities
+import numpy as np
+from pyxdh.Utilities.contraction import contract as einsum
+from scipy.linalg import solve_triangular
+# python utilities
+from functools import partial
+# pyscf utilities
+from pyscf.df.grad.rhf import _int3c_wrapper as int3c_wrapper
+# pyxdh utilities
+from pyxdh.DerivOnce import GradDFSCF
+from pyxdh.DerivTwice import HessSCF, HessNCDFT
+from pyxdh.Utilities import timing, cached_property
+# simplification
+st = partial(solve_triangular, lower=True)
+
+
+class HessDFSCF(HessSCF):
+
+    def __init__(self, config):
+        super(HessDFSCF, self).__init__(config)
+        self.A = self.A  # type: GradDFSCF
+        assert(isinstance(self.A, GradDFSCF))
+        self.aux_jk = self.A.aux_jk
+
+    @cached_property
+    def eri2_ao(self):
+        raise AssertionError("eri2 should not be called in density fitting module!")
+
+    @cached_property
+    def int2c2e_2_jk(self):
+        # Second derivative 2-center integrals, each of shape (3, 3, naux, naux)
+        naux = self.aux_jk.nao
+        return {
+            intor: self.aux_jk.intor(intor).reshape((3, 3, naux, naux))
+            for intor in ["int2c2e_ipip1", "int2c2e_ip1ip2"]
+        }
+
+    def aux_slice(self, atm_id):
+        _, _, p0, p1 = self.aux_jk.aoslice_by_atom()[atm_id]
+        return slice(p0, p1)
+
+    def _get_int3c2e_1_jk(self, A):
+        sA, sP = self.mol_slice(A), self.aux_slice(A)
+        ip1, ip2 = self.A.int3c2e_ip1_jk, self.A.int3c2e_ip2_jk
+        int3c2e_1 = np.zeros(ip1.shape)
+        int3c2e_1[:, sA] -= ip1[:, sA]
+        int3c2e_1[:, :, sA] -= ip1[:, sA].swapaxes(1, 2)
+        int3c2e_1[:, :, :, sP] -= ip2[:, :, :, sP]
+        return int3c2e_1
+
+    def _get_int2c2e_1_jk(self, A):
+        sP = self.aux_slice(A)
+        ip1_2c = self.A.int2c2e_ip1_jk
+        int2c2e_1 = np.zeros(ip1_2c.shape)
+        int2c2e_1[:, sP] -= ip1_2c[:, sP]
+        int2c2e_1[:, :, sP] -= ip1_2c[:, sP].swapaxes(1, 2)
+        return int2c2e_1
+
+    def _get_V_jk(self, A):
+        # (μν|P)^A - W_{μν,Q} J^A_{QP}; J^A only has rows and columns of auxiliary basis of A
+        sP = self.aux_slice(A)
+        W, ip1_2c = self.A.int3c2e_fit_jk, self.A.int2c2e_ip1_jk
+        V = self._get_int3c2e_1_jk(A)
+        V += einsum("uvQ, tQP -> tuvP", W[:, :, sP], ip1_2c[:, sP])
+        V[:, :, :, sP] += einsum("uvQ, tPQ -> tuvP", W, ip1_2c[:, sP])
+        return V
+
+    def _gen_int3c2e_2_jk(self, A, B):
+        """
+        Second derivative 3-center integrals of atoms A and B, restricted to AO and auxiliary shells of A and B.
+
+        Yields
+        ------
+        tuple
+            ``(I, su, sv, sP)``, in which ``I`` of shape (3, 3, nu, nv, nP) is the nonzero block ``[:, :, su, sv, sP]``
+            of derivative integrals :math:`(\\mu \\nu | P)^{\\mathbb{A} \\mathbb{B}}`; blocks may overlap.
+        """
+        mol, aux_jk = self.mol, self.aux_jk
+        shlA, shlB = [tuple(mol.aoslice_by_atom()[X][:2]) for X in (A, B)]
+        shlPA, shlPB = [tuple(aux_jk.aoslice_by_atom()[X][:2]) for X in (A, B)]
+        sA, sB = self.mol_slice(A), self.mol_slice(B)
+        sPA, sPB = self.aux_slice(A), self.aux_slice(B)
+        hbas, sall = (0, mol.nbas), slice(None)
+
+        def int3c2e(intor, shls_slice):
+            ints = int3c_wrapper(mol, aux_jk, intor, "s1")(shls_slice)
+            return ints.reshape((3, 3) + ints.shape[1:])
+
+        if A == B:
+            ipip1 = int3c2e("int3c2e_ipip1", shlA + hbas + (0, aux_jk.nbas))
+            yield ipip1, sA, sall, sall
+            yield ipip1.swapaxes(2, 3), sall, sA, sall
+            yield int3c2e("int3c2e_ipip2", hbas + hbas + shlPA), sall, sall, sPA
+        ipvip1 = int3c2e("int3c2e_ipvip1", shlA + shlB + (0, aux_jk.nbas))
+        yield ipvip1, sA, sB, sall
+        yield ipvip1.swapaxes(2, 3), sB, sA, sall
+        ip1ip2 = int3c2e("int3c2e_ip1ip2", shlA + hbas + shlPB)
+        yield ip1ip2, sA, sall, sPB
+        yield ip1ip2.swapaxes(2, 3), sall, sA, sPB
+        ip1ip2 = int3c2e("int3c2e_ip1ip2", shlB + hbas + shlPA).swapaxes(0, 1)
+        yield ip1ip2, sB, sall, sPA
+        yield ip1ip2.swapaxes(2, 3), sall, sB, sPA
+
+    def _get_int2c2e_2_jk(self, A, B):
+        sPA, sPB = self.aux_slice(A), self.aux_slice(B)
+        ipip1, ip1ip2 = self.int2c2e_2_jk["int2c2e_ipip1"], self.int2c2e_2_jk["int2c2e_ip1ip2"]
+        int2c2e_2 = np.zeros(ipip1.shape)
+        if A == B:
+            int2c2e_2[:, :, sPA] += ipip1[:, :, sPA]
+            int2c2e_2[:, :, :, sPA] += ipip1[:, :, sPA].swapaxes(2, 3)
+        int2c2e_2[:, :, sPA, sPB] += ip1ip2[:, :, sPA, sPB]
+        int2c2e_2[:, :, sPB, sPA] += ip1ip2[:, :, sPA, sPB].swapaxes(2, 3)
+        return int2c2e_2
+
+    @cached_property
+    @timing
+    def F_2_ao_JKcontrib(self):
+        """
+        Density-fitted counterpart of ``HessSCF.F_2_ao_JKcontrib``, built from first and second derivative 3-center
+        and 2-center integrals of ``aux_jk``.
+
+        With fitting coefficient tensor :math:`W_{\\mu \\nu, P} = (\\mu \\nu | Q) (J^{-1})_{QP}`, and
+        :math:`V^{\\mathbb{A}}_{\\mu \\nu, P} = (\\mu \\nu | P)^{\\mathbb{A}} - W_{\\mu \\nu, Q} J^{\\mathbb{A}}_{QP}`,
+        second derivative of fitted integrals is
+
+        .. math::
+
+            (\\mu \\nu | \\kappa \\lambda)^{\\mathbb{A} \\mathbb{B}} =
+                (\\mu \\nu | P)^{\\mathbb{A} \\mathbb{B}} W_{\\kappa \\lambda, P}
+                + W_{\\mu \\nu, P} (\\kappa \\lambda | P)^{\\mathbb{A} \\mathbb{B}}
+                + V^{\\mathbb{A}}_{\\mu \\nu, P} (J^{-1})_{PQ} V^{\\mathbb{B}}_{\\kappa \\lambda, Q}
+                + V^{\\mathbb{B}}_{\\mu \\nu, P} (J^{-1})_{PQ} V^{\\mathbb{A}}_{\\kappa \\lambda, Q}
+                - W_{\\mu \\nu, P} J^{\\mathbb{A} \\mathbb{B}}_{PQ} W_{\\kappa \\lambda, Q}
+
+        which is contracted with density before any 4-index quantity is formed.
+
+        Returns
+        -------
+        tuple of np.ndarray
+            Coulomb and exchange contributions, each of shape (dhess, dhess, nao, nao).
+        """
+        atoms, nao, naux = self.atoms, self.nao, self.aux_jk.nao
+        natm = len(atoms)
+        dhess = natm * 3
+        D, W, L = self.D, self.A.int3c2e_fit_jk, self.A.L_jk
+
+        # Fitted density, and half-fitted exchange density
+        c = einsum("klP, kl -> P", W, D)
+        X = einsum("vlP, lk -> vkP", W, D)
+
+        # First derivative intermediates are built atom by atom: V^A, and dW^A = V^A J^-1 as derivative of fitting
+        # coefficient tensor; V^A is cheap to rebuild, and only fitted density derivatives f are kept for all atoms
+        g = np.array([einsum("tklP, kl -> tP", self._get_V_jk(A), D) for A in atoms])
+        f = st(L, st(L, g.reshape(-1, naux).T), trans="T").T.reshape(g.shape)
+
+        # In Hessian-vector product or blocked Hessian, perturbation B is contracted with v_B atom pair by atom pair
+        if self.v_B is None:
+            J_2 = np.zeros((natm, natm, 3, 3, nao, nao))
+        else:
+            J_2 = np.zeros((natm, 1, 3, self.v_B.shape[1], nao, nao))
+        K_2 = np.zeros(J_2.shape)
+        for iB, B in enumerate(atoms):
+            if self.v_B is not None and not self.v_B[3 * iB:3 * iB + 3].any():
+                continue
+            V_B = self._get_V_jk(B)
+            dW_B = st(L, st(L, V_B.reshape(-1, naux).T), trans="T").T.reshape(V_B.shape)
+            Y_B = einsum("svlP, lk -> svkP", dW_B, D)
+            dW_B = None
+            for iA, A in enumerate(atoms):
+                V_A = V_B if A == B else self._get_V_jk(A)
+                int2c2e_2 = self._get_int2c2e_2_jk(A, B)
+                # Contraction of second derivative 3-center integrals with D in (kl) is fitted back by W in e
+                J_2_AB = np.zeros((3, 3, nao, nao))
+                K_2_AB = np.zeros((3, 3, nao, nao))
+                e = - einsum("tsPQ, Q -> tsP", int2c2e_2, c)
+                for I, su, sv, sP in self._gen_int3c2e_2_jk(A, B):
+                    J_2_AB[:, :, su, sv] += einsum("tsuvP, P -> tsuv", I, c[sP])
+                    e[:, :, sP] += einsum("tsklP, kl -> tsP", I, D[su, sv])
+                    K_2_AB[:, :, su] += einsum("tsukP, vkP -> tsuv", I, X[:, sv, sP])
+                J_2_AB += (
+                    + einsum("uvP, tsP -> tsuv", W, e)
+                    + einsum("tuvP, sP -> tsuv", V_A, f[iB])
+                    + einsum("suvP, tP -> tsuv", V_B, f[iA])
+                )
+                K_2_AB += (
+                    + einsum("tukP, svkP -> tsuv", V_A, Y_B)
+                    - 0.5 * einsum("ukP, tsPQ, vkQ -> tsuv", W, int2c2e_2, X)
+                )
+                K_2_AB += K_2_AB.swapaxes(-1, -2)
+                if self.v_B is None:
+                    J_2[iA, iB], K_2[iA, iB] = J_2_AB, K_2_AB
+                else:
+                    vB = self.v_B[3 * iB:3 * iB + 3]
+                    J_2[iA, 0] += einsum("tsuv, sK -> tKuv", J_2_AB, vB)
+                    K_2[iA, 0] += einsum("tsuv, sK -> tKuv", K_2_AB, vB)
+
+        return (
+            J_2.swapaxes(1, 2).reshape((dhess, -1, nao, nao)),
+            K_2.swapaxes(1, 2).reshape((dhess, -1, nao, nao)),
+        )
+
+
+class HessDFNCDFT(HessNCDFT, HessDFSCF):
+    pass
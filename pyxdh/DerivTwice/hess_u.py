@@ -1,9 +1,9 @@
 # basic utilities
 import numpy as np
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # pyxdh utilities
 from pyxdh.DerivTwice import DerivTwiceUSCF, DerivTwiceUMP2, HessSCF
-from pyxdh.Utilities import timing, cached_property
+from pyxdh.Utilities import timing, cached_property, GridIteratorU
 
 
 class HessUSCF(DerivTwiceUSCF, HessSCF):
@@ -18,15 +18,100 @@ class HessUSCF(DerivTwiceUSCF, HessSCF):
             einsum("ABukvl, xkl -> xABuv", eri2_ao, D),
         )
 
+    @cached_property
+    @timing
+    def F_2_ao_GGAcontrib(self):
+        if self.xc_type != "GGA":
+            return 0
+
+        natm, nao = self.natm, self.nao
+        dhess = natm * 3
+        F_2_ao_GGA = np.zeros((2, natm, natm, 3, 3, nao, nao))
+
+        # Per-grid intermediates: spin-resolved AB_rho_01 of all atom pairs, kernel derivative contractions (xiAtzkg,
+        # xBtsig) and AO contractions of one atom A; contributions are accumulated into F_2_ao_GGA atom by atom
+        footprint = 8 * (72 * natm ** 2 + 36 * natm * nao + 256 * natm)
+        grdit = GridIteratorU(self.mol, self.grids, self.D, deriv=3, memory=self.grdit_memory, footprint=footprint)
+        for grdh in grdit:
+            vxc, fxc, kxc = grdh.get_xc_eff(self.xc, deriv=3)
+            A_rho_01 = grdh.get_A_rho_01()
+            AB_rho_01 = grdh.get_AB_rho_01()
+
+            # Contrib 1: second derivative of kernel
+            pd_fxc = einsum("xiyjzkg, yAtjg -> xiAtzkg", kxc, A_rho_01)
+            for A in range(natm):
+                pdpd_M = (
+                    + einsum("xitzkg, zBskg -> xBtsig", pd_fxc[:, :, A], A_rho_01)
+                    + einsum("xiyjg, yBtsjg -> xBtsig", fxc, AB_rho_01[:, A])
+                )
+                F_2_ao_GGA[:, A] += grdh.get_pair_0(pdpd_M.reshape((-1, 4, grdh.ngrid))).reshape(
+                    (2, natm, 3, 3, nao, nao))
+            pd_fxc = None
+
+            # Contrib 2: derivative of kernel and of AO pairs; rows of A with perturbation B, and their transpose, with
+            # exchange of A and B
+            pd_M = einsum("xiyjg, yBsjg -> xBsig", fxc, A_rho_01)
+            tmp_contrib = grdh.get_pair_1(pd_M.reshape((-1, 4, grdh.ngrid))).reshape((3, 2, natm, 3, nao, nao))
+            for A in range(natm):
+                sA = self.mol_slice(A)
+                contrib2 = tmp_contrib[:, :, :, :, sA].transpose((1, 2, 0, 3, 4, 5))
+                F_2_ao_GGA[:, A, :, :, :, sA] += contrib2
+                F_2_ao_GGA[:, A, :, :, :, :, sA] += contrib2.swapaxes(-1, -2)
+                F_2_ao_GGA[:, :, A, :, :, sA] += contrib2.swapaxes(2, 3)
+                F_2_ao_GGA[:, :, A, :, :, :, sA] += contrib2.swapaxes(2, 3).swapaxes(-1, -2)
+            tmp_contrib = contrib2 = None
+
+            # Contrib 3: second derivative of AO pairs
+            tmp_contrib = grdh.get_pair_2(vxc)
+            for A in range(natm):
+                sA = self.mol_slice(A)
+                contrib3 = tmp_contrib[:, :, :, sA].transpose((2, 0, 1, 3, 4))
+                F_2_ao_GGA[:, A, A, :, :, sA] += contrib3
+                F_2_ao_GGA[:, A, A, :, :, :, sA] += contrib3.swapaxes(-1, -2)
+            tmp_contrib = grdh.get_pair_11(vxc)
+            for A in range(natm):
+                for B in range(natm):
+                    sA, sB = self.mol_slice(A), self.mol_slice(B)
+                    contrib3 = tmp_contrib[:, :, :, sA, sB].transpose((2, 0, 1, 3, 4))
+                    F_2_ao_GGA[:, A, B, :, :, sA, sB] += contrib3
+                    F_2_ao_GGA[:, A, B, :, :, sB, sA] += contrib3.swapaxes(-1, -2)
+            tmp_contrib = contrib3 = None
+
+        return F_2_ao_GGA.swapaxes(2, 3).reshape((2, dhess, dhess, nao, nao))
+
     def _get_E_2_Skeleton(self, grids=None, xc=None, cx=None, xc_type=None):
+        natm = self.natm
         D = self.D
+        grids = self.grids if grids is None else grids
+        xc = self.xc if xc is None else xc
         cx = self.cx if cx is None else cx
+        xc_type = self.xc_type if xc_type is None else xc_type
+        dhess = natm * 3
+
+        # GGA Contribution
+        E_SS_GGA_contrib = np.zeros((natm, natm, 3, 3))
+        if xc_type == "GGA":
+            # Per-grid intermediates: spin-resolved A_rho_01 and AB_rho_01
+            footprint = 8 * (72 * natm ** 2 + 24 * natm)
+            grdit = GridIteratorU(self.mol, grids, D, deriv=3, memory=self.grdit_memory, footprint=footprint)
+            for grdh in grdit:
+                vxc, fxc = grdh.get_xc_eff(xc, deriv=2)
+                A_rho_01 = grdh.get_A_rho_01()
+                E_SS_GGA_contrib += (
+                    + einsum("xiyjg, xAtig, yBsjg -> ABts", fxc, A_rho_01, A_rho_01)
+                    + einsum("xig, xABtsig -> ABts", vxc, grdh.get_AB_rho_01())
+                )
+        E_SS_GGA_contrib = E_SS_GGA_contrib.swapaxes(1, 2).reshape((dhess, dhess))
+
         # HF Contribution
         E_SS_HF_contrib = (
-            + einsum("ABuv, xuv -> AB", self.H_2_ao, D)
+            + self.H_2_ao_block.dot(D.sum(axis=0))
             + 0.5 * einsum("xABuv, xuv -> AB", self.F_2_ao_Jcontrib - cx * self.F_2_ao_Kcontrib, D)
         )
-        return E_SS_HF_contrib
+        return E_SS_GGA_contrib + E_SS_HF_contrib
+
+    def hessian_vector_product(self, v):
+        raise NotImplementedError("Hessian-vector product is only implemented for restricted references!")
 
 
 class HessUMP2(DerivTwiceUMP2, HessUSCF):
@@ -1,5 +1,8 @@
 # basic utilities
-from opt_einsum import contract as einsum
+import numpy as np
+from pyxdh.Utilities.contraction import contract as einsum
+# python utilities
+import copy
 # pyxdh utilities
 from pyxdh.DerivTwice import DerivTwiceSCF, DerivTwiceNCDFT, DerivTwiceMP2, DerivTwiceXDH
 from pyxdh.Utilities import cached_property
@@ -46,6 +49,26 @@ class PolarSCF(DerivTwiceSCF):
     def _get_E_2(self):
         return self._get_E_2_U()
 
+    def get_E_2_dynamic(self, omegas):
+        """
+        Frequency-dependent counterpart of ``E_2``, i.e. negative dynamic polarizability; responses of all
+        frequencies are solved in one shared subspace (``DipoleSCF.get_U_1_dynamic``).
+
+        Parameters
+        ----------
+        omegas: list of float
+            Frequencies in a.u., should be smaller than the first excitation energy.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (nomega, 3, 3).
+        """
+        A = self.A
+        so, sv = self.so, self.sv
+        U_plus, _ = A.get_U_1_dynamic(omegas)
+        return 4 * einsum("Aai, wBai -> wAB", A.H_1_mo[:, sv, so], U_plus)
+
 
 class PolarNCDFT(DerivTwiceNCDFT, PolarSCF):
 
@@ -57,6 +80,83 @@ class PolarNCDFT(DerivTwiceNCDFT, PolarSCF):
         E_2_U += 4 * einsum("ABai, ai -> AB", self.pdB_F_A_mo[:, :, sv, so], self.Z)
         return E_2_U
 
+    def _get_E_2_quasi(self, K_A, K_B, real):
+        # Bilinear part of time-averaged Lagrangian (non-consistent energy and SCF v-o Fock with static Z), for orbital
+        # rotations exp(K); real rotations are anti-symmetric K, and imaginary rotations iK are evaluated by symmetric
+        # K, so that bilinear part of imaginary rotations is the negative of returned value; explicit field terms only
+        # couple to real rotations
+        A = self.A
+        so, sv, sa = self.so, self.sv, self.sa
+        n, e = self.mo_occ, self.e
+        antisym = not real
+        Ax0_Core = A.Ax0_Core(sa, sa, sa, sa, antisym=antisym)
+        nc_Ax0_Core = A.nc_deriv.Ax0_Core(sa, sa, sa, sa, antisym=antisym)
+
+        def comm(X, Y):
+            # Commutator [X^A, Y^B]
+            return einsum("Apr, Brq -> ABpq", X, Y) - einsum("Bpr, Arq -> ABpq", Y, X)
+
+        # First and second order density matrices in MO basis; Ax0_Core(sa, sa, sa, sa)(D / 4) is Fock response
+        D1_A, D1_B = K_A * (n[None, :] - n[:, None]), K_B * (n[None, :] - n[:, None])
+        D2 = 0.5 * (comm(K_A, D1_B) - comm(D1_A, K_B))
+        F1_A, F1_B = Ax0_Core(D1_A / 4), Ax0_Core(D1_B / 4)
+        if real:
+            F1_A, F1_B = F1_A + A.H_1_mo, F1_B + A.H_1_mo
+        # Commutator of K with diagonal Fock
+        FK_A, FK_B = K_A * (e[:, None] - e[None, :]), K_B * (e[:, None] - e[None, :])
+
+        E_2 = (
+            + einsum("pq, ABpq -> AB", A.nc_deriv.F_0_mo, D2)
+            + einsum("Aqp, Bpq -> AB", D1_A, nc_Ax0_Core(D1_B / 4))
+        )
+        F_2 = (
+            + A.Ax0_Core(sa, sa, sa, sa)(D2 / 4)
+            + comm(F1_A, K_B) - comm(K_A, F1_B)
+            + 0.5 * (comm(FK_A, K_B) - comm(K_A, FK_B))
+        )
+        if real:
+            E_2 += einsum("Apq, Bpq -> AB", A.H_1_mo, D1_B) + einsum("Bpq, Apq -> AB", A.H_1_mo, D1_A)
+            # Exchange-correlation kernel derivative, by dipole Ax1_Core of orbital response K_A; Ax1_Core only
+            # accounts for half of the symmetric density K_A n - n K_A
+            A_K = copy.copy(A)
+            A_K._U_1 = K_A
+            F_2 += 2 * A_K.Ax1_Core(sa, sa, sa, so)(K_B[:, :, so])
+        E_2 += 4 * einsum("ABai, ai -> AB", F_2[:, :, sv, so], self.Z)
+        return E_2
+
+    def get_E_2_dynamic(self, omegas):
+        """
+        Frequency-dependent counterpart of ``E_2``, as second derivative of time-averaged quasi-energy Lagrangian of
+        non-consistent energy, where the multiplier ``Z`` is kept static and constrains SCF v-o Fock of rotated
+        orbitals. Orbitals rotate by exp(K_c cos(wt) + i K_s sin(wt)), with K_c and K_s from ``U_plus`` and
+        ``U_minus`` of ``DipoleSCF.get_U_1_dynamic``; time-derivative term of quasi-energy couples K_c and K_s, and
+        does not enter v-o constraint to second order.
+
+        Parameters
+        ----------
+        omegas: list of float
+            Frequencies in a.u., should be smaller than the first excitation energy.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (nomega, 3, 3).
+        """
+        A = self.A
+        so, sv = self.so, self.sv
+        n = self.mo_occ
+        omegas = np.asarray(omegas, dtype=float).reshape(-1)
+        U_plus, U_minus = A.get_U_1_dynamic(omegas)
+        E_2 = np.zeros((U_plus.shape[0], 3, 3))
+        for iw in range(U_plus.shape[0]):
+            K_c, K_s = np.zeros((2, 3, self.nmo, self.nmo))
+            K_c[:, sv, so], K_c[:, so, sv] = U_plus[iw], - U_plus[iw].swapaxes(-1, -2)
+            K_s[:, sv, so], K_s[:, so, sv] = U_minus[iw], U_minus[iw].swapaxes(-1, -2)
+            # Time-derivative term: omega * tr(n [K_c^A, K_s^B]), symmetrized in A, B
+            E_2_t = omegas[iw] * einsum("Apq, Bqp -> AB", K_c * (n[:, None] - n[None, :]), K_s)
+            E_2[iw] = self._get_E_2_quasi(K_c, K_c, True) - self._get_E_2_quasi(K_s, K_s, False) + E_2_t + E_2_t.T
+        return E_2
+
 
 class PolarMP2(DerivTwiceMP2, PolarSCF):
 
@@ -71,6 +171,9 @@ class PolarMP2(DerivTwiceMP2, PolarSCF):
         )
         return E_2_MP2_Contrib
 
+    def get_E_2_dynamic(self, omegas):
+        raise NotImplementedError("Dynamic polarizability is only implemented for SCF and non-consistent DFT!")
+
 
 class PolarXDH(DerivTwiceXDH, PolarMP2, PolarNCDFT):
 
@@ -1,5 +1,5 @@
 # basic utilities
-from opt_einsum import contract as einsum
+from pyxdh.Utilities.contraction import contract as einsum
 # pyxdh utilities
 from pyxdh.DerivTwice import DerivTwiceUSCF, PolarSCF, DerivTwiceUMP2
 
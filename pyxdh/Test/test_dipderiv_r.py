@@ -1,10 +1,11 @@
 import numpy as np
+import pytest
 from pyscf import gto, scf, dft
 from pyxdh.DerivOnce import GradSCF, GradMP2, GradXDH
 from pyxdh.DerivOnce import DipoleSCF, DipoleMP2, DipoleXDH
 from pyxdh.DerivTwice import DipDerivSCF, DipDerivMP2, DipDerivXDH
 from pkg_resources import resource_filename
-from pyxdh.Utilities import FormchkInterface
+from pyxdh.Utilities import FormchkInterface, NucCoordDerivGenerator, NumericDiff
 
 
 class TestDipDerivSCF:
@@ -40,6 +41,20 @@ class TestDipDerivSCF:
         # ASSERT: hessian - Gaussian
         assert np.allclose(ddh.E_2.T, formchk.dipolederiv(), atol=5e-6, rtol=2e-4)
 
+    def test_r_mp2_frozen_dipderiv(self):
+
+        def mf_func(mol_):
+            scf_eng_ = scf.RHF(mol_); scf_eng_.conv_tol = 1e-12; scf_eng_.run()
+            return DipoleMP2({"scf_eng": scf_eng_, "frozen": 1, "cphf_tol": 1e-10}).E_1
+
+        scf_eng = scf.RHF(self.mol); scf_eng.conv_tol = 1e-12; scf_eng.run()
+        gradh = GradMP2({"scf_eng": scf_eng, "frozen": 1, "cphf_tol": 1e-10})
+        diph = DipoleMP2({"scf_eng": scf_eng, "frozen": 1, "cphf_tol": 1e-10})
+        ddh = DipDerivMP2({"deriv_A": diph, "deriv_B": gradh})
+        num_dipderiv = NumericDiff(NucCoordDerivGenerator(self.mol, mf_func)).derivative
+        # ASSERT: dipole derivative - numerical
+        assert np.allclose(ddh.E_2.T, num_dipderiv, atol=1e-6, rtol=1e-4)
+
     def test_r_xyg3_dipderiv(self):
         scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
         nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
@@ -51,6 +66,23 @@ class TestDipDerivSCF:
         # ASSERT: hessian - Gaussian
         np.allclose(ddh.E_2.T, formchk.dipolederiv(), atol=5e-6, rtol=2e-4)
 
+    def test_r_shared_context(self):
+        scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids_cphf; scf_eng.run()
+        nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
+        config = {"scf_eng": scf_eng, "nc_eng": nc_eng, "cc": 0.3211}
+        gradh = GradXDH(config)
+        diph = DipoleXDH(config)
+        DipDerivXDH({"deriv_A": diph, "deriv_B": gradh})
+        # Perturbation-independent quantities are evaluated once for both instances
+        assert gradh.context is diph.context and gradh.nc_deriv.context is diph.nc_deriv.context
+        assert gradh.D_r is diph.D_r and gradh.t_iajb is diph.t_iajb and gradh.Z is diph.Z
+        # Shared quantities could not be changed once evaluated
+        with pytest.raises(AttributeError):
+            diph.D_r = np.zeros_like(gradh.D_r)
+        # Instances of different method settings do not share context
+        for key, val in [("rotation", False), ("mp2_batched", True), ("eri0_outcore", True)]:
+            assert not DipoleXDH(dict(config, **{key: val})).share_context(gradh)
+
     def test_r_xygjos_dipderiv(self):
         scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
         nc_eng = dft.RKS(self.mol, xc="0.7731*HF + 0.2269*LDA, 0.2309*VWN3 + 0.2754*LYP"); nc_eng.grids = self.grids
@@ -61,3 +93,15 @@ class TestDipDerivSCF:
         formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-XYGJOS-freq.fchk"))
         # ASSERT: hessian - Gaussian
         np.allclose(ddh.E_2.T, formchk.dipolederiv(), atol=5e-6, rtol=2e-4)
+
+    def test_r_dipderiv_no_nuclear_cphf(self):
+        scf_eng = scf.RHF(self.mol).run()
+        formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-MP2-freq.fchk"))
+        # Partial dipole derivative of atoms (2, 0)
+        idx = [6, 7, 8, 0, 1, 2]
+        gradh = GradMP2({"scf_eng": scf_eng, "atoms": [2, 0]})
+        diph = DipoleMP2({"scf_eng": scf_eng})
+        ddh = DipDerivMP2({"deriv_A": diph, "deriv_B": gradh})
+        assert np.allclose(ddh.E_2.T, formchk.dipolederiv()[idx], atol=5e-6, rtol=2e-4)
+        # CP-HF of nuclear coordinates is not solved
+        assert "_U_1" not in gradh.__dict__
@@ -67,3 +67,17 @@ class TestDipoleR:
         formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-XYGJOS-freq.fchk"))
         # ASSERT: grad - Gaussian
         assert np.allclose(diph.E_1, formchk.dipole(), atol=1e-6, rtol=1e-4)
+
+    def test_r_xyg3_dipole_no_share(self):
+        scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
+        nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
+        config = {"scf_eng": scf_eng, "nc_eng": nc_eng, "cc": 0.3211, "cphf_grids": self.grids_cphf}
+        diph = DipoleXDH(config)
+        nc_eng_other = dft.RKS(self.mol, xc="PBE0"); nc_eng_other.grids = self.grids
+        diph_other = DipoleXDH(dict(config, nc_eng=nc_eng_other))
+        diph_other.E_1
+        # Instances of different non-consistent functionals should not share context
+        assert not diph.share_context(diph_other)
+        assert diph.context is not diph_other.context
+        formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-XYG3-freq.fchk"))
+        assert np.allclose(diph.E_1, formchk.dipole(), atol=1e-6, rtol=1e-4)
@@ -52,6 +52,28 @@ class TestGradR:
         # ASSERT: grad - numerical
         assert np.allclose(gradh.E_1, ref_grad, atol=1e-6, rtol=1e-4)
 
+    def test_r_ncdft_jk_reuse(self):
+        scf_eng = scf.RHF(self.mol).run()
+        grids = dft.Grids(self.mol); grids.atom_grid = (50, 194)
+        nc_eng = dft.RKS(self.mol, xc="B3LYPg"); nc_eng.grids = grids
+        gradh = GradNCDFT({"scf_eng": scf_eng, "nc_eng": nc_eng})
+        eng, F_0_ao = gradh.eng, gradh.nc_deriv.F_0_ao
+        # Grids of caller are not built by XC energy and potential
+        assert grids.coords is None
+        assert np.allclose(eng, nc_eng.energy_tot(dm=gradh.D))
+        # J/K of SCF density are evaluated once for SCF and non-consistent functional
+        assert np.allclose(F_0_ao, nc_eng.get_fock(dm=gradh.D))
+        assert gradh.nc_deriv.jk_0_ao is gradh.jk_0_ao
+        _ = gradh.E_1
+        assert gradh.nc_deriv.jk_1_ao is gradh.jk_1_ao
+        # Non-local correlation is kept in energy and Fock matrix
+        nc_eng = dft.RKS(self.mol, xc="B3LYPg"); nc_eng.grids = self.grids_cphf; nc_eng.nlc = "VV10"
+        nc_eng.nlcgrids.atom_grid = (50, 194)
+        gradh = GradNCDFT({"scf_eng": scf_eng, "nc_eng": nc_eng})
+        assert gradh.nc_deriv.is_nlc
+        assert np.allclose(gradh.eng, nc_eng.energy_tot(dm=gradh.D))
+        assert np.allclose(gradh.nc_deriv.F_0_ao, nc_eng.get_fock(dm=gradh.D))
+
     def test_r_mp2_grad(self):
         scf_eng = scf.RHF(self.mol).run()
         mp2_eng = mp.MP2(scf_eng).run()
@@ -67,6 +89,30 @@ class TestGradR:
         # ASSERT: grad - PySCF
         assert np.allclose(gradh.E_1, mp2_grad.de, atol=1e-6, rtol=1e-4)
 
+    def test_r_mp2_frozen_grad(self):
+        scf_eng = scf.RHF(self.mol).run()
+        mp2_eng = mp.MP2(scf_eng, frozen=[0]).run()
+        mp2_grad = mp2_eng.Gradients().run()
+        for batched in [False, True]:
+            gradh = GradMP2({"scf_eng": scf_eng, "frozen": 1, "mp2_batched": batched, "mp2_memory": 0.05})
+            # ASSERT: energy - PySCF
+            assert np.allclose(gradh.eng, mp2_eng.e_tot)
+            # ASSERT: grad - PySCF
+            assert np.allclose(gradh.E_1, mp2_grad.de, atol=1e-6, rtol=1e-4)
+
+    def test_r_mp2_eri0_mo_blocks(self):
+        scf_eng = scf.RHF(self.mol).run()
+        gradh = GradMP2({"scf_eng": scf_eng})
+        # Tiny memory forces row-by-row copy; blocks are stored in memory-mapped files
+        gradh_outcore = GradMP2({"scf_eng": scf_eng, "eri0_memory": 1e-3, "eri0_outcore": True})
+        so, sv = gradh.so, gradh.sv
+        eri0_mo = gradh.eri0_mo
+        for blocks, sl in [("ovov", (so, sv, so, sv)), ("oovo", (so, so, sv, so)), ("vvov", (sv, sv, so, sv))]:
+            assert np.allclose(gradh.get_eri0_mo(blocks), eri0_mo[sl])
+            assert isinstance(gradh_outcore.get_eri0_mo(blocks), np.memmap)
+            assert np.allclose(gradh_outcore.get_eri0_mo(blocks), eri0_mo[sl])
+        assert np.allclose(gradh_outcore.E_1, gradh.E_1)
+
     def test_r_b2plyp_grad(self):
         scf_eng = dft.RKS(self.mol, xc="0.53*HF + 0.47*B88, 0.73*LYP"); scf_eng.grids = self.grids; scf_eng.run()
         gradh = GradMP2({"scf_eng": scf_eng, "cc": 0.27, "cphf_grids": self.grids_cphf})
@@ -87,6 +133,20 @@ class TestGradR:
         # ASSERT: grad - Gaussian
         assert np.allclose(gradh.E_1, formchk.grad(), atol=5e-6, rtol=1e-4)
 
+    def test_r_xyg3_batched_grad(self):
+        scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
+        nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
+        config = {"scf_eng": scf_eng, "nc_eng": nc_eng, "cc": 0.3211, "cphf_grids": self.grids_cphf,
+                  "mp2_batched": True, "mp2_memory": 0.05}
+        gradh = GradXDH(config)
+        formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-XYG3-freq.fchk"))
+        # ASSERT: energy - Gaussian
+        assert np.allclose(gradh.eng, formchk.total_energy())
+        # ASSERT: grad - Gaussian
+        assert np.allclose(gradh.E_1, formchk.grad(), atol=5e-6, rtol=1e-4)
+        # Amplitudes are never stored in batched mode
+        assert all(key not in gradh.__dict__ and key not in gradh.context.values for key in ("_t_iajb", "_T_iajb"))
+
     def test_r_xygjos_grad(self):
         scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
         nc_eng = dft.RKS(self.mol, xc="0.7731*HF + 0.2269*LDA, 0.2309*VWN3 + 0.2754*LYP"); nc_eng.grids = self.grids
@@ -1,6 +1,7 @@
 import numpy as np
-from pyscf import gto, scf, mp, df
-from pyxdh.DerivOnce import GradDFSCF, GradDFMP2
+from pyscf import gto, scf, dft, mp, df
+from pyxdh.DerivOnce import GradDFSCF, GradDFMP2, GradDFXDH
+from pyxdh.Utilities import NucCoordDerivGenerator, NumericDiff
 
 
 class TestGradRDF:
@@ -23,6 +24,33 @@ class TestGradRDF:
         helper = GradDFSCF(config)
         assert np.allclose(helper.E_1, mf_grad.de, atol=1e-6, rtol=1e-4)
 
+    def test_rdf_rhf_ax1_core(self):
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  0.9  0.1  0.0
+        H -0.2  0.8  0.1
+        """
+        mol.basis = "6-31G"
+        mol.verbose = 0
+        mol.build()
+        mf_scf = scf.RHF(mol).density_fit(auxbasis="cc-pVDZ-jkfit").run()
+        helper = GradDFSCF({"scf_eng": mf_scf})
+
+        nao = mol.nao
+        X = np.random.random((2, nao, nao))
+        X += X.swapaxes(-1, -2)
+        # Ax1_Core symmetrizes input matrix (X + X^T), so half of X is passed in
+        ax1 = helper.Ax1_Core(None, None, None, None)(X / 2)
+
+        # Skeleton derivative of density-fitted 2J - K with fixed AO density matrix
+        def mf_func(mol_):
+            vj, vk = scf.RHF(mol_).density_fit(auxbasis="cc-pVDZ-jkfit").get_jk(mol_, X)
+            return 2 * vj - vk
+
+        num_ax1 = NumericDiff(NucCoordDerivGenerator(mol, mf_func)).derivative
+        assert np.allclose(ax1, num_ax1, atol=1e-6, rtol=1e-4)
+
     def test_rdf_rhf_eng(self):
         mol = gto.Mole()
         mol.atom = """
@@ -42,4 +70,115 @@ class TestGradRDF:
         aux_ri = df.make_auxmol(mol, "cc-pVDZ-ri")
         config = {"scf_eng": mf_scf, "aux_ri": aux_ri}
         helper = GradDFMP2(config)
-        assert np.allclose(helper.eng, mf_mp2.e_tot, rtol=1e-10, atol=1e-12)
\ No newline at end of file
+        assert np.allclose(helper.eng, mf_mp2.e_tot, rtol=1e-10, atol=1e-12)
+
+    def test_rdf_ri_outcore(self):
+        mol = gto.Mole()
+        mol.atom = """
+        N  0.  0.  0.
+        H  1.5 0.  0.2
+        H  0.1 1.2 0.
+        H  0.  0.  1.
+        """
+        mol.basis = "cc-pVDZ"
+        mol.verbose = 0
+        mol.build()
+        mf_scf = scf.RHF(mol).density_fit(auxbasis="cc-pVDZ-jkfit").run()
+        aux_ri = df.make_auxmol(mol, "cc-pVDZ-ri")
+
+        helper = GradDFMP2({"scf_eng": mf_scf, "aux_ri": aux_ri})
+        # Tiny memory forces one AO shell per batch; Y_ia_ri is stored in memory-mapped file
+        helper_outcore = GradDFMP2({"scf_eng": mf_scf, "aux_ri": aux_ri, "ri_memory": 1e-6, "ri_outcore": True})
+        int3c2e = df.incore.aux_e2(mol, aux_ri, aosym="s1").reshape((mol.nao, mol.nao, aux_ri.nao))
+        L_inv = np.linalg.inv(np.linalg.cholesky(aux_ri.intor("int2c2e")))
+        Y_ia_ri = np.einsum("uvQ, ui, va, PQ -> iaP", int3c2e, helper.Co, helper.Cv, L_inv)
+        assert isinstance(helper_outcore.Y_ia_ri, np.memmap)
+        assert np.allclose(helper.Y_ia_ri, Y_ia_ri)
+        assert np.allclose(helper_outcore.Y_ia_ri, Y_ia_ri)
+        assert np.allclose(helper_outcore.eng, helper.eng)
+
+    def test_rdf_mp2_grad(self):
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  0.9  0.1  0.0
+        H -0.2  0.8  0.1
+        """
+        mol.basis = "cc-pVDZ"
+        mol.verbose = 0
+        mol.build()
+
+        def mf_func(mol_):
+            mf_scf = scf.RHF(mol_).density_fit(auxbasis="cc-pVDZ-jkfit")
+            mf_scf.conv_tol = 1e-12
+            mf_mp2 = mp.MP2(mf_scf.run())
+            mf_mp2.with_df = df.DF(mol_, auxbasis="cc-pVDZ-ri")
+            return mf_mp2.run().e_tot
+
+        mf_scf = scf.RHF(mol).density_fit(auxbasis="cc-pVDZ-jkfit")
+        mf_scf.conv_tol = 1e-12
+        mf_scf.run()
+        aux_ri = df.make_auxmol(mol, "cc-pVDZ-ri")
+        config = {"scf_eng": mf_scf, "aux_ri": aux_ri, "cphf_tol": 1e-10}
+        helper = GradDFMP2(config)
+        num_grad = NumericDiff(NucCoordDerivGenerator(mol, mf_func)).derivative.reshape((mol.natm, 3))
+        assert np.allclose(helper.E_1, num_grad, atol=1e-6, rtol=1e-4)
+        # Tiny memory forces one occupied orbital per batch; amplitudes are never formed
+        helper_batched = GradDFMP2(dict(config, mp2_memory=1e-6))
+        assert np.allclose(helper_batched.E_1, helper.E_1, atol=1e-8)
+        assert all(key not in helper.__dict__ and key not in helper.context.values for key in ("_t_iajb", "_T_iajb"))
+
+    def test_rdf_xyg3_grad(self):
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  0.9  0.1  0.0
+        H -0.2  0.8  0.1
+        """
+        mol.basis = "cc-pVDZ"
+        mol.verbose = 0
+        mol.build()
+
+        def get_helper(mol_):
+            grids = dft.Grids(mol_)
+            grids.atom_grid = (99, 590)
+            grids.build()
+            scf_eng = dft.RKS(mol_, xc="B3LYPg").density_fit(auxbasis="cc-pVDZ-jkfit")
+            scf_eng.grids = grids
+            scf_eng.conv_tol = 1e-12
+            scf_eng.run()
+            nc_eng = dft.RKS(mol_, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP")\
+                .density_fit(auxbasis="cc-pVDZ-jkfit")
+            nc_eng.grids = grids
+            aux_ri = df.make_auxmol(mol_, "cc-pVDZ-ri")
+            config = {"scf_eng": scf_eng, "nc_eng": nc_eng, "cc": 0.3211, "aux_ri": aux_ri, "cphf_tol": 1e-10}
+            return GradDFXDH(config)
+
+        helper = get_helper(mol)
+        num_grad = NumericDiff(NucCoordDerivGenerator(mol, lambda mol_: get_helper(mol_).eng)).derivative
+        # Grid weight derivative is not included in analytical gradient
+        assert np.allclose(helper.E_1, num_grad.reshape((mol.natm, 3)), atol=1e-6, rtol=1e-4)
+
+    def test_rdf_sos_mp2_laplace_grad(self):
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  0.9  0.1  0.0
+        H -0.2  0.8  0.1
+        """
+        mol.basis = "cc-pVDZ"
+        mol.verbose = 0
+        mol.build()
+        mf_scf = scf.RHF(mol).density_fit(auxbasis="cc-pVDZ-jkfit")
+        mf_scf.conv_tol = 1e-12
+        mf_scf.run()
+        aux_ri = df.make_auxmol(mol, "cc-pVDZ-ri")
+
+        config = {"scf_eng": mf_scf, "aux_ri": aux_ri, "cc": 1.3, "ss": 0., "cphf_tol": 1e-10}
+        helper = GradDFMP2(config)
+        helper_ref = GradDFMP2(dict(config, laplace=False))
+        # Laplace path is switched on automatically, and amplitudes are never formed
+        assert helper.laplace and not helper_ref.laplace
+        assert np.allclose(helper.eng, helper_ref.eng, rtol=0, atol=1e-7)
+        assert np.allclose(helper.E_1, helper_ref.E_1, atol=1e-7)
+        assert all(key not in helper.__dict__ and key not in helper.context.values for key in ("_t_iajb", "_T_iajb"))
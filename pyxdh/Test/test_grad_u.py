@@ -68,6 +68,17 @@ class TestGradU:
         # ASSERT: grad - PySCF
         assert np.allclose(gradh.E_1, mp2_grad.de, atol=1e-6, rtol=1e-4)
 
+    def test_u_mp2_frozen_grad(self):
+        scf_eng = scf.UHF(self.mol); scf_eng.conv_tol_grad = 1e-8; scf_eng.max_cycle = 128; scf_eng.run()
+        mp2_eng = mp.MP2(scf_eng, frozen=[0]).run()
+        mp2_grad = mp2_eng.Gradients().run()
+        for batched in [False, True]:
+            gradh = GradUMP2({"scf_eng": scf_eng, "frozen": 1, "mp2_batched": batched, "mp2_memory": 0.02})
+            # ASSERT: energy - PySCF
+            assert np.allclose(gradh.eng, mp2_eng.e_tot)
+            # ASSERT: grad - PySCF
+            assert np.allclose(gradh.E_1, mp2_grad.de, atol=1e-6, rtol=1e-4)
+
     def test_u_xyg3_grad(self):
         scf_eng = dft.UKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids
         scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 128; scf_eng.run()
@@ -80,6 +91,21 @@ class TestGradU:
         # ASSERT: grad - Gaussian
         assert np.allclose(gradh.E_1, formchk.grad(), atol=5e-6, rtol=1e-4)
 
+    def test_u_xyg3_batched_grad(self):
+        scf_eng = dft.UKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids
+        scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 128; scf_eng.run()
+        nc_eng = dft.UKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
+        config = {"scf_eng": scf_eng, "nc_eng": nc_eng, "cc": 0.3211, "cphf_grids": self.grids_cphf, "cphf_tol": 1e-10,
+                  "mp2_batched": True, "mp2_memory": 0.02}
+        gradh = GradUXDH(config)
+        formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/CH3-XYG3-force.fchk"))
+        # ASSERT: energy - Gaussian
+        assert np.allclose(gradh.eng, formchk.total_energy())
+        # ASSERT: grad - Gaussian
+        assert np.allclose(gradh.E_1, formchk.grad(), atol=5e-6, rtol=1e-4)
+        # Amplitudes are never stored in batched mode
+        assert all(key not in gradh.__dict__ and key not in gradh.context.values for key in ("_t_iajb", "_T_iajb"))
+
     def test_u_xygjos_grad(self):
         scf_eng = dft.UKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids
         scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 128; scf_eng.run()
@@ -3,7 +3,7 @@ from pyscf import gto, scf, dft
 from pyxdh.DerivOnce import GradSCF, GradNCDFT, GradMP2, GradXDH
 from pyxdh.DerivTwice import HessSCF, HessNCDFT, HessMP2, HessXDH
 from pkg_resources import resource_filename
-from pyxdh.Utilities import FormchkInterface
+from pyxdh.Utilities import FormchkInterface, NucCoordDerivGenerator, NumericDiff
 import pickle
 
 
@@ -24,6 +24,30 @@ class TestHessR:
         # ASSERT: hessian - PySCF
         assert np.allclose(hessh.E_2, scf_hess.de.swapaxes(-2, -3).reshape((-1, self.mol.natm * 3)), atol=1e-6, rtol=1e-4)
 
+    def test_r_ax0_memo(self):
+        scf_eng = scf.RHF(self.mol).run()
+        gradh = GradSCF({"scf_eng": scf_eng})
+        hessh = HessSCF({"deriv_A": gradh})
+        sa, so = gradh.sa, gradh.so
+        # Batched responses are memoized, and are the same to unbatched responses
+        Ax_U, Ax_S = gradh.Ax0_Core_batch(
+            (sa, sa, sa, so, gradh.U_1[:, :, so]), (sa, sa, so, so, gradh.S_1_mo[:, so, so]))
+        assert Ax_U is gradh.Ax0_Core_batch((sa, sa, sa, so, gradh.U_1[:, :, so]))[0]
+        assert np.allclose(Ax_S, gradh.Ax0_Core(sa, sa, so, so)(gradh.S_1_mo[:, so, so]))
+        # Responses memoized inside scope are evicted on exit; responses memoized before are kept
+        memo = gradh.context.values["_Ax0_memo"]
+        keys = set(memo)
+        X = np.random.RandomState(0).randn(2, gradh.nmo, gradh.nocc)
+        with hessh._scope_Ax0_memo():
+            Ax_X = gradh.Ax0_Core_batch((sa, sa, sa, so, X))[0]
+            assert Ax_X is gradh.Ax0_Core_batch((sa, sa, sa, so, X))[0]
+            assert set(memo) > keys
+        assert set(memo) == keys
+        assert Ax_U is gradh.Ax0_Core_batch((sa, sa, sa, so, gradh.U_1[:, :, so]))[0]
+        # Responses memoized during E_2 are evicted as well
+        _ = hessh.E_2
+        assert set(memo) == keys
+
     def test_r_b3lyp_hess(self):
         scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
         scf_hess = scf_eng.Hessian().run()
@@ -35,6 +59,38 @@ class TestHessR:
         # ASSERT: hessian - PySCF
         assert np.allclose(hessh.E_2, scf_hess.de.swapaxes(-2, -3).reshape((-1, self.mol.natm * 3)), atol=1e-6, rtol=1e-4)
 
+    def test_r_active_atoms_hess(self):
+        atoms = [2, 0]
+        idx = np.array([3 * A + t for A in atoms for t in range(3)])
+        for scf_eng, fchk, atol in [
+            (scf.RHF(self.mol).run(), "NH3-HF-freq.fchk", 1e-6),
+            (dft.RKS(self.mol, xc="B3LYPg").set(grids=self.grids).run(), "NH3-B3LYP-freq.fchk", 1e-5),
+        ]:
+            gradh = GradSCF({"scf_eng": scf_eng, "cphf_grids": self.grids_cphf, "atoms": atoms})
+            hessh = HessSCF({"deriv_A": gradh})
+            formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/" + fchk))
+            # Only perturbations of active atoms are solved
+            assert gradh.U_1.shape[0] == 3 * len(atoms)
+            # ASSERT: gradient - Gaussian
+            assert np.allclose(gradh.E_1, formchk.grad()[atoms], atol=5e-6, rtol=1e-4)
+            # ASSERT: hessian - Gaussian
+            assert np.allclose(hessh.E_2, formchk.hessian()[np.ix_(idx, idx)], atol=atol, rtol=2e-4)
+
+    def test_r_atom_block_ao(self):
+        scf_eng = scf.RHF(self.mol).run()
+        hessh = HessSCF({"deriv_A": GradSCF({"scf_eng": scf_eng})})
+        natm, nao, C = self.mol.natm, hessh.nao, hessh.C
+        hcore_deriv = scf_eng.Hessian().hcore_generator()
+        H_2_ao = np.array([[hcore_deriv(A, B) for B in range(natm)] for A in range(natm)])
+        H_2_ao = H_2_ao.swapaxes(1, 2).reshape((natm * 3, natm * 3, nao, nao))
+        # ASSERT: H_2 blocks - PySCF
+        assert np.allclose(hessh.H_2_ao, H_2_ao)
+        assert np.allclose(hessh.H_2_mo, C.T @ H_2_ao @ C)
+        assert np.allclose(hessh.H_2_ao_block.dot(hessh.D), (H_2_ao * hessh.D).sum(axis=(-1, -2)))
+        # ASSERT: S_1, S_2 blocks - dense transform
+        assert np.allclose(hessh.S_2_mo, C.T @ hessh.S_2_ao @ C)
+        assert np.allclose(hessh.A.S_1_mo, C.T @ hessh.A.S_1_ao @ C)
+
     def test_r_hfb3lyp_hess(self):
         scf_eng = scf.RHF(self.mol); scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 256; scf_eng.run()
         nc_eng = dft.RKS(self.mol, xc="B3LYPg")
@@ -54,6 +110,19 @@ class TestHessR:
         # ASSERT: hessian - Gaussian
         assert np.allclose(hessh.E_2, formchk.hessian(), atol=1e-6, rtol=1e-4)
 
+    def test_r_mp2_frozen_hess(self):
+
+        def mf_func(mol_):
+            scf_eng_ = scf.RHF(mol_); scf_eng_.conv_tol = 1e-12; scf_eng_.run()
+            return GradMP2({"scf_eng": scf_eng_, "frozen": 1, "cphf_tol": 1e-10}).E_1.ravel()
+
+        scf_eng = scf.RHF(self.mol); scf_eng.conv_tol = 1e-12; scf_eng.run()
+        gradh = GradMP2({"scf_eng": scf_eng, "frozen": 1, "cphf_tol": 1e-10})
+        hessh = HessMP2({"deriv_A": gradh})
+        num_hess = NumericDiff(NucCoordDerivGenerator(self.mol, mf_func)).derivative
+        # ASSERT: hessian - numerical
+        assert np.allclose(hessh.E_2, num_hess, atol=1e-6, rtol=1e-4)
+
     def test_r_xyg3_hess(self):
         scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
         nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
@@ -73,3 +142,53 @@ class TestHessR:
         formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-XYGJOS-freq.fchk"))
         # ASSERT: hessian - Gaussian
         np.allclose(hessh.E_2, formchk.hessian(), atol=2e-5, rtol=2e-4)
+
+    def test_r_hessian_vector_product(self):
+        v = np.random.RandomState(0).randn(self.mol.natm * 3)
+        scf_eng = scf.RHF(self.mol).run()
+        formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-MP2-freq.fchk"))
+        for frozen in [0, 1]:
+            gradh = GradMP2({"scf_eng": scf_eng, "frozen": frozen})
+            hessh = HessMP2({"deriv_A": gradh})
+            # Skeleton derivatives of A tensor are recorded by shape
+            shapes, get_Ax1_HF_ao = [], gradh._get_Ax1_HF_ao
+
+            def record_Ax1_HF_ao(dmX, v_B=None):
+                ax = get_Ax1_HF_ao(dmX, v_B)
+                shapes.append(ax.shape)
+                return ax
+            gradh._get_Ax1_HF_ao = record_Ax1_HF_ao
+            hvp = hessh.hessian_vector_product(v)
+            # CP-HF of all atomic perturbations is not solved
+            assert "_U_1" not in gradh.__dict__
+            # Skeleton derivative of B is contracted with v inside, so no (natm * 3, natm * 3, nao, nao) tensor is formed
+            assert shapes and all(np.prod(shape[:-2]) < (self.mol.natm * 3) ** 2 for shape in shapes)
+            # ASSERT: hessian-vector product - full hessian
+            assert np.allclose(hvp, hessh.E_2 @ v, atol=1e-6, rtol=1e-4)
+        # ASSERT: hessian-vector product - Gaussian
+        assert np.allclose(HessMP2({"deriv_A": GradMP2({"scf_eng": scf_eng})}).hessian_vector_product(v),
+                           formchk.hessian() @ v, atol=1e-5, rtol=1e-4)
+        # GGA kernel response of A is evaluated by adjoint CP-HF
+        scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids_cphf; scf_eng.run()
+        nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
+        config = {"scf_eng": scf_eng, "nc_eng": nc_eng, "cc": 0.3211, "cphf_grids": self.grids_cphf}
+        hessh = HessXDH({"deriv_A": GradXDH(config)})
+        # ASSERT: hessian-vector product - full hessian
+        assert np.allclose(hessh.hessian_vector_product(v), hessh.E_2 @ v, atol=1e-6, rtol=1e-4)
+
+    def test_r_hess_blocked(self):
+        scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids_cphf; scf_eng.run()
+        hessh = HessSCF({"deriv_A": GradSCF({"scf_eng": scf_eng})})
+        hessh_blocked = HessSCF({"deriv_A": GradSCF({"scf_eng": scf_eng}), "E_2_blocksize": 5})
+        # ASSERT: blocked hessian - full hessian
+        assert np.allclose(hessh_blocked.E_2, hessh.E_2, atol=1e-8)
+        # Full second derivative MO intermediates are not formed
+        assert "_Xi_2" not in hessh_blocked.__dict__ and "_pdB_F_A_mo" not in hessh_blocked.__dict__
+        # GGA skeleton hessian is evaluated once for all blocks
+        assert len(hessh_blocked._E_2_Skeleton_GGA) == 1
+        # Memoized responses of blocks are evicted after E_2
+        assert not hessh_blocked.A.context.values["_Ax0_memo"]
+        scf_eng = scf.RHF(self.mol).run()
+        hessh = HessMP2({"deriv_A": GradMP2({"scf_eng": scf_eng, "frozen": 1})})
+        hessh_blocked = HessMP2({"deriv_A": GradMP2({"scf_eng": scf_eng, "frozen": 1}), "E_2_blocksize": 3})
+        assert np.allclose(hessh_blocked.E_2, hessh.E_2, atol=1e-8)
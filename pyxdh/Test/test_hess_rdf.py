@@ -0,0 +1,35 @@
+import numpy as np
+from pyscf import gto, scf, dft
+from pyxdh.DerivOnce import GradSCF, GradDFSCF, GradDFNCDFT
+from pyxdh.DerivTwice import HessSCF, HessDFSCF, HessDFNCDFT
+from pkg_resources import resource_filename
+import pickle
+
+
+class TestHessRDF:
+
+    mol = gto.Mole(atom="N 0. 0. 0.; H .9 0. 0.; H 0. 1. 0.; H 0. 0. 1.1", basis="6-31G", verbose=0).build()
+    grids = dft.Grids(mol); grids.atom_grid = (99, 590); grids.build()
+
+    def test_rdf_rhf_hess(self):
+        scf_eng = scf.RHF(self.mol).density_fit(auxbasis="cc-pVDZ-jkfit"); scf_eng.conv_tol = 1e-12; scf_eng.run()
+        scf_hess = scf_eng.Hessian(); scf_hess.auxbasis_response = 2; scf_hess.run()
+        gradh = GradDFSCF({"scf_eng": scf_eng})
+        hessh = HessDFSCF({"deriv_A": gradh})
+        # ASSERT: hessian - PySCF density fitting
+        assert np.allclose(hessh.E_2, scf_hess.de.swapaxes(-2, -3).reshape((-1, self.mol.natm * 3)), atol=1e-7, rtol=1e-5)
+        # ASSERT: hessian - conventional integrals
+        hessh_conv = HessSCF({"deriv_A": GradSCF({"scf_eng": scf.RHF(self.mol).run()})})
+        assert np.allclose(hessh.E_2, hessh_conv.E_2, atol=1e-4, rtol=1e-4)
+
+    def test_rdf_hfb3lyp_hess(self):
+        scf_eng = scf.RHF(self.mol).density_fit(auxbasis="cc-pVDZ-jkfit")
+        scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 256; scf_eng.run()
+        nc_eng = dft.RKS(self.mol, xc="B3LYPg").density_fit(auxbasis="cc-pVDZ-jkfit")
+        nc_eng.grids = self.grids
+        gradh = GradDFNCDFT({"scf_eng": scf_eng, "nc_eng": nc_eng})
+        hessh = HessDFNCDFT({"deriv_A": gradh})
+        with open(resource_filename("pyxdh", "Validation/numerical_deriv/NH3-HFB3LYP-hess.dat"), "rb") as f:
+            ref_hess = pickle.load(f)
+        # ASSERT: hessian - numerical (conventional integrals), within density fitting error
+        assert np.allclose(hessh.E_2, ref_hess.reshape((-1, self.mol.natm * 3)), atol=1e-4, rtol=1e-4)
@@ -1,5 +1,5 @@
 import numpy as np
-from pyscf import gto, scf
+from pyscf import gto, scf, dft
 from pyxdh.DerivOnce import GradUSCF
 from pyxdh.DerivTwice import HessUSCF
 from pyxdh.Utilities import FormchkInterface
@@ -9,6 +9,8 @@ from pkg_resources import resource_filename
 class TestHessU:
 
     mol = gto.Mole(atom="C 0. 0. 0.; H 1. 0. 0.; H 0. 2. 0.; H 0. 0. 1.5", basis="6-31G", spin=1, verbose=0).build()
+    grids = dft.Grids(mol); grids.atom_grid = (99, 590); grids.build()
+    grids_cphf = dft.Grids(mol); grids_cphf.atom_grid = (50, 194); grids_cphf.build()
 
     def test_u_uhf_hess(self):
         scf_eng = scf.UHF(self.mol); scf_eng.conv_tol = 1e-12; scf_eng.conv_tol_grad = 1e-10
@@ -18,6 +20,20 @@ class TestHessU:
         formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/CH3-HF-freq.fchk"))
         assert np.allclose(hessh.E_2, formchk.hessian(), atol=1e-6, rtol=1e-4)
 
+    def test_u_b3lyp_hess(self):
+        scf_eng = dft.UKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids
+        scf_eng.conv_tol = 1e-12; scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 256; scf_eng.run()
+        scf_hess = scf_eng.Hessian().run()
+        gradh = GradUSCF({"scf_eng": scf_eng, "cphf_grids": self.grids_cphf})
+        hessh = HessUSCF({"deriv_A": gradh})
+        formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/CH3-B3LYP-freq.fchk"))
+        # ASSERT: hessian - Gaussian
+        assert np.allclose(hessh.E_2, formchk.hessian(), atol=1e-5, rtol=2e-4)
+        # ASSERT: hessian - PySCF
+        assert np.allclose(hessh.E_2, scf_hess.de.swapaxes(-2, -3).reshape((-1, self.mol.natm * 3)), atol=1e-6, rtol=1e-4)
+        # Derivative integrals of first order are not stored
+        assert "_eri1_ao" not in gradh.__dict__ and "_eri1_ao" not in gradh.context.values
+
     # TODO: UMP2 Hessian is possibly flawed
     # def test_u_mp2_hess(self):
     #     scf_eng = scf.UHF(self.mol); scf_eng.conv_tol = 1e-12; scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 256; scf_eng.run()
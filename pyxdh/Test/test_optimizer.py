@@ -0,0 +1,38 @@
+import numpy as np
+from pyscf import gto, scf, mp
+from pyscf.geomopt import berny_solver
+from pyxdh.DerivOnce import GradSCF, GradMP2, GeomOptimizer
+
+
+class TestGeomOptimizer:
+
+    mol = gto.Mole(atom="O 0. 0. 0.; H 1. 0. 0.; H 0. 1.3 0.2", basis="6-31G", verbose=0).build()
+
+    def test_r_rhf_optimizer(self):
+        scf_eng = scf.RHF(self.mol).run()
+        opt = GeomOptimizer(GradSCF({"scf_eng": scf_eng}))
+        mol_opt = opt.kernel()
+        mol_ref = berny_solver.optimize(scf.RHF(self.mol))
+        # ASSERT: converged geometry and energy - PySCF
+        assert opt.converged
+        assert np.allclose(mol_opt.atom_coords(), mol_ref.atom_coords(), atol=1e-3)
+        assert np.allclose(opt.deriv.eng, scf.RHF(mol_ref).run().e_tot, atol=1e-7)
+        assert np.allclose(opt.deriv.E_1, 0, atol=5e-4)
+
+    def test_r_mp2_optimizer(self):
+        scf_eng = scf.RHF(self.mol); scf_eng.conv_tol = 1e-10; scf_eng.run()
+        cphf_cycles, scf_cycles = [], []
+        for warm_start in (True, False):
+            opt = GeomOptimizer(GradMP2({"scf_eng": scf_eng, "cphf_tol": 1e-8}), warm_start=warm_start)
+            opt.kernel()
+            assert opt.converged
+            cphf_cycles.append([step["cphf_cycles"]["D_r"] for step in opt.history])
+            scf_cycles.append([step["scf_cycles"] for step in opt.history])
+        # Warm start does not change optimization path, and requires no more CP-HF and SCF iterations
+        assert len(cphf_cycles[0]) == len(cphf_cycles[1])
+        assert sum(cphf_cycles[0][1:]) < sum(cphf_cycles[1][1:])
+        assert all(n > 0 for n in scf_cycles[0] + scf_cycles[1]) and scf_cycles[0][0] == scf_cycles[1][0]
+        assert sum(scf_cycles[0][1:]) < sum(scf_cycles[1][1:])
+        # ASSERT: converged energy - PySCF
+        mp2_eng = mp.MP2(scf.RHF(opt.mol).run()).run()
+        assert np.allclose(opt.deriv.eng, mp2_eng.e_tot)
@@ -1,9 +1,10 @@
 import numpy as np
-from pyscf import gto, scf, dft
+from scipy.linalg import expm
+from pyscf import gto, scf, dft, tdscf
 from pyxdh.DerivOnce import DipoleSCF, DipoleNCDFT, DipoleMP2, DipoleXDH
 from pyxdh.DerivTwice import PolarSCF, PolarNCDFT, PolarMP2, PolarXDH
 from pkg_resources import resource_filename
-from pyxdh.Utilities import FormchkInterface
+from pyxdh.Utilities import FormchkInterface, DipoleDerivGenerator, NumericDiff
 import pickle
 
 
@@ -40,6 +41,78 @@ class TestPolarR:
         # ASSERT: polar - numerical
         assert np.allclose(- polh.E_2, ref_polar, atol=1e-6, rtol=1e-4)
 
+    def test_r_rhf_dynamic_polar(self):
+        scf_eng = scf.RHF(self.mol).run()
+        diph = DipoleSCF({"scf_eng": scf_eng, "cphf_tol": 1e-8})
+        polh = PolarSCF({"deriv_A": diph})
+        omegas = [0., 0.05, 0.1, 0.2]
+        E_2 = polh.get_E_2_dynamic(omegas)
+        # Sum over all TDHF states
+        td_eng = tdscf.TDHF(scf_eng); td_eng.nstates = diph.nocc * diph.nvir; td_eng.conv_tol = 1e-10; td_eng.kernel()
+        e, tdip = td_eng.e, td_eng.transition_dipole()
+        ref = np.array([- np.einsum("n, nt, ns -> ts", 2 * e / (e ** 2 - omega ** 2), tdip, tdip) for omega in omegas])
+        # ASSERT: dynamic polar - sum over states
+        assert np.allclose(E_2, ref, atol=1e-6, rtol=1e-5)
+        # ASSERT: static limit
+        assert np.allclose(E_2[0], polh.E_2, atol=1e-6, rtol=1e-5)
+
+    def test_r_ncdft_dynamic_polar(self):
+        scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
+        omegas = [0., 0.1]
+        # Non-consistent functional is the same to SCF functional, so dynamic polar should be the same to SCF
+        nc_eng = dft.RKS(self.mol, xc="B3LYPg"); nc_eng.grids = self.grids
+        diph = DipoleNCDFT({"scf_eng": scf_eng, "nc_eng": nc_eng, "cphf_grids": self.grids_cphf, "cphf_tol": 1e-8})
+        polh_scf = PolarSCF({"deriv_A": DipoleSCF({"scf_eng": scf_eng, "cphf_grids": self.grids_cphf})})
+        assert np.allclose(PolarNCDFT({"deriv_A": diph}).get_E_2_dynamic(omegas), polh_scf.get_E_2_dynamic(omegas),
+                           atol=1e-4, rtol=1e-5)
+        # Static limit of XYG3 non-consistent part
+        nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
+        diph = DipoleNCDFT({"scf_eng": scf_eng, "nc_eng": nc_eng, "cphf_grids": self.grids_cphf, "cphf_tol": 1e-8})
+        polh = PolarNCDFT({"deriv_A": diph})
+        E_2 = polh.get_E_2_dynamic(omegas)
+        assert np.allclose(E_2[0], polh.E_2, atol=1e-6, rtol=1e-5)
+        assert np.allclose(E_2[1], E_2[1].T)
+        assert np.all(np.linalg.eigvalsh(E_2[1] - E_2[0]) < 0)
+
+        # Finite frequency reference: time-averaged quasi-energy Lagrangian of explicitly rotated (complex) orbitals
+        # exp(eps * (K_c cos(wt) + i K_s sin(wt))), differentiated numerically with respect to field strength eps
+        C, n, Z, so, sv, H_1_ao = diph.C, diph.mo_occ, diph.Z, diph.so, diph.sv, diph.H_1_ao
+        ni, hcore = scf_eng._numint, scf_eng.get_hcore()
+
+        def fock_eng(D, xc):
+            vj, vk = scf.hf.get_jk(self.mol, D, hermi=0)
+            cx = ni.hybrid_coeff(xc)
+            _, exc, vxc = ni.nr_rks(self.mol, self.grids, xc, D.real)
+            eng = np.einsum("uv, vu -> ", hcore + 0.5 * vj - 0.25 * cx * vk, D).real + exc
+            return hcore + vj - 0.5 * cx * vk + vxc, eng
+
+        def lagrangian(K, H):
+            C_K = C @ expm(K)
+            D = np.einsum("up, p, vp -> uv", C_K, n, C_K.conj())
+            eng = fock_eng(D, nc_eng.xc)[1] + np.einsum("uv, vu -> ", H, D).real
+            F_mo = C_K.conj().T @ (fock_eng(D, scf_eng.xc)[0] + H) @ C_K
+            return eng + 4 * np.einsum("ai, ai -> ", Z, F_mo[sv, so].real)
+
+        U_plus, U_minus = diph.get_U_1_dynamic(omegas[1:])
+        K_c, K_s = np.zeros((2, 3, diph.nmo, diph.nmo))
+        K_c[:, sv, so], K_c[:, so, sv] = U_plus[0], - U_plus[0].swapaxes(-1, -2)
+        K_s[:, sv, so], K_s[:, so, sv] = U_minus[0], U_minus[0].swapaxes(-1, -2)
+
+        def quasi(f):
+            K, S = np.einsum("A, Apq -> pq", f, K_c), np.einsum("A, Apq -> pq", f, K_s)
+            # Time-derivative term - i <d/dt>, averaged over period
+            eng_t = omegas[1] * np.einsum("p, pp -> ", n, K @ S - S @ K)
+            return lagrangian(K, np.einsum("A, Auv -> uv", f, H_1_ao)) + lagrangian(1j * S, 0 * hcore) + eng_t
+
+        eps, fs = 1e-4, np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1], [0, 1, 1], [1, 0, 1], [1, 1, 0]])
+        eng_0 = quasi(np.zeros(3))
+        d2 = np.array([(quasi(eps * f) + quasi(- eps * f) - 2 * eng_0) / eps ** 2 for f in fs])
+        num_E_2 = np.diag(d2[:3])
+        for A, B, t in ((1, 2, 3), (0, 2, 4), (0, 1, 5)):
+            num_E_2[A, B] = num_E_2[B, A] = (d2[t] - d2[A] - d2[B]) / 2
+        # ASSERT: dynamic polar - numerical quasi-energy
+        assert np.allclose(E_2[1], num_E_2, atol=1e-4, rtol=1e-4)
+
     def test_r_mp2_polar(self):
         scf_eng = scf.RHF(self.mol).run()
         diph = DipoleMP2({"scf_eng": scf_eng})
@@ -48,6 +121,20 @@ class TestPolarR:
         # ASSERT: polar - Gaussian
         assert np.allclose(- polh.E_2, formchk.polarizability(), atol=1e-6, rtol=1e-4)
 
+    def test_r_mp2_frozen_polar(self):
+
+        def mf_func(t, interval):
+            scf_eng_ = scf.RHF(self.mol); scf_eng_.conv_tol = 1e-12
+            scf_eng_.get_hcore = lambda mol_: scf.rhf.get_hcore(mol_) - interval * mol_.intor("int1e_r")[t]
+            scf_eng_.run()
+            return DipoleMP2({"scf_eng": scf_eng_, "frozen": 1, "cphf_tol": 1e-10}).E_1
+
+        scf_eng = scf.RHF(self.mol); scf_eng.conv_tol = 1e-12; scf_eng.run()
+        polh = PolarMP2({"deriv_A": DipoleMP2({"scf_eng": scf_eng, "frozen": 1, "cphf_tol": 1e-10})})
+        num_polar = NumericDiff(DipoleDerivGenerator(mf_func, interval=1e-4)).derivative
+        # ASSERT: polar - numerical
+        assert np.allclose(polh.E_2, num_polar, atol=1e-5, rtol=1e-5)
+
     def test_r_xyg3_polar(self):
         scf_eng = dft.RKS(self.mol, xc="B3LYPg"); scf_eng.grids = self.grids; scf_eng.run()
         nc_eng = dft.RKS(self.mol, xc="0.8033*HF - 0.0140*LDA + 0.2107*B88, 0.6789*LYP"); nc_eng.grids = self.grids
@@ -66,4 +153,4 @@ class TestPolarR:
         polh = PolarXDH({"deriv_A": diph})
         formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/NH3-XYGJOS-freq.fchk"))
         # ASSERT: polar - Gaussian
-        np.allclose(- polh.E_2, formchk.polarizability(), atol=1e-6, rtol=1e-4)
\ No newline at end of file
+        np.allclose(- polh.E_2, formchk.polarizability(), atol=1e-6, rtol=1e-4)
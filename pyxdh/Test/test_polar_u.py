@@ -2,7 +2,7 @@ import numpy as np
 from pyscf import gto, scf
 from pyxdh.DerivOnce import DipoleUSCF, DipoleUMP2
 from pyxdh.DerivTwice import PolarUSCF, PolarUMP2
-from pyxdh.Utilities import FormchkInterface
+from pyxdh.Utilities import FormchkInterface, DipoleDerivGenerator, NumericDiff
 from pkg_resources import resource_filename
 
 
@@ -22,4 +22,20 @@ class TestPolarU:
         diph = DipoleUMP2({"scf_eng": scf_eng, "cphf_tol": 1e-12})
         polh = PolarUMP2({"deriv_A": diph})
         formchk = FormchkInterface(resource_filename("pyxdh", "Validation/gaussian/CH3-MP2-freq.fchk"))
-        assert np.allclose(- polh.E_2, formchk.polarizability(), atol=1e-6, rtol=1e-4)
\ No newline at end of file
+        assert np.allclose(- polh.E_2, formchk.polarizability(), atol=1e-6, rtol=1e-4)
+
+    def test_u_mp2_frozen_polar(self):
+
+        def mf_func(t, interval):
+            scf_eng_ = scf.UHF(self.mol); scf_eng_.conv_tol = 1e-12; scf_eng_.conv_tol_grad = 1e-10
+            scf_eng_.max_cycle = 256
+            scf_eng_.get_hcore = lambda mol_: scf.hf.get_hcore(mol_) - interval * mol_.intor("int1e_r")[t]
+            scf_eng_.run()
+            return DipoleUMP2({"scf_eng": scf_eng_, "frozen": 1, "cphf_tol": 1e-10}).E_1
+
+        scf_eng = scf.UHF(self.mol); scf_eng.conv_tol = 1e-12; scf_eng.conv_tol_grad = 1e-10; scf_eng.max_cycle = 256
+        scf_eng.run()
+        polh = PolarUMP2({"deriv_A": DipoleUMP2({"scf_eng": scf_eng, "frozen": 1, "cphf_tol": 1e-10})})
+        num_polar = NumericDiff(DipoleDerivGenerator(mf_func, interval=1e-4)).derivative
+        # ASSERT: polar - numerical
+        assert np.allclose(polh.E_2, num_polar, atol=5e-5, rtol=1e-5)
@@ -0,0 +1,50 @@
+import numpy as np
+from pyxdh.Utilities import contract, plan_stats, clear_plans, set_memory_limit
+from pyxdh.Utilities import contraction
+from pyxdh.Utilities.contraction import MAXMEM, MAXPLANS
+
+
+class TestContraction:
+
+    def test_plan_cache(self):
+
+        clear_plans()
+        A = np.random.random((5, 7, 7))
+        C = np.random.random((7, 4))
+        for _ in range(3):
+            res = contract("Auv, ui, vj -> Aij", A, C, C)
+            assert(np.allclose(res, np.einsum("Auv, ui, vj -> Aij", A, C, C)))
+        stats = plan_stats()
+        assert(stats["plans"] == 1 and stats["miss"] == 1 and stats["hit"] == 2)
+
+        # Different shape requires another plan
+        contract("Auv, ui, vj -> Aij", A, C[:, :2], C)
+        assert(plan_stats()["plans"] == 2)
+
+    def test_memory_limit(self):
+
+        A = np.random.random((6, 6, 6, 6))
+        C = np.random.random((6, 6))
+        ref = np.einsum("uvkl, up, vq, kr, ls -> pqrs", A, C, C, C, C)
+        # Tiny limit should not break contraction, and changing limit drops cached plans
+        set_memory_limit(1e-9)
+        assert(plan_stats()["plans"] == 0)
+        assert(np.allclose(contract("uvkl, up, vq, kr, ls -> pqrs", A, C, C, C, C), ref))
+        set_memory_limit(MAXMEM)
+
+    def test_plan_eviction(self):
+
+        clear_plans()
+        contraction._max_plans = 3
+        try:
+            C = np.random.random((7, 4))
+            for n in range(1, 6):
+                contract("Auv, ui, vj -> Aij", np.random.random((n, 7, 7)), C, C)
+            # Only the least recently used plans are dropped
+            assert(plan_stats()["plans"] == 3)
+            contract("Auv, ui, vj -> Aij", np.random.random((5, 7, 7)), C, C)
+            assert(plan_stats()["hit"] == 1)
+            contract("Auv, ui, vj -> Aij", np.random.random((1, 7, 7)), C, C)
+            assert(plan_stats()["plans"] == 3 and plan_stats()["miss"] == 6)
+        finally:
+            contraction._max_plans = MAXPLANS
@@ -1,6 +1,6 @@
 import numpy as np
 from pyscf import gto, dft
-from pyxdh.Utilities import GridHelper, GridIterator
+from pyxdh.Utilities import GridHelper, GridIterator, GridIteratorU, KernelHelper
 
 
 class TestGrid:
@@ -74,3 +74,141 @@ class TestGrid:
             assert(np.allclose(grdh.A_gamma_1[:, :, s], grdi.A_gamma_1))
             assert(np.allclose(grdh.AB_gamma_2[:, :, :, :, s], grdi.AB_gamma_2))
             idx += inc
+
+    def test_lower_deriv_fallback(self):
+
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  1.5  0.0  0.0
+        H  0.0  0.0  1.5
+        """
+        mol.basis = "6-31G"
+        mol.verbose = 0
+        mol.build()
+
+        nao = mol.nao
+
+        grids = dft.gen_grid.Grids(mol)
+        grids.atom_grid = (75, 302)
+        grids.becke_scheme = dft.gen_grid.stratmann
+        grids.build()
+
+        dmX = np.random.random((nao, nao))
+        dmX += dmX.T
+        grdit_3 = GridIterator(mol, grids, dmX, deriv=3, memory=100)
+        grdit_1 = GridIterator(mol, grids, dmX, deriv=1, memory=100)
+
+        for grdi_3, grdi_1 in zip(grdit_3, grdit_1):
+            assert(grdi_1.ao.shape[0] == 4)
+            assert(np.allclose(grdi_3.rho_1, grdi_1.rho_1))
+            # Higher-order quantities should be evaluated on demand
+            assert(np.allclose(grdi_3.A_rho_2, grdi_1.A_rho_2))
+            assert(np.allclose(grdi_3.AB_rho_3, grdi_1.AB_rho_3))
+            assert(grdi_1.ao.shape[0] == 20)
+
+    def test_packed_accordance_with_legacy(self):
+
+        from pyxdh.Utilities.grid_helper import GridHelperLegacy
+
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  1.5  0.0  0.0
+        H  0.0  0.0  1.5
+        """
+        mol.basis = "6-31G"
+        mol.verbose = 0
+        mol.build()
+
+        grids = dft.gen_grid.Grids(mol)
+        grids.atom_grid = (50, 194)
+        grids.becke_scheme = dft.gen_grid.stratmann
+        grids.build()
+
+        dmX = np.random.random((mol.nao, mol.nao))
+        dmX += dmX.T
+        grdh = GridHelper(mol, grids, dmX)
+        grdl = GridHelperLegacy(mol, grids, dmX)
+        assert(np.allclose(grdh.ao_2, grdl.ao_2))
+        assert(np.allclose(grdh.ao_3, grdl.ao_3))
+        assert(np.allclose(grdh.ao_3T, grdl.ao_3T))
+        assert(np.allclose(grdh.rho_2, grdl.rho_2))
+        assert(np.allclose(grdh.A_rho_2, grdl.A_rho_2))
+        assert(np.allclose(grdh.AB_rho_2, grdl.AB_rho_2))
+        assert(np.allclose(grdh.AB_rho_3, grdl.AB_rho_3))
+
+    def test_footprint_batch_size(self):
+
+        import warnings
+
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  1.5  0.0  0.0
+        H  0.0  0.0  1.5
+        """
+        mol.basis = "6-31G"
+        mol.verbose = 0
+        mol.build()
+
+        nao = mol.nao
+
+        grids = dft.gen_grid.Grids(mol)
+        grids.atom_grid = (75, 302)
+        grids.build()
+
+        dmX = np.random.random((nao, nao))
+        dmX += dmX.T
+
+        # Caller's footprint should shrink batch so that total memory is within budget
+        blksize_0 = GridIterator.get_blksize(mol, grids, 2, 20)
+        blksize_1 = GridIterator.get_blksize(mol, grids, 2, 20, footprint=8 * 1000)
+        assert(blksize_1 < blksize_0)
+        assert(blksize_1 * (11 * nao * 8 + 8 * 1000) <= 20e6)
+
+        # Batched result should not depend on batch size
+        rho_1 = np.concatenate([grdh.rho_1 for grdh in GridIterator(mol, grids, dmX, deriv=1, memory=20)], axis=-1)
+        rho_1_small = np.concatenate([grdh.rho_1 for grdh in
+                                      GridIterator(mol, grids, dmX, deriv=1, memory=20, footprint=8 * 1000)], axis=-1)
+        assert(np.allclose(rho_1, rho_1_small))
+
+        # Warning should be raised if even minimal batch cannot fit in budget
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            GridIterator(mol, grids, dmX, deriv=1, memory=1, footprint=8 * 10 ** 5)
+            assert(len(w) == 1)
+
+    def test_spin_shared_accordance(self):
+
+        mol = gto.Mole()
+        mol.atom = """
+        O  0.0  0.0  0.0
+        H  1.5  0.0  0.0
+        H  0.0  0.0  1.5
+        """
+        mol.basis = "6-31G"
+        mol.charge = 1
+        mol.spin = 1
+        mol.verbose = 0
+        mol.build()
+
+        nao = mol.nao
+
+        grids = dft.gen_grid.Grids(mol)
+        grids.atom_grid = (50, 194)
+        grids.build()
+
+        D = np.random.random((2, nao, nao))
+        D += D.swapaxes(-1, -2)
+
+        grdit = GridIteratorU(mol, grids, D, deriv=3, memory=100)
+        grdit_a = GridIterator(mol, grids, D[0], deriv=3, memory=100)
+        grdit_b = GridIterator(mol, grids, D[1], deriv=3, memory=100)
+        for grdh, grdh_a, grdh_b in zip(grdit, grdit_a, grdit_b):
+            for prop in ["rho_01", "rho_2", "A_rho_1", "A_rho_2", "A_gamma_1", "AB_rho_2", "AB_rho_3", "AB_gamma_2"]:
+                assert(np.allclose(getattr(grdh, prop), [getattr(grdh_a, prop), getattr(grdh_b, prop)]))
+            kerh = KernelHelper(grdh, "B3LYPG", deriv=3)
+            kerh_ref = KernelHelper((grdh_a, grdh_b), "B3LYPG", deriv=3)
+            for prop in ["fr", "fg", "frr", "frg", "fgg", "frrr", "frrg", "frgg", "fggg"]:
+                assert(np.allclose(getattr(kerh, prop), getattr(kerh_ref, prop)))
@@ -0,0 +1,22 @@
+import numpy as np
+from scipy.linalg import expm
+from pyxdh.Utilities import laplace_quadrature
+from pyxdh.Utilities.laplace import exp_divided_difference
+
+
+class TestLaplace:
+
+    def test_quadrature(self):
+        x = np.linspace(0.8, 60., 1000)
+        t, w = laplace_quadrature(12, 0.8, 60.)
+        assert np.allclose(np.exp(- x[:, None] * t[None, :]) @ w, 1 / x, rtol=1e-5, atol=0)
+
+    def test_divided_difference(self):
+        # Degenerate and distant orbital energies
+        e = np.array([-20., -1.2, -0.5, -0.5 + 1e-9, -0.3])
+        t, h = 2.5, 1e-6
+        X = np.random.random((5, 5))
+        X += X.T
+        # Directional derivative of matrix exponential at diagonal matrix
+        num = (expm((np.diag(e) + h * X) * t) - expm((np.diag(e) - h * X) * t)) / (2 * h)
+        assert np.allclose(exp_divided_difference(e, t) * X, num, atol=1e-6)
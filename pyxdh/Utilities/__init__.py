@@ -1,15 +1,23 @@
 __all__ = [
     "NucCoordDerivGenerator", "NumericDiff", "DipoleDerivGenerator",
     "timing",
-    "GridIterator",
+    "GridIterator", "GridIteratorU",
     "GridHelper", "KernelHelper",
     "FormchkInterface",
-    "cached_property"
+    "cached_property",
+    "contract", "plan_stats", "clear_plans", "set_memory_limit",
+    "laplace_quadrature",
+    "solve_dynamic_response",
+    "AtomBlockMatrix",
 ]
 
 from pyxdh.Utilities.deriv_numerical import NucCoordDerivGenerator, NumericDiff, DipoleDerivGenerator
 from pyxdh.Utilities.timing import timing
-from pyxdh.Utilities.grid_iterator import GridIterator
+from pyxdh.Utilities.grid_iterator import GridIterator, GridIteratorU
 from pyxdh.Utilities.grid_helper import GridHelper, KernelHelper
 from pyxdh.Utilities.formchk_interface import FormchkInterface
 from pyxdh.Utilities.cached_property import cached_property
+from pyxdh.Utilities.contraction import contract, plan_stats, clear_plans, set_memory_limit
+from pyxdh.Utilities.laplace import laplace_quadrature
+from pyxdh.Utilities.dynamic_response import solve_dynamic_response
+from pyxdh.Utilities.atom_block import AtomBlockMatrix
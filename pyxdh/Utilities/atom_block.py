@@ -0,0 +1,131 @@
+import numpy as np
+from pyxdh.Utilities.contraction import contract as einsum
+
+
+class AtomBlockMatrix:
+    """
+    Atom-block-sparse storage of symmetric AO perturbation matrices of nuclear coordinates.
+
+    Matrix of perturbation :math:`A_t` (``order=1``) or :math:`(A_t, B_s)` (``order=2``) is stored as a list of
+    blocks :math:`h`, each restricted to AO rows and columns of some atoms, so that
+
+    .. math::
+
+        X^{\\mathbb{A}}_{\\mu \\nu} = \\sum h^{\\mathbb{A}}_{\\mu \\nu} + h^{\\mathbb{A}}_{\\nu \\mu}
+
+    Full-width rows (``cols = slice(None)``) are allowed for operator derivatives that are not local to atoms.
+    Dense layout of perturbation indexes is the same to other pyxdh perturbation matrices, i.e. ``(natm * 3, ...)``
+    for each perturbation; if only perturbations of some ``atoms`` are stored, ``(len(atoms) * 3, ...)`` in the order
+    of ``atoms``.
+    """
+
+    def __init__(self, natm, nao, order=1, atoms=None):
+        self.natm = natm
+        self.nao = nao
+        self.order = order
+        self.atoms = list(range(natm)) if atoms is None else list(atoms)
+        self.blocks = []
+
+    def add(self, atoms, rows, cols, block):
+        """
+        Parameters
+        ----------
+        atoms: tuple of int
+            Perturbed atoms, length ``order``.
+        rows: slice
+        cols: slice
+        block: np.ndarray
+            Shape ``(3, ) * order + (nrows, ncols)``.
+        """
+        self.blocks.append((tuple(atoms), rows, cols, block))
+
+    def _dense_view(self, mat):
+        # (natm * 3, ) * order -> (natm, 3) * order
+        return mat.reshape((len(self.atoms), 3) * self.order + mat.shape[self.order:])
+
+    def _atom_index(self, atoms):
+        idx = ()
+        for A in atoms:
+            idx += (self.atoms.index(A), slice(None))
+        return idx
+
+    @property
+    def _pert_subscripts(self):
+        return "ts"[:self.order]
+
+    def to_ao(self):
+        """
+        Returns
+        -------
+        np.ndarray
+            Dense matrices, shape ``(natm * 3, ) * order + (nao, nao)``.
+        """
+        mat = np.zeros((len(self.atoms) * 3, ) * self.order + (self.nao, self.nao))
+        view = self._dense_view(mat)
+        for atoms, rows, cols, block in self.blocks:
+            view[self._atom_index(atoms) + (rows, cols)] += block
+        return mat + mat.swapaxes(-1, -2)
+
+    def to_mo(self, C):
+        """
+        AO to MO transform, in which only rows of ``C`` belonging to stored blocks contribute.
+
+        Parameters
+        ----------
+        C: np.ndarray
+            Molecular orbital coefficients, shape (nao, nmo).
+
+        Returns
+        -------
+        np.ndarray
+            Shape ``(natm * 3, ) * order + (nmo, nmo)``.
+        """
+        nmo = C.shape[-1]
+        t = self._pert_subscripts
+        mat = np.zeros((len(self.atoms) * 3, ) * self.order + (nmo, nmo))
+        view = self._dense_view(mat)
+        for atoms, rows, cols, block in self.blocks:
+            view[self._atom_index(atoms)] += einsum(t + "uv, up, vq -> " + t + "pq", block, C[rows], C[cols])
+        return mat + mat.swapaxes(-1, -2)
+
+    def dot(self, D):
+        """
+        Contraction with symmetric AO density matrix, :math:`X^{\\mathbb{A}}_{\\mu \\nu} D_{\\mu \\nu}`.
+
+        Parameters
+        ----------
+        D: np.ndarray
+            Shape (nao, nao).
+
+        Returns
+        -------
+        np.ndarray
+            Shape ``(natm * 3, ) * order``.
+        """
+        t = self._pert_subscripts
+        res = np.zeros((len(self.atoms) * 3, ) * self.order)
+        view = self._dense_view(res)
+        for atoms, rows, cols, block in self.blocks:
+            view[self._atom_index(atoms)] += 2 * einsum(t + "uv, uv -> " + t, block, D[rows, cols])
+        return res
+
+    def contract(self, v):
+        """
+        Contraction of the last perturbation index with vector ``v``, keeping atom-block sparsity.
+
+        Parameters
+        ----------
+        v: np.ndarray
+            Shape ``(len(atoms) * 3, )``.
+
+        Returns
+        -------
+        AtomBlockMatrix
+            Of order ``order - 1``.
+        """
+        res = AtomBlockMatrix(self.natm, self.nao, order=self.order - 1, atoms=self.atoms)
+        for atoms, rows, cols, block in self.blocks:
+            iB = self.atoms.index(atoms[-1])
+            vB = v[3 * iB:3 * iB + 3]
+            res.add(atoms[:-1], rows, cols, np.tensordot(block, vB, axes=([self.order - 1], [0])))
+        return res
@@ -0,0 +1,102 @@
+"""
+Tensor contraction layer with cached contraction plans.
+
+Most contractions in pyxdh have a fixed subscript string, and the operand shapes repeat across grid batches and
+CP-HF iterations. Path search of ``opt_einsum`` is then performed once per (subscript, shapes) pair, and the compiled
+``contract_expression`` is reused afterwards. Shapes still change with geometry, the last grid batch, Hessian blocks
+and so on, so that only the least recently used ``MAXPLANS`` plans (environment variable, default 1024) are kept.
+
+Memory limit of contraction intermediates is controlled by environment variable ``MAXMEM`` (in GB, default 2), or
+by :func:`set_memory_limit`.
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+from opt_einsum import contract_expression
+from opt_einsum.parser import parse_einsum_input
+
+MAXMEM = float(os.getenv("MAXMEM", 2))
+MAXPLANS = int(os.getenv("MAXPLANS", 1024))
+
+_memory_limit = int(1024 ** 3 * MAXMEM / 8)
+_max_plans = MAXPLANS
+_plans = OrderedDict()
+_stats = {"hit": 0, "miss": 0}
+
+
+def contract(subscripts, *operands):
+    """
+    Evaluate Einstein summation with a cached ``opt_einsum`` contraction plan.
+
+    Parameters
+    ----------
+    subscripts: str
+        Einstein summation subscripts, e.g. ``"Auv, ui, vj -> Aij"``.
+    operands: np.ndarray
+
+    Returns
+    -------
+    np.ndarray
+    """
+    operands = [np.asarray(op) for op in operands]
+    key = (subscripts, tuple(op.shape for op in operands))
+    expr = _plans.get(key)
+    if expr is None:
+        _stats["miss"] += 1
+        expr = _plans[key] = _compile(subscripts, [op.shape for op in operands])
+        while len(_plans) > _max_plans:
+            _plans.popitem(last=False)
+    else:
+        _stats["hit"] += 1
+        _plans.move_to_end(key)
+    return expr(*operands)
+
+
+def _compile(subscripts, shapes):
+    # Input and output tensors exist anyway, so memory limit never forbids an intermediate of their size;
+    # otherwise opt_einsum falls back to one single (and extremely slow) contraction of all remaining operands
+    dummies = [np.empty(shape, dtype=np.int8) for shape in shapes]
+    input_subscripts, output_subscript, _ = parse_einsum_input([subscripts] + dummies)
+    dim = {}
+    for term, shape in zip(input_subscripts.split(","), shapes):
+        dim.update(zip(term, shape))
+    size_out = int(np.prod([dim[c] for c in output_subscript]))
+    size_in = max([int(np.prod(shape)) for shape in shapes] + [1])
+    memory_limit = max(_memory_limit, size_out, size_in)
+    return contract_expression(subscripts, *shapes, memory_limit=memory_limit)
+
+
+def plan_stats():
+    """
+    Statistics of cached contraction plans.
+
+    Returns
+    -------
+    dict
+        ``plans``: number of cached plans; ``hit``: contractions that reused a cached plan;
+        ``miss``: contractions that required path search; ``memory_limit``: intermediate size limit in float64 number.
+    """
+    return {"plans": len(_plans), "hit": _stats["hit"], "miss": _stats["miss"], "memory_limit": _memory_limit}
+
+
+def clear_plans():
+    """
+    Drop all cached contraction plans and reset statistics.
+    """
+    _plans.clear()
+    _stats["hit"] = _stats["miss"] = 0
+
+
+def set_memory_limit(maxmem):
+    """
+    Set memory limit of contraction intermediates. Cached plans are dropped, since their paths depend on it.
+
+    Parameters
+    ----------
+    maxmem: float
+        Memory limit in GB.
+    """
+    global _memory_limit
+    _memory_limit = int(1024 ** 3 * maxmem / 8)
+    clear_plans()
@@ -0,0 +1,113 @@
+"""
+Frequency-dependent (dynamic) linear response of real perturbations, solved for all frequencies in one subspace.
+
+For frequency :math:`\\omega`, symmetric (real) and anti-symmetric (imaginary) parts :math:`U^+, U^-` of v-o orbital
+response satisfy
+
+.. math::
+
+    (\\mathbf{A} + \\mathbf{B}) U^+ - \\omega U^- = - P, \\quad (\\mathbf{A} - \\mathbf{B}) U^- - \\omega U^+ = 0
+
+in which :math:`\\mathbf{A} \\pm \\mathbf{B} = \\Delta \\varepsilon + \\mathrm{Ax}^\\pm`; at :math:`\\omega = 0`,
+:math:`U^+` is the usual CP-HF solution. Expansion vectors of :math:`U^+` and :math:`U^-` are shared among all
+frequencies and right-hand sides, so each iteration requires only one batched call of each response function.
+"""
+
+import numpy as np
+import warnings
+
+
+def _orthonormalize(V, X, thresh):
+    # Gram-Schmidt (twice) of new vectors X against orthonormal V, dropping linear dependent ones
+    new = []
+    for x in X:
+        for _ in range(2):
+            if len(V):
+                x = x - V.T @ (V @ x)
+            for y in new:
+                x = x - y * (y @ x)
+        norm = np.linalg.norm(x)
+        if norm > thresh:
+            new.append(x / norm)
+    return np.array(new).reshape(-1, V.shape[1])
+
+
+def solve_dynamic_response(Ax_plus, Ax_minus, e_ai, P, omegas, tol=1e-6, max_cycle=100, lindep=1e-10):
+    """
+    Parameters
+    ----------
+    Ax_plus: callable
+        :math:`\\mathrm{Ax}^+` of v-o matrices, i.e. ``Ax0_Core(sv, so, sv, so)``.
+    Ax_minus: callable
+        :math:`\\mathrm{Ax}^-` of v-o matrices, i.e. ``Ax0_Core(sv, so, sv, so, antisym=True)``.
+    e_ai: np.ndarray
+        Orbital energy differences :math:`\\varepsilon_a - \\varepsilon_i`, shape (nvir, nocc).
+    P: np.ndarray
+        Right-hand sides, shape (nrhs, nvir, nocc).
+    omegas: list of float
+        Frequencies, should be smaller than the first excitation energy.
+    tol: float
+        Convergence threshold of maximum residual.
+    max_cycle: int
+    lindep: float
+        Threshold of norm of new expansion vectors.
+
+    Returns
+    -------
+    tuple of np.ndarray
+        :math:`U^+` and :math:`U^-`, each of shape (nomega, nrhs, nvir, nocc).
+    """
+    omegas = np.asarray(omegas, dtype=float).reshape(-1)
+    nw, nrhs = omegas.size, P.shape[0]
+    shape = e_ai.shape
+    d = e_ai.ravel()
+    P = P.reshape(nrhs, -1)
+    dim = d.size
+
+    def precond(r_plus, r_minus):
+        # Inverse of 2x2 block diagonal (by orbital pairs) of response equations, for each frequency
+        denom = d ** 2 - omegas[:, None, None] ** 2
+        denom[abs(denom) < 1e-8] = 1e-8
+        x_plus = (d * r_plus + omegas[:, None, None] * r_minus) / denom
+        x_minus = (omegas[:, None, None] * r_plus + d * r_minus) / denom
+        return x_plus.reshape(-1, dim), x_minus.reshape(-1, dim)
+
+    V_plus, V_minus = np.zeros((0, dim)), np.zeros((0, dim))
+    AV_plus, AV_minus = np.zeros((0, dim)), np.zeros((0, dim))
+    X_plus, X_minus = precond(- np.broadcast_to(P, (nw, nrhs, dim)), np.zeros((nw, nrhs, dim)))
+    U_plus, U_minus = np.zeros((nw, nrhs, dim)), np.zeros((nw, nrhs, dim))
+    conv = np.zeros(1)
+    for _ in range(max_cycle):
+        X_plus = _orthonormalize(V_plus, X_plus, lindep)
+        X_minus = _orthonormalize(V_minus, X_minus, lindep)
+        if X_plus.shape[0] == 0 and X_minus.shape[0] == 0:
+            break
+        if X_plus.shape[0]:
+            AX = d * X_plus + Ax_plus(X_plus.reshape((-1, ) + shape)).reshape(-1, dim)
+            V_plus, AV_plus = np.concatenate([V_plus, X_plus]), np.concatenate([AV_plus, AX])
+        if X_minus.shape[0]:
+            AX = d * X_minus + Ax_minus(X_minus.reshape((-1, ) + shape)).reshape(-1, dim)
+            V_minus, AV_minus = np.concatenate([V_minus, X_minus]), np.concatenate([AV_minus, AX])
+
+        # Projected equations for all frequencies and right-hand sides
+        np_, nm = V_plus.shape[0], V_minus.shape[0]
+        G_pp, G_mm, S_pm = V_plus @ AV_plus.T, V_minus @ AV_minus.T, V_plus @ V_minus.T
+        rhs = np.zeros((np_ + nm, nrhs))
+        rhs[:np_] = - V_plus @ P.T
+        c_plus, c_minus = np.zeros((nw, nrhs, np_)), np.zeros((nw, nrhs, nm))
+        for iw, omega in enumerate(omegas):
+            G = np.block([[G_pp, - omega * S_pm], [- omega * S_pm.T, G_mm]])
+            c = np.linalg.solve(G, rhs).T
+            c_plus[iw], c_minus[iw] = c[:, :np_], c[:, np_:]
+        U_plus, U_minus = c_plus @ V_plus, c_minus @ V_minus
+        r_plus = c_plus @ AV_plus - omegas[:, None, None] * U_minus + P
+        r_minus = c_minus @ AV_minus - omegas[:, None, None] * U_plus
+        conv = np.maximum(abs(r_plus).max(axis=-1), abs(r_minus).max(axis=-1))
+        if conv.max() < tol:
+            break
+        X_plus, X_minus = precond(- r_plus, - r_minus)
+        X_plus, X_minus = X_plus[conv.ravel() >= tol], X_minus[conv.ravel() >= tol]
+    if conv.max() >= tol:
+        msg = "\nsolve_dynamic_response: not converged well!\nMaximum deviation: " + str(conv.max())
+        warnings.warn(msg)
+    return U_plus.reshape((nw, nrhs) + shape), U_minus.reshape((nw, nrhs) + shape)
@@ -3,13 +3,10 @@ from typing import Tuple
 from pyscf import dft, gto
 import pyscf.dft.numint
 import numpy as np
-from functools import partial
-import os
 
-from pyxdh.Utilities.grid_iterator import GridIterator
+from pyxdh.Utilities.contraction import contract as einsum
+from pyxdh.Utilities.grid_iterator import GridIterator, GridIteratorU, IDX_2, IDX_3, IDX_3T
 
-MAXMEM = float(os.getenv("MAXMEM", 2))
-np.einsum = partial(np.einsum, optimize=["greedy", 1024 ** 3 * MAXMEM / 8])
 np.set_printoptions(8, linewidth=1000, suppress=True)
 
 
@@ -62,19 +59,19 @@ class GridHelperLegacy:
              [grid_ao[XYZ], grid_ao[YYZ], grid_ao[YZZ]],
              [grid_ao[XZZ], grid_ao[YZZ], grid_ao[ZZZ]]],
         ])
-        grid_rho_01 = np.einsum("uv, rgu, gv -> rg", D, grid_ao[0:4], grid_ao_0)
+        grid_rho_01 = einsum("uv, rgu, gv -> rg", D, grid_ao[0:4], grid_ao_0)
         grid_rho_01[1:] *= 2
         grid_rho_0 = grid_rho_01[0]
         grid_rho_1 = grid_rho_01[1:4]
         grid_rho_2 = (
-            + 2 * np.einsum("uv, rgu, wgv -> rwg", D, grid_ao_1, grid_ao_1)
-            + 2 * np.einsum("uv, rwgu, gv -> rwg", D, grid_ao_2, grid_ao_0)
+            + 2 * einsum("uv, rgu, wgv -> rwg", D, grid_ao_1, grid_ao_1)
+            + 2 * einsum("uv, rwgu, gv -> rwg", D, grid_ao_2, grid_ao_0)
         )
         grid_rho_3 = (
-            + 2 * np.einsum("uv, rwxgu, gv -> rwxg", D, grid_ao_3, grid_ao_0)
-            + 2 * np.einsum("uv, rwgu, xgv -> rwxg", D, grid_ao_2, grid_ao_1)
-            + 2 * np.einsum("uv, rxgu, wgv -> rwxg", D, grid_ao_2, grid_ao_1)
-            + 2 * np.einsum("uv, wxgu, rgv -> rwxg", D, grid_ao_2, grid_ao_1)
+            + 2 * einsum("uv, rwxgu, gv -> rwxg", D, grid_ao_3, grid_ao_0)
+            + 2 * einsum("uv, rwgu, xgv -> rwxg", D, grid_ao_2, grid_ao_1)
+            + 2 * einsum("uv, rxgu, wgv -> rwxg", D, grid_ao_2, grid_ao_1)
+            + 2 * einsum("uv, wxgu, rgv -> rwxg", D, grid_ao_2, grid_ao_1)
         )
 
         natm = mol.natm
@@ -83,11 +80,11 @@ class GridHelperLegacy:
         for A in range(natm):
             _, _, p0, p1 = mol.aoslice_by_atom()[A]
             sA = slice(p0, p1)
-            grid_A_rho_1[A] = - 2 * np.einsum("tgk, gl, kl -> tg ", grid_ao_1[:, :, sA], grid_ao_0, D[sA])
-            grid_A_rho_2[A] = - 2 * np.einsum("trgk, gl, kl -> trg", grid_ao_2[:, :, :, sA], grid_ao_0, D[sA])
-            grid_A_rho_2[A] += - 2 * np.einsum("tgk, rgl, kl -> trg", grid_ao_1[:, :, sA], grid_ao_1, D[sA])
+            grid_A_rho_1[A] = - 2 * einsum("tgk, gl, kl -> tg ", grid_ao_1[:, :, sA], grid_ao_0, D[sA])
+            grid_A_rho_2[A] = - 2 * einsum("trgk, gl, kl -> trg", grid_ao_2[:, :, :, sA], grid_ao_0, D[sA])
+            grid_A_rho_2[A] += - 2 * einsum("tgk, rgl, kl -> trg", grid_ao_1[:, :, sA], grid_ao_1, D[sA])
 
-        grid_A_gamma_1 = 2 * np.einsum("rg, Atrg -> Atg", grid_rho_1, grid_A_rho_2)
+        grid_A_gamma_1 = 2 * einsum("rg, Atrg -> Atg", grid_rho_1, grid_A_rho_2)
 
         grid_AB_rho_2 = np.zeros((natm, natm, 3, 3, ngrid))
         grid_AB_rho_3 = np.zeros((natm, natm, 3, 3, 3, ngrid))
@@ -95,27 +92,27 @@ class GridHelperLegacy:
             _, _, p0A, p1A = mol.aoslice_by_atom()[A]
             sA = slice(p0A, p1A)
 
-            grid_AB_rho_2[A, A] += 2 * np.einsum("tsgu, gv, uv -> tsg", grid_ao_2[:, :, :, sA], grid_ao_0, D[sA])
-            grid_AB_rho_3[A, A] += 2 * np.einsum("tsgu, rgv, uv -> tsrg", grid_ao_2[:, :, :, sA], grid_ao_1, D[sA])
-            grid_AB_rho_3[A, A] += 2 * np.einsum("tsrgu, gv, uv -> tsrg", grid_ao_3[:, :, :, :, sA], grid_ao_0, D[sA])
+            grid_AB_rho_2[A, A] += 2 * einsum("tsgu, gv, uv -> tsg", grid_ao_2[:, :, :, sA], grid_ao_0, D[sA])
+            grid_AB_rho_3[A, A] += 2 * einsum("tsgu, rgv, uv -> tsrg", grid_ao_2[:, :, :, sA], grid_ao_1, D[sA])
+            grid_AB_rho_3[A, A] += 2 * einsum("tsrgu, gv, uv -> tsrg", grid_ao_3[:, :, :, :, sA], grid_ao_0, D[sA])
 
             for B in range(A + 1):
                 _, _, p0B, p1B = mol.aoslice_by_atom()[B]
                 sB = slice(p0B, p1B)
 
-                grid_AB_rho_2[A, B] += 2 * np.einsum("tgu, sgv, uv -> tsg",
-                                                     grid_ao_1[:, :, sA], grid_ao_1[:, :, sB], D[sA, sB])
-                grid_AB_rho_3[A, B] += 2 * np.einsum("tgu, srgv, uv -> tsrg",
-                                                     grid_ao_1[:, :, sA], grid_ao_2[:, :, :, sB], D[sA, sB])
-                grid_AB_rho_3[A, B] += 2 * np.einsum("trgu, sgv, uv -> tsrg",
-                                                     grid_ao_2[:, :, :, sA], grid_ao_1[:, :, sB], D[sA, sB])
+                grid_AB_rho_2[A, B] += 2 * einsum("tgu, sgv, uv -> tsg",
+                                                  grid_ao_1[:, :, sA], grid_ao_1[:, :, sB], D[sA, sB])
+                grid_AB_rho_3[A, B] += 2 * einsum("tgu, srgv, uv -> tsrg",
+                                                  grid_ao_1[:, :, sA], grid_ao_2[:, :, :, sB], D[sA, sB])
+                grid_AB_rho_3[A, B] += 2 * einsum("trgu, sgv, uv -> tsrg",
+                                                  grid_ao_2[:, :, :, sA], grid_ao_1[:, :, sB], D[sA, sB])
                 if A != B:
                     grid_AB_rho_2[B, A] = grid_AB_rho_2[A, B].swapaxes(0, 1)
                     grid_AB_rho_3[B, A] = grid_AB_rho_3[A, B].swapaxes(0, 1)
 
         grid_AB_gamma_2 = (
-            + 2 * np.einsum("Atrg, Bsrg -> ABtsg", grid_A_rho_2, grid_A_rho_2)
-            + 2 * np.einsum("rg, ABtsrg -> ABtsg", grid_rho_1, grid_AB_rho_3)
+            + 2 * einsum("Atrg, Bsrg -> ABtsg", grid_A_rho_2, grid_A_rho_2)
+            + 2 * einsum("rg, ABtsrg -> ABtsg", grid_rho_1, grid_AB_rho_3)
         )
 
         # Variable definition
@@ -162,6 +159,7 @@ class GridHelper:
         self._ao_2 = None
         self._ao_2T = None
         self._ao_3 = None
+        self._ao_3P = None
         self._ao_3T = None
         self._rho_01 = None
         self._rho_0 = None
@@ -208,44 +206,29 @@ class GridHelper:
 
     @property
     def ao_2(self):
+        # Expanded copy of ao_2T; contractions should prefer packed ao_2T with IDX_2 or SYM_2
         if self._ao_2 is None:
-            XX, XY, XZ, YY, YZ, ZZ = range(4, 10)
-            ao = self.ao
-            self._ao_2 = np.array([
-                [ao[XX], ao[XY], ao[XZ]],
-                [ao[XY], ao[YY], ao[YZ]],
-                [ao[XZ], ao[YZ], ao[ZZ]],
-            ])
+            self._ao_2 = self.ao_2T[IDX_2]
         return self._ao_2
 
+    @property
+    def ao_3P(self):
+        if self._ao_3P is None:
+            self._ao_3P = self.ao[10:20]
+        return self._ao_3P
+
     @property
     def ao_3(self):
+        # Expanded copy of ao_3P; contractions should prefer packed ao_3P with IDX_3 or SYM_3T
         if self._ao_3 is None:
-            XXX, XXY, XXZ, XYY, XYZ, XZZ, YYY, YYZ, YZZ, ZZZ = range(10, 20)
-            ao = self.ao
-            self._ao_3 = np.array([
-                [[ao[XXX], ao[XXY], ao[XXZ]],
-                 [ao[XXY], ao[XYY], ao[XYZ]],
-                 [ao[XXZ], ao[XYZ], ao[XZZ]]],
-                [[ao[XXY], ao[XYY], ao[XYZ]],
-                 [ao[XYY], ao[YYY], ao[YYZ]],
-                 [ao[XYZ], ao[YYZ], ao[YZZ]]],
-                [[ao[XXZ], ao[XYZ], ao[XZZ]],
-                 [ao[XYZ], ao[YYZ], ao[YZZ]],
-                 [ao[XZZ], ao[YZZ], ao[ZZZ]]],
-            ])
+            self._ao_3 = self.ao_3P[IDX_3]
         return self._ao_3
 
     @property
     def ao_3T(self):
+        # Expanded copy of ao_3P; contractions should prefer packed ao_3P with SYM_3T
         if self._ao_3T is None:
-            XXX, XXY, XXZ, XYY, XYZ, XZZ, YYY, YYZ, YZZ, ZZZ = range(10, 20)
-            ao = self.ao
-            self._ao_3T = np.array([
-                [ao[XXX], ao[XXY], ao[XXZ], ao[XYY], ao[XYZ], ao[XZZ]],
-                [ao[XXY], ao[XYY], ao[XYZ], ao[YYY], ao[YYZ], ao[YZZ]],
-                [ao[XXZ], ao[XYZ], ao[XZZ], ao[YYZ], ao[YZZ], ao[ZZZ]],
-            ])
+            self._ao_3T = self.ao_3P[IDX_3T]
         return self._ao_3T
 
     @property
@@ -334,7 +317,7 @@ class GridHelper:
         """
         if D is None:
             D = self.D
-        rho_0 = np.einsum("uv, gu, gv -> g", D, self.ao_0, self.ao_0)
+        rho_0 = einsum("uv, gu, gv -> g", D, self.ao_0, self.ao_0)
         return rho_0
 
     def get_rho_1(self, D=None):
@@ -355,7 +338,7 @@ class GridHelper:
         """
         if D is None:
             D = self.D
-        rho_1 = 2 * np.einsum("uv, rgu, gv -> rg", D, self.ao_1, self.ao_0)
+        rho_1 = 2 * einsum("uv, rgu, gv -> rg", D, self.ao_1, self.ao_0)
         return rho_1
 
     def get_rho_01(self, D=None):
@@ -383,8 +366,8 @@ class GridHelper:
         if D is None:
             D = self.D
         rho_2 = (
-            + 2 * np.einsum("uv, rwgu, gv -> rwg", D, self.ao_2, self.ao_0)
-            + 2 * np.einsum("uv, rgu, wgv -> rwg", D, self.ao_1, self.ao_1)
+            + 2 * einsum("uv, Tgu, gv -> Tg", D, self.ao_2T, self.ao_0)[IDX_2]
+            + 2 * einsum("uv, rgu, wgv -> rwg", D, self.ao_1, self.ao_1)
         )
         return rho_2
 
@@ -395,7 +378,7 @@ class GridHelper:
         A_rho_1 = np.zeros((natm, 3, self.ngrid))
         for A in range(natm):
             sA = self.mol_slice(A)
-            A_rho_1[A] = - 2 * np.einsum("tgk, gl, kl -> tg ", self.ao_1[:, :, sA], self.ao_0, D[sA])
+            A_rho_1[A] = - 2 * einsum("tgk, gl, kl -> tg ", self.ao_1[:, :, sA], self.ao_0, D[sA])
         return A_rho_1
 
     def get_A_rho_2(self, D=None):
@@ -405,12 +388,12 @@ class GridHelper:
         A_rho_2 = np.zeros((natm, 3, 3, self.ngrid))
         for A in range(natm):
             sA = self.mol_slice(A)
-            A_rho_2[A] = - 2 * np.einsum("trgk, gl, kl -> trg", self.ao_2[:, :, :, sA], self.ao_0, D[sA])
-            A_rho_2[A] += - 2 * np.einsum("tgk, rgl, kl -> trg", self.ao_1[:, :, sA], self.ao_1, D[sA])
+            A_rho_2[A] = - 2 * einsum("Tgk, gl, kl -> Tg", self.ao_2T[:, :, sA], self.ao_0, D[sA])[IDX_2]
+            A_rho_2[A] += - 2 * einsum("tgk, rgl, kl -> trg", self.ao_1[:, :, sA], self.ao_1, D[sA])
         return A_rho_2
 
     def get_A_gamma_1(self):
-        A_gamma_1 = 2 * np.einsum("rg, Atrg -> Atg", self.rho_1, self.A_rho_2)
+        A_gamma_1 = 2 * einsum("rg, Atrg -> Atg", self.rho_1, self.A_rho_2)
         return A_gamma_1
 
     def get_AB_rho_2(self, D=None):
@@ -421,11 +404,11 @@ class GridHelper:
         AB_rho_2 = np.zeros((natm, natm, 3, 3, self.ngrid))
         for A in range(natm):
             sA = self.mol_slice(A)
-            AB_rho_2[A, A] += 2 * np.einsum("tsgu, gv, uv -> tsg", self.ao_2[:, :, :, sA], self.ao_0, D[sA])
+            AB_rho_2[A, A] += 2 * einsum("Tgu, gv, uv -> Tg", self.ao_2T[:, :, sA], self.ao_0, D[sA])[IDX_2]
             for B in range(A + 1):
                 sB = self.mol_slice(B)
-                AB_rho_2[A, B] += 2 * np.einsum("tgu, sgv, uv -> tsg",
-                                                self.ao_1[:, :, sA], self.ao_1[:, :, sB], D[sA, sB])
+                AB_rho_2[A, B] += 2 * einsum("tgu, sgv, uv -> tsg",
+                                             self.ao_1[:, :, sA], self.ao_1[:, :, sB], D[sA, sB])
                 if A != B:
                     AB_rho_2[B, A] = AB_rho_2[A, B].swapaxes(0, 1)
         return AB_rho_2
@@ -438,23 +421,23 @@ class GridHelper:
         AB_rho_3 = np.zeros((natm, natm, 3, 3, 3, self.ngrid))
         for A in range(natm):
             sA = self.mol_slice(A)
-            AB_rho_3[A, A] += 2 * np.einsum("tsgu, rgv, uv -> tsrg", self.ao_2[:, :, :, sA], self.ao_1, D[sA])
-            AB_rho_3[A, A] += 2 * np.einsum("tsrgu, gv, uv -> tsrg", self.ao_3[:, :, :, :, sA], self.ao_0, D[sA])
+            AB_rho_3[A, A] += 2 * einsum("Tgu, rgv, uv -> Trg", self.ao_2T[:, :, sA], self.ao_1, D[sA])[IDX_2]
+            AB_rho_3[A, A] += 2 * einsum("Pgu, gv, uv -> Pg", self.ao_3P[:, :, sA], self.ao_0, D[sA])[IDX_3]
             for B in range(A + 1):
                 _, _, p0B, p1B = mol.aoslice_by_atom()[B]
                 sB = slice(p0B, p1B)
-                AB_rho_3[A, B] += 2 * np.einsum("tgu, srgv, uv -> tsrg",
-                                                self.ao_1[:, :, sA], self.ao_2[:, :, :, sB], D[sA, sB])
-                AB_rho_3[A, B] += 2 * np.einsum("trgu, sgv, uv -> tsrg",
-                                                self.ao_2[:, :, :, sA], self.ao_1[:, :, sB], D[sA, sB])
+                AB_rho_3[A, B] += 2 * einsum("tgu, Tgv, uv -> tTg",
+                                             self.ao_1[:, :, sA], self.ao_2T[:, :, sB], D[sA, sB])[:, IDX_2]
+                AB_rho_3[A, B] += 2 * einsum("Tgu, sgv, uv -> Tsg",
+                                             self.ao_2T[:, :, sA], self.ao_1[:, :, sB], D[sA, sB])[IDX_2].swapaxes(1, 2)
                 if A != B:
                     AB_rho_3[B, A] = AB_rho_3[A, B].swapaxes(0, 1)
         return AB_rho_3
 
     def get_AB_gamma_2(self):
         AB_gamma_2 = (
-            + 2 * np.einsum("Atrg, Bsrg -> ABtsg", self.A_rho_2, self.A_rho_2)
-            + 2 * np.einsum("rg, ABtsrg -> ABtsg", self.rho_1, self.AB_rho_3)
+            + 2 * einsum("Atrg, Bsrg -> ABtsg", self.A_rho_2, self.A_rho_2)
+            + 2 * einsum("rg, ABtsrg -> ABtsg", self.rho_1, self.AB_rho_3)
         )
         return AB_gamma_2
 
@@ -464,7 +447,7 @@ class KernelHelper:
     def __init__(self, gh, xc, deriv=2):
 
         # Initialization Parameters
-        self.gh = gh  # type: GridHelper or GridIterator or Tuple[GridHelper] or Tuple[GridIterator]
+        self.gh = gh  # type: GridHelper or GridIterator or GridIteratorU or Tuple[GridHelper] or Tuple[GridIterator]
         self.xc = xc  # type: str
 
         # Variable definition
@@ -480,7 +463,11 @@ class KernelHelper:
         self.fggg = None
 
         # Calculation
-        if type(gh) is not tuple:
+        if isinstance(gh, GridIteratorU):  # uks calculation, spin-stacked densities share one AO grid
+            ni = gh.ni
+            grid_exc, grid_vxc, grid_fxc, grid_kxc = ni.eval_xc(xc, gh.rho_01, spin=1, deriv=deriv)
+            weight = gh.weight
+        elif type(gh) is not tuple:
             ni = gh.ni
             grid_exc, grid_vxc, grid_fxc, grid_kxc = ni.eval_xc(xc, gh.rho_01, deriv=deriv)
             weight = gh.weight
@@ -1,28 +1,67 @@
 from pyscf import dft, gto
 import pyscf.dft.numint
 import numpy as np
-from functools import partial
-import os
+from itertools import combinations_with_replacement, product
+import warnings
+
+from pyxdh.Utilities.contraction import contract as einsum
 
-MAXMEM = float(os.getenv("MAXMEM", 2))
-np.einsum = partial(np.einsum, optimize=["greedy", 1024 ** 3 * MAXMEM / 8])
 np.set_printoptions(8, linewidth=1000, suppress=True)
 
 
+def _gen_sym_idx(order):
+    comps = list(combinations_with_replacement(range(3), order))
+    idx = np.empty([3] * order, dtype=int)
+    for t in product(range(3), repeat=order):
+        idx[t] = comps.index(tuple(sorted(t)))
+    return idx
+
+
+# PySCF stores symmetric AO derivatives packed: ao[4:10] is XX, XY, XZ, YY, YZ, ZZ; ao[10:20] is XXX, XXY, ..., ZZZ.
+# IDX_* maps cartesian indices to packed component; it is used to expand small (no AO dimension) results.
+# SYM_* is the 0/1 tensor of the same map; it lets packed AO enter einsum directly, without 3x3(x3) AO copies.
+IDX_2 = _gen_sym_idx(2)  # (t, r) -> T
+IDX_3 = _gen_sym_idx(3)  # (t, s, r) -> P
+IDX_3T = np.array([[IDX_3[(r,) + T] for T in combinations_with_replacement(range(3), 2)] for r in range(3)])
+SYM_2 = np.eye(6)[IDX_2]  # (t, r, T)
+SYM_3T = np.eye(10)[IDX_3T]  # (r, T, P)
+
+
 class GridIterator:
 
-    def __init__(self, mol, grids, D, deriv=3, memory=2000, engine="xcfun"):
+    def __init__(self, mol, grids, D, deriv=3, memory=2000, engine="xcfun", footprint=0, atoms=None):
+        """
+        Parameters
+        ----------
+        mol: gto.Mole
+        grids: dft.Grids
+        D: np.ndarray
+        deriv: int
+            Highest AO derivative order that caller needs.
+        memory: float
+            Memory budget (in MB) for one grid batch, including both AO grid and caller's intermediates.
+        engine: str
+        footprint: int
+            Bytes per grid point that caller allocates for its own intermediates in one batch.
+        atoms: list of int or None
+            Perturbed atoms of nuclear derivative densities (``A_*``, ``AB_*``); all atoms if None.
+        """
 
         self.mol = mol  # type: gto.Mole
         self.grids = grids  # type: dft.Grids
         self.D = D
+        self.deriv = deriv
+        self.atoms = list(range(mol.natm)) if atoms is None else list(atoms)
         self.ni = dft.numint.NumInt()
         if engine == "xcfun":
             from pyscf.dft import xcfun
             self.ni.libxc = xcfun
-        self.batch = self.ni.block_loop(mol, grids, mol.nao, deriv, memory)
+        self.blksize = self.get_blksize(mol, grids, deriv, memory, footprint)
+        self.batch = self.ni.block_loop(mol, grids, mol.nao, deriv, memory, blksize=self.blksize)
 
         self._ao = None
+        self._non0tab = None
+        self._coords = None
         self._ngrid = None
         self._weight = None
         self._ao_0 = None
@@ -30,6 +69,7 @@ class GridIterator:
         self._ao_2 = None
         self._ao_2T = None
         self._ao_3 = None
+        self._ao_3P = None
         self._ao_3T = None
         self._rho_01 = None
         self._rho_0 = None
@@ -48,13 +88,15 @@ class GridIterator:
     def __next__(self):
         try:
             self.clear()
-            self._ao, _, self._weight, _ = next(self.batch)
+            self._ao, self._non0tab, self._weight, self._coords = next(self.batch)
             return self
         except StopIteration:
             raise StopIteration
 
     def clear(self):
         self._ao = None
+        self._non0tab = None
+        self._coords = None
         self._ngrid = None
         self._weight = None
         self._ao_0 = None
@@ -62,6 +104,7 @@ class GridIterator:
         self._ao_2 = None
         self._ao_2T = None
         self._ao_3 = None
+        self._ao_3P = None
         self._ao_3T = None
         self._rho_01 = None
         self._rho_0 = None
@@ -98,55 +141,40 @@ class GridIterator:
     @property
     def ao_1(self):
         if self._ao_1 is None:
-            self._ao_1 = self.ao[1:4]
+            self._ao_1 = self.require_deriv(1)[1:4]
         return self._ao_1
 
     @property
     def ao_2T(self):
         if self._ao_2T is None:
-            self._ao_2T = self.ao[4:10]
+            self._ao_2T = self.require_deriv(2)[4:10]
         return self._ao_2T
 
     @property
     def ao_2(self):
+        # Expanded copy of ao_2T; contractions should prefer packed ao_2T with IDX_2 or SYM_2
         if self._ao_2 is None:
-            XX, XY, XZ, YY, YZ, ZZ = range(4, 10)
-            ao = self.ao
-            self._ao_2 = np.array([
-                [ao[XX], ao[XY], ao[XZ]],
-                [ao[XY], ao[YY], ao[YZ]],
-                [ao[XZ], ao[YZ], ao[ZZ]],
-            ])
+            self._ao_2 = self.ao_2T[IDX_2]
         return self._ao_2
 
+    @property
+    def ao_3P(self):
+        if self._ao_3P is None:
+            self._ao_3P = self.require_deriv(3)[10:20]
+        return self._ao_3P
+
     @property
     def ao_3(self):
+        # Expanded copy of ao_3P; contractions should prefer packed ao_3P with IDX_3 or SYM_3T
         if self._ao_3 is None:
-            XXX, XXY, XXZ, XYY, XYZ, XZZ, YYY, YYZ, YZZ, ZZZ = range(10, 20)
-            ao = self.ao
-            self._ao_3 = np.array([
-                [[ao[XXX], ao[XXY], ao[XXZ]],
-                 [ao[XXY], ao[XYY], ao[XYZ]],
-                 [ao[XXZ], ao[XYZ], ao[XZZ]]],
-                [[ao[XXY], ao[XYY], ao[XYZ]],
-                 [ao[XYY], ao[YYY], ao[YYZ]],
-                 [ao[XYZ], ao[YYZ], ao[YZZ]]],
-                [[ao[XXZ], ao[XYZ], ao[XZZ]],
-                 [ao[XYZ], ao[YYZ], ao[YZZ]],
-                 [ao[XZZ], ao[YZZ], ao[ZZZ]]],
-            ])
+            self._ao_3 = self.ao_3P[IDX_3]
         return self._ao_3
 
     @property
     def ao_3T(self):
+        # Expanded copy of ao_3P; contractions should prefer packed ao_3P with SYM_3T
         if self._ao_3T is None:
-            XXX, XXY, XXZ, XYY, XYZ, XZZ, YYY, YYZ, YZZ, ZZZ = range(10, 20)
-            ao = self.ao
-            self._ao_3T = np.array([
-                [ao[XXX], ao[XXY], ao[XXZ], ao[XYY], ao[XYZ], ao[XZZ]],
-                [ao[XXY], ao[XYY], ao[XYZ], ao[YYY], ao[YYZ], ao[YZZ]],
-                [ao[XXZ], ao[XYZ], ao[XZZ], ao[YYZ], ao[YZZ], ao[ZZZ]],
-            ])
+            self._ao_3T = self.ao_3P[IDX_3T]
         return self._ao_3T
 
     @property
@@ -213,6 +241,59 @@ class GridIterator:
 
     # Function definition
 
+    @staticmethod
+    def get_blksize(mol, grids, deriv, memory, footprint=0):
+        """
+        Number of grid points in one batch, so that AO grid and caller's intermediates fit in ``memory`` MB.
+
+        Parameters
+        ----------
+        mol: gto.Mole
+        grids: dft.Grids
+        deriv: int
+        memory: float
+        footprint: int
+
+        Returns
+        -------
+        int
+        """
+        BLKSIZE = dft.numint.BLKSIZE
+        if grids.coords is None:
+            grids.build(with_non0tab=True)
+        ngrid = grids.weights.size
+        comp = (deriv + 1) * (deriv + 2) * (deriv + 3) // 6
+        # AO grid of one batch (same estimation as pyscf's block_loop), then caller's intermediates
+        bytes_per_grid = (comp + 1) * mol.nao * 8 + footprint
+        nblk = int(memory * 1e6 / (bytes_per_grid * BLKSIZE))
+        if nblk < 1:
+            msg = "\nGridIterator: even the minimal grid batch ({:d} points) requires {:.1f} MB, exceeding {:.1f} MB!"\
+                .format(BLKSIZE, bytes_per_grid * BLKSIZE / 1e6, memory)
+            warnings.warn(msg)
+        nblk = max(1, min(nblk, ngrid // BLKSIZE + 1, 1200))
+        return nblk * BLKSIZE
+
+    def require_deriv(self, deriv):
+        """
+        Return AO grid of current batch that contains orbital derivatives up to order ``deriv``.
+
+        ``deriv`` given at initialization should be the lowest order that caller actually needs, so that
+        ``block_loop`` only evaluates necessary AO components. If some higher-order quantity (such as ``ao_3``
+        or ``AB_rho_3``) is still requested, AO of current batch is re-evaluated here as a fallback.
+
+        Parameters
+        ----------
+        deriv: int
+
+        Returns
+        -------
+        np.ndarray
+        """
+        ncomp = (deriv + 1) * (deriv + 2) * (deriv + 3) // 6
+        if self._ao.ndim < 3 or self._ao.shape[0] < ncomp:
+            self._ao = self.ni.eval_ao(self.mol, self._coords, deriv=deriv, non0tab=self._non0tab)
+        return self._ao
+
     def mol_slice(self, atm_id):
         _, _, p0, p1 = self.mol.aoslice_by_atom()[atm_id]
         return slice(p0, p1)
@@ -235,7 +316,7 @@ class GridIterator:
         """
         if D is None:
             D = self.D
-        rho_0 = np.einsum("uv, gu, gv -> g", D, self.ao_0, self.ao_0)
+        rho_0 = einsum("uv, gu, gv -> g", D, self.ao_0, self.ao_0)
         return rho_0
 
     def get_rho_1(self, D=None):
@@ -256,7 +337,7 @@ class GridIterator:
         """
         if D is None:
             D = self.D
-        rho_1 = 2 * np.einsum("uv, rgu, gv -> rg", D, self.ao_1, self.ao_0)
+        rho_1 = 2 * einsum("uv, rgu, gv -> rg", D, self.ao_1, self.ao_0)
         return rho_1
 
     def get_rho_2(self, D=None):
@@ -278,77 +359,306 @@ class GridIterator:
         if D is None:
             D = self.D
         rho_2 = (
-            + 2 * np.einsum("uv, rwgu, gv -> rwg", D, self.ao_2, self.ao_0)
-            + 2 * np.einsum("uv, rgu, wgv -> rwg", D, self.ao_1, self.ao_1)
+            + 2 * einsum("uv, Tgu, gv -> Tg", D, self.ao_2T, self.ao_0)[IDX_2]
+            + 2 * einsum("uv, rgu, wgv -> rwg", D, self.ao_1, self.ao_1)
         )
         return rho_2
 
     def get_A_rho_1(self, D=None):
         if D is None:
             D = self.D
-        natm = self.mol.natm
-        A_rho_1 = np.zeros((natm, 3, self.ngrid))
-        for A in range(natm):
+        A_rho_1 = np.zeros((len(self.atoms), 3, self.ngrid))
+        for iA, A in enumerate(self.atoms):
             sA = self.mol_slice(A)
-            A_rho_1[A] = - 2 * np.einsum("tgk, gl, kl -> tg ", self.ao_1[:, :, sA], self.ao_0, D[sA])
+            A_rho_1[iA] = - 2 * einsum("tgk, gl, kl -> tg ", self.ao_1[:, :, sA], self.ao_0, D[sA])
         return A_rho_1
 
     def get_A_rho_2(self, D=None):
         if D is None:
             D = self.D
-        natm = self.mol.natm
-        A_rho_2 = np.zeros((natm, 3, 3, self.ngrid))
-        for A in range(natm):
+        A_rho_2 = np.zeros((len(self.atoms), 3, 3, self.ngrid))
+        for iA, A in enumerate(self.atoms):
             sA = self.mol_slice(A)
-            A_rho_2[A] = - 2 * np.einsum("trgk, gl, kl -> trg", self.ao_2[:, :, :, sA], self.ao_0, D[sA])
-            A_rho_2[A] += - 2 * np.einsum("tgk, rgl, kl -> trg", self.ao_1[:, :, sA], self.ao_1, D[sA])
+            A_rho_2[iA] = - 2 * einsum("Tgk, gl, kl -> Tg", self.ao_2T[:, :, sA], self.ao_0, D[sA])[IDX_2]
+            A_rho_2[iA] += - 2 * einsum("tgk, rgl, kl -> trg", self.ao_1[:, :, sA], self.ao_1, D[sA])
         return A_rho_2
 
     def get_A_gamma_1(self):
-        A_gamma_1 = 2 * np.einsum("rg, Atrg -> Atg", self.rho_1, self.A_rho_2)
+        A_gamma_1 = 2 * einsum("rg, Atrg -> Atg", self.rho_1, self.A_rho_2)
         return A_gamma_1
 
     def get_AB_rho_2(self, D=None):
         if D is None:
             D = self.D
-        mol = self.mol
-        natm = mol.natm
-        AB_rho_2 = np.zeros((natm, natm, 3, 3, self.ngrid))
-        for A in range(natm):
+        atoms = self.atoms
+        AB_rho_2 = np.zeros((len(atoms), len(atoms), 3, 3, self.ngrid))
+        for iA, A in enumerate(atoms):
             sA = self.mol_slice(A)
-            AB_rho_2[A, A] += 2 * np.einsum("tsgu, gv, uv -> tsg", self.ao_2[:, :, :, sA], self.ao_0, D[sA])
-            for B in range(A + 1):
+            AB_rho_2[iA, iA] += 2 * einsum("Tgu, gv, uv -> Tg", self.ao_2T[:, :, sA], self.ao_0, D[sA])[IDX_2]
+            for iB, B in enumerate(atoms[:iA + 1]):
                 sB = self.mol_slice(B)
-                AB_rho_2[A, B] += 2 * np.einsum("tgu, sgv, uv -> tsg",
-                                                self.ao_1[:, :, sA], self.ao_1[:, :, sB], D[sA, sB])
+                AB_rho_2[iA, iB] += 2 * einsum("tgu, sgv, uv -> tsg",
+                                               self.ao_1[:, :, sA], self.ao_1[:, :, sB], D[sA, sB])
                 if A != B:
-                    AB_rho_2[B, A] = AB_rho_2[A, B].swapaxes(0, 1)
+                    AB_rho_2[iB, iA] = AB_rho_2[iA, iB].swapaxes(0, 1)
         return AB_rho_2
 
     def get_AB_rho_3(self, D=None):
         if D is None:
             D = self.D
         mol = self.mol
-        natm = mol.natm
-        AB_rho_3 = np.zeros((natm, natm, 3, 3, 3, self.ngrid))
-        for A in range(natm):
+        atoms = self.atoms
+        AB_rho_3 = np.zeros((len(atoms), len(atoms), 3, 3, 3, self.ngrid))
+        for iA, A in enumerate(atoms):
             sA = self.mol_slice(A)
-            AB_rho_3[A, A] += 2 * np.einsum("tsgu, rgv, uv -> tsrg", self.ao_2[:, :, :, sA], self.ao_1, D[sA])
-            AB_rho_3[A, A] += 2 * np.einsum("tsrgu, gv, uv -> tsrg", self.ao_3[:, :, :, :, sA], self.ao_0, D[sA])
-            for B in range(A + 1):
+            AB_rho_3[iA, iA] += 2 * einsum("Tgu, rgv, uv -> Trg", self.ao_2T[:, :, sA], self.ao_1, D[sA])[IDX_2]
+            AB_rho_3[iA, iA] += 2 * einsum("Pgu, gv, uv -> Pg", self.ao_3P[:, :, sA], self.ao_0, D[sA])[IDX_3]
+            for iB, B in enumerate(atoms[:iA + 1]):
                 _, _, p0B, p1B = mol.aoslice_by_atom()[B]
                 sB = slice(p0B, p1B)
-                AB_rho_3[A, B] += 2 * np.einsum("tgu, srgv, uv -> tsrg",
-                                                self.ao_1[:, :, sA], self.ao_2[:, :, :, sB], D[sA, sB])
-                AB_rho_3[A, B] += 2 * np.einsum("trgu, sgv, uv -> tsrg",
-                                                self.ao_2[:, :, :, sA], self.ao_1[:, :, sB], D[sA, sB])
+                AB_rho_3[iA, iB] += 2 * einsum("tgu, Tgv, uv -> tTg",
+                                               self.ao_1[:, :, sA], self.ao_2T[:, :, sB], D[sA, sB])[:, IDX_2]
+                AB_rho_3[iA, iB] += 2 * einsum("Tgu, sgv, uv -> Tsg",
+                                               self.ao_2T[:, :, sA], self.ao_1[:, :, sB], D[sA, sB])[IDX_2].swapaxes(1, 2)
                 if A != B:
-                    AB_rho_3[B, A] = AB_rho_3[A, B].swapaxes(0, 1)
+                    AB_rho_3[iB, iA] = AB_rho_3[iA, iB].swapaxes(0, 1)
         return AB_rho_3
 
     def get_AB_gamma_2(self):
         AB_gamma_2 = (
-            + 2 * np.einsum("Atrg, Bsrg -> ABtsg", self.A_rho_2, self.A_rho_2)
-            + 2 * np.einsum("rg, ABtsrg -> ABtsg", self.rho_1, self.AB_rho_3)
+            + 2 * einsum("Atrg, Bsrg -> ABtsg", self.A_rho_2, self.A_rho_2)
+            + 2 * einsum("rg, ABtsrg -> ABtsg", self.rho_1, self.AB_rho_3)
+        )
+        return AB_gamma_2
+
+    # Density components and AO pair contractions, in variables (rho, rho_r) of GGA kernel
+    #   Leading dimensions of density matrices and grid potentials are retained; these functions do not depend on
+    #   spin, so that they are used with spin-resolved kernel derivatives of ``ni.eval_xc_eff``.
+
+    def get_xc_eff(self, xc, deriv=2):
+        """
+        Weighted derivatives of GGA functional on variables :math:`(\\rho, \\rho_r)` by ``ni.eval_xc_eff``; they are
+        spin-resolved, i.e. of shape (2, 4, ..., ngrid), if ``rho_01`` is spin-stacked.
+
+        Returns
+        -------
+        list of np.ndarray
+            ``vxc``, ``fxc``, ``kxc`` up to ``deriv``.
+        """
+        xc_eff = self.ni.eval_xc_eff(xc, self.rho_01, deriv=deriv, xctype="GGA")[1:deriv + 1]
+        return [v * self.weight for v in xc_eff]
+
+    def get_rho_01(self, D):
+        """
+        Density and its gradient of (a batch of) generalized density matrices.
+
+        Parameters
+        ----------
+        D: np.ndarray
+            Shape (..., nao, nao).
+
+        Returns
+        -------
+        np.ndarray
+            Shape (..., 4, ngrid).
+        """
+        D_ = D.reshape((-1, ) + D.shape[-2:])
+        rho_01 = np.empty((D_.shape[0], 4, self.ngrid))
+        rho_01[:, 0] = einsum("Buv, gu, gv -> Bg", D_, self.ao_0, self.ao_0)
+        rho_01[:, 1:4] = 2 * einsum("Buv, rgu, gv -> Brg", D_, self.ao_1, self.ao_0)
+        return rho_01.reshape(D.shape[:-2] + (4, self.ngrid))
+
+    def get_A_rho_01(self, D=None):
+        """
+        Skeleton derivative of density and its gradient, i.e. ``A_rho_1`` and ``A_rho_2`` stacked.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (..., natm, 3, 4, ngrid); leading dimensions are those of ``A_rho_1``.
+        """
+        A_rho_1 = self.A_rho_1 if D is None else self.get_A_rho_1(D)
+        A_rho_2 = self.A_rho_2 if D is None else self.get_A_rho_2(D)
+        return np.concatenate([A_rho_1[..., None, :], A_rho_2], axis=-2)
+
+    def get_AB_rho_01(self, D=None):
+        """
+        Skeleton second derivative of density and its gradient, i.e. ``AB_rho_2`` and ``AB_rho_3`` stacked.
+
+        Returns
+        -------
+        np.ndarray
+            Shape (..., natm, natm, 3, 3, 4, ngrid); leading dimensions are those of ``AB_rho_2``.
+        """
+        AB_rho_2 = self.AB_rho_2 if D is None else self.get_AB_rho_2(D)
+        AB_rho_3 = self.AB_rho_3 if D is None else self.get_AB_rho_3(D)
+        return np.concatenate([AB_rho_2[..., None, :], AB_rho_3], axis=-2)
+
+    def get_pair_0(self, W):
+        """
+        Contraction of grid potential with AO pairs,
+
+        .. math::
+
+            W_0 \\phi_\\mu \\phi_\\nu + W_r (\\phi_{r \\mu} \\phi_\\nu + \\phi_\\mu \\phi_{r \\nu})
+
+        Parameters
+        ----------
+        W: np.ndarray
+            Shape (nW, 4, ngrid).
+
+        Returns
+        -------
+        np.ndarray
+            Shape (nW, nao, nao).
+        """
+        res = (
+            + 0.5 * einsum("Bg, gu, gv -> Buv", W[:, 0], self.ao_0, self.ao_0)
+            + einsum("Brg, rgu, gv -> Buv", W[:, 1:4], self.ao_1, self.ao_0)
+        )
+        return res + res.swapaxes(-1, -2)
+
+    def get_pair_1(self, W):
+        """
+        Contraction of grid potential with nuclear derivative of AO pairs, in which only AO :math:`\\mu` is
+        differentiated,
+
+        .. math::
+
+            - W_0 \\phi_{t \\mu} \\phi_\\nu - W_r (\\phi_{t r \\mu} \\phi_\\nu + \\phi_{t \\mu} \\phi_{r \\nu})
+
+        Caller should take rows :math:`\\mu` of the perturbed atom, and then add the transpose.
+
+        Parameters
+        ----------
+        W: np.ndarray
+            Shape (nW, 4, ngrid).
+
+        Returns
+        -------
+        np.ndarray
+            Shape (3, nW, nao, nao).
+        """
+        W0, W1 = W[:, 0], W[:, 1:4]
+        return - (
+            + einsum("Bg, tgu, gv -> tBuv", W0, self.ao_1, self.ao_0)
+            + einsum("Brg, trT, Tgu, gv -> tBuv", W1, SYM_2, self.ao_2T, self.ao_0)
+            + einsum("Brg, tgu, rgv -> tBuv", W1, self.ao_1, self.ao_1)
+        )
+
+    def get_pair_2(self, W):
+        """
+        Contraction of grid potential with second nuclear derivative of AO pairs, in which AO :math:`\\mu` is
+        differentiated twice,
+
+        .. math::
+
+            W_0 \\phi_{t s \\mu} \\phi_\\nu + W_r (\\phi_{t s r \\mu} \\phi_\\nu + \\phi_{t s \\mu} \\phi_{r \\nu})
+
+        Parameters
+        ----------
+        W: np.ndarray
+            Shape (nW, 4, ngrid).
+
+        Returns
+        -------
+        np.ndarray
+            Shape (3, 3, nW, nao, nao).
+        """
+        W0, W1 = W[:, 0], W[:, 1:4]
+        return (
+            + einsum("Bg, Tgu, gv -> TBuv", W0, self.ao_2T, self.ao_0)
+            + einsum("Brg, rTP, Pgu, gv -> TBuv", W1, SYM_3T, self.ao_3P, self.ao_0)
+            + einsum("Brg, Tgu, rgv -> TBuv", W1, self.ao_2T, self.ao_1)
+        )[IDX_2]
+
+    def get_pair_11(self, W):
+        """
+        Contraction of grid potential with second nuclear derivative of AO pairs, in which AO :math:`\\mu` and
+        :math:`\\nu` are differentiated once each,
+
+        .. math::
+
+            W_0 \\phi_{t \\mu} \\phi_{s \\nu}
+            + W_r (\\phi_{t r \\mu} \\phi_{s \\nu} + \\phi_{t \\mu} \\phi_{s r \\nu})
+
+        Parameters
+        ----------
+        W: np.ndarray
+            Shape (nW, 4, ngrid).
+
+        Returns
+        -------
+        np.ndarray
+            Shape (3, 3, nW, nao, nao).
+        """
+        W0, W1 = W[:, 0], W[:, 1:4]
+        return (
+            + einsum("Bg, tgu, sgv -> tsBuv", W0, self.ao_1, self.ao_1)
+            + einsum("Brg, trT, Tgu, sgv -> tsBuv", W1, SYM_2, self.ao_2T, self.ao_1)
+            + einsum("Brg, tgu, srT, Tgv -> tsBuv", W1, self.ao_1, SYM_2, self.ao_2T)
+        )
+
+
+class GridIteratorU(GridIterator):
+    """
+    Spin-shared grid iterator for unrestricted calculation.
+
+    ``D`` is stacked density matrix of shape (2, nao, nao). AO grid of each batch is evaluated only once, and
+    density properties (``rho_*``, ``A_rho_*``, ``AB_rho_*``, ``A_gamma_1``, ``AB_gamma_2``) are stacked with a leading
+    spin axis (alpha, beta). Since all these densities are linear in ``D``, total density is ``sum(axis=0)`` of them.
+
+    ``get_*`` functions accept either stacked density matrix (returns stacked grid) or a single density matrix
+    (returns the same result as ``GridIterator``).
+    """
+
+    def __init__(self, mol, grids, D, deriv=3, memory=2000, engine="xcfun", footprint=0, atoms=None):
+        super(GridIteratorU, self).__init__(mol, grids, D, deriv=deriv, memory=memory, engine=engine,
+                                            footprint=footprint, atoms=atoms)
+
+    @property
+    def rho_01(self):
+        if self._rho_01 is None:
+            self._rho_01 = np.zeros((2, 4, self.ngrid))
+            self._rho_01[:, 0] = self.rho_0
+            self._rho_01[:, 1:4] = self.rho_1
+        return self._rho_01
+
+    def _spin_stack(self, getter, D):
+        if D is None:
+            D = self.D
+        if D.ndim == 2:
+            return getter(self, D)
+        return np.array([getter(self, d) for d in D])
+
+    def get_rho_0(self, D=None):
+        return self._spin_stack(GridIterator.get_rho_0, D)
+
+    def get_rho_1(self, D=None):
+        return self._spin_stack(GridIterator.get_rho_1, D)
+
+    def get_rho_2(self, D=None):
+        return self._spin_stack(GridIterator.get_rho_2, D)
+
+    def get_A_rho_1(self, D=None):
+        return self._spin_stack(GridIterator.get_A_rho_1, D)
+
+    def get_A_rho_2(self, D=None):
+        return self._spin_stack(GridIterator.get_A_rho_2, D)
+
+    def get_AB_rho_2(self, D=None):
+        return self._spin_stack(GridIterator.get_AB_rho_2, D)
+
+    def get_AB_rho_3(self, D=None):
+        return self._spin_stack(GridIterator.get_AB_rho_3, D)
+
+    def get_A_gamma_1(self):
+        A_gamma_1 = 2 * einsum("xrg, xAtrg -> xAtg", self.rho_1, self.A_rho_2)
+        return A_gamma_1
+
+    def get_AB_gamma_2(self):
+        AB_gamma_2 = (
+            + 2 * einsum("xAtrg, xBsrg -> xABtsg", self.A_rho_2, self.A_rho_2)
+            + 2 * einsum("xrg, xABtsrg -> xABtsg", self.rho_1, self.AB_rho_3)
         )
         return AB_gamma_2
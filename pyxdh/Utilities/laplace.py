@@ -0,0 +1,74 @@
+"""
+Laplace quadrature of orbital energy denominators.
+
+For :math:`x \\in [x_\\mathrm{min}, x_\\mathrm{max}]`, :math:`1/x = \\int_0^\\infty e^{-x t} \\, \\mathrm{d} t` is
+approximated by :math:`\\sum_\\tau w_\\tau e^{-x t_\\tau}`. Quadrature points are log-spaced; the two end points are
+optimized, and weights are fitted by linear least squares of relative error over the whole interval.
+"""
+
+import numpy as np
+from scipy.optimize import minimize
+
+
+def laplace_quadrature(n, x_min, x_max):
+    """
+    Quadrature points and weights of :math:`1/x` on :math:`[x_\\mathrm{min}, x_\\mathrm{max}]`.
+
+    Parameters
+    ----------
+    n: int
+        Number of quadrature points.
+    x_min: float
+        Lower bound of denominators, should be positive.
+    x_max: float
+
+    Returns
+    -------
+    tuple of np.ndarray
+        Quadrature points :math:`t_\\tau` and weights :math:`w_\\tau`, each of shape (n, ).
+    """
+    if x_min <= 0:
+        raise ValueError("Laplace quadrature requires positive denominators!")
+    # Fit on scaled interval [1, R], then scale back
+    R = max(x_max / x_min, 1 + 1e-6)
+    x = np.exp(np.linspace(0, np.log(R), 30 * n))
+
+    def fit(p):
+        t = np.exp(np.linspace(p[0], p[1], n))
+        A = x[:, None] * np.exp(-x[:, None] * t[None, :])
+        w = np.linalg.lstsq(A, np.ones_like(x), rcond=None)[0]
+        return t, w, np.linalg.norm(A @ w - 1)
+
+    res = minimize(lambda p: np.log(fit(p)[2]), np.array([np.log(0.2 / R), np.log(4.)]), method="Nelder-Mead",
+                   options={"xatol": 1e-6, "fatol": 1e-8})
+    t, w, _ = fit(res.x)
+    return t / x_min, w / x_min
+
+
+def exp_divided_difference(e, t):
+    """
+    First divided difference of :math:`f(\\lambda) = e^{\\lambda t}` on orbital energies, i.e. Fréchet derivative of
+    matrix exponential :math:`e^{F t}` at diagonal :math:`F`.
+
+    .. math::
+
+        \\phi_{pq} = \\frac{e^{e_p t} - e^{e_q t}}{e_p - e_q}, \\quad \\phi_{pp} = t e^{e_p t}
+
+    Parameters
+    ----------
+    e: np.ndarray
+        Orbital energies, shape (n, ).
+    t: float
+
+    Returns
+    -------
+    np.ndarray
+        Shape (n, n).
+    """
+    d = e[:, None] - e[None, :]
+    small = np.abs(d * t) < 1
+    d_safe = np.where(d == 0, 1, d)
+    # Close energies use expm1 against cancellation; distant energies use plain difference against overflow
+    phi_close = np.exp(e[None, :] * t) * np.where(d == 0, t, np.expm1(np.where(small, d, 0) * t) / d_safe)
+    phi_far = (np.exp(e[:, None] * t) - np.exp(e[None, :] * t)) / d_safe
+    return np.where(small, phi_close, phi_far)